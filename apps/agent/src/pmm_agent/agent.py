@@ -7,9 +7,11 @@ Creates configurable PMM agents with different capability modes.
 import json
 import os
 from pathlib import Path
-from typing import Literal
+from typing import Callable, Literal, Optional
 
 from langchain_anthropic import ChatAnthropic
+from langchain_core.language_models import BaseChatModel
+from langchain_core.tools import BaseTool
 from langgraph.prebuilt import create_react_agent
 
 from .prompts import (
@@ -62,6 +64,8 @@ def create_pmm_agent(
     mode: AgentMode = "full",
     model_name: str = "claude-sonnet-4-20250514",
     with_subagents: bool = True,
+    model: Optional[BaseChatModel] = None,
+    tool_wrapper: Optional[Callable[[BaseTool], BaseTool]] = None,
 ):
     """
     Create a PMM agent with the specified capabilities.
@@ -75,6 +79,10 @@ def create_pmm_agent(
             - "risk": Risk assessment and validation
         model_name: Claude model to use
         with_subagents: Whether to include specialist subagents
+        model: Optional chat model to use instead of ChatAnthropic
+            (e.g. FakeChatModel for offline benchmarks)
+        tool_wrapper: Optional function applied to each selected tool
+            (e.g. to serve recorded outputs when replaying a turn)
 
     Returns:
         Configured LangGraph agent
@@ -91,9 +99,11 @@ def create_pmm_agent(
         tools = PLANNING_TOOLS + INTAKE_TOOLS
     elif mode == "risk":
         tools = RISK_TOOLS + RESEARCH_TOOLS
+    if tool_wrapper:
+        tools = [tool_wrapper(tool) for tool in tools]
 
     # Initialize model with system prompt
-    llm = ChatAnthropic(
+    llm = model or ChatAnthropic(
         model_name=model_name,
         max_tokens=8192,
         system=MAIN_SYSTEM_PROMPT,
@@ -159,6 +169,8 @@ def create_launch_coordinator(model_name: str = None):
 def create_analytics_agent(
     mode: AgentMode = "full",
     model_name: str = "claude-sonnet-4-20250514",
+    model: Optional[BaseChatModel] = None,
+    tool_wrapper: Optional[Callable[[BaseTool], BaseTool]] = None,
 ):
     """
     Create a Data Analytics agent with the specified capabilities.
@@ -168,9 +180,14 @@ def create_analytics_agent(
             - "full": All tools available
             - "intake": Analytics intake and KPI clarification only
             - "research": Benchmark research and context gathering
-            - "planning": Metrics dictionary, tracking plans, SQL templates
+            - "planning": Metrics dictionary, tracking plans, SQL templates,
+              and computed metrics from event files
             - "risk": Data quality checks and risk assessment
         model_name: Claude model to use
+        model: Optional chat model to use instead of ChatAnthropic
+            (e.g. FakeChatModel for offline benchmarks)
+        tool_wrapper: Optional function applied to each selected tool
+            (e.g. to serve recorded outputs when replaying a turn)
     
     Returns:
         Configured LangGraph agent for analytics domain
@@ -191,6 +208,7 @@ def create_analytics_agent(
             RESEARCH_TOOLS as ANALYTICS_RESEARCH_TOOLS,
             PLANNING_TOOLS as ANALYTICS_PLANNING_TOOLS,
             RISK_TOOLS as ANALYTICS_RISK_TOOLS,
+            COMPUTE_TOOLS as ANALYTICS_COMPUTE_TOOLS,
             ALL_TOOLS as ANALYTICS_ALL_TOOLS,
         )
     except ImportError as e:
@@ -208,13 +226,15 @@ def create_analytics_agent(
     elif mode == "research":
         tools = ANALYTICS_RESEARCH_TOOLS + ANALYTICS_INTAKE_TOOLS
     elif mode == "planning":
-        tools = ANALYTICS_PLANNING_TOOLS + ANALYTICS_INTAKE_TOOLS
+        tools = ANALYTICS_PLANNING_TOOLS + ANALYTICS_COMPUTE_TOOLS + ANALYTICS_INTAKE_TOOLS
     elif mode == "risk":
         tools = ANALYTICS_RISK_TOOLS + ANALYTICS_RESEARCH_TOOLS
+    if tool_wrapper:
+        tools = [tool_wrapper(tool) for tool in tools]
     
     # Initialize model with analytics system prompt
     # Increased max_tokens to ensure complete responses, especially for metrics dictionaries and SQL templates
-    llm = ChatAnthropic(
+    llm = model or ChatAnthropic(
         model_name=model_name,
         max_tokens=16384,  # Increased from 8192 to handle longer responses with tables and SQL
         system=ANALYTICS_SYSTEM_PROMPT,
@@ -0,0 +1,134 @@
+"""
+Debug Event Channel for PMM Agent.
+
+Structured debug events for the streaming loop (events, nodes, tool calls,
+tool results). Replaces inline `print` calls, which wrote synchronously to
+stdout from the event loop on every frame.
+
+Call sites guard on the flag so nothing is formatted when disabled:
+
+    if debug.enabled:
+        debug.emit("tool_call", name=tool_name, args=tool_args)
+
+When enabled, `emit` only enqueues a tuple; a daemon thread formats and
+writes events, so slow terminals or pipes never block the event loop. The
+queue is bounded: while the writer is behind, new events are dropped and
+counted, and the count is reported once the writer catches up.
+
+Enabled by default in local development, off in production (as detected by
+observability.running_in_production); override with DEBUG_STREAM=1 or
+DEBUG_STREAM=0. The setting is read once at import.
+"""
+
+import json
+import os
+import queue
+import sys
+import threading
+from typing import Any, Optional, TextIO
+
+from .observability import running_in_production
+
+# Icons keep the local console output scannable, as the old prints did
+_EVENT_ICONS = {
+    "stream_start": "🚀",
+    "event": "📦",
+    "node": "  ",
+    "tool_call": "🔧",
+    "duplicate_tool_call": "⏭️ ",
+    "tool_result": "✅",
+    "warning": "⚠️ ",
+}
+
+
+def _format_value(value: Any, limit: int = 200) -> str:
+    """Compact, length-capped rendering of an event field."""
+    if isinstance(value, str):
+        text = value
+    else:
+        try:
+            text = json.dumps(value, default=str)
+        except (TypeError, ValueError):
+            text = str(value)
+    return text[:limit] + "..." if len(text) > limit else text
+
+
+def format_event(event: str, fields: dict) -> str:
+    """Render one debug event as a single console line."""
+    icon = _EVENT_ICONS.get(event, "•")
+    details = " ".join(f"{key}={_format_value(value)}" for key, value in fields.items())
+    return f"{icon} [STREAM] {event} {details}".rstrip()
+
+
+class DebugChannel:
+    """Structured debug events with a non-blocking background sink."""
+
+    def __init__(self, enabled: bool, stream: Optional[TextIO] = None, max_pending: int = 10000):
+        self.enabled = enabled
+        self.dropped = 0  # Events discarded because the queue was full
+        self._stream = stream
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_pending)
+        self._thread: Optional[threading.Thread] = None
+        if enabled:
+            self._start()
+
+    def _start(self) -> None:
+        self._thread = threading.Thread(target=self._drain, name="pmm-agent-debug", daemon=True)
+        self._thread.start()
+
+    def emit(self, event: str, **fields: Any) -> None:
+        """Enqueue an event. Callers should check `enabled` first."""
+        if self.enabled:
+            try:
+                self._queue.put_nowait((event, fields))
+            except queue.Full:
+                self.dropped += 1
+
+    def _drain(self) -> None:
+        reported = 0
+        while True:
+            item = self._queue.get()
+            lines = [] if item is None else [format_event(*item)]
+            if self.dropped != reported:
+                lines.append(format_event("warning", {"dropped": self.dropped - reported}))
+                reported = self.dropped
+            stream = self._stream or sys.stdout
+            try:
+                if lines:
+                    stream.write("\n".join(lines) + "\n")
+                    stream.flush()
+            except Exception:
+                # Debug output must never take down the server
+                pass
+            if item is None:
+                break
+
+    def close(self, timeout: float = 1.0) -> None:
+        """Flush pending events and stop the sink thread."""
+        if self._thread is not None:
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                pass  # The daemon thread is stuck writing; leave it
+            self._thread.join(timeout)
+            self._thread = None
+        self.enabled = False
+
+
+def _enabled_from_env() -> bool:
+    setting = os.getenv("DEBUG_STREAM")
+    if setting is not None:
+        return setting.lower() in ("1", "true", "yes", "on")
+    return not running_in_production()
+
+
+# Global channel instance
+_channel_instance: Optional[DebugChannel] = None
+
+
+def get_debug_channel() -> DebugChannel:
+    """Get or create the global debug channel."""
+    global _channel_instance
+    if _channel_instance is None:
+        _channel_instance = DebugChannel(enabled=_enabled_from_env())
+    return _channel_instance
@@ -0,0 +1,119 @@
+"""
+Local Analytics Engine.
+
+Computes real numbers (funnels, retention, cohorts, stickiness) from
+event data the user provides, incrementally as partitions are appended,
+from bitmap indexes of users per day and event, and approximately from a
+sample of users for a first look at very large files. Also runs SQL
+templates against it in a DuckDB sandbox, profiles datasets for data
+quality checks and infers their schemas for query planning, so the
+analytics tools can go beyond templates. Each file is parsed once into a
+memory-mapped Arrow copy that all of these share.
+
+Requires the `analytics` extra (NumPy, pandas, PyArrow, DuckDB):
+
+    pip install "preprod-agent[analytics]"
+
+The tools import this package lazily and report the missing extra instead
+of failing, so the agent still runs without it.
+"""
+
+from .approximate import (
+    UserSample,
+    is_large,
+    load_user_sample,
+)
+from .bitmaps import (
+    StickinessResult,
+    UserIndex,
+    user_index,
+)
+from .events import (
+    DatasetNotFound,
+    EventTable,
+    is_partitioned,
+    load_events,
+    resolve_dataset_path,
+    resolve_partitions,
+)
+from .incremental import (
+    EventLog,
+    load_event_log,
+)
+from .metrics import (
+    CohortMatrix,
+    FunnelResult,
+    RetentionResult,
+    cohort_matrix,
+    funnel,
+    retention,
+)
+from .profile import (
+    ColumnProfile,
+    DatasetProfile,
+    profile_dataset,
+    profile_file,
+)
+from .registry import (
+    DatasetRegistry,
+    get_registry,
+)
+from .sandbox import (
+    QueryRejected,
+    QueryResult,
+    QueryTimeout,
+    SandboxError,
+    SqlSandbox,
+    get_sandbox,
+)
+from .schema import (
+    ColumnSchema,
+    DatasetSchema,
+    infer_schema,
+    schema_hints,
+)
+from .sketches import (
+    HyperLogLog,
+    TDigest,
+)
+
+__all__ = [
+    "UserSample",
+    "is_large",
+    "load_user_sample",
+    "StickinessResult",
+    "UserIndex",
+    "user_index",
+    "DatasetNotFound",
+    "EventTable",
+    "is_partitioned",
+    "load_events",
+    "resolve_dataset_path",
+    "resolve_partitions",
+    "EventLog",
+    "load_event_log",
+    "CohortMatrix",
+    "FunnelResult",
+    "RetentionResult",
+    "cohort_matrix",
+    "funnel",
+    "retention",
+    "ColumnProfile",
+    "DatasetProfile",
+    "profile_dataset",
+    "profile_file",
+    "DatasetRegistry",
+    "get_registry",
+    "QueryRejected",
+    "QueryResult",
+    "QueryTimeout",
+    "SandboxError",
+    "SqlSandbox",
+    "get_sandbox",
+    "ColumnSchema",
+    "DatasetSchema",
+    "infer_schema",
+    "schema_hints",
+    "HyperLogLog",
+    "TDigest",
+]
@@ -0,0 +1,153 @@
+"""
+Approximate Metrics from a User Sample.
+
+For a first look at a large event file, compute_event_metrics can answer
+from a sample of users instead of every event:
+
+- Users are sampled, not events: funnels and retention follow each user
+  across events, so a sampled user keeps all of their events. The sample
+  is the APPROX_SAMPLE_USERS users with the smallest hash of their ID (a
+  bottom-k reservoir), so the same file always gives the same sample.
+- Selecting the sample reads only the user column of the registry's
+  memory-mapped Arrow copy (distinct values and a set-membership filter,
+  both in Arrow); only the sampled users' rows are loaded and parsed.
+- The metrics functions and bitmap index then run unchanged on the sample
+  (when all users fit in the sample, the results are exact).
+  Counts are scaled by total users / sampled users; every rate comes with
+  a 95% Wilson interval over the users it is a rate of, with a finite
+  population correction, so a rate within a small cohort or funnel step
+  gets a wide interval.
+
+Event and user totals are exact. In "auto" mode the tool samples files
+with more than APPROX_MIN_EVENTS rows; partition directories are always
+exact, since appends already update them incrementally.
+"""
+
+import math
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow.compute as pc
+
+from .events import EventTable, events_from_frame, file_hash, resolve_dataset_path
+from .registry import get_registry
+
+APPROX_SAMPLE_USERS = int(os.getenv("APPROX_SAMPLE_USERS", "50000"))
+APPROX_MIN_EVENTS = int(os.getenv("APPROX_MIN_EVENTS", "5000000"))
+MAX_CACHED_SAMPLES = 4
+
+Z_95 = 1.96
+
+
+@dataclass
+class UserSample:
+    """Events of a uniform sample of users, and how to scale results from it."""
+    table: EventTable
+    sampled_users: int
+    total_users: int
+    total_events: int
+
+    @property
+    def fraction(self) -> float:
+        return self.sampled_users / self.total_users if self.total_users else 1.0
+
+    @property
+    def exact(self) -> bool:
+        return self.sampled_users >= self.total_users
+
+    def scale(self, count: int) -> int:
+        """Estimated users in the whole dataset for a count of sampled users."""
+        return round(count / self.fraction) if self.fraction else 0
+
+    def interval(self, successes: int, trials: int) -> Tuple[float, float]:
+        """95% interval for a rate of `successes` out of `trials` sampled users."""
+        if trials <= 0:
+            return 0.0, 1.0
+        p = successes / trials
+        if self.exact:
+            return p, p
+        # Wilson score interval; sampling without replacement shrinks the variance by (1 - f)
+        n = trials / max(1 - self.fraction, 1e-9)
+        z2 = Z_95 * Z_95
+        center = (p + z2 / (2 * n)) / (1 + z2 / n)
+        half = Z_95 * math.sqrt(p * (1 - p) / n + z2 / (4 * n * n)) / (1 + z2 / n)
+        return max(0.0, center - half), min(1.0, center + half)
+
+    def margin(self, successes: int, trials: int) -> float:
+        """Half-width of `interval`, in rate units."""
+        low, high = self.interval(successes, trials)
+        return (high - low) / 2
+
+
+def is_large(dataset: str) -> bool:
+    """
+    Whether a dataset has more than APPROX_MIN_EVENTS rows (read from its registry copy).
+
+    Raises:
+        DatasetNotFound: The dataset is not a file in the data directory
+        ValueError: The file could not be parsed
+    """
+    path = resolve_dataset_path(dataset)
+    return get_registry().table(path, file_hash(path)).num_rows > APPROX_MIN_EVENTS
+
+
+_samples: "OrderedDict[Tuple, UserSample]" = OrderedDict()
+
+
+def load_user_sample(
+    dataset: str,
+    user_column: str = "user_id",
+    event_column: str = "event_name",
+    time_column: str = "occurred_at",
+    users: int = 0,
+) -> UserSample:
+    """
+    Events of up to `users` (default APPROX_SAMPLE_USERS) users, chosen by hash.
+
+    Raises:
+        DatasetNotFound: The dataset is not a file in the data directory
+        ValueError: A named column is missing, or the file could not be parsed
+    """
+    users = users or APPROX_SAMPLE_USERS
+    path = resolve_dataset_path(dataset)
+    digest = file_hash(path)
+    key = (digest, user_column, event_column, time_column, users)
+    sample = _samples.get(key)
+    if sample is not None:
+        _samples.move_to_end(key)
+        return sample
+
+    table = get_registry().table(path, digest)
+    columns = [user_column, event_column, time_column]
+    missing = [c for c in columns if c not in table.schema.names]
+    if missing:
+        raise ValueError(f"Columns {missing} not found; available columns: {table.schema.names}")
+
+    user_values = table.column(user_column)
+    distinct = pc.unique(user_values).drop_null()
+    chosen = distinct
+    if len(distinct) > users:
+        # Values are already distinct, so skip hash_array's factorizing pass
+        hashes = pd.util.hash_array(distinct.to_numpy(zero_copy_only=False), categorize=False)
+        chosen = distinct.take(np.sort(np.argpartition(hashes, users)[:users]))
+    rows = table.select(columns).filter(pc.is_in(user_values, value_set=chosen))
+
+    sample = _samples[key] = UserSample(
+        table=events_from_frame(
+            rows.to_pandas(date_as_object=False),
+            f"{digest}:users-{users}",
+            user_column,
+            event_column,
+            time_column,
+        ),
+        sampled_users=len(chosen),
+        total_users=len(distinct),
+        total_events=table.num_rows,
+    )
+    while len(_samples) > MAX_CACHED_SAMPLES:
+        _samples.popitem(last=False)
+    return sample
@@ -0,0 +1,292 @@
+"""
+Bitmap User Index.
+
+Keeps, for an event table, one bitset of users per day (active that day)
+and per event name (ever did it), as rows of uint64 words with bit u set
+for user code u. Cohort questions then reduce to set operations:
+
+- N-day retention: users whose first start event is on day d, ANDed with
+  the users active on day d + N, popcounted and summed over d
+- cohort matrices: the same with day rows ORed into weeks or months
+- stickiness: DAU is a day's popcount, MAU the popcount of 30 days ORed
+- funnel reach: users who did every step so far, in any order, as an AND
+  of event bitsets
+
+A query costs (days x users / 64) word operations however many events
+there are, so repeated cohort questions over a large user base stay
+interactive. Retention and cohort results equal `metrics.retention` and
+`metrics.cohort_matrix`. An ordered funnel needs each step's time, not
+just its day, so it stays in `metrics.funnel`.
+
+Bitsets for one event per day (e.g. retention with a start event) are
+built on first use. All cached indexes, with those bitsets, share
+USER_INDEX_MAX_MB: the least recently used are dropped to make room, and
+an index larger than the whole budget is not built, so callers fall back
+to the metrics functions.
+"""
+
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .events import SECONDS_PER_DAY, EventTable
+from .metrics import (
+    PERIODS,
+    CohortMatrix,
+    FunnelResult,
+    RetentionResult,
+    _memo,
+    _period_index,
+    _period_label,
+)
+
+USER_INDEX_MAX_BYTES = int(os.getenv("USER_INDEX_MAX_MB", "1024")) * 1024 * 1024
+MAX_CACHED_INDEXES = 4
+MAX_EVENT_DAY_BITMAPS = 8
+
+_BYTE_BITS = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount(bitmaps: np.ndarray) -> np.ndarray:
+    """Set bits per row of uint64 words (per bitmap, along the last axis)."""
+    if hasattr(np, "bitwise_count"):  # NumPy 2
+        return np.bitwise_count(bitmaps).sum(axis=-1, dtype=np.int64)
+    return _BYTE_BITS[bitmaps.view(np.uint8)].sum(axis=-1, dtype=np.int64)
+
+
+def _bitmaps(users: np.ndarray, rows: np.ndarray, n_rows: int, words: int) -> np.ndarray:
+    """(n_rows, words) bitsets with bit `users[i]` set in row `rows[i]`."""
+    bitmaps = np.zeros(n_rows * words, dtype=np.uint64)
+    users = users.astype(np.uint64)
+    np.bitwise_or.at(
+        bitmaps,
+        rows.astype(np.int64) * words + (users >> np.uint64(6)).astype(np.int64),
+        np.left_shift(np.uint64(1), users & np.uint64(63)),
+    )
+    return bitmaps.reshape(n_rows, words)
+
+
+def _first_rows(bitmaps: np.ndarray) -> np.ndarray:
+    """Each user only in the first row they appear in."""
+    first = np.empty_like(bitmaps)
+    seen = np.zeros(bitmaps.shape[1], dtype=np.uint64)
+    for row in range(len(bitmaps)):
+        np.bitwise_and(bitmaps[row], ~seen, out=first[row])
+        seen |= bitmaps[row]
+    return first
+
+
+@dataclass
+class StickinessResult:
+    """Daily active users over trailing-window active users, for the most recent days."""
+    window_days: int
+    labels: List[str]
+    dau: List[int]
+    mau: List[int]
+
+    @property
+    def ratios(self) -> List[float]:
+        return [d / m if m else 0.0 for d, m in zip(self.dau, self.mau)]
+
+    @property
+    def average(self) -> float:
+        """Mean DAU/MAU over the days shown."""
+        return float(np.mean(self.ratios)) if self.ratios else 0.0
+
+
+class UserIndex:
+    """Bitsets of users per day and per event name for one event table."""
+
+    def __init__(self, table: EventTable):
+        self.table = table
+        self.words = (table.n_users + 63) // 64
+        day = table.ts // SECONDS_PER_DAY
+        self.first_day = int(day.min()) if len(day) else 0
+        self.n_days = int(day.max()) - self.first_day + 1 if len(day) else 0
+        self._day = (day - self.first_day).astype(np.int32)
+        self.days = _bitmaps(table.user, self._day, self.n_days, self.words)
+        self.events = _bitmaps(table.user, table.event, len(table.event_names), self.words)
+        self._event_days: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+    @staticmethod
+    def estimate_bytes(table: EventTable) -> int:
+        """Size of the day and event bitsets for a table."""
+        day = table.ts // SECONDS_PER_DAY
+        n_days = int(day.max() - day.min()) + 1 if len(day) else 0
+        return (n_days + len(table.event_names)) * ((table.n_users + 63) // 64) * 8
+
+    @property
+    def nbytes(self) -> int:
+        return self.days.nbytes + self.events.nbytes + sum(b.nbytes for b in self._event_days.values())
+
+    def event_days(self, name: Optional[str]) -> np.ndarray:
+        """Users per day who did an event (any event when name is None)."""
+        if name is None:
+            return self.days
+        bitmaps = self._event_days.get(name)
+        if bitmaps is not None:
+            self._event_days.move_to_end(name)
+            return bitmaps
+        code = self.table.event_code(name)
+        mask = self.table.event == code if code is not None else np.zeros(len(self.table), dtype=bool)
+        bitmaps = _bitmaps(self.table.user[mask], self._day[mask], self.n_days, self.words)
+        if _make_room(bitmaps.nbytes, keep=self):  # otherwise used once, not cached
+            self._event_days[name] = bitmaps
+            while len(self._event_days) > MAX_EVENT_DAY_BITMAPS:
+                self._event_days.popitem(last=False)
+        return bitmaps
+
+    def _periods(self, bitmaps: np.ndarray, period: str) -> Tuple[np.ndarray, int]:
+        """Day rows ORed into periods, and the index of the first period."""
+        index = _period_index((self.first_day + np.arange(self.n_days)) * SECONDS_PER_DAY, period)
+        if period == "day" or not len(index):
+            return bitmaps, int(index[0]) if len(index) else 0
+        starts = np.flatnonzero(np.r_[True, index[1:] != index[:-1]])
+        return np.bitwise_or.reduceat(bitmaps, starts, axis=0), int(index[0])
+
+    def retention(
+        self,
+        start_event: Optional[str] = None,
+        days: Sequence[int] = (1, 7, 30),
+        return_event: Optional[str] = None,
+    ) -> RetentionResult:
+        """Same as `metrics.retention`, from day bitsets."""
+        days = sorted(set(int(d) for d in days))
+
+        def compute():
+            cohorts = _first_rows(self.event_days(start_event))
+            returning = self.event_days(return_event)
+            sizes = popcount(cohorts)
+            eligible, retained = [], []
+            for n in days:
+                # Cohort days d with d + n inside the data
+                lo, hi = max(0, -n), self.n_days - max(0, n)
+                eligible.append(int(sizes[:hi].sum()) if hi > 0 else 0)
+                retained.append(int(popcount(cohorts[lo:hi] & returning[lo + n:hi + n]).sum()) if hi > lo else 0)
+            return RetentionResult(
+                start_event=start_event,
+                return_event=return_event,
+                days=days,
+                eligible=eligible,
+                retained=retained,
+            )
+
+        return _memo(self.table, ("index-retention", start_event, tuple(days), return_event), compute)
+
+    def cohort_matrix(self, start_event: Optional[str] = None, period: str = "week", periods: int = 8) -> CohortMatrix:
+        """Same as `metrics.cohort_matrix`, from period bitsets."""
+        if period not in PERIODS:
+            raise ValueError(f"period must be one of {PERIODS}, got '{period}'")
+        if periods < 1:
+            raise ValueError("periods must be at least 1")
+
+        def compute():
+            active, first_period = self._periods(self.days, period)
+            starts, _ = self._periods(self.event_days(start_event), period)
+            cohorts = _first_rows(starts)
+            last_period = first_period + len(active) - 1 if len(active) else 0
+            first_row = last_period - periods + 1
+
+            sizes = np.zeros(periods, dtype=np.int64)
+            counts = np.zeros((periods, periods), dtype=np.int64)
+            for r in range(periods):
+                c = first_row + r - first_period  # row in the bitsets
+                if c < 0:
+                    continue
+                sizes[r] = popcount(cohorts[c])
+                later = active[c:c + periods]
+                counts[r, :len(later)] = popcount(cohorts[c] & later)
+
+            grid = np.arange(periods)
+            return CohortMatrix(
+                period=period,
+                labels=[_period_label(first_row + r, period) for r in range(periods)],
+                sizes=sizes,
+                active=counts,
+                observable=grid[:, None] + grid[None, :] <= periods - 1,
+            )
+
+        return _memo(self.table, ("index-cohorts", start_event, period, periods), compute)
+
+    def stickiness(self, window_days: int = 30, days: int = 30) -> StickinessResult:
+        """DAU and trailing `window_days` active users for each of the last `days` days."""
+        if window_days < 1 or days < 1:
+            raise ValueError("window_days and days must be at least 1")
+
+        def compute():
+            shown = range(max(0, self.n_days - days), self.n_days)
+            dau = popcount(self.days[shown.start:]).tolist() if len(shown) else []
+            mau = [
+                int(popcount(np.bitwise_or.reduce(self.days[max(0, d - window_days + 1):d + 1], axis=0)))
+                for d in shown
+            ]
+            return StickinessResult(
+                window_days=window_days,
+                labels=[str(np.datetime64(self.first_day + d, "D")) for d in shown],
+                dau=[int(v) for v in dau],
+                mau=mau,
+            )
+
+        return _memo(self.table, ("index-stickiness", window_days, days), compute)
+
+    def funnel_reach(self, steps: Sequence[str]) -> FunnelResult:
+        """Users who did every step up to each one, in any order and at any time."""
+        steps = list(steps)
+        if not steps:
+            raise ValueError("A funnel needs at least one step")
+
+        def compute():
+            reached = np.full(self.words, np.iinfo(np.uint64).max, dtype=np.uint64)
+            users = []
+            for step in steps:
+                code = self.table.event_code(step)
+                reached = reached & self.events[code] if code is not None else np.zeros_like(reached)
+                users.append(int(popcount(reached)))
+            return FunnelResult(steps=steps, users=users, window_days=self.n_days, ordered=False)
+
+        return _memo(self.table, ("index-reach", tuple(steps)), compute)
+
+
+_indexes: "OrderedDict[Tuple, UserIndex]" = OrderedDict()
+
+
+def _cached_bytes() -> int:
+    return sum(index.nbytes for index in _indexes.values())
+
+
+def _make_room(needed: int, keep: Optional[UserIndex] = None) -> bool:
+    """
+    Drop least recently used indexes, then `keep`'s per-event bitsets, until
+    `needed` more bytes fit in USER_INDEX_MAX_MB. Returns whether they fit.
+    """
+    for key, index in list(_indexes.items()):
+        if _cached_bytes() + needed <= USER_INDEX_MAX_BYTES:
+            return True
+        if index is not keep:
+            del _indexes[key]
+    if keep is not None:
+        while keep._event_days and _cached_bytes() + needed > USER_INDEX_MAX_BYTES:
+            keep._event_days.popitem(last=False)
+    return _cached_bytes() + needed <= USER_INDEX_MAX_BYTES
+
+
+def user_index(table: EventTable) -> Optional[UserIndex]:
+    """
+    The bitmap index of an event table, built on first use and cached by content hash.
+
+    Returns None when the index alone would exceed USER_INDEX_MAX_MB.
+    """
+    key = (table.dataset_hash, table.columns)
+    index = _indexes.get(key)
+    if index is not None:
+        _indexes.move_to_end(key)
+        return index
+    if not _make_room(UserIndex.estimate_bytes(table)):
+        return None
+    index = _indexes[key] = UserIndex(table)
+    while len(_indexes) > MAX_CACHED_INDEXES:
+        _indexes.popitem(last=False)
+    return index
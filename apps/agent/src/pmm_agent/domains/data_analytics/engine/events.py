@@ -0,0 +1,241 @@
+"""
+Event Tables.
+
+Loads an event export (CSV or Parquet) into compact NumPy columns that the
+metric functions aggregate with vectorized group-bys:
+
+- user: int32 codes (factorized user IDs)
+- event: int32 codes into `event_names`
+- ts: int64 seconds since the epoch (UTC)
+
+Files are read from ANALYTICS_DATA_DIR only; tool arguments are names
+relative to it, never arbitrary server paths. Columns are read from the
+dataset registry's memory-mapped Arrow copy, and loaded tables are cached
+by content hash, so repeated tool calls on the same file skip parsing.
+"""
+
+import hashlib
+import os
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from .registry import get_registry
+
+ANALYTICS_DATA_DIR = Path(os.getenv("ANALYTICS_DATA_DIR", "data"))
+MAX_CACHED_TABLES = 4
+DATASET_SUFFIXES = (".csv", ".parquet", ".pq")
+
+SECONDS_PER_DAY = 86_400
+
+
+class DatasetNotFound(Exception):
+    """The dataset name does not refer to a readable file in the data directory."""
+
+
+@dataclass
+class EventTable:
+    """Columnar event data: one entry per event in each array."""
+
+    dataset_hash: str
+    user: np.ndarray
+    event: np.ndarray
+    ts: np.ndarray
+    event_names: List[str]
+    n_users: int
+    columns: Tuple[str, str, str] = ("user_id", "event_name", "occurred_at")
+    dropped_rows: int = 0
+    _event_codes: Dict[str, int] = field(default_factory=dict, repr=False)
+    _by_user: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = field(default=None, repr=False)
+
+    def __post_init__(self):
+        self._event_codes = {name: code for code, name in enumerate(self.event_names)}
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    @property
+    def day(self) -> np.ndarray:
+        """Days since the epoch for each event."""
+        return (self.ts // SECONDS_PER_DAY).astype(np.int32)
+
+    def event_code(self, name: str) -> Optional[int]:
+        """Code of an event name, or None if it never occurs."""
+        return self._event_codes.get(name)
+
+    def sorted_by_user(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(user, event, ts) sorted by user, then time. Computed once per table."""
+        if self._by_user is None:
+            order = np.lexsort((self.ts, self.user))
+            self._by_user = (self.user[order], self.event[order], self.ts[order])
+        return self._by_user
+
+
+def resolve_dataset_path(dataset: str) -> Path:
+    """
+    Resolve a dataset name inside ANALYTICS_DATA_DIR, refusing paths that escape it.
+
+    Uploaded datasets are stored as `<dataset_id>.<ext>`, so a bare ID
+    (e.g. "ds_3f2a…") also resolves to its file.
+    """
+    root = ANALYTICS_DATA_DIR.resolve()
+    path = (root / dataset).resolve()
+    if not path.is_file() and not path.suffix:
+        path = next((p for p in (path.with_name(path.name + s) for s in DATASET_SUFFIXES) if p.is_file()), path)
+    if root not in path.parents or not path.is_file():
+        raise DatasetNotFound(f"No dataset named '{dataset}' in {ANALYTICS_DATA_DIR}")
+    return path
+
+
+def is_partitioned(dataset: str) -> bool:
+    """Whether a dataset name refers to a directory of partition files in ANALYTICS_DATA_DIR."""
+    root = ANALYTICS_DATA_DIR.resolve()
+    path = (root / dataset).resolve()
+    return root in path.parents and path.is_dir()
+
+
+def resolve_partitions(dataset: str) -> List[Path]:
+    """
+    Partition files of a directory dataset in ANALYTICS_DATA_DIR, in name order.
+
+    Appends add files that sort after the existing ones (e.g. one
+    `2024-06-01.parquet` per day); hidden files, such as uploads in
+    progress, are skipped.
+    """
+    if not is_partitioned(dataset):
+        raise DatasetNotFound(f"No partitioned dataset named '{dataset}' in {ANALYTICS_DATA_DIR}")
+    directory = (ANALYTICS_DATA_DIR.resolve() / dataset).resolve()
+    files = sorted(
+        p for p in directory.iterdir()
+        if p.is_file() and p.suffix.lower() in DATASET_SUFFIXES and not p.name.startswith(".")
+    )
+    if not files:
+        raise DatasetNotFound(f"Dataset '{dataset}' has no {', '.join(DATASET_SUFFIXES)} partitions")
+    return files
+
+
+_hashes: Dict[Tuple[str, int, int], str] = {}
+
+
+def file_hash(path: Path) -> str:
+    """SHA-256 of a file's contents, memoized by path, size and modification time."""
+    stat = path.stat()
+    key = (str(path), stat.st_size, stat.st_mtime_ns)
+    digest = _hashes.get(key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha.update(chunk)
+        digest = _hashes[key] = sha.hexdigest()
+    return digest
+
+
+def _read_columns(table: pa.Table, columns: List[str]) -> pd.DataFrame:
+    available = table.schema.names
+    missing = [c for c in columns if c not in available]
+    if missing:
+        raise ValueError(f"Columns {missing} not found; available columns: {available}")
+    return table.select(columns).to_pandas(date_as_object=False)
+
+
+def parse_iso_strings(values: pd.Series) -> Optional[np.ndarray]:
+    """
+    Fast path for ISO 8601 strings via Arrow: int64 UTC seconds, or None.
+
+    Handles columns where every value has a UTC offset or none does (naive
+    values are taken as UTC); mixed formats return None.
+    """
+    try:
+        strings = pa.array(values, type=pa.string(), from_pandas=True)
+    except (pa.ArrowException, TypeError):
+        return None
+    for target in (pa.timestamp("ns", tz="UTC"), pa.timestamp("ns")):
+        try:
+            nanos = strings.cast(target).cast(pa.int64())
+        except pa.ArrowException:
+            continue
+        nanos = pc.fill_null(nanos, -1).to_numpy()
+        return np.where(nanos >= 0, nanos // 1_000_000_000, -1)
+    return None
+
+
+def to_epoch_seconds(values: pd.Series) -> np.ndarray:
+    """Timestamps (datetimes, ISO strings or epoch numbers) as int64 UTC seconds; NaT as -1."""
+    if pd.api.types.is_numeric_dtype(values):
+        seconds = values.astype("float64").to_numpy()
+        # Epoch milliseconds are common in event exports
+        if np.nanmax(np.abs(seconds), initial=0) > 1e11:
+            seconds = seconds / 1000
+        return np.where(np.isnan(seconds), -1, seconds).astype(np.int64)
+    if not pd.api.types.is_datetime64_any_dtype(values):
+        seconds = parse_iso_strings(values)
+        if seconds is not None:
+            return seconds
+    stamps = pd.to_datetime(values, utc=True, errors="coerce", format="mixed")
+    seconds = stamps.to_numpy(dtype="datetime64[s]").astype(np.int64)
+    return np.where(stamps.isna().to_numpy(), -1, seconds)
+
+
+def events_from_frame(
+    frame: pd.DataFrame,
+    dataset_hash: str,
+    user_column: str = "user_id",
+    event_column: str = "event_name",
+    time_column: str = "occurred_at",
+) -> EventTable:
+    """Build an EventTable from a DataFrame, dropping rows without a user, event or time."""
+    ts = to_epoch_seconds(frame[time_column])
+    valid = (ts >= 0) & frame[user_column].notna().to_numpy() & frame[event_column].notna().to_numpy()
+    dropped = int(len(frame) - valid.sum())
+
+    user_codes, user_ids = pd.factorize(frame[user_column][valid])
+    event_codes, event_names = pd.factorize(frame[event_column][valid].astype(str))
+    return EventTable(
+        dataset_hash=dataset_hash,
+        user=user_codes.astype(np.int32),
+        event=event_codes.astype(np.int32),
+        ts=ts[valid],
+        event_names=list(event_names),
+        n_users=len(user_ids),
+        columns=(user_column, event_column, time_column),
+        dropped_rows=dropped,
+    )
+
+
+_tables: "OrderedDict[Tuple[str, str, str, str], EventTable]" = OrderedDict()
+
+
+def load_events(
+    dataset: str,
+    user_column: str = "user_id",
+    event_column: str = "event_name",
+    time_column: str = "occurred_at",
+) -> EventTable:
+    """
+    Load an event table from ANALYTICS_DATA_DIR, reusing a cached copy if the content is unchanged.
+
+    Raises:
+        DatasetNotFound: The dataset is not a file in the data directory
+        ValueError: A named column is missing, or the file could not be parsed
+    """
+    path = resolve_dataset_path(dataset)
+    digest = file_hash(path)
+    key = (digest, user_column, event_column, time_column)
+    table = _tables.get(key)
+    if table is not None:
+        _tables.move_to_end(key)
+        return table
+
+    frame = _read_columns(get_registry().table(path, digest), [user_column, event_column, time_column])
+    table = events_from_frame(frame, digest, user_column, event_column, time_column)
+    _tables[key] = table
+    while len(_tables) > MAX_CACHED_TABLES:
+        _tables.popitem(last=False)
+    return table
@@ -0,0 +1,409 @@
+"""
+Incremental Metrics for Appended Event Data.
+
+A dataset can be a directory of event files in ANALYTICS_DATA_DIR, one
+per append (e.g. `events/2024-06-01.parquet`). Instead of recomputing a
+funnel or retention from all of history after each append, every metric
+definition keeps per-user state and per-period partial aggregates that
+new partitions update:
+
+- funnel: per user, when they reached each step; per day of the first
+  step, users reaching each step
+- retention and cohort matrices: per user, their start period and the
+  last period they were counted active in; per start period, cohort size
+  and active users by periods since start
+
+A partition whose events are all later than everything seen so far
+updates these in time proportional to its own size. A partition with
+earlier events (late data) merges everything in memory and rebuilds the
+aggregates; a changed or removed partition reloads the dataset. Either
+way, results equal those of the metrics functions on all partitions
+concatenated.
+"""
+
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .events import (
+    SECONDS_PER_DAY,
+    _read_columns,
+    file_hash,
+    resolve_partitions,
+    to_epoch_seconds,
+)
+from .metrics import (
+    _NEVER,
+    PERIODS,
+    CohortMatrix,
+    FunnelResult,
+    RetentionResult,
+    _period_index,
+    _period_label,
+    _run_starts,
+)
+from .registry import get_registry
+
+MAX_CACHED_LOGS = 4
+MAX_AGGREGATES = 32
+
+# (user, event, ts) with global codes, sorted by user, then time
+Batch = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+def _grow(values: np.ndarray, size: int, fill: int) -> np.ndarray:
+    """Per-user state sized for `size` users, doubling capacity so growth is amortized."""
+    if len(values) >= size:
+        return values
+    grown = np.full(max(size, 2 * len(values)), fill, dtype=values.dtype)
+    grown[:len(values)] = values
+    return grown
+
+
+def _first_per_user(users: np.ndarray, ts: np.ndarray, mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Users with a matching row and the time of their first one (rows sorted by user, time)."""
+    users, ts = users[mask], ts[mask]
+    starts = _run_starts(users)
+    return users[starts], ts[starts]
+
+
+class _Grid:
+    """Counts by (period, column), growing as periods and columns arrive."""
+
+    def __init__(self):
+        self.origin = 0
+        self.counts = np.zeros((0, 0), dtype=np.int64)
+
+    def add(self, periods: np.ndarray, columns: np.ndarray) -> None:
+        if not len(periods):
+            return
+        low, high = int(periods.min()), int(periods.max())
+        if not self.counts.size:
+            self.origin = low
+        origin = min(self.origin, low)
+        rows = max(self.origin + len(self.counts), high + 1) - origin
+        width = int(columns.max()) + 1
+        if origin != self.origin or rows > len(self.counts) or width > self.counts.shape[1]:
+            # Double what grows, so appending one period at a time copies amortized O(1) per cell
+            if rows > len(self.counts):
+                rows = max(rows, 2 * len(self.counts))
+            width = max(width, 2 * self.counts.shape[1]) if width > self.counts.shape[1] else self.counts.shape[1]
+            grown = np.zeros((rows, width), dtype=np.int64)
+            shift = self.origin - origin
+            grown[shift:shift + len(self.counts), :self.counts.shape[1]] = self.counts
+            self.origin, self.counts = origin, grown
+        np.add.at(self.counts, (periods - self.origin, columns), 1)
+
+    def rows(self, first: int, last: int, width: int) -> np.ndarray:
+        """Counts for periods first..last and columns 0..width-1, zero where nothing was added."""
+        out = np.zeros((last - first + 1, width), dtype=np.int64)
+        lo, hi = max(first, self.origin), min(last, self.origin + len(self.counts) - 1)
+        if lo <= hi:
+            cols = min(width, self.counts.shape[1])
+            out[lo - first:hi - first + 1, :cols] = self.counts[lo - self.origin:hi - self.origin + 1, :cols]
+        return out
+
+    def column_totals(self) -> np.ndarray:
+        return self.counts.sum(axis=0)
+
+
+class _FunnelAggregate:
+    """Ordered funnel state: per user, when each step was reached; per first-step day, users per step."""
+
+    def __init__(self, steps: Sequence[str], window_days: int):
+        self.steps = list(steps)
+        self.window_days = window_days
+        self.reached = [np.empty(0, dtype=np.int64) for _ in self.steps]
+        self.by_day = _Grid()
+
+    def update(self, log: "EventLog", batch: Batch) -> None:
+        users, events, ts = batch
+        self.reached = [_grow(reached, log.n_users, _NEVER) for reached in self.reached]
+        first = self.reached[0]
+        window = self.window_days * SECONDS_PER_DAY
+        for k, step in enumerate(self.steps):
+            mask = log.event_mask(events, step) & (self.reached[k][users] == _NEVER)
+            if k:
+                # Same rule as metrics.funnel: at or after the previous step, within the window
+                mask &= (ts >= self.reached[k - 1][users]) & (ts - first[users] <= window)
+            new_users, new_ts = _first_per_user(users, ts, mask)
+            self.reached[k][new_users] = new_ts
+            self.by_day.add(first[new_users] // SECONDS_PER_DAY, np.full(len(new_users), k))
+
+    def result(self) -> FunnelResult:
+        totals = self.by_day.column_totals()
+        users = [int(totals[k]) if k < len(totals) else 0 for k in range(len(self.steps))]
+        return FunnelResult(steps=self.steps, users=users, window_days=self.window_days)
+
+
+class _CohortAggregate:
+    """
+    Cohort state for one start event, return event and period.
+
+    Appends only add later events, so a user's activity offsets only grow:
+    remembering the last offset counted per user is enough to count each
+    (user, offset) once.
+    """
+
+    def __init__(self, start_event: Optional[str], return_event: Optional[str], period: str):
+        self.start_event = start_event
+        self.return_event = return_event
+        self.period = period
+        self.start = np.empty(0, dtype=np.int64)  # start period, _NEVER before the start event
+        self.counted = np.empty(0, dtype=np.int64)  # last offset counted active, -1 for none
+        self.last_active = np.empty(0, dtype=np.int64)  # last period with a return event, -1 for none
+        self.sizes = _Grid()
+        self.active = _Grid()
+        self.last_period: Optional[int] = None
+
+    def update(self, log: "EventLog", batch: Batch) -> None:
+        users, events, ts = batch
+        if not len(ts):
+            return
+        self.start = _grow(self.start, log.n_users, _NEVER)
+        self.counted = _grow(self.counted, log.n_users, -1)
+        self.last_active = _grow(self.last_active, log.n_users, -1)
+        periods = _period_index(ts, self.period)
+        last = int(periods.max())
+        self.last_period = last if self.last_period is None else max(self.last_period, last)
+
+        mask = log.event_mask(events, self.start_event) & (self.start[users] == _NEVER)
+        new_users, new_ts = _first_per_user(users, ts, mask)
+        self.start[new_users] = _period_index(new_ts, self.period)
+        self.sizes.add(self.start[new_users], np.zeros(len(new_users), dtype=np.int64))
+        # Return events from earlier partitions in the period the user started in count as offset 0
+        earlier = new_users[self.last_active[new_users] == self.start[new_users]]
+        self.active.add(self.start[earlier], np.zeros(len(earlier), dtype=np.int64))
+        self.counted[earlier] = 0
+
+        returning = log.event_mask(events, self.return_event)
+        active_users, active_periods = users[returning], periods[returning]
+        np.maximum.at(self.last_active, active_users, active_periods)
+        started = self.start[active_users] != _NEVER
+        active_users, active_periods = active_users[started], active_periods[started]
+        offset = active_periods - self.start[active_users]
+        keep = offset > self.counted[active_users]
+        active_users, offset = active_users[keep], offset[keep]
+        # Rows are sorted by user and time, so repeats of a (user, offset) are adjacent
+        first = np.ones(len(active_users), dtype=bool)
+        first[1:] = (active_users[1:] != active_users[:-1]) | (offset[1:] != offset[:-1])
+        active_users, offset = active_users[first], offset[first]
+        self.active.add(self.start[active_users], offset)
+        np.maximum.at(self.counted, active_users, offset)
+
+    def retention(self, days: List[int]) -> RetentionResult:
+        last_day = self.last_period if self.last_period is not None else -1
+        first = self.sizes.origin
+        totals = self.active.column_totals()
+        eligible, retained = [], []
+        for n in days:
+            eligible.append(int(self.sizes.rows(first, last_day - n, 1).sum()) if last_day - n >= first else 0)
+            retained.append(int(totals[n]) if 0 <= n < len(totals) else 0)
+        return RetentionResult(
+            start_event=self.start_event,
+            return_event=self.return_event,
+            days=days,
+            eligible=eligible,
+            retained=retained,
+        )
+
+    def cohort_matrix(self, periods: int) -> CohortMatrix:
+        last = self.last_period if self.last_period is not None else 0
+        first_row = last - periods + 1
+        grid = np.arange(periods)
+        return CohortMatrix(
+            period=self.period,
+            labels=[_period_label(first_row + r, self.period) for r in range(periods)],
+            sizes=self.sizes.rows(first_row, last, 1)[:, 0],
+            active=self.active.rows(first_row, last, periods),
+            observable=grid[:, None] + grid[None, :] <= periods - 1,
+        )
+
+
+def _user_keys(values: pd.Series) -> Tuple[np.ndarray, List[str]]:
+    """Codes and string keys of user IDs, so partitions parsed as int, float or string agree."""
+    codes, uniques = pd.factorize(values)
+    if pd.api.types.is_float_dtype(uniques) and np.all(np.mod(uniques, 1) == 0):
+        uniques = uniques.astype(np.int64)
+    return codes, [str(u) for u in uniques]
+
+
+class EventLog:
+    """
+    A partitioned event dataset: its events so far, with global user and
+    event codes, and the aggregates kept over them per metric definition.
+    """
+
+    def __init__(self, dataset: str, columns: Tuple[str, str, str] = ("user_id", "event_name", "occurred_at")):
+        self.dataset = dataset
+        self.columns = columns
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self) -> None:
+        self.partitions: List[str] = []  # content hashes, in the order they were added
+        self.dropped_rows = 0
+        self.watermark = -1  # latest event time seen
+        self.last_append = (0, 0)  # (partitions, events) read by the latest refresh
+        self.rebuilds = 0
+        self.event_names: List[str] = []
+        self._event_codes: Dict[str, int] = {}
+        self._user_codes: Dict[str, int] = {}
+        self._batches: List[Batch] = []
+        self._aggregates: "OrderedDict[Tuple[Hashable, ...], object]" = OrderedDict()
+
+    @property
+    def n_users(self) -> int:
+        return len(self._user_codes)
+
+    def __len__(self) -> int:
+        return sum(len(batch[2]) for batch in self._batches)
+
+    def event_code(self, name: str) -> Optional[int]:
+        """Code of an event name, or None if it does not occur yet."""
+        return self._event_codes.get(name)
+
+    def event_mask(self, events: np.ndarray, name: Optional[str]) -> np.ndarray:
+        """Rows matching an event name (all rows when name is None)."""
+        if name is None:
+            return np.ones(len(events), dtype=bool)
+        code = self.event_code(name)
+        if code is None:
+            return np.zeros(len(events), dtype=bool)
+        return events == code
+
+    def _read(self, path: Path, digest: str) -> Batch:
+        user_column, event_column, time_column = self.columns
+        frame = _read_columns(get_registry().table(path, digest), list(self.columns))
+        ts = to_epoch_seconds(frame[time_column])
+        valid = (ts >= 0) & frame[user_column].notna().to_numpy() & frame[event_column].notna().to_numpy()
+        self.dropped_rows += int(len(frame) - valid.sum())
+
+        codes, keys = _user_keys(frame[user_column][valid])
+        users = np.asarray([self._user_codes.setdefault(key, len(self._user_codes)) for key in keys], dtype=np.int32)
+        event_codes, names = pd.factorize(frame[event_column][valid].astype(str))
+        for name in names:
+            if name not in self._event_codes:
+                self._event_codes[name] = len(self.event_names)
+                self.event_names.append(name)
+        events = np.asarray([self._event_codes[name] for name in names], dtype=np.int32)
+
+        user, event, ts = users[codes], events[event_codes], ts[valid]
+        order = np.lexsort((ts, user))
+        return user[order], event[order], ts[order]
+
+    def refresh(self) -> None:
+        """
+        Read partitions added since the last refresh and fold them into the aggregates.
+
+        Raises:
+            DatasetNotFound: The dataset is not a directory of partitions
+            ValueError: A named column is missing, or a file could not be parsed
+        """
+        with self._lock:
+            paths = resolve_partitions(self.dataset)
+            digests = [file_hash(path) for path in paths]
+            if digests[:len(self.partitions)] != self.partitions:
+                self._reset()  # a partition changed or was removed
+            added = list(zip(paths, digests))[len(self.partitions):]
+            appended = 0
+            for path, digest in added:
+                batch = self._read(path, digest)
+                self.partitions.append(digest)
+                appended += len(batch[2])
+                if not len(batch[2]):
+                    continue
+                if batch[2].min() <= self.watermark:
+                    self._merge(batch)
+                else:
+                    self._batches.append(batch)
+                    for aggregate in self._aggregates.values():
+                        aggregate.update(self, batch)
+                self.watermark = max(self.watermark, int(batch[2].max()))
+            self.last_append = (len(added), appended)
+
+    def _merge(self, batch: Batch) -> None:
+        """Late data: merge all events into one batch and rebuild the aggregates from it."""
+        user, event, ts = (np.concatenate(parts) for parts in zip(*self._batches + [batch]))
+        order = np.lexsort((ts, user))
+        self._batches = [(user[order], event[order], ts[order])]
+        definitions = list(self._aggregates)
+        self._aggregates.clear()
+        for key in definitions:
+            self._aggregate(key)
+        self.rebuilds += 1
+
+    def _aggregate(self, key: Tuple[Hashable, ...]):
+        aggregate = self._aggregates.get(key)
+        if aggregate is not None:
+            self._aggregates.move_to_end(key)
+            return aggregate
+        aggregate = _FunnelAggregate(*key[1:]) if key[0] == "funnel" else _CohortAggregate(*key[1:])
+        for batch in self._batches:
+            aggregate.update(self, batch)
+        self._aggregates[key] = aggregate
+        while len(self._aggregates) > MAX_AGGREGATES:
+            self._aggregates.popitem(last=False)
+        return aggregate
+
+    def funnel(self, steps: Sequence[str], window_days: int = 30) -> FunnelResult:
+        """Same as `metrics.funnel` over all partitions."""
+        steps = tuple(steps)
+        if not steps:
+            raise ValueError("A funnel needs at least one step")
+        with self._lock:
+            return self._aggregate(("funnel", steps, window_days)).result()
+
+    def retention(
+        self,
+        start_event: Optional[str] = None,
+        days: Sequence[int] = (1, 7, 30),
+        return_event: Optional[str] = None,
+    ) -> RetentionResult:
+        """Same as `metrics.retention` over all partitions."""
+        days = sorted(set(int(d) for d in days))
+        with self._lock:
+            return self._aggregate(("cohorts", start_event, return_event, "day")).retention(days)
+
+    def cohort_matrix(self, start_event: Optional[str] = None, period: str = "week", periods: int = 8) -> CohortMatrix:
+        """Same as `metrics.cohort_matrix` over all partitions."""
+        if period not in PERIODS:
+            raise ValueError(f"period must be one of {PERIODS}, got '{period}'")
+        if periods < 1:
+            raise ValueError("periods must be at least 1")
+        with self._lock:
+            return self._aggregate(("cohorts", start_event, None, period)).cohort_matrix(periods)
+
+
+_logs: "OrderedDict[Tuple[str, str, str, str], EventLog]" = OrderedDict()
+_logs_lock = threading.Lock()
+
+
+def load_event_log(
+    dataset: str,
+    user_column: str = "user_id",
+    event_column: str = "event_name",
+    time_column: str = "occurred_at",
+) -> EventLog:
+    """
+    The event log of a partitioned dataset, refreshed with any partitions added since the last call.
+
+    Raises:
+        DatasetNotFound: The dataset is not a directory of partitions in the data directory
+        ValueError: A named column is missing, or a file could not be parsed
+    """
+    key = (str(resolve_partitions(dataset)[0].parent), user_column, event_column, time_column)
+    with _logs_lock:
+        log = _logs.get(key)
+        if log is None:
+            log = _logs[key] = EventLog(dataset, (user_column, event_column, time_column))
+            while len(_logs) > MAX_CACHED_LOGS:
+                _logs.popitem(last=False)
+        else:
+            _logs.move_to_end(key)
+    log.refresh()
+    return log
@@ -0,0 +1,279 @@
+"""
+Funnel, Retention and Cohort Metrics.
+
+Vectorized equivalents of the templates in `draft_sql_query_pack`. Every
+metric works on the table's events sorted by (user, time), so "first
+matching event per user" is a boolean mask followed by picking the first
+row of each user run, with no per-row Python.
+
+Results are cached per (dataset hash, columns, metric, arguments), so a
+repeated question about the same file is answered from memory.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .events import SECONDS_PER_DAY, EventTable
+
+MAX_CACHED_RESULTS = 256
+
+PERIODS = ("day", "week", "month")
+
+_NEVER = np.iinfo(np.int64).max
+
+
+@dataclass
+class FunnelResult:
+    """
+    Users reaching each step, in order, within the window from the first step.
+
+    Unordered results (see `UserIndex.funnel_reach`) count users who did
+    every step so far in any order, an upper bound on the ordered funnel.
+    """
+    steps: List[str]
+    users: List[int]
+    window_days: int
+    ordered: bool = True
+
+    @property
+    def step_conversion(self) -> List[Optional[float]]:
+        """Share of the previous step's users reaching each step (None for the first)."""
+        return [None] + [cur / prev if prev else 0.0 for prev, cur in zip(self.users, self.users[1:])]
+
+    @property
+    def overall_conversion(self) -> List[float]:
+        """Share of the first step's users reaching each step."""
+        first = self.users[0]
+        return [count / first if first else 0.0 for count in self.users]
+
+
+@dataclass
+class RetentionResult:
+    """On-day-N retention: users active exactly N days after their start day."""
+    start_event: Optional[str]
+    return_event: Optional[str]
+    days: List[int]
+    eligible: List[int]
+    retained: List[int]
+
+    @property
+    def rates(self) -> List[float]:
+        return [r / e if e else 0.0 for r, e in zip(self.retained, self.eligible)]
+
+
+@dataclass
+class CohortMatrix:
+    """Active users per start cohort (rows) and periods since start (columns)."""
+    period: str
+    labels: List[str]
+    sizes: np.ndarray
+    active: np.ndarray
+    observable: np.ndarray
+
+    @property
+    def rates(self) -> np.ndarray:
+        """Active share per cell; NaN where the period has not happened yet."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rates = self.active / self.sizes[:, None]
+        return np.where(self.observable & (self.sizes[:, None] > 0), rates, np.nan)
+
+
+_results: "OrderedDict[Tuple, object]" = OrderedDict()
+
+
+def _memo(table: EventTable, key: Tuple[Hashable, ...], compute: Callable[[], object]):
+    key = (table.dataset_hash, table.columns) + key
+    result = _results.get(key)
+    if result is None:
+        result = _results[key] = compute()
+        while len(_results) > MAX_CACHED_RESULTS:
+            _results.popitem(last=False)
+    else:
+        _results.move_to_end(key)
+    return result
+
+
+def clear_cache() -> None:
+    """Drop cached metric results."""
+    _results.clear()
+
+
+def _run_starts(sorted_users: np.ndarray) -> np.ndarray:
+    """Index of the first row of each user in a user-sorted array."""
+    if not len(sorted_users):
+        return np.empty(0, dtype=np.intp)
+    return np.flatnonzero(np.r_[True, sorted_users[1:] != sorted_users[:-1]])
+
+
+def _event_mask(table: EventTable, events: np.ndarray, name: Optional[str]) -> np.ndarray:
+    """Rows matching an event name (all rows when name is None)."""
+    if name is None:
+        return np.ones(len(events), dtype=bool)
+    code = table.event_code(name)
+    if code is None:
+        return np.zeros(len(events), dtype=bool)
+    return events == code
+
+
+def _first_time(table: EventTable, event_name: Optional[str]) -> np.ndarray:
+    """Per user, the time of their first matching event (_NEVER if none)."""
+    users, events, ts = table.sorted_by_user()
+    mask = _event_mask(table, events, event_name)
+    matched_users, matched_ts = users[mask], ts[mask]
+    starts = _run_starts(matched_users)
+    first = np.full(table.n_users, _NEVER, dtype=np.int64)
+    first[matched_users[starts]] = matched_ts[starts]
+    return first
+
+
+def funnel(table: EventTable, steps: Sequence[str], window_days: int = 30) -> FunnelResult:
+    """
+    Ordered funnel: users who did each step at or after the previous one,
+    within `window_days` of their first step.
+    """
+    steps = list(steps)
+    if not steps:
+        raise ValueError("A funnel needs at least one step")
+
+    def compute():
+        users, events, ts = table.sorted_by_user()
+        reached_at = _first_time(table, steps[0])
+        reached = reached_at != _NEVER
+        deadline = np.where(reached, reached_at + window_days * SECONDS_PER_DAY, -1)
+        counts = [int(reached.sum())]
+
+        for step in steps[1:]:
+            mask = _event_mask(table, events, step)
+            step_users, step_ts = users[mask], ts[mask]
+            ok = (step_ts >= reached_at[step_users]) & (step_ts <= deadline[step_users])
+            step_users, step_ts = step_users[ok], step_ts[ok]
+            starts = _run_starts(step_users)
+            reached_at = np.full(table.n_users, _NEVER, dtype=np.int64)
+            reached_at[step_users[starts]] = step_ts[starts]
+            counts.append(len(starts))
+
+        return FunnelResult(steps=steps, users=counts, window_days=window_days)
+
+    return _memo(table, ("funnel", tuple(steps), window_days), compute)
+
+
+def retention(
+    table: EventTable,
+    start_event: Optional[str] = None,
+    days: Sequence[int] = (1, 7, 30),
+    return_event: Optional[str] = None,
+) -> RetentionResult:
+    """
+    On-day-N retention.
+
+    A user's start day is the day of their first `start_event` (first event
+    of any kind when None). They count as retained on day N if they did
+    `return_event` (any event when None) on start day + N. Only users whose
+    start day + N is within the data are in the denominator.
+    """
+    days = sorted(set(int(d) for d in days))
+
+    def compute():
+        users, events, ts = table.sorted_by_user()
+        start_ts = _first_time(table, start_event)
+        has_start = start_ts != _NEVER
+        start_day = np.where(has_start, start_ts // SECONDS_PER_DAY, -1)
+        last_day = int(ts.max() // SECONDS_PER_DAY) if len(ts) else -1
+
+        mask = _event_mask(table, events, return_event)
+        active_users = users[mask]
+        offset = ts[mask] // SECONDS_PER_DAY - start_day[active_users]
+        offset[~has_start[active_users]] = -1
+
+        eligible, retained = [], []
+        for n in days:
+            mature = has_start & (start_day + n <= last_day)
+            hit = np.zeros(table.n_users, dtype=bool)
+            hit[active_users[offset == n]] = True
+            eligible.append(int(mature.sum()))
+            retained.append(int((hit & mature).sum()))
+
+        return RetentionResult(
+            start_event=start_event,
+            return_event=return_event,
+            days=days,
+            eligible=eligible,
+            retained=retained,
+        )
+
+    return _memo(table, ("retention", start_event, tuple(days), return_event), compute)
+
+
+def _period_index(ts: np.ndarray, period: str) -> np.ndarray:
+    day = ts // SECONDS_PER_DAY
+    if period == "day":
+        return day
+    if period == "week":
+        # Weeks start on Monday; 1970-01-01 was a Thursday
+        return (day + 3) // 7
+    return ts.astype("datetime64[s]").astype("datetime64[M]").astype(np.int64)
+
+
+def _period_label(index: int, period: str) -> str:
+    if period == "day":
+        return str(np.datetime64(index, "D"))
+    if period == "week":
+        return str(np.datetime64(index * 7 - 3, "D"))
+    return str(np.datetime64(index, "M"))
+
+
+def cohort_matrix(
+    table: EventTable,
+    start_event: Optional[str] = None,
+    period: str = "week",
+    periods: int = 8,
+) -> CohortMatrix:
+    """
+    Cohort activity matrix for the most recent `periods` cohorts.
+
+    Users join the cohort of the period of their first `start_event` (first
+    event when None). Cell (c, k) counts cohort c's users with any event k
+    periods after their start period.
+    """
+    if period not in PERIODS:
+        raise ValueError(f"period must be one of {PERIODS}, got '{period}'")
+    if periods < 1:
+        raise ValueError("periods must be at least 1")
+
+    def compute():
+        users, _, ts = table.sorted_by_user()
+        event_period = _period_index(ts, period)
+        last_period = int(event_period.max()) if len(ts) else 0
+        first_row = last_period - periods + 1
+
+        start_ts = _first_time(table, start_event)
+        has_start = start_ts != _NEVER
+        cohort = np.full(table.n_users, first_row - 1, dtype=np.int64)  # outside every row
+        cohort[has_start] = _period_index(start_ts[has_start], period)
+
+        row = cohort - first_row
+        in_rows = (row >= 0) & (row < periods)
+        sizes = np.bincount(row[in_rows], minlength=periods)
+
+        offset = event_period - cohort[users]
+        keep = in_rows[users] & (offset >= 0) & (offset < periods)
+        # One count per (user, offset), however many events the user had
+        pairs = np.unique(users[keep].astype(np.int64) * periods + offset[keep])
+        cells = row[pairs // periods] * periods + pairs % periods
+        active = np.bincount(cells, minlength=periods * periods).reshape(periods, periods)
+
+        grid = np.arange(periods)
+        observable = grid[:, None] + grid[None, :] <= periods - 1
+
+        return CohortMatrix(
+            period=period,
+            labels=[_period_label(first_row + r, period) for r in range(periods)],
+            sizes=sizes,
+            active=active,
+            observable=observable,
+        )
+
+    return _memo(table, ("cohorts", start_event, period, periods), compute)
@@ -0,0 +1,397 @@
+"""
+Streaming Dataset Profiler.
+
+Profiles a CSV or Parquet file in one pass over fixed-size row chunks, so
+memory depends on the chunk size and the number of columns, not the file
+size. Per column it keeps:
+
+- row and null counts
+- a HyperLogLog distinct count
+- min/max for numeric and timestamp columns (timestamps in UTC seconds)
+- a t-digest of numeric columns for quantiles
+- value counts for low-cardinality columns (dropped once a column has
+  more than MAX_TRACKED_VALUES distinct values)
+
+Duplicate keys are counted exactly from 64-bit row-key hashes while they
+fit in MAX_EXACT_KEYS; beyond that the count is estimated from a
+HyperLogLog of the keys.
+
+Large files can be profiled by several worker processes. Columns are
+split into groups and, for Parquet, row groups into slices; each worker
+profiles one (column group, row slice) part and the parent merges the
+per-column state, all of which is mergeable.
+
+Profiles of files in ANALYTICS_DATA_DIR are computed from the dataset
+registry's Arrow copy and cached by content hash.
+"""
+
+import math
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .events import file_hash, resolve_dataset_path, to_epoch_seconds
+from .registry import get_registry, is_arrow
+from .sketches import HyperLogLog, TDigest
+
+DEFAULT_CHUNK_ROWS = 100_000
+MAX_TRACKED_VALUES = 1_000
+MAX_EXACT_KEYS = 5_000_000
+MAX_CACHED_PROFILES = 16
+
+# profile_dataset uses worker processes only for files at least this large
+PROFILE_WORKERS = int(os.getenv("PROFILE_WORKERS", str(min(4, os.cpu_count() or 1))))
+PARALLEL_MIN_BYTES = int(os.getenv("PROFILE_PARALLEL_MIN_MB", "64")) * 1024 * 1024
+
+TIME_NAMES = ("time", "timestamp", "date", "ts")
+TIME_SUFFIXES = ("_at", "_time", "_timestamp", "_date", "_ts")
+
+
+def is_time_column(name: str, values: pd.Series) -> bool:
+    """Datetime dtype, or a name like occurred_at / event_time / signup_date."""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return True
+    if pd.api.types.is_bool_dtype(values):
+        return False
+    name = name.lower()
+    return name in TIME_NAMES or name.endswith(TIME_SUFFIXES)
+
+
+def _is_parquet(path: Path) -> bool:
+    return path.suffix.lower() in (".parquet", ".pq")
+
+
+def column_names(path: Path) -> List[str]:
+    """Column names of a CSV, Parquet or Arrow file, without reading its rows."""
+    if _is_parquet(path):
+        return pq.read_schema(path).names
+    if is_arrow(path):
+        with pa.memory_map(str(path)) as source:
+            return pa.ipc.open_file(source).schema.names
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def _batch_count(path: Path) -> Optional[int]:
+    """Row groups of a Parquet file or record batches of an Arrow file (None for CSV)."""
+    if _is_parquet(path):
+        return pq.ParquetFile(path).num_row_groups
+    if is_arrow(path):
+        with pa.memory_map(str(path)) as source:
+            return pa.ipc.open_file(source).num_record_batches
+    return None
+
+
+def iter_chunks(
+    path: Path,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    columns: Optional[List[str]] = None,
+    row_groups: Optional[List[int]] = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Read a CSV, Parquet or Arrow file as DataFrames of at most `chunk_rows` rows.
+
+    `row_groups` selects Parquet row groups or Arrow record batches.
+    """
+    if _is_parquet(path):
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=columns, row_groups=row_groups):
+            yield batch.to_pandas()
+    elif is_arrow(path):
+        with pa.memory_map(str(path)) as source:
+            reader = pa.ipc.open_file(source)
+            for index in range(reader.num_record_batches) if row_groups is None else row_groups:
+                batch = reader.get_batch(index)
+                if columns is not None:
+                    batch = batch.select(columns)
+                for offset in range(0, batch.num_rows, chunk_rows):
+                    yield batch.slice(offset, chunk_rows).to_pandas(date_as_object=False)
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_rows, usecols=columns)
+
+
+@dataclass
+class ColumnProfile:
+    """One column's running statistics."""
+    name: str
+    rows: int = 0
+    nulls: int = 0
+    is_time: bool = False
+    unparsed: int = 0
+    minimum: Optional[float] = None
+    maximum: Optional[float] = None
+    distinct: HyperLogLog = field(default_factory=HyperLogLog, repr=False)
+    quantiles: TDigest = field(default_factory=TDigest, repr=False)
+    values: Optional[Dict[str, int]] = field(default_factory=dict, repr=False)
+
+    @property
+    def null_rate(self) -> float:
+        return self.nulls / self.rows if self.rows else 0.0
+
+    @property
+    def distinct_count(self) -> int:
+        return self.distinct.estimate()
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimated quantile of a numeric column (None for other columns)."""
+        return self.quantiles.quantile(q)
+
+    def top_values(self, k: int = 10) -> Optional[List[tuple]]:
+        """Most frequent values with counts, or None for high-cardinality columns."""
+        if self.values is None:
+            return None
+        return sorted(self.values.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+    def _extend_range(self, low, high) -> None:
+        self.minimum = low if self.minimum is None else min(self.minimum, low)
+        self.maximum = high if self.maximum is None else max(self.maximum, high)
+
+    def _count_values(self, counts) -> None:
+        if self.values is None:
+            return
+        for value, count in counts:
+            self.values[value] = self.values.get(value, 0) + int(count)
+        if len(self.values) > MAX_TRACKED_VALUES:
+            self.values = None
+
+    def update(self, values: pd.Series) -> None:
+        self.rows += len(values)
+        present = values.dropna()
+        self.nulls += len(values) - len(present)
+        if present.empty:
+            return
+        self.distinct.add(present)
+
+        if self.is_time:
+            seconds = to_epoch_seconds(present)
+            parsed = seconds[seconds >= 0]
+            self.unparsed += len(seconds) - len(parsed)
+            if len(parsed):
+                self._extend_range(int(parsed.min()), int(parsed.max()))
+            return
+        if pd.api.types.is_numeric_dtype(present) and not pd.api.types.is_bool_dtype(present):
+            numbers = present.to_numpy(dtype=np.float64)
+            self._extend_range(float(numbers.min()), float(numbers.max()))
+            self.quantiles.add(numbers)
+            return
+        self._count_values(present.astype(str).value_counts().items())
+
+    def merge(self, other: "ColumnProfile") -> "ColumnProfile":
+        """Fold in the same column's profile from another part of the file."""
+        self.rows += other.rows
+        self.nulls += other.nulls
+        self.unparsed += other.unparsed
+        if other.minimum is not None:
+            self._extend_range(other.minimum, other.maximum)
+        self.distinct.merge(other.distinct)
+        self.quantiles.merge(other.quantiles)
+        if other.values is None:
+            self.values = None
+        else:
+            self._count_values(other.values.items())
+        return self
+
+
+@dataclass
+class DatasetProfile:
+    """Result of profiling a file."""
+    rows: int
+    chunks: int
+    columns: Dict[str, ColumnProfile]
+    key_columns: List[str]
+    duplicate_keys: Optional[int] = None
+    duplicates_exact: bool = True
+    workers: int = 1
+
+
+class _KeyCounter:
+    """Counts duplicate row keys: exact while the hashes fit, estimated after."""
+
+    def __init__(self):
+        self.rows = 0
+        self.sketch = HyperLogLog()
+        self._hashes: Optional[List[np.ndarray]] = []
+        self._stored = 0
+
+    def _keep(self, hashes: List[np.ndarray], count: int) -> None:
+        if self._hashes is None:
+            return
+        self._stored += count
+        if self._stored > MAX_EXACT_KEYS:
+            self._hashes = None
+        else:
+            self._hashes.extend(hashes)
+
+    def update(self, keys: pd.DataFrame) -> None:
+        hashes = pd.util.hash_pandas_object(keys, index=False).to_numpy()
+        self.rows += len(hashes)
+        self.sketch.add_hashes(hashes)
+        self._keep([hashes], len(hashes))
+
+    def merge(self, other: "_KeyCounter") -> "_KeyCounter":
+        self.rows += other.rows
+        self.sketch.merge(other.sketch)
+        if other._hashes is None:
+            self._hashes = None
+        else:
+            self._keep(other._hashes, other._stored)
+        return self
+
+    def duplicates(self) -> Tuple[int, bool]:
+        """Duplicate rows beyond the first per key, and whether the count is exact."""
+        if self._hashes is not None:
+            distinct = len(np.unique(np.concatenate(self._hashes))) if self._hashes else 0
+            return self.rows - distinct, True
+        return max(0, self.rows - self.sketch.estimate()), False
+
+
+def _profile_part(
+    path: Path,
+    columns: List[str],
+    key_columns: List[str],
+    row_groups: Optional[List[int]],
+    chunk_rows: int,
+) -> Tuple[Dict[str, ColumnProfile], Optional[_KeyCounter], int, int]:
+    """Profile some columns (and row groups) of a file; runs in a worker process."""
+    profiles: Dict[str, ColumnProfile] = {}
+    keys = _KeyCounter() if key_columns else None
+    rows = chunks = 0
+    for chunk in iter_chunks(path, chunk_rows, list(dict.fromkeys(columns + key_columns)), row_groups):
+        if not profiles:
+            profiles = {name: ColumnProfile(name, is_time=is_time_column(name, chunk[name])) for name in columns}
+        for name, profile in profiles.items():
+            profile.update(chunk[name])
+        if keys is not None:
+            keys.update(chunk[key_columns])
+        rows += len(chunk)
+        chunks += 1
+    return profiles or {name: ColumnProfile(name) for name in columns}, keys, rows, chunks
+
+
+def _plan(path: Path, columns: List[str], workers: int) -> List[Tuple[List[str], Optional[List[int]]]]:
+    """Split a file into (column group, row groups) parts, about one per worker."""
+    groups = max(1, min(workers, len(columns)))
+    column_groups = [columns[i::groups] for i in range(groups)]
+    row_slices: List[Optional[List[int]]] = [None]
+    row_groups = _batch_count(path)
+    if row_groups is not None:
+        slices = min(math.ceil(workers / groups), row_groups)
+        if slices > 1:
+            row_slices = [part.tolist() for part in np.array_split(np.arange(row_groups), slices)]
+    return [(group, row_slice) for row_slice in row_slices for group in column_groups]
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_workers = 0
+
+
+def _get_executor(workers: int) -> ProcessPoolExecutor:
+    """Process pool kept between calls, so worker start-up is paid once."""
+    global _executor, _executor_workers
+    if _executor is None or _executor_workers != workers:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        # spawn, not fork: the server process has threads running
+        _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        _executor_workers = workers
+    return _executor
+
+
+def profile_file(
+    path: Path,
+    key_columns: Sequence[str] = (),
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    workers: int = 1,
+) -> DatasetProfile:
+    """
+    Profile a CSV, Parquet or Arrow file in one streaming pass.
+
+    Args:
+        path: File to profile
+        key_columns: Columns that should identify a row uniquely (e.g. event_id);
+            duplicates of this key are counted
+        chunk_rows: Rows held in memory at a time (per worker)
+        workers: Worker processes. Parquet and Arrow files are split by columns
+            and row groups; CSV files only by columns, since each worker still
+            parses every line
+
+    Raises:
+        ValueError: A key column is not in the file
+    """
+    key_columns = list(key_columns)
+    columns = column_names(path)
+    missing = [c for c in key_columns if c not in columns]
+    if missing:
+        raise ValueError(f"Key columns {missing} not found; available columns: {columns}")
+
+    parts = _plan(path, columns, workers)
+    # The first column group of each row slice also counts rows and keys
+    first_group = parts[0][0]
+    jobs = [
+        (path, group, key_columns if group is first_group else [], row_slice, chunk_rows)
+        for group, row_slice in parts
+    ]
+    if workers > 1 and len(jobs) > 1:
+        results = list(_get_executor(workers).map(_profile_part, *zip(*jobs)))
+    else:
+        results = [_profile_part(*job) for job in jobs]
+
+    merged: Dict[str, ColumnProfile] = {}
+    keys = _KeyCounter() if key_columns else None
+    rows = chunks = 0
+    for (group, _), (profiles, part_keys, part_rows, part_chunks) in zip(parts, results):
+        for name, profile in profiles.items():
+            merged[name] = merged[name].merge(profile) if name in merged else profile
+        if group is first_group:
+            rows += part_rows
+            chunks += part_chunks
+            if keys is not None:
+                keys.merge(part_keys)
+
+    result = DatasetProfile(
+        rows=rows,
+        chunks=chunks,
+        columns={name: merged[name] for name in columns},
+        key_columns=key_columns,
+        workers=min(workers, len(jobs)),
+    )
+    if keys is not None:
+        result.duplicate_keys, result.duplicates_exact = keys.duplicates()
+    return result
+
+
+_profiles: "OrderedDict[Tuple, DatasetProfile]" = OrderedDict()
+
+
+def profile_dataset(dataset: str, key_columns: Sequence[str] = (), chunk_rows: int = DEFAULT_CHUNK_ROWS) -> DatasetProfile:
+    """
+    Profile a dataset in ANALYTICS_DATA_DIR, reusing the profile if the content is unchanged.
+
+    Reads the registry's Arrow copy of the file. Files of
+    PROFILE_PARALLEL_MIN_MB or more are profiled by PROFILE_WORKERS processes.
+
+    Raises:
+        DatasetNotFound: The dataset is not a file in the data directory
+        ValueError: A key column is not in the file, or the file could not be parsed
+    """
+    path = resolve_dataset_path(dataset)
+    digest = file_hash(path)
+    key = (digest, tuple(key_columns))
+    profile = _profiles.get(key)
+    if profile is not None:
+        _profiles.move_to_end(key)
+        return profile
+    workers = PROFILE_WORKERS if path.stat().st_size >= PARALLEL_MIN_BYTES else 1
+    # Pinned so eviction cannot remove the file while worker processes open it
+    with get_registry().pinned(path, digest) as artifact:
+        profile = _profiles[key] = profile_file(artifact, key_columns, chunk_rows, workers)
+    while len(_profiles) > MAX_CACHED_PROFILES:
+        _profiles.popitem(last=False)
+    return profile
@@ -0,0 +1,234 @@
+"""
+Dataset Registry.
+
+Converts each dataset file once into an uncompressed Arrow IPC file in
+ANALYTICS_CACHE_DIR/datasets, named by content hash, and serves it back
+memory-mapped. Event loading, profiling and the SQL sandbox read these
+artifacts instead of re-parsing the CSV on every tool call: opening one
+only reads its footer, and column buffers are views of the mapped file,
+so pages are read from disk (or the page cache) only when touched.
+
+Conversion streams record batches from the source file, so it never holds
+the whole file in memory. CSV types are inferred from the first block;
+if a later block does not fit (an integer column with "1.5" further down,
+a timestamp column with a bad value), the column is widened (int to
+float, anything else to string) and the conversion restarts.
+
+Everything cached in the registry's directory (these artifacts and the
+SQL sandbox's DuckDB databases) shares one `max_bytes` budget: files are
+evicted least recently used first once the total passes it. Callers pin an
+artifact while they open or read it by name, so eviction cannot remove it
+in between. Each file converts behind its own lock, so unrelated
+conversions run in parallel.
+"""
+
+import os
+import re
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+ANALYTICS_CACHE_DIR = Path(os.getenv("ANALYTICS_CACHE_DIR", Path(tempfile.gettempdir()) / "pmm_agent_analytics"))
+
+ARTIFACT_SUFFIX = ".arrow"
+DATABASE_SUFFIX = ".duckdb"  # SQL sandbox databases, kept in the same directory and budget
+CACHE_SUFFIXES = (ARTIFACT_SUFFIX, DATABASE_SUFFIX)
+MAX_CONVERT_ATTEMPTS = 3
+BATCH_ROWS = 65_536
+CSV_BLOCK_BYTES = 4 << 20
+
+_CSV_COLUMN_ERROR = re.compile(r"In CSV column #(\d+)")
+
+
+def is_arrow(path: Path) -> bool:
+    return path.suffix.lower() in (ARTIFACT_SUFFIX, ".feather", ".ipc")
+
+
+def open_arrow(path: Path) -> pa.Table:
+    """Memory-map an Arrow IPC file as a Table without reading its buffers."""
+    with pa.memory_map(str(path)) as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def _widen(column_type: pa.DataType) -> pa.DataType:
+    return pa.float64() if pa.types.is_integer(column_type) else pa.string()
+
+
+Progress = Callable[[float], None]
+
+
+def _write_csv(path: Path, target: Path, progress: Progress) -> None:
+    column_types: Dict[str, pa.DataType] = {}
+    size = max(path.stat().st_size, 1)
+    while True:
+        with open(path, "rb") as source:
+            reader = pa_csv.open_csv(
+                source,
+                read_options=pa_csv.ReadOptions(block_size=CSV_BLOCK_BYTES),
+                convert_options=pa_csv.ConvertOptions(column_types=column_types, strings_can_be_null=True),
+            )
+            try:
+                with pa.ipc.new_file(str(target), reader.schema) as writer:
+                    for batch in reader:
+                        writer.write_batch(batch)
+                        progress(min(source.tell() / size, 1.0))
+                return
+            except pa.ArrowInvalid as e:
+                match = _CSV_COLUMN_ERROR.search(str(e))
+                field = reader.schema.field(int(match.group(1))) if match else None
+                if field is None or field.type == pa.string():
+                    raise
+                column_types[field.name] = _widen(field.type)
+
+
+def _write_parquet(path: Path, target: Path, progress: Progress) -> None:
+    source = pq.ParquetFile(path)
+    rows = max(source.metadata.num_rows, 1)
+    written = 0
+    with pa.ipc.new_file(str(target), source.schema_arrow) as writer:
+        for batch in source.iter_batches(batch_size=BATCH_ROWS):
+            writer.write_batch(batch)
+            written += batch.num_rows
+            progress(written / rows)
+
+
+class DatasetRegistry:
+    """Content-addressed Arrow copies of dataset files, evicted by total size."""
+
+    def __init__(self, root: Optional[Path] = None, max_bytes: int = 2 << 30):
+        """
+        Args:
+            root: Cache directory (default ANALYTICS_CACHE_DIR/datasets)
+            max_bytes: Total size of the cached files to keep on disk
+        """
+        self.root = Path(root) if root is not None else ANALYTICS_CACHE_DIR / "datasets"
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()  # guards eviction, pins and _converting
+        self._converting: Dict[str, threading.Lock] = {}  # digest -> lock held while it converts
+        self._pins: Dict[Path, int] = {}
+
+    def path(self, digest: str) -> Path:
+        return self.root / f"{digest}{ARTIFACT_SUFFIX}"
+
+    def _pin(self, target: Path) -> bool:
+        """Mark the artifact recently used and protect it from eviction, if it exists."""
+        with self._lock:
+            try:
+                os.utime(target)
+            except FileNotFoundError:
+                return False
+            self._pins[target] = self._pins.get(target, 0) + 1
+            return True
+
+    def _unpin(self, target: Path) -> None:
+        with self._lock:
+            self._pins[target] -= 1
+            if not self._pins[target]:
+                del self._pins[target]
+
+    def _convert(self, source: Path, digest: str, progress: Optional[Progress]) -> None:
+        target = self.path(digest)
+        with self._lock:
+            converting = self._converting.setdefault(digest, threading.Lock())
+        # One conversion per file; callers waiting for the same file find it done
+        try:
+            with converting:
+                if target.exists():
+                    return
+                self.root.mkdir(parents=True, exist_ok=True)
+                partial = target.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+                write = _write_parquet if source.suffix.lower() in (".parquet", ".pq") else _write_csv
+                try:
+                    write(source, partial, progress or (lambda fraction: None))
+                    os.replace(partial, target)
+                except (pa.ArrowException, OSError) as e:
+                    raise ValueError(f"Could not read {source.name}: {e}")
+                finally:
+                    partial.unlink(missing_ok=True)
+        finally:
+            with self._lock:
+                self._converting.pop(digest, None)
+        self.evict(keep=target)
+
+    @contextmanager
+    def pinned(self, source: Path, digest: str, progress: Optional[Progress] = None) -> Iterator[Path]:
+        """
+        The Arrow artifact for a file with this content hash, kept on disk for the block.
+
+        The file is converted on first use, or again if it was evicted
+        meanwhile. `progress` is called with the fraction converted (0 to 1)
+        after each batch.
+
+        Raises:
+            ValueError: The file could not be parsed as CSV or Parquet
+        """
+        target = self.path(digest)
+        for _ in range(MAX_CONVERT_ATTEMPTS):
+            if self._pin(target):
+                break
+            self._convert(source, digest, progress)
+        else:
+            raise ValueError(f"{source.name} was evicted as soon as it converted; raise DATASET_CACHE_MAX_MB")
+        try:
+            yield target
+        finally:
+            self._unpin(target)
+
+    def artifact(self, source: Path, digest: str, progress: Optional[Progress] = None) -> Path:
+        """
+        The artifact's path (see `pinned`). It may be evicted once this returns;
+        hold `pinned` while reading the file by name.
+        """
+        with self.pinned(source, digest, progress) as target:
+            return target
+
+    def table(self, source: Path, digest: str, progress: Optional[Progress] = None) -> pa.Table:
+        """Memory-mapped table of a file's artifact (see `pinned`)."""
+        with self.pinned(source, digest, progress) as target:
+            return open_arrow(target)
+
+    def artifacts(self) -> List[Path]:
+        """Cached files on disk (artifacts and sandbox databases), least recently used first."""
+        if not self.root.is_dir():
+            return []
+        files = [p for suffix in CACHE_SUFFIXES for p in self.root.glob(f"*{suffix}")]
+        return sorted(files, key=lambda p: p.stat().st_mtime_ns)
+
+    def evict(self, keep: Optional[Path] = None) -> List[Path]:
+        """
+        Delete least recently used cached files until the total fits in max_bytes.
+
+        Pinned artifacts and `keep` are skipped. Tables and databases already
+        open stay valid: their mapping outlives the file name.
+        """
+        removed = []
+        with self._lock:
+            cached = self.artifacts()
+            total = sum(p.stat().st_size for p in cached)
+            for path in cached:
+                if total <= self.max_bytes:
+                    break
+                if path == keep or path in self._pins:
+                    continue
+                total -= path.stat().st_size
+                path.unlink(missing_ok=True)
+                removed.append(path)
+        return removed
+
+
+_registry: Optional[DatasetRegistry] = None
+
+
+def get_registry() -> DatasetRegistry:
+    """The process-wide registry, configured from the environment on first use."""
+    global _registry
+    if _registry is None:
+        _registry = DatasetRegistry(max_bytes=int(os.getenv("DATASET_CACHE_MAX_MB", "2048")) * 1024 * 1024)
+        _registry.evict()  # the budget may have shrunk since the files were written
+    return _registry
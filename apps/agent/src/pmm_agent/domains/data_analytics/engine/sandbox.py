@@ -0,0 +1,402 @@
+"""
+SQL Sandbox.
+
+Runs a single SELECT (such as a `draft_sql_query_pack` template) against
+an event file with an embedded DuckDB engine.
+
+Each dataset is loaded once, from the registry's Arrow copy, into a
+DuckDB database file next to it, named by content hash, as the table
+`events`; the registry counts these files in its size budget. Queries
+then run on connections that are:
+
+- read-only: the database is attached read-only, and only single SELECT
+  statements are accepted
+- closed to the file system: external access is disabled and the
+  configuration is locked, so a query cannot read other files or undo this
+- bounded: a timer interrupts queries after `timeout_seconds`, and at most
+  `max_rows` rows are fetched
+
+Connections are pooled per dataset. Each pooled connection keeps its own
+prepared statements, and results are cached, so a repeated question
+skips parsing and planning or the query altogether.
+
+Datasets load outside the sandbox-wide lock, one load per content hash,
+so a cold dataset does not hold up queries on loaded ones. At most
+`max_datasets` pools stay open; the least recently used one, or the pool
+of a file that has since changed, is closed once its queries finish, and
+its database file is deleted.
+"""
+
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from datetime import date
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import duckdb
+
+from .events import file_hash, resolve_dataset_path
+from .registry import get_registry
+
+TABLE_NAME = "events"
+
+SANDBOX_CONFIG = {"enable_external_access": False, "lock_configuration": True}
+
+MAX_PREPARED_PER_CONNECTION = 64
+MAX_CACHED_RESULTS = 128
+MAX_ACQUIRE_ATTEMPTS = 3
+
+
+class SandboxError(Exception):
+    """The query could not be run in the sandbox."""
+
+
+class QueryRejected(SandboxError):
+    """The SQL is not a single read-only statement."""
+
+
+class QueryTimeout(SandboxError):
+    """The query ran longer than the sandbox allows."""
+
+
+@dataclass
+class QueryResult:
+    """Preview of a query's result."""
+    columns: List[str]
+    rows: List[Tuple[Any, ...]]
+    truncated: bool
+    elapsed_ms: float
+    plan: Optional[str] = None
+    cached: bool = False
+
+
+def single_statement(sql: str) -> str:
+    """
+    The SQL as one read-only statement, without a trailing semicolon.
+
+    Raises:
+        QueryRejected: Empty, multiple or non-SELECT statements
+    """
+    try:
+        statements = duckdb.extract_statements(sql)
+    except duckdb.Error as e:
+        raise QueryRejected(f"SQL does not parse: {e}")
+    if len(statements) != 1:
+        raise QueryRejected(f"Expected one statement, got {len(statements)}")
+    statement = statements[0]
+    if statement.type != duckdb.StatementType.SELECT:
+        raise QueryRejected(f"Only SELECT queries can run in the sandbox, got {statement.type.name}")
+    return statement.query.strip()
+
+
+def _fetch_rows(result: duckdb.DuckDBPyConnection, limit: int) -> List[Tuple[Any, ...]]:
+    """
+    Up to `limit` rows, fetched as Arrow batches.
+
+    Arrow converts TIMESTAMPTZ columns with the standard library's zoneinfo,
+    where DuckDB's own row conversion would require pytz.
+    """
+    # to_arrow_reader replaces fetch_record_batch in newer DuckDB releases
+    reader = getattr(result, "to_arrow_reader", result.fetch_record_batch)(limit)
+    rows: List[Tuple[Any, ...]] = []
+    for batch in reader:
+        rows.extend(zip(*(column.to_pylist() for column in batch.columns)))
+        if len(rows) >= limit:
+            break
+    return rows[:limit]
+
+
+class _PooledConnection:
+    """A sandboxed cursor and the statements it has prepared."""
+
+    def __init__(self, cursor: duckdb.DuckDBPyConnection):
+        self.cursor = cursor
+        self._prepared: "OrderedDict[str, str]" = OrderedDict()
+        self._next_id = 0
+
+    def execute(self, query: str) -> duckdb.DuckDBPyConnection:
+        """Execute through a prepared statement, preparing it on first use."""
+        name = self._prepared.get(query)
+        if name is None:
+            name = f"q{self._next_id}"
+            self._next_id += 1
+            self.cursor.execute(f"PREPARE {name} AS {query}")
+            self._prepared[query] = name
+            if len(self._prepared) > MAX_PREPARED_PER_CONNECTION:
+                _, evicted = self._prepared.popitem(last=False)
+                self.cursor.execute(f"DEALLOCATE {evicted}")
+        else:
+            self._prepared.move_to_end(query)
+        return self.cursor.execute(f"EXECUTE {name}")
+
+    def prepared_count(self) -> int:
+        return len(self._prepared)
+
+
+class _PoolRetired(Exception):
+    """The pool was retired before a connection could be taken from it."""
+
+
+class ConnectionPool:
+    """Read-only connections to one dataset's database."""
+
+    def __init__(self, database: Path, size: int, on_close: Optional[Callable[["ConnectionPool"], None]] = None):
+        """
+        Args:
+            database: DuckDB file to open read-only
+            size: Number of pooled connections
+            on_close: Called once the pool has been retired and closed
+        """
+        self.database = database
+        self.on_close = on_close
+        self._root = duckdb.connect(str(database), read_only=True, config=SANDBOX_CONFIG)
+        self._idle: "queue.LifoQueue[_PooledConnection]" = queue.LifoQueue()
+        for _ in range(size):
+            self._idle.put(_PooledConnection(self._root.cursor()))
+        self._lock = threading.Lock()
+        self._users = 0  # queries holding or waiting for a connection
+        self.retired = False
+        self.closed = False
+
+    def acquire(self, timeout: float) -> _PooledConnection:
+        with self._lock:
+            if self.retired:
+                raise _PoolRetired()
+            self._users += 1
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            self._leave()
+            raise QueryTimeout(f"No free connection for {self.database.stem} within {timeout:.0f}s")
+
+    def release(self, connection: _PooledConnection) -> None:
+        self._idle.put(connection)
+        self._leave()
+
+    def retire(self) -> None:
+        """Take no new queries and close once the running ones finish."""
+        with self._lock:
+            self.retired = True
+            idle = self._users == 0
+        if idle:
+            self._close()
+
+    def _leave(self) -> None:
+        with self._lock:
+            self._users -= 1
+            idle = self.retired and self._users == 0
+        if idle:
+            self._close()
+
+    def _close(self) -> None:
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+        while not self._idle.empty():
+            self._idle.get_nowait().cursor.close()
+        self._root.close()
+        if self.on_close is not None:
+            self.on_close(self)
+
+
+class SqlSandbox:
+    """Loads datasets into DuckDB and runs bounded read-only queries on them."""
+
+    def __init__(
+        self,
+        cache_dir: Optional[Path] = None,
+        pool_size: int = 4,
+        timeout_seconds: float = 10.0,
+        max_rows: int = 1000,
+        max_datasets: int = 8,
+    ):
+        """
+        Args:
+            cache_dir: Directory for the per-dataset DuckDB files (default: the registry's)
+            pool_size: Connections per dataset (concurrent queries on it)
+            timeout_seconds: Queries running longer are interrupted
+            max_rows: Most rows a query may return
+            max_datasets: Datasets kept loaded (pools open, database files on disk)
+        """
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else get_registry().root
+        self.pool_size = pool_size
+        self.timeout_seconds = timeout_seconds
+        self.max_rows = max_rows
+        self.max_datasets = max_datasets
+        self._pools: "OrderedDict[str, ConnectionPool]" = OrderedDict()  # hash -> pool, least recently used first
+        self._datasets: Dict[str, str] = {}  # dataset -> hash of its loaded version
+        self._loading: Dict[str, threading.Lock] = {}  # hash -> lock held while it loads
+        self._results: "OrderedDict[Tuple, QueryResult]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _build_database(self, path: Path, digest: str) -> Path:
+        database = self.cache_dir / f"{digest}.duckdb"
+        if database.exists():
+            return database
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        partial = database.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            # DuckDB scans the registry's memory-mapped Arrow copy without re-parsing the file
+            source = get_registry().table(path, digest)
+            with duckdb.connect(str(partial)) as writer:
+                writer.register("source", source)
+                writer.execute(f"CREATE TABLE {TABLE_NAME} AS SELECT * FROM source")
+            os.replace(partial, database)
+            get_registry().evict(keep=database)
+        except (duckdb.Error, ValueError) as e:
+            raise SandboxError(f"Could not load {path.name}: {e}")
+        finally:
+            partial.unlink(missing_ok=True)
+        return database
+
+    def _use_version(self, dataset: str, digest: str) -> List[ConnectionPool]:
+        """
+        Record the dataset's loaded version, marking its pool recently used.
+
+        Returns the pool of the version it replaces, if no other dataset
+        uses it, for the caller to retire once _lock (held here) is released.
+        """
+        self._pools.move_to_end(digest)
+        previous = self._datasets.get(dataset)
+        self._datasets[dataset] = digest
+        if previous is None or previous == digest or previous in self._datasets.values():
+            return []
+        stale = self._pools.pop(previous, None)
+        return [stale] if stale is not None else []
+
+    def _pool_closed(self, pool: ConnectionPool) -> None:
+        """Delete a closed pool's database file unless the same content was loaded again."""
+        with self._lock:
+            if pool.database.stem not in self._pools:
+                pool.database.unlink(missing_ok=True)
+
+    def pool(self, dataset: str) -> Tuple[str, ConnectionPool]:
+        """
+        The dataset's content hash and connection pool, loading it if new or changed.
+
+        Raises:
+            DatasetNotFound: The dataset is not a file in the data directory
+            SandboxError: The file could not be loaded
+        """
+        path = resolve_dataset_path(dataset)
+        digest = file_hash(path)
+        retired: List[ConnectionPool] = []
+        try:
+            with self._lock:
+                pool = self._pools.get(digest)
+                if pool is not None:
+                    retired = self._use_version(dataset, digest)
+                    return digest, pool
+                loading = self._loading.setdefault(digest, threading.Lock())
+
+            # Only callers of this content wait for its load
+            with loading:
+                with self._lock:
+                    pool = self._pools.get(digest)
+                    if pool is not None:
+                        retired = self._use_version(dataset, digest)
+                        return digest, pool
+                try:
+                    pool = ConnectionPool(self._build_database(path, digest), self.pool_size, self._pool_closed)
+                except duckdb.Error as e:
+                    raise SandboxError(f"Could not open {path.name}: {e}")
+                finally:
+                    with self._lock:
+                        self._loading.pop(digest, None)
+                with self._lock:
+                    self._pools[digest] = pool
+                    retired = self._use_version(dataset, digest)
+                    while len(self._pools) > self.max_datasets:
+                        evicted_digest, evicted_pool = self._pools.popitem(last=False)
+                        for name in [name for name, loaded in self._datasets.items() if loaded == evicted_digest]:
+                            del self._datasets[name]
+                        retired.append(evicted_pool)
+            return digest, pool
+        finally:
+            for stale in retired:
+                stale.retire()
+
+    def _execute(self, connection: _PooledConnection, query: str, max_rows: int) -> Tuple[List[str], List[tuple], bool]:
+        timer = threading.Timer(self.timeout_seconds, connection.cursor.interrupt)
+        timer.start()
+        try:
+            result = connection.execute(query)
+            columns = [column[0] for column in result.description]
+            rows = _fetch_rows(result, max_rows + 1)
+        except duckdb.InterruptException:
+            raise QueryTimeout(f"Query exceeded {self.timeout_seconds:g}s and was stopped")
+        except duckdb.Error as e:
+            raise SandboxError(str(e))
+        finally:
+            timer.cancel()
+        return columns, rows[:max_rows], len(rows) > max_rows
+
+    def run(self, dataset: str, sql: str, max_rows: int = 50, explain: bool = True) -> QueryResult:
+        """
+        Run one SELECT against the dataset's `events` table.
+
+        Raises:
+            DatasetNotFound: The dataset is not a file in the data directory
+            QueryRejected: The SQL is not a single read-only statement
+            QueryTimeout: The query or the wait for a connection took too long
+            SandboxError: DuckDB reported an error
+        """
+        query = single_statement(sql)
+        max_rows = max(1, min(max_rows, self.max_rows))
+        digest, pool = self.pool(dataset)
+
+        # Queries may use CURRENT_DATE, so cached results last one day
+        key = (digest, query, max_rows, explain, date.today())
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None:
+                self._results.move_to_end(key)
+                return replace(cached, cached=True)
+
+        # A pool evicted between lookup and acquire takes no new queries: look it up again
+        for attempt in range(MAX_ACQUIRE_ATTEMPTS):
+            try:
+                connection = pool.acquire(self.timeout_seconds)
+                break
+            except _PoolRetired:
+                if attempt == MAX_ACQUIRE_ATTEMPTS - 1:
+                    raise SandboxError(f"{dataset} was unloaded while the query waited; try again")
+                digest, pool = self.pool(dataset)
+        try:
+            started = time.perf_counter()
+            columns, rows, truncated = self._execute(connection, query, max_rows)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            plan = None
+            if explain:
+                plan_rows = connection.cursor.execute(f"EXPLAIN {query}").fetchall()
+                plan = "\n".join(row[1] for row in plan_rows)
+        finally:
+            pool.release(connection)
+
+        result = QueryResult(columns, rows, truncated, elapsed_ms, plan)
+        with self._lock:
+            self._results[key] = result
+            while len(self._results) > MAX_CACHED_RESULTS:
+                self._results.popitem(last=False)
+        return result
+
+
+_sandbox: Optional[SqlSandbox] = None
+
+
+def get_sandbox() -> SqlSandbox:
+    """The process-wide sandbox, configured from the environment on first use."""
+    global _sandbox
+    if _sandbox is None:
+        _sandbox = SqlSandbox(
+            pool_size=int(os.getenv("SQL_SANDBOX_POOL_SIZE", "4")),
+            timeout_seconds=float(os.getenv("SQL_SANDBOX_TIMEOUT_SECONDS", "10")),
+            max_rows=int(os.getenv("SQL_SANDBOX_MAX_ROWS", "1000")),
+            max_datasets=int(os.getenv("SQL_SANDBOX_MAX_DATASETS", "8")),
+        )
+    return _sandbox
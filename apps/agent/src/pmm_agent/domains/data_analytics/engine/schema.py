@@ -0,0 +1,233 @@
+"""
+Schema Inference.
+
+Describes a dataset compactly enough to pass to the planning tools in
+place of a pasted table description:
+
+- column kinds: id, timestamp, category, numeric, boolean or text
+- grain candidates: columns (or pairs) that identify a row
+- join keys: id columns, and which of them several datasets share
+
+Inference reads a random sample of SAMPLE_ROWS rows (seeded, so the same
+file always gives the same schema) from the dataset registry's
+memory-mapped Arrow copy, so it costs about the same for any file size.
+Results are cached by content hash.
+"""
+
+import itertools
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from .events import file_hash, parse_iso_strings, resolve_dataset_path, to_epoch_seconds
+from .profile import is_time_column
+from .registry import get_registry
+
+SAMPLE_ROWS = 50_000
+MAX_CACHED_SCHEMAS = 32
+MAX_CATEGORY_VALUES = 50
+MAX_GRAIN_CANDIDATES = 3
+
+ID_NAMES = ("id", "uuid", "key")
+ID_SUFFIXES = ("_id", "_uuid", "_key")
+
+
+@dataclass
+class ColumnSchema:
+    """Inferred kind and summary of one column, from the sample."""
+    name: str
+    kind: str  # id | timestamp | category | numeric | boolean | text
+    arrow_type: str
+    null_rate: float
+    distinct: int
+    values: List[str] = field(default_factory=list)  # categories, most frequent first
+    minimum: Optional[float] = None
+    maximum: Optional[float] = None
+
+    def describe(self) -> str:
+        nulls = f", {100 * self.null_rate:.0f}% null" if self.null_rate >= 0.005 else ""
+        if self.kind == "category":
+            shown = ", ".join(self.values[:8]) + (", …" if len(self.values) > 8 else "")
+            return f"category ({self.distinct} values: {shown}){nulls}"
+        if self.kind == "timestamp" and self.minimum is not None:
+            first, last = (datetime.fromtimestamp(v, timezone.utc).strftime("%Y-%m-%d") for v in (self.minimum, self.maximum))
+            return f"timestamp ({first} to {last}){nulls}"
+        if self.kind == "numeric" and self.minimum is not None:
+            return f"numeric {self.arrow_type} ({self.minimum:,.6g} to {self.maximum:,.6g}){nulls}"
+        if self.kind == "id":
+            return f"id {self.arrow_type} (~{self.distinct:,} distinct in sample){nulls}"
+        return f"{self.kind} {self.arrow_type}{nulls}"
+
+
+@dataclass
+class DatasetSchema:
+    """Inferred schema of a dataset."""
+    dataset: str
+    dataset_hash: str
+    rows: int
+    sampled: int
+    columns: Dict[str, ColumnSchema]
+    grain: List[Tuple[str, ...]]
+
+    @property
+    def join_keys(self) -> List[str]:
+        return [c.name for c in self.columns.values() if c.kind == "id"]
+
+    @property
+    def time_columns(self) -> List[str]:
+        return [c.name for c in self.columns.values() if c.kind == "timestamp"]
+
+    def summary(self) -> str:
+        """Compact description for `schema_hints`."""
+        sample = "all rows" if self.sampled == self.rows else f"a {self.sampled:,}-row sample"
+        if self.grain:
+            grains = " or ".join("(" + ", ".join(g) + ")" if len(g) > 1 else g[0] for g in self.grain)
+            grain = f"one row per {grains} (unique in {sample})"
+        else:
+            grain = f"no unique column or pair in {sample}"
+        lines = [f"Table `{self.dataset}`: {self.rows:,} rows; grain: {grain}"]
+        lines += [f"- {c.name}: {c.describe()}" for c in self.columns.values()]
+        if self.join_keys:
+            lines.append(f"Join keys: {', '.join(self.join_keys)}")
+        return "\n".join(lines)
+
+
+def _sample(table: pa.Table, rows: int) -> pd.DataFrame:
+    if table.num_rows > rows:
+        # Random rather than evenly spaced rows: a stride can alias with periodic data
+        rng = np.random.default_rng(0)
+        table = table.take(np.sort(rng.choice(table.num_rows, rows, replace=False)))
+    return table.to_pandas(date_as_object=False)
+
+
+def _is_id_name(name: str) -> bool:
+    name = name.lower()
+    return name in ID_NAMES or name.endswith(ID_SUFFIXES)
+
+
+def _infer_column(name: str, arrow_type: pa.DataType, values: pd.Series) -> ColumnSchema:
+    present = values.dropna()
+    null_rate = 1 - len(present) / len(values) if len(values) else 0.0
+    distinct = int(present.nunique())
+    column = ColumnSchema(name, "text", str(arrow_type), null_rate, distinct)
+    if present.empty:
+        return column
+
+    if pa.types.is_boolean(arrow_type):
+        column.kind = "boolean"
+        return column
+    if pa.types.is_temporal(arrow_type) or (
+        (pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type))
+        and (is_time_column(name, present) or parse_iso_strings(present.head(100)) is not None)
+    ):
+        seconds = to_epoch_seconds(present)
+        parsed = seconds[seconds >= 0]
+        if len(parsed) >= 0.9 * len(present):
+            column.kind, column.minimum, column.maximum = "timestamp", int(parsed.min()), int(parsed.max())
+            return column
+    if _is_id_name(name) and not pa.types.is_floating(arrow_type):
+        column.kind = "id"
+    elif pa.types.is_integer(arrow_type) or pa.types.is_floating(arrow_type):
+        column.kind, column.minimum, column.maximum = "numeric", float(present.min()), float(present.max())
+    elif distinct <= MAX_CATEGORY_VALUES:
+        column.kind = "category"
+        column.values = [str(v) for v in present.value_counts().index]
+    elif distinct >= 0.9 * len(present):
+        column.kind = "id"
+    return column
+
+
+def _grain_candidates(sample: pd.DataFrame, columns: Dict[str, ColumnSchema]) -> List[Tuple[str, ...]]:
+    """Columns, then pairs, with no nulls and no repeated values in the sample."""
+    keys = [c.name for c in columns.values() if c.kind in ("id", "timestamp", "category", "text") and c.null_rate == 0]
+    unique = [(name,) for name in keys if columns[name].kind != "timestamp" and columns[name].distinct == len(sample)]
+    if unique:
+        # ids first: a unique category or text column is usually a coincidence of a small sample
+        return sorted(unique, key=lambda key: columns[key[0]].kind != "id")[:MAX_GRAIN_CANDIDATES]
+    # Prefer pairs that pair an entity with a time or a type, e.g. (user_id, occurred_at)
+    pairs = sorted(
+        itertools.combinations(keys, 2),
+        key=lambda pair: sum(columns[name].kind != "id" for name in pair) != 1,
+    )
+    found = []
+    for pair in pairs:
+        if not sample.duplicated(subset=list(pair)).any():
+            found.append(pair)
+            if len(found) == MAX_GRAIN_CANDIDATES:
+                break
+    return found
+
+
+def infer_table_schema(
+    table: pa.Table,
+    dataset: str,
+    dataset_hash: str,
+    sample_rows: Optional[int] = None,
+) -> DatasetSchema:
+    """Infer the schema of an Arrow table from a sample of its rows (default SAMPLE_ROWS)."""
+    sample = _sample(table, sample_rows or SAMPLE_ROWS)
+    columns = {
+        name: _infer_column(name, table.schema.field(name).type, sample[name])
+        for name in table.schema.names
+    }
+    return DatasetSchema(
+        dataset=dataset,
+        dataset_hash=dataset_hash,
+        rows=table.num_rows,
+        sampled=len(sample),
+        columns=columns,
+        grain=_grain_candidates(sample, columns),
+    )
+
+
+_schemas: "OrderedDict[str, DatasetSchema]" = OrderedDict()
+
+
+def infer_schema(dataset: str) -> DatasetSchema:
+    """
+    Inferred schema of a dataset in ANALYTICS_DATA_DIR, cached by content hash.
+
+    Raises:
+        DatasetNotFound: The dataset is not a file in the data directory
+        ValueError: The file could not be parsed
+    """
+    path = resolve_dataset_path(dataset)
+    digest = file_hash(path)
+    schema = _schemas.get(digest)
+    if schema is not None:
+        _schemas.move_to_end(digest)
+        return schema if schema.dataset == dataset else _renamed(schema, dataset)
+    schema = _schemas[digest] = infer_table_schema(get_registry().table(path, digest), dataset, digest)
+    while len(_schemas) > MAX_CACHED_SCHEMAS:
+        _schemas.popitem(last=False)
+    return schema
+
+
+def _renamed(schema: DatasetSchema, dataset: str) -> DatasetSchema:
+    """The same content under another name (e.g. a file and its upload ID)."""
+    return DatasetSchema(dataset, schema.dataset_hash, schema.rows, schema.sampled, schema.columns, schema.grain)
+
+
+def schema_hints(datasets: Sequence[str]) -> str:
+    """
+    Schema summaries of several datasets, with the join keys they share.
+
+    Raises:
+        DatasetNotFound: A dataset is not a file in the data directory
+        ValueError: A file could not be parsed
+    """
+    schemas = [infer_schema(dataset) for dataset in datasets]
+    parts = [schema.summary() for schema in schemas]
+    owners: Dict[str, List[str]] = {}
+    for schema in schemas:
+        for key in schema.join_keys:
+            owners.setdefault(key, []).append(f"`{schema.dataset}`")
+    shared = [f"{key} ({', '.join(tables)})" for key, tables in owners.items() if len(tables) > 1]
+    if shared:
+        parts.append(f"Shared join keys: {'; '.join(shared)}")
+    return "\n\n".join(parts)
@@ -0,0 +1,145 @@
+"""
+Mergeable Sketches.
+
+Fixed-size summaries that are updated chunk by chunk and can be merged,
+so a column can be profiled in one pass with bounded memory:
+
+- HyperLogLog: distinct counts (about 0.8% standard error at p=14, 16 KB)
+- TDigest: quantiles, most accurate in the tails (about delta / 2 centroids)
+
+Both merge exactly as if the combined data had been added to one sketch
+(HyperLogLog) or within the digest's usual error (TDigest), so parallel
+workers can profile parts of a file and the parent combines the results.
+"""
+
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+
+def hash_values(values: pd.Series) -> np.ndarray:
+    """
+    64-bit hashes of non-null values.
+
+    Numbers are hashed as float64, so a column read as int in one chunk and
+    float in another (because of nulls) hashes the same values identically.
+    """
+    values = values.dropna()
+    if pd.api.types.is_bool_dtype(values) or pd.api.types.is_numeric_dtype(values):
+        values = values.astype("float64")
+    return pd.util.hash_pandas_object(values, index=False).to_numpy()
+
+
+def _leading_zeros(words: np.ndarray) -> np.ndarray:
+    """
+    Leading zero bits of each uint64 (64 for zero).
+
+    Uses the float64 exponent. Words within 2**-53 of the next power of two
+    round up and count one zero short, which is far below HLL's own error.
+    """
+    _, exponent = np.frexp(words.astype(np.float64))
+    return (64 - exponent).astype(np.uint8)
+
+
+class HyperLogLog:
+    """Distinct-count estimator over 64-bit hashes."""
+
+    def __init__(self, p: int = 14):
+        """
+        Args:
+            p: Register index bits; 2**p one-byte registers, error ~1.04 / sqrt(2**p)
+        """
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    def add_hashes(self, hashes: np.ndarray) -> None:
+        if not len(hashes):
+            return
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        index = (hashes >> np.uint64(64 - self.p)).astype(np.intp)
+        rank = np.minimum(_leading_zeros(hashes << np.uint64(self.p)), 64 - self.p) + 1
+        np.maximum.at(self.registers, index, rank.astype(np.uint8))
+
+    def add(self, values: pd.Series) -> None:
+        self.add_hashes(hash_values(values))
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        """Fold another sketch with the same precision into this one."""
+        if other.p != self.p:
+            raise ValueError(f"Cannot merge HyperLogLog sketches with p={self.p} and p={other.p}")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int32)))
+        empty = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and empty:
+            # Linear counting is more accurate while many registers are empty
+            return int(round(m * np.log(m / empty)))
+        return int(round(raw))
+
+
+
+class TDigest:
+    """
+    Quantile sketch of weighted centroids (merging t-digest, k1 scale).
+
+    Compression is vectorized: centroids are sorted, mapped through the
+    scale function k(q) = delta / (2 pi) * asin(2q - 1), and all centroids
+    in the same unit of k are merged into one. That keeps about delta / 2
+    centroids, small ones near q=0 and q=1 where accuracy matters most.
+    """
+
+    def __init__(self, delta: float = 200):
+        self.delta = delta
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.minimum = np.inf
+        self.maximum = -np.inf
+
+    @property
+    def count(self) -> float:
+        return float(self.weights.sum())
+
+    def _compress(self, means: np.ndarray, weights: np.ndarray) -> None:
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        q_left = (np.cumsum(weights) - weights) / total
+        k = self.delta / (2 * np.pi) * np.arcsin(2 * q_left - 1)
+        bins = np.floor(k - k[0]).astype(np.intp)
+        merged_weights = np.bincount(bins, weights)
+        keep = merged_weights > 0
+        self.weights = merged_weights[keep]
+        self.means = np.bincount(bins, weights * means)[keep] / self.weights
+
+    def add(self, values) -> None:
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        self.minimum = min(self.minimum, float(values.min()))
+        self.maximum = max(self.maximum, float(values.max()))
+        self._compress(np.concatenate([self.means, values]), np.concatenate([self.weights, np.ones(len(values))]))
+
+    def merge(self, other: "TDigest") -> "TDigest":
+        if len(other.weights):
+            self.minimum = min(self.minimum, other.minimum)
+            self.maximum = max(self.maximum, other.maximum)
+            self._compress(np.concatenate([self.means, other.means]), np.concatenate([self.weights, other.weights]))
+        return self
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimated value at quantile q (0..1), or None if empty."""
+        if not len(self.weights):
+            return None
+        if len(self.weights) == 1:
+            return float(self.means[0])
+        # Each centroid's mean sits at the middle of its weight
+        centers = (np.cumsum(self.weights) - self.weights / 2) / self.count
+        points = np.concatenate([[0.0], centers, [1.0]])
+        values = np.concatenate([[self.minimum], self.means, [self.maximum]])
+        return float(np.interp(q, points, values))
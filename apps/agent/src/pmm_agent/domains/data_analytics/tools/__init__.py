@@ -6,6 +6,7 @@ Tools are organized by workflow phase:
 - RESEARCH: Benchmark research and context gathering
 - PLANNING: Metrics dictionary, tracking plans, SQL templates, dashboard specs
 - RISK: Data quality checks and risk assessment
+- COMPUTE: Funnels, retention, cohorts and sandboxed SQL run on event files
 """
 
 from .intake import (
@@ -30,6 +31,11 @@ from .risk import (
     create_data_quality_checklist,
 )
 
+from .compute import (
+    compute_event_metrics,
+    run_sql_query,
+)
+
 # Tool categories for mode-based selection
 INTAKE_TOOLS = [
     capture_analytics_intake,
@@ -53,5 +59,10 @@ RISK_TOOLS = [
     create_data_quality_checklist,
 ]
 
-ALL_TOOLS = INTAKE_TOOLS + RESEARCH_TOOLS + PLANNING_TOOLS + RISK_TOOLS
+COMPUTE_TOOLS = [
+    compute_event_metrics,
+    run_sql_query,
+]
+
+ALL_TOOLS = INTAKE_TOOLS + RESEARCH_TOOLS + PLANNING_TOOLS + RISK_TOOLS + COMPUTE_TOOLS
 
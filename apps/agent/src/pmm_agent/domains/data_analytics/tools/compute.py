@@ -0,0 +1,360 @@
+"""
+Compute Tools - Real Numbers from Event Data.
+
+These tools run the analyses that `draft_sql_query_pack` templates
+(funnels, retention, cohorts) directly on an event file the user has
+provided, and execute the templates themselves in a read-only SQL
+sandbox, using the local analytics engine.
+"""
+
+from typing import List, Optional
+
+from langchain_core.tools import tool
+
+ANALYTICS_EXTRA_MISSING = (
+    "The local analytics engine is not installed. Install it with "
+    '`pip install "preprod-agent[analytics]"`, or use `draft_sql_query_pack` '
+    "to get SQL you can run in your warehouse."
+)
+
+
+def _split(value: Optional[str]) -> List[str]:
+    return [item.strip() for item in (value or "").split(",") if item.strip()]
+
+
+def _pct(value: Optional[float]) -> str:
+    return "—" if value is None else f"{100 * value:.1f}%"
+
+
+def _count(users: int, sample=None) -> str:
+    """A user count, scaled to the whole dataset when computed from a sample."""
+    return f"{users:,}" if sample is None else f"≈{sample.scale(users):,}"
+
+
+def _margin(successes: int, trials: int, sample=None) -> str:
+    """The 95% margin of a sampled rate, in percentage points."""
+    if sample is None or not trials:
+        return ""
+    return f" ± {100 * sample.margin(successes, trials):.1f}"
+
+
+def _cell(value) -> str:
+    text = "NULL" if value is None else str(value)
+    return text.replace("|", "\\|").replace("\n", " ")
+
+
+def _format_rows(result) -> str:
+    lines = [
+        "| " + " | ".join(_cell(column) for column in result.columns) + " |",
+        "|" + "---|" * len(result.columns),
+    ]
+    lines += ["| " + " | ".join(_cell(value) for value in row) + " |" for row in result.rows]
+    return "\n".join(lines)
+
+
+def _format_funnel(result, sample=None) -> str:
+    first, previous = result.users[0], [0] + result.users[:-1]
+    rows = [
+        f"| {i + 1}. {step} | {_count(users, sample)} "
+        f"| {_pct(step_rate)}{_margin(users, prev, sample) if i else ''} "
+        f"| {_pct(overall)}{_margin(users, first, sample) if i else ''} |"
+        for i, (step, users, prev, step_rate, overall) in enumerate(
+            zip(result.steps, result.users, previous, result.step_conversion, result.overall_conversion)
+        )
+    ]
+    title = (
+        f"### Funnel ({result.window_days}-day window from the first step)" if result.ordered
+        else "### Funnel Reach (users who did every step so far, in any order)"
+    )
+    return "\n".join([
+        title,
+        "",
+        "| Step | Users | From previous | From first |",
+        "|------|-------|---------------|------------|",
+        *rows,
+    ])
+
+
+def _format_stickiness(result, sample=None) -> str:
+    rows = [
+        f"| {label} | {_count(dau, sample)} | {_count(mau, sample)} | {_pct(ratio)}{_margin(dau, mau, sample)} |"
+        for label, dau, mau, ratio in zip(result.labels, result.dau, result.mau, result.ratios)
+    ]
+    average = ""
+    if sample is not None and result.labels:
+        # Days share most of their users, so the mean daily margin bounds the average's
+        margins = [sample.margin(dau, mau) for dau, mau in zip(result.dau, result.mau) if mau]
+        average = f" ± {100 * sum(margins) / len(margins):.1f}" if margins else ""
+    return "\n".join([
+        f"### Stickiness (DAU / {result.window_days}-day active users)",
+        "",
+        f"| Day | DAU | {result.window_days}-day active | DAU/MAU |",
+        "|-----|-----|------------|---------|",
+        *rows,
+        "",
+        f"**Average DAU/MAU:** {_pct(result.average)}{average}",
+    ])
+
+
+def _format_retention(result, sample=None) -> str:
+    start = result.start_event or "first event"
+    returning = result.return_event or "any event"
+    rows = [
+        f"| Day {day} | {_count(retained, sample)} | {_count(eligible, sample)} "
+        f"| {_pct(rate)}{_margin(retained, eligible, sample)} |"
+        for day, retained, eligible, rate in zip(result.days, result.retained, result.eligible, result.rates)
+    ]
+    return "\n".join([
+        f"### Retention (start: {start}; return: {returning})",
+        "",
+        "| Day | Retained | Eligible users | Retention |",
+        "|-----|----------|----------------|-----------|",
+        *rows,
+        "",
+        "_Eligible users started at least N days before the last day in the data._",
+    ])
+
+
+def _format_cohorts(result, sample=None) -> str:
+    periods = result.active.shape[1]
+    header = "| Cohort | Users | " + " | ".join(f"{result.period.title()} {k}" for k in range(periods)) + " |"
+    divider = "|" + "---|" * (periods + 2)
+    rows = []
+    for label, size, active, rates in zip(result.labels, result.sizes, result.active, result.rates):
+        # Period 0 is the cohort itself (100%), so it has no margin
+        cells = [
+            "" if rate != rate else f"{100 * rate:.1f}%{_margin(int(users), int(size), sample) if k else ''}"
+            for k, (users, rate) in enumerate(zip(active, rates))
+        ]
+        rows.append(f"| {label} | {_count(int(size), sample)} | " + " | ".join(cells) + " |")
+    return "\n".join([
+        f"### Cohort Matrix (by {result.period} of first event)",
+        "",
+        header,
+        divider,
+        *rows,
+    ])
+
+
+@tool
+def compute_event_metrics(
+    dataset: str,
+    analysis: str = "funnel",
+    steps: Optional[str] = None,
+    start_event: Optional[str] = None,
+    return_event: Optional[str] = None,
+    days: str = "1,7,30",
+    period: str = "week",
+    periods: int = 8,
+    window_days: int = 30,
+    ordered: bool = True,
+    mode: str = "auto",
+    user_column: str = "user_id",
+    event_column: str = "event_name",
+    time_column: str = "occurred_at",
+) -> str:
+    """
+    Compute a funnel, N-day retention, a cohort matrix or stickiness from an event file.
+
+    Use this when the user has an event table (CSV or Parquet with one row
+    per event) and wants actual numbers, e.g. "what is my activation rate"
+    or "what is day-7 retention". It runs the same analyses as the
+    templates in draft_sql_query_pack. Results for the same file and
+    arguments are cached, so asking again is instant.
+
+    Retention, cohorts and stickiness on a single file are answered from a
+    bitmap index of users per day, built once per file, so follow-up cohort
+    questions are fast even with millions of users.
+
+    A dataset can also be a directory with one event file per append (e.g.
+    a daily export); results are then updated from the new files only.
+
+    Very large files are answered approximately by default, from a fixed
+    sample of users: counts are estimates (≈) and each rate has a 95%
+    margin (±). Use this for a first look; if the user needs exact
+    numbers, or a margin is too wide to decide, call again with mode="exact".
+
+    Args:
+        dataset: Event file name in the analytics data directory (e.g. "events.parquet"),
+            the ID of a dataset uploaded to /datasets (e.g. "ds_3f2a9c01d4e8"),
+            or a directory of event files, one per append (e.g. "events/")
+        analysis: "funnel", "retention", "cohorts" or "stickiness" (DAU/MAU)
+        steps: Comma-separated funnel steps in order (e.g. "signup_completed,onboarding_completed,first_value_action")
+        start_event: Event that starts a user's retention clock or cohort (default: first event)
+        return_event: Event that counts as returning for retention (default: any event)
+        days: Comma-separated retention days (default "1,7,30")
+        period: Cohort period: "day", "week" or "month"
+        periods: Number of cohorts and periods in the cohort matrix, or days shown for stickiness
+        window_days: Days a user has to complete the funnel after its first step,
+            or the active-user window for stickiness (30 for DAU/MAU)
+        ordered: False counts users who did every funnel step in any order, at any time
+        mode: "auto" (approximate for very large files), "approximate" or "exact"
+        user_column: Column holding the user ID
+        event_column: Column holding the event name
+        time_column: Column holding the event timestamp
+
+    Returns:
+        Markdown table of results with the dataset summary
+    """
+    try:
+        from ..engine import (
+            DatasetNotFound,
+            cohort_matrix,
+            funnel,
+            is_large,
+            is_partitioned,
+            load_event_log,
+            load_events,
+            load_user_sample,
+            retention,
+            user_index,
+        )
+    except ImportError:
+        return ANALYTICS_EXTRA_MISSING
+
+    mode = mode.strip().lower()
+    if mode not in ("auto", "approximate", "exact"):
+        return f"❌ Unknown mode '{mode}'. Use auto, approximate or exact."
+    partitioned = is_partitioned(dataset)
+    sample = None
+    try:
+        if partitioned:
+            table = load_event_log(dataset, user_column, event_column, time_column)
+        elif mode == "approximate" or (mode == "auto" and is_large(dataset)):
+            sample = load_user_sample(dataset, user_column, event_column, time_column)
+            table = sample.table
+            if sample.exact:
+                sample = None  # every user fits in the sample: it is the whole table
+        else:
+            table = load_events(dataset, user_column, event_column, time_column)
+    except DatasetNotFound as e:
+        return f"❌ {e}"
+    except ValueError as e:
+        return f"❌ Could not read {dataset}: {e}"
+
+    analysis = analysis.strip().lower()
+
+    # Built on first use, so ordered funnels never pay for the bitmap index
+    def bitmap_index():
+        return None if partitioned else user_index(table)
+
+    # Partitioned logs keep their own aggregates; single files use the bitmap index when it fits
+    def aggregates():
+        return table if partitioned else user_index(table)
+
+    try:
+        if analysis == "funnel":
+            step_list = _split(steps)
+            if not step_list:
+                return "❌ A funnel needs `steps`, e.g. steps=\"signup_completed,first_value_action\"."
+            if not ordered:
+                index = bitmap_index()
+                if index is None:
+                    return "❌ Unordered funnels need the bitmap user index, which is not built for partitioned or very large datasets."
+                result = index.funnel_reach(step_list)
+            else:
+                result = table.funnel(step_list, window_days) if partitioned else funnel(table, step_list, window_days)
+            body = _format_funnel(result, sample)
+        elif analysis == "retention":
+            day_list = [int(day) for day in _split(days)]
+            source = aggregates()
+            if source is not None:
+                result = source.retention(start_event, day_list, return_event)
+            else:
+                result = retention(table, start_event, day_list, return_event)
+            body = _format_retention(result, sample)
+        elif analysis in ("cohorts", "cohort"):
+            source = aggregates()
+            if source is not None:
+                result = source.cohort_matrix(start_event, period, periods)
+            else:
+                result = cohort_matrix(table, start_event, period, periods)
+            body = _format_cohorts(result, sample)
+        elif analysis == "stickiness":
+            index = bitmap_index()
+            if index is None:
+                return "❌ Stickiness needs the bitmap user index, which is not built for partitioned or very large datasets."
+            body = _format_stickiness(index.stickiness(window_days, periods), sample)
+        else:
+            return f"❌ Unknown analysis '{analysis}'. Use funnel, retention, cohorts or stickiness."
+    except ValueError as e:
+        return f"❌ {e}"
+
+    unknown = [
+        name for name in _split(steps) + [start_event, return_event]
+        if name and table.event_code(name) is None
+    ]
+    notes = f"\n\n⚠️ Not found in the {'sample' if sample else 'data'}: {', '.join(unknown)}" if unknown else ""
+    dropped = f", {table.dropped_rows:,} rows skipped (missing user, event or time)" if table.dropped_rows else ""
+    summary = f"{len(table):,} events, {table.n_users:,} users, {len(table.event_names)} event types{dropped}"
+    appended = ""
+    if partitioned:
+        added, events_added = table.last_append
+        appended = f"\n**Partitions:** {len(table.partitions)} ({added} new since the last call, {events_added:,} events)"
+    if sample:
+        summary = f"{sample.total_events:,} rows, {sample.total_users:,} users"
+        appended = (
+            f"\n**Approximate:** from {sample.sampled_users:,} sampled users ({100 * sample.fraction:.1f}%); "
+            "≈ marks scaled estimates and ± a 95% margin in percentage points. "
+            'Call again with mode="exact" for exact numbers.'
+        )
+
+    return f"""
+## Event Metrics: {dataset}
+
+**Data:** {summary}{appended}
+
+{body}{notes}
+"""
+
+
+@tool
+def run_sql_query(
+    dataset: str,
+    sql: str,
+    max_rows: int = 50,
+    show_plan: bool = True,
+) -> str:
+    """
+    Run a SQL query against an event file and show a preview of the result.
+
+    Use this to validate and execute SQL from draft_sql_query_pack (or SQL
+    the user writes) on their own data. The file is available as the table
+    `events`; its columns are whatever the file has. Only a single SELECT
+    runs: the connection is read-only, queries are stopped after a time
+    limit, and results are capped at a row limit. Repeating a query reuses
+    the prepared statement or the cached result.
+
+    Args:
+        dataset: Event file name in the analytics data directory (e.g. "events.parquet"),
+            or the ID of a dataset uploaded to /datasets (e.g. "ds_3f2a9c01d4e8")
+        sql: One SELECT statement over the `events` table (DuckDB SQL dialect)
+        max_rows: Rows to show in the preview
+        show_plan: Include the query plan
+
+    Returns:
+        Markdown table with the first rows, timing and the query plan
+    """
+    try:
+        from ..engine import DatasetNotFound, SandboxError, get_sandbox
+    except ImportError:
+        return ANALYTICS_EXTRA_MISSING
+
+    try:
+        result = get_sandbox().run(dataset, sql, max_rows=max_rows, explain=show_plan)
+    except DatasetNotFound as e:
+        return f"❌ {e}"
+    except SandboxError as e:
+        return f"❌ Query failed: {e}"
+
+    shown = f"first {len(result.rows):,} rows" if result.truncated else f"{len(result.rows):,} rows"
+    timing = "cached result" if result.cached else f"{result.elapsed_ms:.1f} ms"
+    plan = f"\n\n### Query Plan\n\n```\n{result.plan}\n```" if result.plan else ""
+
+    return f"""
+## SQL Result: {dataset}
+
+**Rows:** {shown} · **Time:** {timing}
+
+{_format_rows(result)}{plan}
+"""
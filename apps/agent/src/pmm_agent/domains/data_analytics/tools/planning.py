@@ -137,10 +137,24 @@ Following Segment-style naming:
     return tracking_plan
 
 
+def _inferred_schema(dataset: str) -> str:
+    """Schema summaries of comma-separated datasets, or why they are unavailable."""
+    try:
+        from ..engine import DatasetNotFound, schema_hints
+    except ImportError:
+        return 'Schema inference needs the analytics extra: `pip install "preprod-agent[analytics]"`.'
+
+    try:
+        return schema_hints([name.strip() for name in dataset.split(",") if name.strip()])
+    except (DatasetNotFound, ValueError) as e:
+        return f"❌ {e}"
+
+
 @tool
 def draft_sql_query_pack(
-    schema_hints: str,
     questions: str,
+    schema_hints: str = "",
+    dataset: Optional[str] = None,
 ) -> str:
     """
     Draft SQL query templates for common analytics patterns.
@@ -152,20 +166,30 @@ def draft_sql_query_pack(
     to the user verbatim. Do NOT summarize or describe what it contains. Show all SQL 
     code blocks, all markdown, everything. The user needs the actual SQL to copy and use.**
     
+    If the data has been provided as files, pass them as dataset instead of
+    describing them in schema_hints: their column types, grain and join keys
+    are inferred from a sample and summarized for you.
+
     Args:
-        schema_hints: Description of available tables/events (columns, grain, relationships)
         questions: Analytics questions to answer with SQL
+        schema_hints: Description of available tables/events (columns, grain, relationships)
+        dataset: Optional comma-separated file names in the analytics data
+            directory, or uploaded dataset IDs (e.g. "ds_3f2a9c01d4e8"), whose
+            inferred schemas are added to the schema context
     
     Returns:
         SQL query templates with comments explaining logic - SHOW THIS COMPLETE OUTPUT TO USER
     """
+    schema_context = "\n\n".join(
+        part for part in (schema_hints.strip(), _inferred_schema(dataset) if dataset else "") if part
+    )
     sql_pack = f"""
 ## SQL Query Pack
 
 **IMPORTANT: This entire output must be shown to the user verbatim. Do not summarize or describe - show the complete SQL code blocks.**
 
 ### Schema Context
-{schema_hints}
+{schema_context or "No schema provided - will need to clarify: tables, columns, grain and join keys."}
 
 ### Questions to Answer
 {questions}
@@ -5,9 +5,11 @@ These tools ensure trust in data and identify potential issues
 before shipping insights.
 """
 
-from langchain_core.tools import tool
+from datetime import datetime, timezone
 from typing import Optional
 
+from langchain_core.tools import tool
+
 
 @tool
 def assess_analytics_risks(
@@ -108,10 +110,91 @@ def assess_analytics_risks(
     return risk_assessment
 
 
+def _format_value(value, is_time: bool) -> str:
+    if value is None:
+        return "—"
+    if is_time:
+        return datetime.fromtimestamp(value, timezone.utc).strftime("%Y-%m-%d %H:%M")
+    return f"{value:,.6g}"
+
+
+def _profile_results(data_file: str, key_columns: Optional[str]) -> str:
+    """Run the checklist's checks against a file with the streaming profiler."""
+    try:
+        from ..engine import DatasetNotFound, infer_schema, profile_dataset
+    except ImportError:
+        return (
+            "\n### Profile Results\n"
+            'Profiling needs the analytics extra: `pip install "preprod-agent[analytics]"`.\n'
+        )
+
+    keys = [column.strip() for column in (key_columns or "").split(",") if column.strip()]
+    try:
+        schema = infer_schema(data_file)
+        # Without key columns, check the grain inferred from a sample
+        inferred_grain = not keys and bool(schema.grain)
+        if inferred_grain:
+            keys = list(schema.grain[0])
+        profile = profile_dataset(data_file, keys)
+    except (DatasetNotFound, ValueError) as e:
+        return f"\n### Profile Results\n❌ {e}\n"
+
+    checks = []
+    for column in profile.columns.values():
+        if column.nulls:
+            checks.append(f"| not_null: `{column.name}` | ⚠️ {column.nulls:,} nulls ({100 * column.null_rate:.1f}%) |")
+        if column.unparsed:
+            checks.append(f"| valid timestamp: `{column.name}` | ❌ {column.unparsed:,} values could not be parsed |")
+        if column.is_time and column.maximum is not None:
+            age_hours = (datetime.now(timezone.utc).timestamp() - column.maximum) / 3600
+            status = "❌ in the future" if age_hours < 0 else f"{age_hours:,.1f} hours old"
+            checks.append(f"| freshness: `{column.name}` | latest {_format_value(column.maximum, True)} UTC ({status}) |")
+    if keys:
+        approx = "" if profile.duplicates_exact else " (estimated)"
+        status = "✅ unique" if profile.duplicate_keys == 0 else f"❌ {profile.duplicate_keys:,} duplicate rows{approx}"
+        inferred = " (inferred grain)" if inferred_grain else ""
+        checks.append(f"| unique: `{', '.join(keys)}`{inferred} | {status} |")
+    if not any(column.nulls for column in profile.columns.values()):
+        checks.append("| not_null: all columns | ✅ no nulls |")
+
+    column_rows = [
+        f"| `{c.name}` | {100 * c.null_rate:.1f}% | ≈{c.distinct_count:,} | "
+        f"{_format_value(c.minimum, c.is_time)} | {_format_value(c.quantile(0.5), False)} | "
+        f"{_format_value(c.quantile(0.95), False)} | {_format_value(c.maximum, c.is_time)} |"
+        for c in profile.columns.values()
+    ]
+    distributions = []
+    for c in profile.columns.values():
+        top = c.top_values(5)
+        if top:
+            shown = ", ".join(f"{value} ({100 * count / (c.rows - c.nulls):.1f}%)" for value, count in top)
+            distributions.append(f"- `{c.name}`: {shown}")
+
+    return "\n".join([
+        "",
+        f"### Profile Results: {data_file}",
+        f"{profile.rows:,} rows, {len(profile.columns)} columns (profiled in {profile.chunks} chunks)",
+        "",
+        schema.summary(),
+        "",
+        "| Check | Result |",
+        "|-------|--------|",
+        *checks,
+        "",
+        "| Column | Null rate | Distinct | Min | p50 | p95 | Max |",
+        "|--------|-----------|----------|-----|-----|-----|-----|",
+        *column_rows,
+        *(["", "**Value distributions (top 5):**", *distributions] if distributions else []),
+        "",
+    ])
+
+
 @tool
 def create_data_quality_checklist(
     dataset: str,
     kpi: Optional[str] = None,
+    data_file: Optional[str] = None,
+    key_columns: Optional[str] = None,
 ) -> str:
     """
     Create a data quality checklist and dbt-style test ideas.
@@ -119,13 +202,24 @@ def create_data_quality_checklist(
     Use this to design data quality tests that ensure trust in data
     before shipping insights. Follows dbt testing mindset.
     
+    If the user has provided the data as a file, pass it as data_file to
+    also run the checks (nulls, uniqueness, freshness, distinct counts,
+    value distributions) against it. Large files are read in chunks.
+    
     Args:
         dataset: Description of the dataset/table being tested
         kpi: Optional KPI that depends on this dataset
+        data_file: Optional file name in the analytics data directory, or uploaded
+            dataset ID (e.g. "ds_3f2a9c01d4e8"), to profile
+        key_columns: Optional comma-separated columns that should be unique
+            together (e.g. "event_id"), checked for duplicates; defaults to
+            the grain inferred from data_file
     
     Returns:
-        Data quality checklist with dbt-style test recommendations
+        Data quality checklist with dbt-style test recommendations, and
+        profile results when data_file is given
     """
+    profile_results = _profile_results(data_file, key_columns) if data_file else ""
     dq_checklist = f"""
 ## Data Quality Checklist
 
@@ -134,7 +228,7 @@ def create_data_quality_checklist(
 
 ### KPI Dependency
 {kpi if kpi else "No specific KPI - general data quality checks"}
-
+{profile_results}
 ### Data Quality Tests
 
 #### 1. Uniqueness Tests
@@ -0,0 +1,136 @@
+"""
+Deterministic Fake Chat Model for offline benchmarking.
+
+Stands in for ChatAnthropic so the server, the ReAct loop and the real
+tools can be exercised without network access or API spend. Responses
+follow a script of ReAct steps and are paced by a configurable latency
+and token rate, so throughput numbers reflect the server rather than a
+remote API.
+
+A script is a list of steps replayed on every turn. The step index is the
+number of AI messages since the last human message, so a two-step script
+calls tools on the first model call and answers on the second:
+
+    FakeChatModel(script=[
+        {"tool_calls": [{"name": "draft_sql_query_pack",
+                         "args": {"schema_hints": "events", "questions": "activation"}}]},
+        {"text": "Here is the SQL pack."},
+    ])
+
+Steps past the end of the script return `default_text`.
+"""
+
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 characters per token)."""
+    return max(1, len(text) // 4)
+
+
+def _message_text(message: BaseMessage) -> str:
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return "".join(
+        item.get("text", "") if isinstance(item, dict) else str(item)
+        for item in content
+    )
+
+
+class FakeChatModel(BaseChatModel):
+    """Scripted, latency-simulating chat model."""
+
+    script: List[Dict[str, Any]] = []
+    default_text: str = "This is a deterministic response from the fake chat model."
+    latency_s: float = 0.0
+    """Fixed delay before each response (time to first token)."""
+    tokens_per_second: float = 0.0
+    """Output pacing; 0 means instant generation."""
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> "FakeChatModel":
+        # Tool choice comes from the script, so bound tools are not needed
+        return self
+
+    def _step_index(self, messages: List[BaseMessage]) -> int:
+        """Number of AI messages since the last human message."""
+        steps = 0
+        for message in reversed(messages):
+            if isinstance(message, HumanMessage):
+                break
+            if isinstance(message, AIMessage):
+                steps += 1
+        return steps
+
+    def _build_message(self, messages: List[BaseMessage]) -> AIMessage:
+        step_index = self._step_index(messages)
+        step = self.script[step_index] if step_index < len(self.script) else {"text": self.default_text}
+
+        text = step.get("text", "")
+        tool_calls = [
+            {
+                "name": call["name"],
+                "args": call.get("args", {}),
+                "id": call.get("id", f"call_{step_index}_{i}"),
+                "type": "tool_call",
+            }
+            for i, call in enumerate(step.get("tool_calls", []))
+        ]
+
+        input_tokens = sum(estimate_tokens(_message_text(m)) for m in messages)
+        output_tokens = estimate_tokens(text) + sum(estimate_tokens(str(tc["args"])) for tc in tool_calls)
+        return AIMessage(
+            content=text,
+            tool_calls=tool_calls,
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+            },
+        )
+
+    def _delay(self, message: AIMessage) -> float:
+        delay = self.latency_s
+        if self.tokens_per_second > 0:
+            delay += message.usage_metadata["output_tokens"] / self.tokens_per_second
+        return delay
+
+    def _respond(self, messages: List[BaseMessage]) -> Tuple[AIMessage, float]:
+        """Return the next message and how long to wait before returning it."""
+        message = self._build_message(messages)
+        return message, self._delay(message)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        message, delay = self._respond(messages)
+        if delay:
+            time.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        message, delay = self._respond(messages)
+        if delay:
+            await asyncio.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=message)])
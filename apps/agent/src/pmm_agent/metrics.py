@@ -0,0 +1,342 @@
+"""
+Prometheus Metrics for PMM Agent.
+
+Scrape-friendly counters, gauges and histograms rendered in the Prometheus
+text exposition format (version 0.0.4, also accepted by OpenMetrics scrapers).
+
+Unlike the JSON `/metrics` endpoint, nothing here grows with traffic:
+label sets are bounded (route templates, tool names, event types) and
+rendering walks a fixed registry, so a scrape costs the same with 10 or
+10,000 sessions.
+
+Updates are plain attribute increments with no locks. All writers run on the
+event loop thread (ASGI middleware and the streaming generator), so there is
+no contention to guard against; a rare lost increment from a threadpool
+endpoint is an acceptable trade for a zero-cost hot path.
+"""
+
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Default latency buckets (seconds) - spans fast endpoints through long agent turns
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape_label(value: str) -> str:
+    """Escape a label value per the exposition format."""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    """Render a `{name="value",...}` label block (empty string when unlabelled)."""
+    parts = [f'{n}="{_escape_label(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    """Render a sample value, keeping integers free of a trailing `.0`."""
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric(ABC):
+    """Base class for a named metric family with optional labels."""
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """Exposition lines for every label combination."""
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter."""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, *labelvalues: str) -> None:
+        """Increment the counter for the given label values."""
+        self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def labels(self, *labelvalues: str) -> "_BoundCounter":
+        """Bind label values so the hot path is a single dict update."""
+        return _BoundCounter(self, tuple(labelvalues))
+
+    def get(self, *labelvalues: str) -> float:
+        return self._values.get(labelvalues, 0.0)
+
+    def samples(self) -> List[str]:
+        # Snapshot with list() so a concurrent insert cannot break iteration
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in list(self._values.items())
+        ]
+
+
+class _BoundCounter:
+    """Counter bound to a fixed label set."""
+
+    __slots__ = ("_counter", "_key")
+
+    def __init__(self, counter: Counter, key: Tuple[str, ...]):
+        self._counter = counter
+        self._key = key
+
+    def inc(self, amount: float = 1.0) -> None:
+        values = self._counter._values
+        values[self._key] = values.get(self._key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """Point-in-time value read from a callback at scrape time."""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], float]):
+        super().__init__(name, documentation)
+        self._callback = callback
+
+    def samples(self) -> List[str]:
+        try:
+            value = float(self._callback())
+        except Exception:
+            return []
+        return [f"{self.name} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    """Fixed-bucket histogram with cumulative rendering."""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts..., +Inf count], sum
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        """Record an observation (in the histogram's base unit)."""
+        series = self._series.get(labelvalues)
+        if series is None:
+            # len(buckets) finite buckets + +Inf bucket + running sum
+            series = [0.0] * (len(self.buckets) + 2)
+            self._series[labelvalues] = series
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def count(self, *labelvalues: str) -> int:
+        series = self._series.get(labelvalues)
+        return int(sum(series[:-1])) if series else 0
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, series in list(self._series.items()):
+            cumulative = 0.0
+            for bound, bucket_count in zip(self.buckets, series):
+                cumulative += bucket_count
+                le = _format_labels(self.labelnames, key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {_format_value(cumulative)}")
+            cumulative += series[len(self.buckets)]
+            le = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {_format_value(cumulative)}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_count{labels} {_format_value(cumulative)}")
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    """Fixed set of metric families rendered together."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, callback: Callable[[], float]) -> Gauge:
+        return self.register(Gauge(name, documentation, callback))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Render every registered family in the text exposition format."""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.header())
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+class PrometheusMiddleware:
+    """
+    Pure ASGI middleware recording request counts and latency.
+
+    Latency is measured until the final body chunk is sent, so streaming
+    responses report the full stream duration rather than time-to-headers.
+    Routes are labelled by their template (`/metrics/session/{session_id}`)
+    to keep cardinality bounded.
+    """
+
+    def __init__(self, app, metrics: "AgentMetrics"):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+        recorded = False
+
+        def record() -> None:
+            nonlocal recorded
+            if recorded:
+                return
+            recorded = True
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            self.metrics.requests_total.inc(1.0, scope["method"], route_path, str(status_code))
+            self.metrics.request_duration.observe(time.perf_counter() - start, route_path)
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                record()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            record()
+
+
+class AgentMetrics:
+    """The agent server's metric families."""
+
+    def __init__(self, session_count: Optional[Callable[[], float]] = None):
+        self.registry = MetricsRegistry()
+        r = self.registry
+
+        self.requests_total = r.counter(
+            "pmm_agent_http_requests_total",
+            "HTTP requests by method, route template and status code.",
+            ("method", "route", "status"),
+        )
+        self.request_duration = r.histogram(
+            "pmm_agent_http_request_duration_seconds",
+            "HTTP request latency, including the full body for streaming responses.",
+            ("route",),
+        )
+        self.sse_frames_total = r.counter(
+            "pmm_agent_sse_frames_total",
+            "Server-sent event frames written to clients.",
+        )
+        self.sse_bytes_total = r.counter(
+            "pmm_agent_sse_bytes_total",
+            "Server-sent event payload bytes written to clients.",
+        )
+        self.tool_calls_total = r.counter(
+            "pmm_agent_tool_calls_total",
+            "Tool calls requested by the agent, by tool name.",
+            ("tool",),
+        )
+        self.cache_hits_total = r.counter(
+            "pmm_agent_cache_hits_total",
+            "Response cache hits by cache name.",
+            ("cache",),
+        )
+        self.cache_misses_total = r.counter(
+            "pmm_agent_cache_misses_total",
+            "Response cache misses by cache name.",
+            ("cache",),
+        )
+        self.tokens_total = r.counter(
+            "pmm_agent_tokens_total",
+            "Model tokens consumed, by kind (input, output, cache_read, cache_creation).",
+            ("kind",),
+        )
+        self.streams_cancelled_total = r.counter(
+            "pmm_agent_streams_cancelled_total",
+            "Streaming turns cancelled before completion, by reason.",
+            ("reason",),
+        )
+        self.streams_resumed_total = r.counter(
+            "pmm_agent_streams_resumed_total",
+            "Streaming turns resumed from Last-Event-ID.",
+        )
+        self.requests_coalesced_total = r.counter(
+            "pmm_agent_requests_coalesced_total",
+            "Chat requests served by an identical request's in-flight run, by endpoint.",
+            ("endpoint",),
+        )
+        self.token_rate_limited_total = r.counter(
+            "pmm_agent_token_rate_limited_total",
+            "Chat requests refused with 429 because the caller's token bucket was empty, by endpoint.",
+            ("endpoint",),
+        )
+        self.session_turns_rejected_total = r.counter(
+            "pmm_agent_session_turns_rejected_total",
+            "Chat requests refused with 429 because the session's turn queue was full, by endpoint.",
+            ("endpoint",),
+        )
+        self.chat_turn_duration = r.histogram(
+            "pmm_agent_chat_turn_duration_seconds",
+            "End-to-end agent turn latency by endpoint.",
+            ("endpoint",),
+        )
+        if session_count is not None:
+            r.gauge(
+                "pmm_agent_sessions",
+                "Conversation sessions currently held in the session store.",
+                session_count,
+            )
+
+    def render(self) -> str:
+        return self.registry.render()
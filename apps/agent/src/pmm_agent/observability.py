@@ -4,14 +4,18 @@ Observability and Logging for PMM Agent.
 Tracks agent behavior, tool usage, and response quality for debugging and improvement.
 """
 
+import heapq
 import json
 import logging
 import os
+import random
 import time
+import zlib
+from collections import deque
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, List, Optional
-from dataclasses import dataclass, asdict
+from typing import Any, Deque, Dict, List, Optional
+from dataclasses import dataclass, asdict, field
 from enum import Enum
 
 
@@ -20,6 +24,11 @@ def running_on_vercel() -> bool:
     return os.getenv("VERCEL") == "1" or os.getenv("VERCEL_ENV") is not None
 
 
+def running_in_production() -> bool:
+    """Check for a production deployment (Vercel, PRODUCTION=true or ENVIRONMENT=production)."""
+    return bool(os.getenv("VERCEL")) or os.getenv("PRODUCTION") == "true" or os.getenv("ENVIRONMENT") == "production"
+
+
 class LogLevel(Enum):
     """Log severity levels."""
     DEBUG = "DEBUG"
@@ -28,6 +37,87 @@ class LogLevel(Enum):
     ERROR = "ERROR"
 
 
+@dataclass
+class TokenUsage:
+    """Token counts reported by the model (Anthropic usage metadata)."""
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_read_tokens: int = 0
+    cache_creation_tokens: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    def add(self, other: "TokenUsage") -> None:
+        self.input_tokens += other.input_tokens
+        self.output_tokens += other.output_tokens
+        self.cache_read_tokens += other.cache_read_tokens
+        self.cache_creation_tokens += other.cache_creation_tokens
+
+    def split(self, parts: int) -> "TokenUsage":
+        """Return an even 1/parts share (floored) for attribution."""
+        return TokenUsage(
+            input_tokens=self.input_tokens // parts,
+            output_tokens=self.output_tokens // parts,
+            cache_read_tokens=self.cache_read_tokens // parts,
+            cache_creation_tokens=self.cache_creation_tokens // parts,
+        )
+
+    @classmethod
+    def from_message(cls, message: Any) -> Optional["TokenUsage"]:
+        """Read `usage_metadata` from a LangChain AIMessage, if present."""
+        usage = getattr(message, "usage_metadata", None)
+        if not usage:
+            return None
+        details = usage.get("input_token_details") or {}
+        return cls(
+            input_tokens=usage.get("input_tokens", 0) or 0,
+            output_tokens=usage.get("output_tokens", 0) or 0,
+            cache_read_tokens=details.get("cache_read", 0) or 0,
+            cache_creation_tokens=details.get("cache_creation", 0) or 0,
+        )
+
+    def to_dict(self) -> Dict[str, int]:
+        return {**asdict(self), "total_tokens": self.total_tokens}
+
+
+class TurnTokenAccounting:
+    """
+    Accumulates token usage across the ReAct steps of one turn.
+
+    Each model step's usage is also attributed to the tools whose results
+    it consumed (the tools requested by the previous step), split evenly.
+    That is where tool output lands in the prompt, so it approximates what
+    each tool costs in follow-up model calls.
+    """
+
+    def __init__(self):
+        self.total = TokenUsage()
+        self.by_tool: Dict[str, TokenUsage] = {}
+        self.steps = 0
+        self._pending_tools: List[str] = []
+
+    def record_step(self, message: Any) -> None:
+        """Record one model step (an AIMessage from the agent node)."""
+        usage = TokenUsage.from_message(message)
+        if usage is not None:
+            self.steps += 1
+            self.total.add(usage)
+            if self._pending_tools:
+                share = usage.split(len(self._pending_tools))
+                for tool_name in self._pending_tools:
+                    self.by_tool.setdefault(tool_name, TokenUsage()).add(share)
+
+        tool_calls = getattr(message, "tool_calls", None) or []
+        self._pending_tools = [
+            name for name in (
+                tc.get("name") if isinstance(tc, dict) else getattr(tc, "name", None)
+                for tc in tool_calls
+            ) if name
+        ]
+
+
 @dataclass
 class ToolCallEvent:
     """Record of a tool call."""
@@ -54,6 +144,20 @@ class AgentResponseEvent:
     token_count: Optional[int] = None
     followed_clarification_protocol: Optional[bool] = None
     clarification_question: Optional[str] = None
+    span_timings: Optional[Dict[str, float]] = None  # Stage name -> total ms (see tracing.py)
+    token_usage: Optional[TokenUsage] = None
+    error: Optional[str] = None  # Set when the turn failed
+
+
+@dataclass
+class StreamCancellationEvent:
+    """Record of a streaming turn stopped before it completed."""
+    session_id: str
+    message_id: str
+    reason: str  # e.g. "client_disconnected"
+    frames_sent: int
+    elapsed_ms: float
+    timestamp: float
 
 
 @dataclass
@@ -66,18 +170,81 @@ class SessionMetrics:
     total_response_time_ms: float
     tools_used: List[str]
     errors: List[str]
+    token_usage: TokenUsage = field(default_factory=TokenUsage)
+    cancelled_streams: int = 0
+
+
+@dataclass
+class SamplingPolicy:
+    """
+    Decides which turns are recorded in full.
+
+    Session aggregates (message, tool and token counts) are always updated;
+    sampling only controls the per-turn detail: stored events, event files
+    and per-tool INFO lines. Errors and protocol violations are always kept.
+
+    The decision is a hash of the message ID, so every record of a turn
+    (its tool calls and its response) is kept or dropped together.
+    """
+    rate: float = 1.0
+    keep_errors: bool = True
+    keep_protocol_violations: bool = True
+
+    @classmethod
+    def from_env(cls) -> "SamplingPolicy":
+        """Build from OBSERVABILITY_SAMPLE_RATE (0.0-1.0, default 1.0)."""
+        try:
+            rate = float(os.getenv("OBSERVABILITY_SAMPLE_RATE", "1.0"))
+        except ValueError:
+            rate = 1.0
+        return cls(rate=min(max(rate, 0.0), 1.0))
+
+    def sampled(self, key: Optional[str] = None) -> bool:
+        """Rate-based decision, deterministic for a given key."""
+        if self.rate >= 1.0:
+            return True
+        if self.rate <= 0.0:
+            return False
+        if key is None:
+            return random.random() < self.rate
+        return zlib.crc32(key.encode()) % 10000 < self.rate * 10000
+
+    def keep_event(self, event: "AgentResponseEvent") -> bool:
+        """Whether to keep a response event in full."""
+        if self.keep_protocol_violations and event.followed_clarification_protocol is False:
+            return True
+        if self.keep_errors and (event.error or any(tc.error for tc in event.tool_calls)):
+            return True
+        return self.sampled(event.message_id)
+
+
+def _truncate(text: str, limit: int) -> str:
+    """Cap stored text at `limit` characters (0 disables the cap)."""
+    if not limit or len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [{len(text) - limit} chars truncated]"
 
 
 class AgentLogger:
     """Centralized logging for agent observability."""
     
-    def __init__(self, log_dir: Optional[Path] = None, enable_file_logging: bool = True):
+    def __init__(
+        self,
+        log_dir: Optional[Path] = None,
+        enable_file_logging: bool = True,
+        sampling: Optional[SamplingPolicy] = None,
+        max_events: Optional[int] = None,
+        max_text_chars: Optional[int] = None,
+    ):
         """
         Initialize logger.
         
         Args:
             log_dir: Directory to save log files (default: ./logs or /tmp/logs on Vercel)
             enable_file_logging: Whether to write logs to files
+            sampling: Which turns to record in full (default: OBSERVABILITY_SAMPLE_RATE)
+            max_events: Response events kept in memory (default: OBSERVABILITY_MAX_EVENTS or 10000)
+            max_text_chars: Cap on stored prompt/response text (default: OBSERVABILITY_MAX_TEXT_CHARS or 4000)
         """
         # On Vercel, use /tmp for any file operations (read-write)
         # Otherwise use project directory
@@ -135,9 +302,24 @@ class AgentLogger:
                 self.logger.warning(f"Could not create file handler: {e}. Using console logging only.")
                 self.enable_file_logging = False
         
-        # Event storage
-        self.events: List[AgentResponseEvent] = []
+        # Sampling and storage bounds
+        self.sampling = sampling or SamplingPolicy.from_env()
+        if max_events is None:
+            max_events = int(os.getenv("OBSERVABILITY_MAX_EVENTS", "10000"))
+        if max_text_chars is None:
+            max_text_chars = int(os.getenv("OBSERVABILITY_MAX_TEXT_CHARS", "4000"))
+        self.max_text_chars = max_text_chars
+
+        # Event storage (bounded: oldest events are dropped first)
+        self.events: Deque[AgentResponseEvent] = deque(maxlen=max_events or None)
+        self.cancellations: Deque[StreamCancellationEvent] = deque(maxlen=max_events or None)
         self.sessions: Dict[str, SessionMetrics] = {}
+        self.tool_token_usage: Dict[str, TokenUsage] = {}
+
+        # Self-measurement: time spent inside log_tool_call/log_response
+        self.overhead_calls = 0
+        self.overhead_ns = 0
+        self.events_sampled_out = 0
     
     def log_tool_call(
         self,
@@ -150,6 +332,7 @@ class AgentLogger:
         error: Optional[str] = None,
     ):
         """Log a tool call event."""
+        started = time.perf_counter_ns()
         event = ToolCallEvent(
             tool_name=tool_name,
             args=args,
@@ -161,14 +344,18 @@ class AgentLogger:
             error=error,
         )
         
-        self.logger.info(
-            f"[TOOL] {tool_name} | Session: {session_id[:8]}... | "
-            f"Args: {json.dumps(args, default=str)[:100]}"
-        )
+        # Args are only serialized when the line will actually be emitted
+        if self.logger.isEnabledFor(logging.INFO) and self.sampling.sampled(message_id):
+            self.logger.info(
+                f"[TOOL] {tool_name} | Session: {session_id[:8]}... | "
+                f"Args: {json.dumps(args, default=str)[:100]}"
+            )
         
         if error:
             self.logger.error(f"[TOOL ERROR] {tool_name}: {error}")
+            self._get_session_metrics(session_id).errors.append(f"{tool_name}: {error}")
         
+        self._record_overhead(started)
         return event
     
     def log_response(
@@ -181,8 +368,18 @@ class AgentLogger:
         response_time_ms: float,
         token_count: Optional[int] = None,
         is_first_message: bool = False,
+        span_timings: Optional[Dict[str, float]] = None,
+        token_accounting: Optional[TurnTokenAccounting] = None,
+        error: Optional[str] = None,
     ):
-        """Log an agent response event."""
+        """Log an agent response event (`error`: why the turn failed, if it did)."""
+        started = time.perf_counter_ns()
+        token_usage = None
+        if token_accounting is not None and token_accounting.steps:
+            token_usage = token_accounting.total
+            if token_count is None:
+                token_count = token_usage.total_tokens
+
         # Analyze if clarification protocol was followed (only check on first message)
         followed_protocol, clarification_q = self._analyze_clarification_protocol(
             user_message, agent_response, tool_calls, is_first_message
@@ -191,44 +388,46 @@ class AgentLogger:
         event = AgentResponseEvent(
             session_id=session_id,
             message_id=message_id,
-            user_message=user_message,
-            agent_response=agent_response,
+            user_message=_truncate(user_message, self.max_text_chars),
+            agent_response=_truncate(agent_response, self.max_text_chars),
             timestamp=time.time(),
             tool_calls=tool_calls,
             response_time_ms=response_time_ms,
             token_count=token_count,
             followed_clarification_protocol=followed_protocol,
             clarification_question=clarification_q,
+            span_timings=span_timings,
+            token_usage=token_usage,
+            error=error,
         )
         
-        self.events.append(event)
-        
-        # Update session metrics
-        if session_id not in self.sessions:
-            self.sessions[session_id] = SessionMetrics(
-                session_id=session_id,
-                start_time=time.time(),
-                message_count=0,
-                tool_call_count=0,
-                total_response_time_ms=0,
-                tools_used=[],
-                errors=[],
-            )
+        keep_event = self.sampling.keep_event(event)
+        if keep_event:
+            self.events.append(event)
+        else:
+            self.events_sampled_out += 1
         
-        session = self.sessions[session_id]
+        # Update session metrics (always, regardless of sampling)
+        session = self._get_session_metrics(session_id)
+        if token_accounting is not None:
+            self.log_token_usage(session_id, token_accounting)
         session.message_count += 1
         session.tool_call_count += len(tool_calls)
         session.total_response_time_ms += response_time_ms
         session.tools_used.extend([tc.tool_name for tc in tool_calls])
+        if error:
+            session.errors.append(error)
         
-        # Log summary
-        protocol_status = "✅ FOLLOWED" if followed_protocol else "❌ VIOLATED"
-        self.logger.info(
-            f"[RESPONSE] Session: {session_id[:8]}... | "
-            f"Protocol: {protocol_status} | "
-            f"Tools: {len(tool_calls)} | "
-            f"Time: {response_time_ms:.0f}ms"
-        )
+        # Log summary (sampled with the event)
+        if keep_event and self.logger.isEnabledFor(logging.INFO):
+            protocol_status = "✅ FOLLOWED" if followed_protocol else "❌ VIOLATED"
+            self.logger.info(
+                f"[RESPONSE] Session: {session_id[:8]}... | "
+                f"Protocol: {protocol_status} | "
+                f"Tools: {len(tool_calls)} | "
+                f"Tokens: {token_count if token_count is not None else 'n/a'} | "
+                f"Time: {response_time_ms:.0f}ms"
+            )
         
         if not followed_protocol and len(tool_calls) > 0:
             self.logger.warning(
@@ -237,11 +436,104 @@ class AgentLogger:
             )
         
         # Save to file
-        if self.enable_file_logging:
+        if self.enable_file_logging and keep_event:
             self._save_event(event)
         
+        self._record_overhead(started)
         return event
     
+    def _record_overhead(self, started_ns: int):
+        """Accumulate time spent in observability calls."""
+        self.overhead_calls += 1
+        self.overhead_ns += time.perf_counter_ns() - started_ns
+
+    def get_overhead_stats(self) -> Dict[str, Any]:
+        """Measured cost of observability itself."""
+        return {
+            "sample_rate": self.sampling.rate,
+            "calls": self.overhead_calls,
+            "total_ms": self.overhead_ns / 1_000_000,
+            "avg_us_per_call": (self.overhead_ns / self.overhead_calls / 1000) if self.overhead_calls else 0,
+            "events_stored": len(self.events),
+            "events_max": self.events.maxlen,
+            "events_sampled_out": self.events_sampled_out,
+        }
+
+    def _get_session_metrics(self, session_id: str) -> SessionMetrics:
+        """Get or create the metrics record for a session."""
+        if session_id not in self.sessions:
+            self.sessions[session_id] = SessionMetrics(
+                session_id=session_id,
+                start_time=time.time(),
+                message_count=0,
+                tool_call_count=0,
+                total_response_time_ms=0,
+                tools_used=[],
+                errors=[],
+            )
+        return self.sessions[session_id]
+
+    def log_token_usage(self, session_id: str, token_accounting: TurnTokenAccounting):
+        """Aggregate one turn's token usage into session and tool totals."""
+        session = self._get_session_metrics(session_id)
+        session.token_usage.add(token_accounting.total)
+        for tool_name, usage in token_accounting.by_tool.items():
+            self.tool_token_usage.setdefault(tool_name, TokenUsage()).add(usage)
+
+    def log_stream_cancelled(
+        self,
+        session_id: str,
+        message_id: str,
+        reason: str,
+        frames_sent: int,
+        elapsed_ms: float,
+    ):
+        """Record a streaming turn that was cancelled (e.g. the client disconnected)."""
+        event = StreamCancellationEvent(
+            session_id=session_id,
+            message_id=message_id,
+            reason=reason,
+            frames_sent=frames_sent,
+            elapsed_ms=elapsed_ms,
+            timestamp=time.time(),
+        )
+        self.cancellations.append(event)
+        self._get_session_metrics(session_id).cancelled_streams += 1
+        self.logger.info(
+            f"[STREAM CANCELLED] Session {session_id}, message {message_id}: "
+            f"{reason} after {frames_sent} frames ({elapsed_ms:.0f}ms)"
+        )
+
+    def get_token_report(self, limit: int = 10) -> Dict[str, Any]:
+        """Heaviest sessions and tools by total tokens."""
+        totals = TokenUsage()
+        for session in self.sessions.values():
+            totals.add(session.token_usage)
+
+        heaviest_sessions = heapq.nlargest(
+            limit, self.sessions.values(), key=lambda s: s.token_usage.total_tokens
+        )
+        heaviest_tools = heapq.nlargest(
+            limit, self.tool_token_usage.items(), key=lambda item: item[1].total_tokens
+        )
+
+        return {
+            "totals": totals.to_dict(),
+            "sessions": [
+                {
+                    "session_id": s.session_id,
+                    "message_count": s.message_count,
+                    "avg_tokens_per_message": s.token_usage.total_tokens / s.message_count if s.message_count > 0 else 0,
+                    **s.token_usage.to_dict(),
+                }
+                for s in heaviest_sessions
+            ],
+            "tools": [
+                {"tool_name": tool_name, **usage.to_dict()}
+                for tool_name, usage in heaviest_tools
+            ],
+        }
+
     def _analyze_clarification_protocol(
         self,
         user_message: str,
@@ -290,7 +582,8 @@ class AgentLogger:
         """Save event to JSON file for analysis."""
         if not self.enable_file_logging:
             # On Vercel or when file logging disabled, just log to console
-            self.logger.debug(f"[EVENT] {json.dumps(asdict(event), default=str)}")
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug(f"[EVENT] {json.dumps(asdict(event), default=str)}")
             return
         
         try:
@@ -322,6 +615,8 @@ class AgentLogger:
             "tools_used": list(set(session.tools_used)),
             "protocol_violations": protocol_violations,
             "errors": session.errors,
+            "token_usage": session.token_usage.to_dict(),
+            "cancelled_streams": session.cancelled_streams,
         }
     
     def export_metrics(self, output_path: Optional[Path] = None) -> Path:
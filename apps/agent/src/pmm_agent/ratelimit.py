@@ -0,0 +1,212 @@
+"""
+Token-Bucket Rate Limiting for Chat Turns.
+
+Chat turns are charged by the model tokens they consume rather than by
+request count, so a heavy turn (long history, many tool calls) uses up
+more of a client's budget than a one-line question.
+
+Each key has a bucket holding up to `capacity` tokens that refills at
+`refill_per_second`. A turn is charged to one bucket: its API key's when
+the request carries a known one, otherwise its client IP's. Authenticated
+callers behind a shared NAT each keep their own budget; anonymous traffic
+from one address shares one:
+
+1. Before the turn, an estimate is reserved on every key. The request is
+   refused (429) if any bucket holds less than the estimate, capped at
+   `capacity` so an oversized turn can still run from a full bucket.
+2. After the turn, the reservation is settled against the tokens the model
+   reported. The difference is charged or refunded, and a bucket may go
+   negative, so a client that ran an expensive turn waits proportionally
+   longer.
+
+Backends:
+- MemoryBackend: per process. Fine for a single worker.
+- SQLiteBackend: a file shared by all worker processes on the host. Each
+  update is one short IMMEDIATE transaction.
+
+    limiter = TokenBucketLimiter(MemoryBackend(), capacity=100_000, refill_per_second=1_000)
+    key = rate_limit_key(api_key, client_ip, known_api_keys)
+    reservation = limiter.reserve(key, estimate)   # raises RateLimited
+    ...
+    limiter.settle(reservation, actual_tokens)
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple, Union
+
+
+class RateLimited(Exception):
+    """The key's token bucket cannot cover the turn yet."""
+
+    def __init__(self, key: str, retry_after: float):
+        super().__init__(f"Token budget exhausted for {key}; retry in {retry_after:.1f}s")
+        self.key = key
+        self.retry_after = retry_after
+
+
+@dataclass
+class Reservation:
+    """Tokens reserved for one turn on each of its keys, settled when the turn ends."""
+    keys: Tuple[str, ...]
+    estimated: int
+    settled: bool = False
+
+
+def _refill(tokens: float, updated: float, now: float, capacity: float, rate: float) -> float:
+    return min(capacity, tokens + max(0.0, now - updated) * rate)
+
+
+class MemoryBackend:
+    """Buckets in a dict: per process, lost on restart."""
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}  # key -> (tokens, updated)
+
+    def take(self, key: str, amount: float, required: float, capacity: float, rate: float, now: float) -> Tuple[bool, float]:
+        """
+        Refill, then remove `amount` if at least `required` tokens remain.
+
+        Returns (taken, tokens) with the bucket level after the call.
+        """
+        tokens, updated = self._buckets.get(key, (capacity, now))
+        tokens = _refill(tokens, updated, now, capacity, rate)
+        taken = tokens >= required
+        if taken:
+            tokens = min(capacity, tokens - amount)
+        self._buckets[key] = (tokens, now)
+        return taken, tokens
+
+    def close(self) -> None:
+        self._buckets.clear()
+
+
+class SQLiteBackend:
+    """Buckets in a SQLite file shared by the worker processes on one host."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS token_buckets ("
+            "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        # One connection per process; the lock covers threadpool callers
+        self._lock = threading.Lock()
+
+    def take(self, key: str, amount: float, required: float, capacity: float, rate: float, now: float) -> Tuple[bool, float]:
+        """Same contract as MemoryBackend.take, atomic across processes."""
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so the read-modify-write
+            # cannot interleave with another worker's
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT tokens, updated FROM token_buckets WHERE key = ?", (key,)
+                ).fetchone()
+                tokens = _refill(row[0], row[1], now, capacity, rate) if row else capacity
+                taken = tokens >= required
+                if taken:
+                    tokens = min(capacity, tokens - amount)
+                self._conn.execute(
+                    "INSERT INTO token_buckets (key, tokens, updated) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                    (key, tokens, now),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return taken, tokens
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class TokenBucketLimiter:
+    """Reserves estimated tokens per key before a turn and settles actual usage after."""
+
+    def __init__(self, backend, capacity: float, refill_per_second: float, enabled: bool = True):
+        """
+        Args:
+            backend: MemoryBackend or SQLiteBackend
+            capacity: Bucket size in tokens (the largest burst a key can spend)
+            refill_per_second: Tokens added back per second
+            enabled: When False, every reservation succeeds and nothing is charged
+        """
+        self.backend = backend
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.enabled = enabled
+
+    def reserve(self, keys: Union[str, Sequence[str]], estimated_tokens: int) -> Reservation:
+        """
+        Charge the estimate to every key, or raise RateLimited with a retry delay.
+
+        Nothing stays charged if any key's bucket refuses.
+        """
+        keys = (keys,) if isinstance(keys, str) else tuple(keys)
+        if not self.enabled:
+            return Reservation(keys, 0, settled=True)
+        required = min(estimated_tokens, self.capacity)
+        charged: List[str] = []
+        for key in keys:
+            taken, tokens = self.backend.take(
+                key, estimated_tokens, required, self.capacity, self.refill_per_second, time.time()
+            )
+            if not taken:
+                self._adjust(charged, -estimated_tokens)
+                raise RateLimited(key, (required - tokens) / self.refill_per_second)
+            charged.append(key)
+        return Reservation(keys, estimated_tokens)
+
+    def _adjust(self, keys: Iterable[str], amount: float) -> None:
+        """Charge (or, if negative, refund) `amount` on each key unconditionally."""
+        now = time.time()
+        for key in keys:
+            self.backend.take(key, amount, float("-inf"), self.capacity, self.refill_per_second, now)
+
+    def settle(self, reservation: Reservation, actual_tokens: Optional[int]) -> None:
+        """
+        Charge or refund the difference between actual and estimated tokens.
+
+        `actual_tokens` is None when the model reported no usage; the
+        estimate then stands.
+        """
+        if reservation.settled:
+            return
+        reservation.settled = True
+        if actual_tokens is None or actual_tokens == reservation.estimated:
+            return
+        self._adjust(reservation.keys, actual_tokens - reservation.estimated)
+
+
+def estimate_turn_tokens(texts: Iterable[str], output_allowance: int = 1024) -> int:
+    """Rough cost of a turn: its prompt (~4 characters per token) plus an output allowance."""
+    return sum(len(text) for text in texts) // 4 + output_allowance
+
+
+def hash_api_key(api_key: str) -> str:
+    """Bucket key for an API key. Keys are hashed so they never reach the bucket store."""
+    return "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+
+def rate_limit_key(
+    api_key: Optional[str], client_ip: Optional[str], known_api_keys: FrozenSet[str] = frozenset()
+) -> str:
+    """
+    Bucket key a request is charged to: its API key if known, else its client IP.
+
+    `known_api_keys` holds hash_api_key() of the configured keys. Anything
+    else the client sends (an unknown API key, a session ID) is ignored,
+    so rotating it per request cannot reach a fresh bucket.
+    """
+    if api_key:
+        key = hash_api_key(api_key)
+        if key in known_api_keys:
+            return key
+    return f"ip:{client_ip or 'unknown'}"
@@ -0,0 +1,275 @@
+"""
+Record/Replay of Agent Turns.
+
+Recording captures every model response and tool output of a turn (with
+their latencies) to a JSON fixture. Replay re-runs the turn through the
+real agent graph, serving the recorded model responses and tool outputs,
+so prompt, tool and streaming changes can be benchmarked against real
+conversation shapes without network access or API spend.
+
+Recording: set RECORD_TURNS_DIR and the server writes each /chat and
+/chat/stream turn to <RECORD_TURNS_DIR>/<message_id>.json. Fixtures
+contain the full conversation text, so keep them out of version control
+unless they have been reviewed.
+
+Replay:
+
+    fixture = load_fixture("fixtures/turn.json")
+    agent = create_replay_agent(fixture)
+    result = await agent.ainvoke({"messages": fixture_input_messages(fixture)})
+
+With pace=True, replay waits for each recorded model and tool latency, so
+timings resemble production; otherwise it runs as fast as possible.
+"""
+
+import asyncio
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    ToolMessage,
+    message_to_dict,
+    messages_from_dict,
+    messages_to_dict,
+)
+from langchain_core.outputs import LLMResult
+from langchain_core.tools import BaseTool, StructuredTool, ToolException
+
+from .fake_model import FakeChatModel
+
+FIXTURE_VERSION = 1
+
+
+def _args_key(name: str, args: Any) -> Tuple[str, str]:
+    """Order-independent key for a tool invocation."""
+    try:
+        return name, json.dumps(args, sort_keys=True, default=str)
+    except (TypeError, ValueError):
+        return name, str(args)
+
+
+class TurnRecorder(BaseCallbackHandler):
+    """
+    Callback handler that records one agent turn.
+
+    Pass it in the run config (`{"callbacks": [recorder]}`); it sees every
+    model call and tool run in the graph, including nested ones.
+    """
+
+    # Record in call order on the event loop rather than in a thread pool
+    run_inline = True
+
+    def __init__(
+        self,
+        domain: str,
+        model_name: Optional[str] = None,
+        session_id: Optional[str] = None,
+        message_id: Optional[str] = None,
+    ):
+        self.domain = domain
+        self.model_name = model_name
+        self.session_id = session_id
+        self.message_id = message_id
+        self.input_messages: Optional[List[Dict]] = None
+        self.model_responses: List[Dict] = []
+        self.tool_outputs: List[Dict] = []
+        self._starts: Dict[UUID, float] = {}
+
+    def _elapsed(self, run_id: UUID) -> float:
+        start = self._starts.pop(run_id, None)
+        return time.perf_counter() - start if start is not None else 0.0
+
+    def on_chat_model_start(self, serialized: Dict, messages: List[List[BaseMessage]], *, run_id: UUID, **kwargs) -> None:
+        if self.input_messages is None and messages:
+            self.input_messages = messages_to_dict(messages[0])
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs) -> None:
+        latency_s = self._elapsed(run_id)
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                if message is not None:
+                    self.model_responses.append({"message": message_to_dict(message), "latency_s": latency_s})
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs) -> None:
+        self._starts.pop(run_id, None)
+
+    def on_tool_start(self, serialized: Dict, input_str: str, *, run_id: UUID, **kwargs) -> None:
+        self._starts[run_id] = time.perf_counter()
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs) -> None:
+        latency_s = self._elapsed(run_id)
+        if isinstance(output, ToolMessage):
+            entry = {"name": output.name, "tool_call_id": output.tool_call_id, "content": output.content}
+        else:
+            entry = {"name": kwargs.get("name"), "tool_call_id": None, "content": str(output)}
+        entry["latency_s"] = latency_s
+        self.tool_outputs.append(entry)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs) -> None:
+        self.tool_outputs.append({
+            "name": kwargs.get("name"),
+            "tool_call_id": None,
+            "error": str(error),
+            "latency_s": self._elapsed(run_id),
+        })
+
+    def to_fixture(self) -> Dict[str, Any]:
+        """Build the fixture, attaching recorded args to each tool output."""
+        args_by_id = {}
+        for response in self.model_responses:
+            for call in response["message"]["data"].get("tool_calls") or []:
+                args_by_id[call.get("id")] = (call.get("name"), call.get("args", {}))
+
+        tool_outputs = []
+        for output in self.tool_outputs:
+            name, args = args_by_id.get(output["tool_call_id"], (output["name"], None))
+            tool_outputs.append({**output, "name": output["name"] or name, "args": args})
+
+        return {
+            "version": FIXTURE_VERSION,
+            "recorded_at": datetime.now().isoformat(),
+            "domain": self.domain,
+            "model_name": self.model_name,
+            "session_id": self.session_id,
+            "message_id": self.message_id,
+            "input_messages": self.input_messages or [],
+            "model_responses": self.model_responses,
+            "tool_outputs": tool_outputs,
+        }
+
+    def save(self, directory: Union[str, Path]) -> Optional[Path]:
+        """Write the fixture to <directory>/<message_id>.json. Returns the path."""
+        if not self.model_responses:
+            return None
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{self.message_id or int(time.time() * 1000)}.json"
+        with open(path, "w") as f:
+            json.dump(self.to_fixture(), f, indent=2, default=str)
+        return path
+
+
+def load_fixture(path: Union[str, Path]) -> Dict[str, Any]:
+    """Load and validate a recorded turn."""
+    with open(path, "r") as f:
+        fixture = json.load(f)
+    if fixture.get("version") != FIXTURE_VERSION:
+        raise ValueError(f"Unsupported fixture version {fixture.get('version')} in {path}")
+    return fixture
+
+
+def fixture_input_messages(fixture: Dict[str, Any]) -> List[BaseMessage]:
+    """The conversation the recorded turn started from."""
+    return messages_from_dict(fixture["input_messages"])
+
+
+def fixture_user_message(fixture: Dict[str, Any]) -> str:
+    """Text of the last user message of the recorded turn."""
+    for message in reversed(fixture_input_messages(fixture)):
+        if message.type == "human":
+            return message.content if isinstance(message.content, str) else str(message.content)
+    return ""
+
+
+class ReplayChatModel(FakeChatModel):
+    """Chat model that returns a fixture's recorded responses, step by step."""
+
+    responses: List[Dict[str, Any]] = []
+    pace: bool = False
+    """Wait for each response's recorded latency."""
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay-chat-model"
+
+    def _respond(self, messages: List[BaseMessage]) -> Tuple[AIMessage, float]:
+        step_index = self._step_index(messages)
+        if step_index >= len(self.responses):
+            return AIMessage(content=self.default_text), 0.0
+        recorded = self.responses[step_index]
+        message = messages_from_dict([recorded["message"]])[0]
+        return message, recorded.get("latency_s", 0.0) if self.pace else 0.0
+
+
+class ToolOutputReplay:
+    """
+    Serves recorded tool outputs in place of the real tools.
+
+    Lookups match on tool name and arguments, then fall back to the first
+    output recorded for that tool name. They don't consume outputs, so one
+    replay agent can run the same turn many times, concurrently.
+    """
+
+    def __init__(self, fixture: Dict[str, Any], pace: bool = False):
+        self.pace = pace
+        self._by_args: Dict[Tuple[str, str], Dict] = {}
+        self._by_name: Dict[str, Dict] = {}
+        for output in fixture.get("tool_outputs", []):
+            if output.get("args") is not None:
+                self._by_args.setdefault(_args_key(output["name"], output["args"]), output)
+            self._by_name.setdefault(output["name"], output)
+
+    def lookup(self, name: str, args: Dict[str, Any]) -> Dict[str, Any]:
+        output = self._by_args.get(_args_key(name, args)) or self._by_name.get(name)
+        if output is None:
+            raise ToolException(f"No recorded output for tool '{name}'")
+        return output
+
+    @staticmethod
+    def _result(output: Dict[str, Any]) -> Any:
+        if "error" in output:
+            raise ToolException(output["error"])
+        return output["content"]
+
+    def wrap(self, tool: BaseTool) -> BaseTool:
+        """Replace a tool with one that returns its recorded outputs."""
+
+        def run(**kwargs):
+            output = self.lookup(tool.name, kwargs)
+            if self.pace:
+                time.sleep(output.get("latency_s", 0.0))
+            return self._result(output)
+
+        async def arun(**kwargs):
+            output = self.lookup(tool.name, kwargs)
+            if self.pace:
+                await asyncio.sleep(output.get("latency_s", 0.0))
+            return self._result(output)
+
+        return StructuredTool.from_function(
+            func=run,
+            coroutine=arun,
+            name=tool.name,
+            description=tool.description,
+            args_schema=tool.args_schema,
+            handle_tool_error=True,
+        )
+
+
+def create_replay_agent(fixture: Dict[str, Any], pace: bool = False):
+    """
+    Create the fixture's domain agent with recorded model and tool outputs.
+
+    Args:
+        fixture: A recorded turn (see load_fixture)
+        pace: Wait for recorded model and tool latencies
+
+    Returns:
+        Configured LangGraph agent that replays the turn offline
+    """
+    from .agent import create_analytics_agent, create_pmm_agent
+
+    model = ReplayChatModel(responses=fixture["model_responses"], pace=pace)
+    tools = ToolOutputReplay(fixture, pace=pace)
+    if fixture.get("domain") == "data_analytics":
+        return create_analytics_agent(mode="full", model=model, tool_wrapper=tools.wrap)
+    return create_pmm_agent(mode="full", model=model, tool_wrapper=tools.wrap)
@@ -5,10 +5,14 @@ Runs without Docker or LangSmith.
 
 import os
 import json
+import math
 import uuid
 import time
-from typing import AsyncGenerator
+import asyncio
+from typing import AsyncGenerator, Iterator, Optional, Tuple
+from contextlib import aclosing
 from functools import lru_cache
+from json.encoder import encode_basestring_ascii
 from datetime import datetime
 from pathlib import Path
 
@@ -33,7 +37,7 @@ except ImportError:
 
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel, Field
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
@@ -45,7 +49,25 @@ from langchain_core.runnables import RunnableLambda
 
 from .prompts import MAIN_SYSTEM_PROMPT
 from .tools import ALL_TOOLS
-from .observability import get_logger
+from .observability import get_logger, running_in_production, TurnTokenAccounting
+from .tracing import get_tracer
+from .debug import get_debug_channel
+from .replay import TurnRecorder
+from .streaming import MessageNormalizer, ToolCallEvent
+from .stream_runs import StreamRun, StreamRunRegistry, parse_last_event_id
+from .ratelimit import (
+    MemoryBackend,
+    RateLimited,
+    Reservation,
+    SQLiteBackend,
+    TokenBucketLimiter,
+    estimate_turn_tokens,
+    hash_api_key,
+    rate_limit_key,
+)
+from .turns import SessionBusy, SessionTurn, SessionTurnLocks, SingleFlight, turn_key
+from .uploads import DatasetUploads, UploadRejected
+from .metrics import AgentMetrics, PrometheusMiddleware, CONTENT_TYPE as PROMETHEUS_CONTENT_TYPE
 from .agent import create_pmm_agent, create_analytics_agent, _load_domain_config
 
 # Domain selection - defaults to "pmm" for backward compatibility
@@ -89,9 +111,7 @@ def get_allowed_origins():
         return [origin.strip() for origin in allowed_origins_env.split(",") if origin.strip()]
     
     # Production environments should restrict origins
-    is_production = os.getenv("VERCEL") or os.getenv("PRODUCTION") == "true" or os.getenv("ENVIRONMENT") == "production"
-    
-    if is_production:
+    if running_in_production():
         # In production, default to empty list (no CORS) unless explicitly configured
         # This ensures security - must set ALLOWED_ORIGINS explicitly
         return []
@@ -112,6 +132,11 @@ limiter = Limiter(key_func=get_remote_address)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
+# Prometheus metrics (scraped via /metrics/prometheus)
+# Session count is read lazily at scrape time, so the gauge is O(1)
+metrics = AgentMetrics(session_count=lambda: len(sessions))
+app.add_middleware(PrometheusMiddleware, metrics=metrics)
+
 # Check for API key (only raise at runtime, not during import)
 # This allows the function to be deployed even if env var isn't set during build
 def check_api_key():
@@ -140,8 +165,28 @@ if 'logger' not in locals():
 # Log which model and domain are being used (for debugging/verification)
 logger.logger.info(f"🤖 Agent initialized - Domain: {domain}, Model: {model_name}")
 
+# Structured debug events for the stream loop (no-op unless enabled)
+debug = get_debug_channel()
+
 # Configuration
 MAX_MESSAGE_HISTORY = int(os.getenv("MAX_MESSAGE_HISTORY", "100"))  # Keep last 100 messages per session
+STREAM_BUFFER_FRAMES = int(os.getenv("STREAM_BUFFER_FRAMES", "256"))  # Frames the agent may run ahead of the client
+STREAM_REPLAY_FRAMES = int(os.getenv("STREAM_REPLAY_FRAMES", "2048"))  # Frames kept per stream for Last-Event-ID resume
+STREAM_RESUME_GRACE_SECONDS = float(os.getenv("STREAM_RESUME_GRACE_SECONDS", "5"))  # Wait for a reconnect before cancelling (0: cancel at once)
+STREAM_RESUME_TTL_SECONDS = float(os.getenv("STREAM_RESUME_TTL_SECONDS", "120"))  # Keep finished streams for late reconnects
+DISCONNECT_POLL_SECONDS = 0.5  # How often an idle stream checks whether the client is still there
+MAX_SESSION_QUEUE_DEPTH = int(os.getenv("MAX_SESSION_QUEUE_DEPTH", "4"))  # Turns that may wait behind a session's running turn
+TOKEN_RATE_LIMIT_PER_MINUTE = int(os.getenv("TOKEN_RATE_LIMIT_PER_MINUTE", "40000"))  # Model tokens per key per minute (0 = off)
+TOKEN_RATE_LIMIT_BURST = int(os.getenv("TOKEN_RATE_LIMIT_BURST", str(TOKEN_RATE_LIMIT_PER_MINUTE)))  # Bucket size
+TOKEN_RATE_LIMIT_DB = os.getenv("TOKEN_RATE_LIMIT_DB")  # SQLite file shared by workers (default: in memory)
+# API keys (X-API-Key) whose callers are limited per key instead of per client IP
+RATE_LIMIT_API_KEYS = frozenset(
+    hash_api_key(key.strip()) for key in os.getenv("RATE_LIMIT_API_KEYS", "").split(",") if key.strip()
+)
+RECORD_TURNS_DIR = os.getenv("RECORD_TURNS_DIR")  # Record turns as replay fixtures (see replay.py)
+MAX_UPLOAD_MB = int(os.getenv("MAX_UPLOAD_MB", "1024"))  # Largest dataset upload accepted by /datasets
+UPLOADS_MAX_PER_CLIENT_MB = int(os.getenv("UPLOADS_MAX_PER_CLIENT_MB", "4096"))  # Disk budget per client IP
+UPLOADS_MAX_TOTAL_MB = int(os.getenv("UPLOADS_MAX_TOTAL_MB", "20480"))  # Disk budget for all uploads
 
 # Helper function to get system prompt based on domain
 def get_system_prompt() -> str:
@@ -173,6 +218,201 @@ def truncate_session_messages(session_messages: list) -> list:
     return recent_messages
 
 
+def new_turn_recorder(session_id: str, message_id: str) -> Optional[TurnRecorder]:
+    """Create a recorder for this turn if RECORD_TURNS_DIR is set."""
+    if not RECORD_TURNS_DIR:
+        return None
+    return TurnRecorder(domain=domain, model_name=model_name, session_id=session_id, message_id=message_id)
+
+
+def agent_run_config(session_id: str, recorder: Optional[TurnRecorder] = None) -> dict:
+    """LangGraph run config for a turn, with the recorder attached if any."""
+    config = {"configurable": {"thread_id": session_id}}
+    if recorder is not None:
+        config["callbacks"] = [recorder]
+    return config
+
+
+def save_turn_recording(recorder: Optional[TurnRecorder]) -> None:
+    """Write a recorded turn; recording failures never fail the turn."""
+    if recorder is None:
+        return
+    try:
+        recorder.save(RECORD_TURNS_DIR)
+    except OSError as e:
+        logger.logger.warning(f"Could not save turn recording: {e}")
+
+
+class TurnToolCalls:
+    """
+    A turn's tool calls, logged once the tools node returns their results.
+
+    A call whose ToolMessage has status "error" is logged with that error,
+    so sampling always keeps the turn. Calls that never got a result (the
+    turn failed or was cancelled first) are logged by finish().
+    """
+
+    def __init__(self, session_id: str, message_id: str):
+        self.session_id = session_id
+        self.message_id = message_id
+        self.logged = []
+        self._pending = {}  # tool call ID -> (name, args, start time)
+
+    def called(self, call: ToolCallEvent) -> None:
+        """The model requested a tool call."""
+        metrics.tool_calls_total.inc(1.0, call.name)
+        self._pending[call.id or object()] = (call.name, call.args, time.time())
+
+    def results(self, messages: list) -> None:
+        """Log the calls answered by the ToolMessages among `messages`."""
+        for message in messages:
+            if not isinstance(message, ToolMessage) or message.tool_call_id not in self._pending:
+                continue
+            name, args, started = self._pending.pop(message.tool_call_id)
+            error = None
+            if message.status == "error":
+                error = message.content if isinstance(message.content, str) else json.dumps(message.content, default=str)
+            self._log(name, args, (time.time() - started) * 1000, error)
+
+    def finish(self) -> list:
+        """Log the calls still waiting for a result; returns every logged call."""
+        for name, args, _ in self._pending.values():
+            self._log(name, args)
+        self._pending.clear()
+        return self.logged
+
+    def _log(self, name: str, args: dict, duration_ms: Optional[float] = None, error: Optional[str] = None) -> None:
+        self.logged.append(logger.log_tool_call(
+            tool_name=name,
+            args=args,
+            session_id=self.session_id,
+            message_id=self.message_id,
+            duration_ms=duration_ms,
+            error=error,
+        ))
+
+
+def record_token_metrics(token_accounting: TurnTokenAccounting) -> None:
+    """Add a turn's token usage to the Prometheus token counters."""
+    usage = token_accounting.total
+    metrics.tokens_total.inc(usage.input_tokens, "input")
+    metrics.tokens_total.inc(usage.output_tokens, "output")
+    metrics.tokens_total.inc(usage.cache_read_tokens, "cache_read")
+    metrics.tokens_total.inc(usage.cache_creation_tokens, "cache_creation")
+
+
+async def traced_agent_updates(messages: list, config: dict, turn_span) -> AsyncGenerator[dict, None]:
+    """
+    Stream the agent's {node_name: output} updates for a turn.
+
+    Each ReAct node gets a react.<node> span under `turn_span` covering the
+    wait for its update: the "agent" node is the model call, the "tools"
+    node is tool execution.
+    """
+    tracer = get_tracer()
+    node_start = time.time_ns()
+    async with aclosing(agent.astream({"messages": messages}, config)) as updates:
+        async for event in updates:
+            node_end = time.time_ns()
+            for node_name in event:
+                tracer.start_span(f"react.{node_name}", parent=turn_span, start_time=node_start).end(node_end)
+            yield event
+            node_start = time.time_ns()
+
+
+# SSE frame encoding: frames are written as bytes so StreamingResponse
+# doesn't re-encode each one. The constant part of every frame is encoded
+# once; only the payload is escaped. Output matches json.dumps exactly.
+_SSE_TEXT_PREFIX = b'data: {"type": "text", "content": '
+_SSE_TOOL_CALL_PREFIX = b'data: {"type": "tool_call", "name": '
+_SSE_ARGS_SEPARATOR = b', "args": '
+_SSE_DONE_PREFIX = b'data: {"type": "done", "session_id": '
+_SSE_FRAME_END = b"}\n\n"
+
+
+@lru_cache(maxsize=4096)
+def sse_text(content: str) -> bytes:
+    """Encode a text frame. Cached: text is streamed one character at a time."""
+    return _SSE_TEXT_PREFIX + encode_basestring_ascii(content).encode("ascii") + _SSE_FRAME_END
+
+
+def sse_tool_call(name: str, args: dict) -> bytes:
+    """Encode a tool call frame."""
+    return (
+        _SSE_TOOL_CALL_PREFIX + encode_basestring_ascii(name).encode("ascii")
+        + _SSE_ARGS_SEPARATOR + json.dumps(args).encode("ascii") + _SSE_FRAME_END
+    )
+
+
+def sse_done(session_id: str) -> bytes:
+    """Encode the end-of-stream frame."""
+    return _SSE_DONE_PREFIX + encode_basestring_ascii(session_id).encode("ascii") + _SSE_FRAME_END
+
+
+async def count_sse_frames(frames: AsyncGenerator[bytes, None]) -> AsyncGenerator[bytes, None]:
+    """Pass SSE frames through while counting frames and bytes for Prometheus."""
+    frames_total = metrics.sse_frames_total.labels()
+    bytes_total = metrics.sse_bytes_total.labels()
+    async for frame in frames:
+        frames_total.inc()
+        bytes_total.inc(len(frame))
+        yield frame
+
+
+stream_registry = StreamRunRegistry(ttl_seconds=STREAM_RESUME_TTL_SECONDS)
+
+# Identical in-flight /chat requests share one run; a session's turns run in order
+chat_flights = SingleFlight()
+session_turns = SessionTurnLocks(max_queue_depth=MAX_SESSION_QUEUE_DEPTH)
+
+
+# Chat turns are charged by model tokens against per-key token buckets
+token_limiter = TokenBucketLimiter(
+    SQLiteBackend(TOKEN_RATE_LIMIT_DB) if TOKEN_RATE_LIMIT_DB else MemoryBackend(),
+    capacity=TOKEN_RATE_LIMIT_BURST,
+    refill_per_second=TOKEN_RATE_LIMIT_PER_MINUTE / 60,
+    enabled=TOKEN_RATE_LIMIT_PER_MINUTE > 0,
+)
+
+
+def admit_turn(session_id: str, endpoint: str) -> SessionTurn:
+    """Queue a turn for the session, or refuse it with 429 if the queue is full."""
+    try:
+        return session_turns.admit(session_id)
+    except SessionBusy:
+        metrics.session_turns_rejected_total.inc(1.0, endpoint)
+        raise HTTPException(
+            status_code=429,
+            detail="Too many messages in progress for this session",
+            headers={"Retry-After": "1"},
+        )
+
+
+def follow_stream(run: StreamRun, last_seq: int, request: Request, originator: bool = False) -> StreamingResponse:
+    """Stream a run's frames after `last_seq` to this client (`originator`: the one that started it)."""
+    return StreamingResponse(
+        count_sse_frames(run.follow(last_seq, request.is_disconnected, DISCONNECT_POLL_SECONDS, originator)),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+        }
+    )
+
+
+def resume_stream(last_event_id: str, session_id: Optional[str], request: Request) -> StreamingResponse:
+    """Continue a stream after `last_event_id` from the run's replay buffer."""
+    position = parse_last_event_id(last_event_id)
+    run = stream_registry.get(position[0]) if position else None
+    if run is None or (session_id and session_id != run.session_id):
+        raise HTTPException(status_code=404, detail="Stream not found")
+    if not run.can_resume(position[1]):
+        raise HTTPException(status_code=409, detail="Stream position is no longer available")
+
+    metrics.streams_resumed_total.inc()
+    return follow_stream(run, position[1], request)
+
+
 class ChatRequest(BaseModel):
     message: str = Field(..., min_length=1, max_length=50000, description="User message (1-50000 characters)")
     session_id: str | None = None
@@ -184,6 +424,44 @@ class ChatResponse(BaseModel):
     tool_calls: list | None = None
 
 
+def rate_limit_identity(request: Request) -> str:
+    """Who a chat request is limited as: its known API key, else its client IP."""
+    return rate_limit_key(request.headers.get("x-api-key"), get_remote_address(request), RATE_LIMIT_API_KEYS)
+
+
+def reserve_turn_tokens(chat_request: ChatRequest, request: Request, session_id: str, endpoint: str) -> Reservation:
+    """Charge a turn's estimated tokens to the caller's bucket, or refuse it with 429."""
+    history = sessions[session_id]["messages"] if session_id in sessions else [{"content": get_system_prompt()}]
+    estimate = estimate_turn_tokens([m["content"] for m in history] + [chat_request.message])
+    try:
+        return token_limiter.reserve(rate_limit_identity(request), estimate)
+    except RateLimited as e:
+        metrics.token_rate_limited_total.inc(1.0, endpoint)
+        raise HTTPException(
+            status_code=429,
+            detail="Token rate limit exceeded",
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        )
+
+
+def start_turn(
+    chat_request: ChatRequest, request: Request, session_id: str, endpoint: str
+) -> Tuple[SessionTurn, Reservation]:
+    """Rate-limit and queue a new turn; nothing is held if either refuses it."""
+    reservation = reserve_turn_tokens(chat_request, request, session_id, endpoint)
+    try:
+        return admit_turn(session_id, endpoint), reservation
+    except HTTPException:
+        token_limiter.settle(reservation, 0)
+        raise
+
+
+def settle_turn_tokens(reservation: Reservation, token_accounting: Optional[TurnTokenAccounting]) -> None:
+    """Replace a turn's estimate with the tokens the model reported, if any."""
+    reported = token_accounting is not None and token_accounting.steps > 0
+    token_limiter.settle(reservation, token_accounting.total.total_tokens if reported else None)
+
+
 # Cache health check response (static content)
 @lru_cache(maxsize=1)
 def get_health_response():
@@ -199,6 +477,10 @@ def get_health_response():
 @limiter.limit("60/minute")  # 60 requests per minute for health checks
 def health(request: Request):
     # Return cached response for better performance
+    if get_health_response.cache_info().currsize:
+        metrics.cache_hits_total.inc(1.0, "health")
+    else:
+        metrics.cache_misses_total.inc(1.0, "health")
     return get_health_response()
 
 @app.get("/config")
@@ -240,397 +522,437 @@ def get_config(request: Request):
 
 
 @app.post("/chat")
-@limiter.limit("10/minute")  # 10 chat requests per minute per IP
+@limiter.limit("10/minute", key_func=rate_limit_identity)  # 10 chat requests per minute per API key or IP
 async def chat(chat_request: ChatRequest, request: Request) -> ChatResponse:
-    """Simple chat endpoint."""
+    """Simple chat endpoint. Identical concurrent requests share one agent run."""
     session_id = chat_request.session_id or str(uuid.uuid4())
+    key = turn_key(chat_request.session_id, chat_request.message)
+    # A duplicate joins the run in flight: no tokens charged, no place in the queue
+    turn, reservation = (None, None) if key in chat_flights else start_turn(chat_request, request, session_id, "chat")
+    response, coalesced = await chat_flights.run(key, lambda: run_chat_turn(turn, reservation, chat_request.message))
+    if coalesced:
+        metrics.requests_coalesced_total.inc(1.0, "chat")
+    return response
 
-    # Get or create session
-    if session_id not in sessions:
-        sessions[session_id] = {
-            "messages": [
-                {"role": "system", "content": get_system_prompt()}
-            ]
-        }
 
-    session = sessions[session_id]
-    session["messages"].append({"role": "user", "content": chat_request.message})
-    
-    # Truncate messages to prevent excessive token usage
-    session["messages"] = truncate_session_messages(session["messages"])
-
-    # Convert to LangChain message format and use the agent
-    langchain_messages = []
-    for m in session["messages"]:
-        if m["role"] == "system":
-            continue  # System prompt handled by agent
-        elif m["role"] == "user":
-            langchain_messages.append(HumanMessage(content=m["content"]))
-        elif m["role"] == "assistant":
-            langchain_messages.append(AIMessage(content=m["content"]))
-    
-    # Use the ReAct agent - it will handle tool calling automatically
-    config = {"configurable": {"thread_id": session_id}}
-    result = await agent.ainvoke({"messages": langchain_messages}, config)
-    
-    # Extract final response from agent result
-    # The agent returns messages list, get the last AI message
-    response_text = ""
-    tool_calls = []
-    
-    if isinstance(result, dict) and "messages" in result:
-        messages_list = result["messages"]
-        for msg in reversed(messages_list):
-            if isinstance(msg, AIMessage):
-                if isinstance(msg.content, str):
-                    response_text = msg.content
-                elif isinstance(msg.content, list):
-                    for item in msg.content:
-                        if isinstance(item, dict) and item.get('type') == 'text':
-                            response_text += item.get('text', '')
-                
-                # Extract tool calls if any
-                if hasattr(msg, 'tool_calls') and msg.tool_calls:
-                    tool_calls = [
-                        {"name": tc.get('name') if isinstance(tc, dict) else getattr(tc, 'name', None),
-                         "args": tc.get('args') or tc.get('input', {}) if isinstance(tc, dict) else getattr(tc, 'args', {})}
-                        for tc in msg.tool_calls
-                    ]
-                    break
+async def run_chat_turn(turn: SessionTurn, reservation: Reservation, message: str) -> ChatResponse:
+    """Run one /chat turn, after any earlier turns in the session."""
+    session_id = turn.session_id
+    start_time = time.time()
+    async with turn:
+        # Get or create session
+        if session_id not in sessions:
+            sessions[session_id] = {
+                "messages": [
+                    {"role": "system", "content": get_system_prompt()}
+                ]
+            }
+
+        session = sessions[session_id]
+
+        # Check if this is the first user message (for protocol tracking)
+        is_first_message = not any(m["role"] == "user" for m in session["messages"])
+        session["messages"].append({"role": "user", "content": message})
     
-    # Fallback if no response found
-    if not response_text:
-        response_text = "I processed your request. (Response extraction may need adjustment)"
+        # Truncate messages to prevent excessive token usage
+        session["messages"] = truncate_session_messages(session["messages"])
 
-    session["messages"].append({"role": "assistant", "content": response_text})
+        message_id = str(uuid.uuid4())
+        tracer = get_tracer()
+        turn_span = tracer.start_span("chat.turn", attributes={"session_id": session_id, "message_id": message_id})
+        token_accounting = None
+        turn_tools = TurnToolCalls(session_id, message_id)
+        logged = False
+        try:
+            # Convert to LangChain message format and use the agent
+            with tracer.start_span("chat.convert_messages", parent=turn_span):
+                langchain_messages = []
+                for m in session["messages"]:
+                    if m["role"] == "system":
+                        continue  # System prompt handled by agent
+                    elif m["role"] == "user":
+                        langchain_messages.append(HumanMessage(content=m["content"]))
+                    elif m["role"] == "assistant":
+                        langchain_messages.append(AIMessage(content=m["content"]))
 
-    return ChatResponse(
-        session_id=session_id,
-        response=response_text,
-        tool_calls=tool_calls
-    )
+            # Use the ReAct agent - it will handle tool calling automatically.
+            # Its updates are streamed (not ainvoked) so each node is traced
+            recorder = new_turn_recorder(session_id, message_id)
+            response_text = ""
+            tool_calls = []
+            token_accounting = TurnTokenAccounting()
+            normalizer = MessageNormalizer()
+
+            updates = traced_agent_updates(langchain_messages, agent_run_config(session_id, recorder), turn_span)
+            async with aclosing(updates):
+                async for event in updates:
+                    for node_output in event.values():
+                        # LangGraph may return {"messages": [...]}, a list or one message
+                        if isinstance(node_output, dict):
+                            node_output = node_output.get("messages") or []
+                        if not isinstance(node_output, list):
+                            node_output = [node_output]
+                        turn_tools.results(node_output)
+
+                        # This turn's model steps: account their tokens, collect
+                        # their tool calls and keep the last text
+                        for msg in node_output:
+                            if not isinstance(msg, AIMessage):
+                                continue
+                            token_accounting.record_step(msg)
+                            text = ""
+                            for item in normalizer.normalize(msg):
+                                if isinstance(item, ToolCallEvent):
+                                    tool_calls.append({"name": item.name, "args": item.args})
+                                    turn_tools.called(item)
+                                else:
+                                    text += item.text
+                            if text:
+                                response_text = text
+            save_turn_recording(recorder)
+
+            # Fallback if no response found
+            if not response_text:
+                response_text = "I processed your request. (Response extraction may need adjustment)"
+
+            # Log the complete response (and the turn's token usage)
+            response_time_ms = (time.time() - start_time) * 1000
+            with tracer.start_span("chat.log_response", parent=turn_span):
+                logger.log_response(
+                    session_id=session_id,
+                    message_id=message_id,
+                    user_message=message,
+                    agent_response=response_text,
+                    tool_calls=turn_tools.finish(),
+                    response_time_ms=response_time_ms,
+                    is_first_message=is_first_message,
+                    span_timings=turn_span.timings if turn_span.is_recording() else None,
+                    token_accounting=token_accounting,
+                )
+            logged = True
+            record_token_metrics(token_accounting)
+            settle_turn_tokens(reservation, token_accounting)
+
+            session["messages"].append({"role": "assistant", "content": response_text})
+            metrics.chat_turn_duration.observe(response_time_ms / 1000, "chat")
+
+            return ChatResponse(
+                session_id=session_id,
+                response=response_text,
+                tool_calls=tool_calls
+            )
+        except asyncio.CancelledError:
+            turn_span.set_attribute("cancelled", True)
+            turn_tools.finish()
+            raise
+        except Exception as e:
+            turn_span.record_exception(e)
+            if not logged:
+                # Failed turns are always kept by sampling
+                logger.log_response(
+                    session_id=session_id,
+                    message_id=message_id,
+                    user_message=message,
+                    agent_response="",
+                    tool_calls=turn_tools.finish(),
+                    response_time_ms=(time.time() - start_time) * 1000,
+                    is_first_message=is_first_message,
+                    token_accounting=token_accounting,
+                    error=f"{type(e).__name__}: {e}",
+                )
+                logged = True
+            raise
+        finally:
+            if not logged and token_accounting is not None:
+                # The turn failed: its usage still counts towards the totals
+                logger.log_token_usage(session_id, token_accounting)
+                record_token_metrics(token_accounting)
+            if not reservation.settled:
+                # The turn failed: charge the tokens the model reported, if any
+                reported = token_accounting is not None and token_accounting.steps > 0
+                token_limiter.settle(reservation, token_accounting.total.total_tokens if reported else 0)
+            turn_span.end()
 
 
 @app.post("/chat/stream")
-@limiter.limit("10/minute")  # 10 streaming requests per minute per IP
+@limiter.limit("10/minute", key_func=rate_limit_identity)  # 10 streaming requests per minute per API key or IP
 async def chat_stream(chat_request: ChatRequest, request: Request):
-    """Streaming chat endpoint."""
-    session_id = chat_request.session_id or str(uuid.uuid4())
+    """
+    Streaming chat endpoint.
 
-    if session_id not in sessions:
-        sessions[session_id] = {
-            "messages": [
-                {"role": "system", "content": get_system_prompt()}
-            ]
-        }
+    Every frame carries an SSE `id:`. A client that reconnects with a
+    Last-Event-ID header (and the same request body) receives the frames it
+    missed from the run's replay buffer; the agent is not run again.
+    """
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id:
+        return resume_stream(last_event_id, chat_request.session_id, request)
 
-    session = sessions[session_id]
-    
-    # Check if this is the first user message (for protocol tracking)
-    user_messages = [m for m in session["messages"] if m["role"] == "user"]
-    is_first_message = len(user_messages) == 0
-    
-    session["messages"].append({"role": "user", "content": chat_request.message})
-    
-    # Truncate messages to prevent excessive token usage
-    session["messages"] = truncate_session_messages(session["messages"])
+    # A duplicate of a request that is still running (double-submit, retry)
+    # follows that run from the first frame instead of starting another
+    key = turn_key(chat_request.session_id, chat_request.message)
+    duplicate = stream_registry.inflight(key)
+    if duplicate is not None and duplicate.can_resume(-1):
+        metrics.requests_coalesced_total.inc(1.0, "chat_stream")
+        return follow_stream(duplicate, -1, request)
+
+    session_id = chat_request.session_id or str(uuid.uuid4())
+    turn, reservation = start_turn(chat_request, request, session_id, "chat_stream")
 
     # Generate unique message ID for tracking
     message_id = str(uuid.uuid4())
     start_time = time.time()  # Initialize at function start
-    tool_calls_tracked = []
+    turn_tools = TurnToolCalls(session_id, message_id)
+
+    async def run_turn() -> AsyncGenerator[bytes, None]:
+        # The session's earlier turns finish (and write their answers)
+        # before this turn reads the history
+        async with turn:
+            async with aclosing(generate()) as frames:
+                async for frame in frames:
+                    yield frame
+
+    async def generate() -> AsyncGenerator[bytes, None]:
+        if session_id not in sessions:
+            sessions[session_id] = {
+                "messages": [
+                    {"role": "system", "content": get_system_prompt()}
+                ]
+            }
+
+        session = sessions[session_id]
+
+        # Check if this is the first user message (for protocol tracking)
+        user_messages = [m for m in session["messages"] if m["role"] == "user"]
+        is_first_message = len(user_messages) == 0
+
+        session["messages"].append({"role": "user", "content": chat_request.message})
+
+        # Truncate messages to prevent excessive token usage
+        session["messages"] = truncate_session_messages(session["messages"])
+
+        # Spans are parented explicitly: the current-span context does not
+        # reliably survive across yields of an async generator
+        tracer = get_tracer()
+        turn_span = tracer.start_span(
+            "chat_stream.turn",
+            attributes={"session_id": session_id, "message_id": message_id},
+        )
 
-    async def generate() -> AsyncGenerator[str, None]:
         # Convert session messages to LangChain message format
         # The agent expects messages in LangChain format (HumanMessage, AIMessage, etc.)
-        langchain_messages = []
-        for m in session["messages"]:
-            if m["role"] == "system":
-                continue  # System prompt is handled by agent
-            elif m["role"] == "user":
-                langchain_messages.append(HumanMessage(content=m["content"]))
-            elif m["role"] == "assistant":
-                langchain_messages.append(AIMessage(content=m["content"]))
+        with tracer.start_span("chat_stream.convert_messages", parent=turn_span):
+            langchain_messages = []
+            for m in session["messages"]:
+                if m["role"] == "system":
+                    continue  # System prompt is handled by agent
+                elif m["role"] == "user":
+                    langchain_messages.append(HumanMessage(content=m["content"]))
+                elif m["role"] == "assistant":
+                    langchain_messages.append(AIMessage(content=m["content"]))
 
         full_response = ""
+        error = None  # Set if the agent run fails
+        token_accounting = TurnTokenAccounting()
+        recorder = new_turn_recorder(session_id, message_id)
         
-        # Track seen tool calls to prevent duplicates
-        # Use (tool_name, args_hash) as key since tool calls might not have IDs
-        seen_tool_calls = set()
-        
-        def get_tool_call_key(tool_name: str, tool_args: dict) -> str:
-            """Generate a unique key for a tool call to detect duplicates."""
-            try:
-                args_str = json.dumps(tool_args, sort_keys=True)
-            except (TypeError, ValueError):
-                args_str = str(tool_args)
-            return f"{tool_name}:{args_str}"
-        
-        # Debug logging
-        is_local = not os.getenv("VERCEL") and not os.getenv("PRODUCTION")
-        if is_local:
-            print(f"\n🚀 [STREAM] Starting agent stream with {len(langchain_messages)} messages")
+        # One normalizer per turn: tool calls are deduplicated across the
+        # turn's messages (tool_calls and tool_use blocks describe the same call)
+        normalizer = MessageNormalizer()
+
+        def message_frames(message: AIMessage, source: str) -> Iterator[bytes]:
+            """SSE frames for a message's new tool calls and text."""
+            nonlocal full_response
+            duplicates = normalizer.duplicates
+            events = normalizer.normalize(message)
+            if debug.enabled and normalizer.duplicates > duplicates:
+                debug.emit("duplicate_tool_call", skipped=normalizer.duplicates - duplicates, source=source)
+            for item in events:
+                if isinstance(item, ToolCallEvent):
+                    turn_tools.called(item)
+                    if debug.enabled:
+                        debug.emit("tool_call", name=item.name, args=item.args, source=source)
+                    yield sse_tool_call(item.name, item.args)
+                else:
+                    # Stream text character by character
+                    # Ended even if the client closes the stream mid-message
+                    sse_span = tracer.start_span("chat_stream.sse_serialize", parent=turn_span)
+                    try:
+                        for char in item.text:
+                            yield sse_text(char)
+                        full_response += item.text
+                    finally:
+                        sse_span.end()
+
+        if debug.enabled:
+            debug.emit("stream_start", messages=len(langchain_messages))
         
         try:
             # Use the ReAct agent's streaming - it handles tool calling internally
             # LangGraph streams events as {node_name: output} dictionaries
-            async for event in agent.astream(
-                {"messages": langchain_messages},
-                {"configurable": {"thread_id": session_id}},
-            ):
-                if is_local:
-                    print(f"📦 [STREAM] Event received: {list(event.keys())}")
-                
-                # LangGraph agent streams events with node names
-                # Common node names: "agent" (AI thinking/calling), "tools" (tool execution)
-                for node_name, node_output in event.items():
-                    if is_local:
-                        print(f"   Node: {node_name}, Type: {type(node_output).__name__}")
+            updates = traced_agent_updates(langchain_messages, agent_run_config(session_id, recorder), turn_span)
+            async with aclosing(updates):
+                async for event in updates:
+                    if debug.enabled:
+                        debug.emit("event", nodes=list(event.keys()))
                     
-                    # "agent" node contains AIMessage with text and/or tool_calls
-                    # Note: LangGraph may return dict format with "messages" key
-                    if node_name == "agent":
-                        # Handle both dict and AIMessage formats
-                        agent_message = None
-                        if isinstance(node_output, dict):
-                            # LangGraph returns {"messages": [AIMessage, ...]}
-                            if "messages" in node_output and node_output["messages"]:
-                                if is_local:
-                                    print(f"   Dict has {len(node_output['messages'])} messages")
-                                # Get the last message (usually the AI response)
-                                for msg in reversed(node_output["messages"]):
-                                    if isinstance(msg, AIMessage):
-                                        agent_message = msg
-                                        break
-                        elif isinstance(node_output, AIMessage):
-                            agent_message = node_output
-                        
-                        if is_local and agent_message is None:
-                            print(f"   ⚠️  No AIMessage found in agent node output")
+                    # LangGraph agent streams events with node names
+                    # Common node names: "agent" (AI thinking/calling), "tools" (tool execution)
+                    for node_name, node_output in event.items():
+                        if debug.enabled:
+                            debug.emit("node", name=node_name, type=type(node_output).__name__)
                         
-                        if agent_message:
-                            if is_local:
-                                print(f"   Processing AIMessage, content type: {type(agent_message.content).__name__}")
-                            
-                            # Check for tool calls first
-                            if hasattr(agent_message, 'tool_calls') and agent_message.tool_calls:
-                                for tc in agent_message.tool_calls:
-                                    # Handle both dict and object formats
-                                    if isinstance(tc, dict):
-                                        tool_name = tc.get('name')
-                                        tool_args = tc.get('input') or tc.get('args', {})
-                                    else:
-                                        tool_name = getattr(tc, 'name', None)
-                                        tool_args = getattr(tc, 'args', {}) or getattr(tc, 'input', {})
-                                    
-                                    if tool_name:
-                                        # Check if we've already seen this tool call
-                                        tool_call_key = get_tool_call_key(tool_name, tool_args)
-                                        if tool_call_key in seen_tool_calls:
-                                            if is_local:
-                                                print(f"   ⏭️  Skipping duplicate tool call: {tool_name}")
-                                            continue
-                                        
-                                        seen_tool_calls.add(tool_call_key)
-                                        
-                                        # Log tool call
-                                        tool_event = logger.log_tool_call(
-                                            tool_name=tool_name,
-                                            args=tool_args,
-                                            session_id=session_id,
-                                            message_id=message_id,
-                                        )
-                                        tool_calls_tracked.append(tool_event)
-                                        
-                                        # Local logging
-                                        if is_local:
-                                            try:
-                                                args_preview = json.dumps(tool_args)[:200] + "..." if len(json.dumps(tool_args)) > 200 else json.dumps(tool_args)
-                                            except (TypeError, ValueError):
-                                                args_preview = str(tool_args)[:200] + "..." if len(str(tool_args)) > 200 else str(tool_args)
-                                            print(f"\n🔧 [TOOL] Executing: {tool_name}")
-                                            print(f"   Args: {args_preview}")
-                                        
-                                        # Stream tool call to frontend
-                                        yield f"data: {json.dumps({'type': 'tool_call', 'name': tool_name, 'args': tool_args})}\n\n"
-            
-                            # Extract and stream text content
-                            text_content = ""
-                            if isinstance(agent_message.content, str):
-                                text_content = agent_message.content
-                            elif isinstance(agent_message.content, list):
-                                for item in agent_message.content:
-                                    if isinstance(item, dict):
-                                        if item.get('type') == 'text':
-                                            text_content += item.get('text', '')
-                                        elif item.get('type') == 'tool_use':
-                                            # Also handle tool_use in content (Anthropic format)
-                                            # Note: This is the same tool call, just in different format
-                                            tool_name = item.get('name')
-                                            tool_args = item.get('input', {})
-                                            if tool_name:
-                                                # Check if we've already seen this tool call
-                                                tool_call_key = get_tool_call_key(tool_name, tool_args)
-                                                if tool_call_key in seen_tool_calls:
-                                                    if is_local:
-                                                        print(f"   ⏭️  Skipping duplicate tool_use: {tool_name}")
-                                                    continue
-                                                
-                                                seen_tool_calls.add(tool_call_key)
-                                                
-                                                tool_event = logger.log_tool_call(
-                                                    tool_name=tool_name,
-                                                    args=tool_args,
-                                                    session_id=session_id,
-                                                    message_id=message_id,
-                                                )
-                                                tool_calls_tracked.append(tool_event)
-                                                if is_local:
-                                                    print(f"\n🔧 [TOOL] Executing (from content): {tool_name}")
-                                                yield f"data: {json.dumps({'type': 'tool_call', 'name': tool_name, 'args': tool_args})}\n\n"
+                        # "agent" node contains AIMessage with text and/or tool_calls
+                        # Note: LangGraph may return dict format with "messages" key
+                        if node_name == "agent":
+                            # Handle both dict and AIMessage formats
+                            agent_message = None
+                            if isinstance(node_output, dict):
+                                # LangGraph returns {"messages": [AIMessage, ...]}
+                                if "messages" in node_output and node_output["messages"]:
+                                    if debug.enabled:
+                                        debug.emit("node", name=node_name, messages=len(node_output["messages"]))
+                                    # Get the last message (usually the AI response)
+                                    for msg in reversed(node_output["messages"]):
+                                        if isinstance(msg, AIMessage):
+                                            agent_message = msg
+                                            break
+                            elif isinstance(node_output, AIMessage):
+                                agent_message = node_output
                             
-                            # Stream text character by character (only new text)
-                            if text_content:
-                                # Only stream characters we haven't already streamed
-                                new_text = text_content[len(full_response):]
-                                for char in new_text:
-                                    full_response += char
-                                    yield f"data: {json.dumps({'type': 'text', 'content': char})}\n\n"
-                    
-                    # "tools" node contains ToolMessage list (tool results)
-                    elif node_name == "tools":
-                        if is_local:
-                            print(f"   Tool results received: {len(node_output) if isinstance(node_output, list) else 1}")
-                        # Tool results are handled internally by the agent, we just log
-                        if isinstance(node_output, list):
-                            for tool_msg in node_output:
-                                if hasattr(tool_msg, 'content') and is_local:
-                                    result_preview = str(tool_msg.content)[:150] + "..." if len(str(tool_msg.content)) > 150 else str(tool_msg.content)
-                                    print(f"✅ [TOOL] Result received: {result_preview}")
-                    
-                    # Fallback: handle any list of messages or other formats
-                    elif isinstance(node_output, list):
-                        # Process tool calls
-                        for msg in node_output if isinstance(node_output, list) else [node_output]:
-                            if isinstance(msg, AIMessage) and hasattr(msg, 'tool_calls') and msg.tool_calls:
-                                for tc in msg.tool_calls:
-                                    tool_name = tc.get('name') if isinstance(tc, dict) else getattr(tc, 'name', None)
-                                    tool_args = tc.get('input', {}) or tc.get('args', {}) if isinstance(tc, dict) else getattr(tc, 'args', {})
-                                    
-                                    if tool_name:
-                                        # Check if we've already seen this tool call
-                                        tool_call_key = get_tool_call_key(tool_name, tool_args)
-                                        if tool_call_key in seen_tool_calls:
-                                            if is_local:
-                                                print(f"   ⏭️  Skipping duplicate tool call (fallback): {tool_name}")
-                                            continue
-                                        
-                                        seen_tool_calls.add(tool_call_key)
-                                        
-                                        # Log tool call for observability
-                                        tool_event = logger.log_tool_call(
-                                            tool_name=tool_name,
-                                            args=tool_args,
-                                            session_id=session_id,
-                                            message_id=message_id,
-                                        )
-                                        tool_calls_tracked.append(tool_event)
-                                        
-                                        # Log for local development
-                                        if is_local:
-                                            try:
-                                                args_preview = json.dumps(tool_args)[:200] + "..." if len(json.dumps(tool_args)) > 200 else json.dumps(tool_args)
-                                            except (TypeError, ValueError):
-                                                args_preview = str(tool_args)[:200] + "..." if len(str(tool_args)) > 200 else str(tool_args)
-                                            print(f"\n🔧 [TOOL] Executing: {tool_name}")
-                                            print(f"   Args: {args_preview}")
-                                        
-                                        # Stream tool call event to frontend
-                                        yield f"data: {json.dumps({'type': 'tool_call', 'name': tool_name, 'args': tool_args})}\n\n"
+                            if debug.enabled and agent_message is None:
+                                debug.emit("warning", message="No AIMessage found in agent node output")
                             
-                            # Extract text content from AI messages
-                            if isinstance(msg, AIMessage):
-                                text_content = ""
-                                if isinstance(msg.content, str):
-                                    text_content = msg.content
-                                elif isinstance(msg.content, list):
-                                    for item in msg.content:
-                                        if isinstance(item, dict) and item.get('type') == 'text':
-                                            text_content += item.get('text', '')
-                                
-                                # Stream text character by character
-                                if text_content:
-                                    for char in text_content:
-                                        full_response += char
-                                        yield f"data: {json.dumps({'type': 'text', 'content': char})}\n\n"
-                                
-                                # Check for tool calls in this message too
-                                if hasattr(msg, 'tool_calls') and msg.tool_calls:
-                                    for tc in msg.tool_calls:
-                                        tool_name = tc.get('name') if isinstance(tc, dict) else getattr(tc, 'name', None)
-                                        tool_args = tc.get('input', {}) or tc.get('args', {}) if isinstance(tc, dict) else getattr(tc, 'args', {})
-                                        
-                                        if tool_name:
-                                            # Check if we've already seen this tool call
-                                            tool_call_key = get_tool_call_key(tool_name, tool_args)
-                                            if tool_call_key in seen_tool_calls:
-                                                if is_local:
-                                                    print(f"   ⏭️  Skipping duplicate tool call (msg.tool_calls): {tool_name}")
-                                                continue
-                                            
-                                            seen_tool_calls.add(tool_call_key)
-                                            
-                                            tool_event = logger.log_tool_call(
-                                                tool_name=tool_name,
-                                                args=tool_args,
-                                                session_id=session_id,
-                                                message_id=message_id,
-                                            )
-                                            tool_calls_tracked.append(tool_event)
-                                            
-                                            if is_local:
-                                                try:
-                                                    args_preview = json.dumps(tool_args)[:200] + "..." if len(json.dumps(tool_args)) > 200 else json.dumps(tool_args)
-                                                except (TypeError, ValueError):
-                                                    args_preview = str(tool_args)[:200] + "..." if len(str(tool_args)) > 200 else str(tool_args)
-                                                print(f"\n🔧 [TOOL] Executing: {tool_name}")
-                                                print(f"   Args: {args_preview}")
-                                            
-                                            yield f"data: {json.dumps({'type': 'tool_call', 'name': tool_name, 'args': tool_args})}\n\n"
-                    
-                    # Note: "agent" node is already handled above at line 300
-                    # This legacy code path is removed to prevent duplicate processing
-                                    
+                            if agent_message:
+                                token_accounting.record_step(agent_message)
+                                if debug.enabled:
+                                    debug.emit("node", name=node_name, content_type=type(agent_message.content).__name__)
+                                for frame in message_frames(agent_message, source="agent"):
+                                    yield frame
+                        
+                        # "tools" node contains ToolMessage list (tool results)
+                        elif node_name == "tools":
+                            # LangGraph returns {"messages": [ToolMessage, ...]}
+                            tool_messages = (node_output.get("messages") or []) if isinstance(node_output, dict) else node_output
+                            turn_tools.results(tool_messages if isinstance(tool_messages, list) else [tool_messages])
+                            if debug.enabled:
+                                debug.emit("node", name=node_name, results=len(node_output) if isinstance(node_output, list) else 1)
+                            # Tool results are handled internally by the agent, we just log
+                            if debug.enabled and isinstance(node_output, list):
+                                for tool_msg in node_output:
+                                    if hasattr(tool_msg, 'content'):
+                                        debug.emit("tool_result", content=tool_msg.content)
+                        
+                        # Fallback: handle any list of messages or other formats
+                        elif isinstance(node_output, list):
+                            for msg in node_output:
+                                if isinstance(msg, AIMessage):
+                                    token_accounting.record_step(msg)
+                                    for frame in message_frames(msg, source="fallback"):
+                                        yield frame
+
+        except (asyncio.CancelledError, GeneratorExit):
+            # The client went away mid-turn: keep the partial answer so the
+            # session history stays user/assistant, then stop the run
+            session["messages"].append({"role": "assistant", "content": full_response})
+            turn_tools.finish()
+            logger.log_token_usage(session_id, token_accounting)
+            record_token_metrics(token_accounting)
+            settle_turn_tokens(reservation, token_accounting)
+            turn_span.set_attribute("cancelled", True)
+            turn_span.end()
+            raise
         except Exception as e:
+            turn_span.record_exception(e)
+            error = f"{type(e).__name__}: {e}"
             logger.logger.error(f"Error in agent stream: {e}")
             import traceback
             traceback.print_exc()
-            yield f"data: {json.dumps({'type': 'text', 'content': f'Error: {str(e)}'})}\n\n"
+            yield sse_text(f"Error: {str(e)}")
 
         # Log the complete response
         response_time_ms = (time.time() - start_time) * 1000
-        logger.log_response(
-            session_id=session_id,
-            message_id=message_id,
-            user_message=chat_request.message,
-            agent_response=full_response,
-            tool_calls=tool_calls_tracked,
-            response_time_ms=response_time_ms,
-            is_first_message=is_first_message,
-        )
+        with tracer.start_span("chat_stream.log_response", parent=turn_span):
+            # span_timings is the trace's live timings dict: the logging and
+            # turn spans add themselves when they end
+            logger.log_response(
+                session_id=session_id,
+                message_id=message_id,
+                user_message=chat_request.message,
+                agent_response=full_response,
+                tool_calls=turn_tools.finish(),
+                response_time_ms=response_time_ms,
+                is_first_message=is_first_message,
+                span_timings=turn_span.timings if turn_span.is_recording() else None,
+                token_accounting=token_accounting,
+                error=error,
+            )
+        record_token_metrics(token_accounting)
+        settle_turn_tokens(reservation, token_accounting)
+        save_turn_recording(recorder)
 
         # Update session with final response
         session["messages"].append({"role": "assistant", "content": full_response})
-        yield f"data: {json.dumps({'type': 'done', 'session_id': session_id})}\n\n"
+        metrics.chat_turn_duration.observe(response_time_ms / 1000, "chat_stream")
+        turn_span.end()
+        yield sse_done(session_id)
 
-    return StreamingResponse(
-        generate(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-        }
+    def record_cancellation(reason: str, frames_sent: int) -> None:
+        turn.discard()  # in case the run was cancelled before it started
+        elapsed_ms = (time.time() - start_time) * 1000
+        logger.log_stream_cancelled(session_id, message_id, reason, frames_sent, elapsed_ms)
+        metrics.streams_cancelled_total.inc(1.0, reason)
+
+    run = StreamRun(
+        message_id,
+        session_id,
+        window=STREAM_BUFFER_FRAMES,
+        history=STREAM_REPLAY_FRAMES,
+        grace_seconds=STREAM_RESUME_GRACE_SECONDS,
+        on_cancel=record_cancellation,
+        # Clients replaying a cancelled run keep the partial answer, which is
+        # also what the session history keeps
+        closing_frame=sse_done(session_id),
     )
+    run.start(run_turn())
+    stream_registry.add(run, key)
+    return follow_stream(run, -1, request, originator=True)
+
+
+# Dataset uploads for the analytics tools (see uploads.py)
+dataset_uploads = DatasetUploads(
+    max_bytes=MAX_UPLOAD_MB * 1024 * 1024,
+    max_client_bytes=UPLOADS_MAX_PER_CLIENT_MB * 1024 * 1024,
+    max_total_bytes=UPLOADS_MAX_TOTAL_MB * 1024 * 1024,
+)
+
+
+@app.post("/datasets", status_code=202)
+@limiter.limit("10/minute")  # 10 uploads per minute
+async def upload_dataset(request: Request):
+    """Upload a CSV or Parquet file (multipart field `file`); it is converted in the background."""
+    try:
+        job = await dataset_uploads.receive(
+            request.headers.get("content-type", ""), request.stream(), client=get_remote_address(request)
+        )
+    except ImportError:
+        raise HTTPException(
+            status_code=501,
+            detail='Dataset uploads need the analytics extra: pip install "preprod-agent[analytics]"',
+        )
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return job.to_dict()
+
+
+@app.get("/datasets/{dataset_id}")
+@limiter.limit("120/minute")  # Clients poll this while a dataset converts
+def get_dataset(dataset_id: str, request: Request):
+    """Upload and conversion progress of a dataset."""
+    job = dataset_uploads.get(dataset_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    return job.to_dict()
 
 
 @app.delete("/sessions/{session_id}")
@@ -655,10 +977,12 @@ def get_cached_metrics():
     
     # Return cached metrics if still valid
     if _metrics_cache and _metrics_cache_time and (current_time - _metrics_cache_time) < METRICS_CACHE_TTL:
+        metrics.cache_hits_total.inc(1.0, "metrics")
         return _metrics_cache
-    
+    metrics.cache_misses_total.inc(1.0, "metrics")
+
     # Generate fresh metrics
-    metrics = {
+    summary = {
         "sessions": {
             sid: logger.get_session_summary(sid)
             for sid in logger.sessions.keys()
@@ -671,13 +995,14 @@ def get_cached_metrics():
                 if e.followed_clarification_protocol is False
             ),
         },
+        "observability": logger.get_overhead_stats(),
         "cached_at": datetime.now().isoformat()
     }
     
     # Update cache
-    _metrics_cache = metrics
+    _metrics_cache = summary
     _metrics_cache_time = current_time
-    return metrics
+    return summary
 
 @app.get("/metrics")
 @limiter.limit("30/minute")  # 30 requests per minute for metrics
@@ -686,6 +1011,24 @@ def get_metrics(request: Request):
     return get_cached_metrics()
 
 
+@app.get("/metrics/prometheus")
+def get_prometheus_metrics():
+    """
+    Prometheus/OpenMetrics scrape endpoint.
+
+    Not rate-limited or cached: rendering walks a fixed set of counters
+    and histograms, so cost is constant regardless of session count.
+    """
+    return Response(content=metrics.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@app.get("/metrics/tokens")
+@limiter.limit("30/minute")  # 30 requests per minute for metrics
+def get_token_metrics(request: Request, limit: int = 10):
+    """Get token usage totals and the heaviest sessions and tools."""
+    return logger.get_token_report(limit=max(1, min(limit, 100)))
+
+
 @app.get("/metrics/session/{session_id}")
 @limiter.limit("30/minute")  # 30 requests per minute for metrics
 def get_session_metrics(session_id: str, request: Request):
@@ -0,0 +1,316 @@
+"""
+Resumable Streaming Runs.
+
+A StreamRun owns one /chat/stream agent turn. The agent producer runs as
+its own task and publishes SSE frames into a bounded buffer; client
+connections follow the run from a position in that buffer, so the agent
+run is not tied to any one HTTP connection:
+
+- Backpressure: the producer pauses while it is `window` frames ahead of
+  the slowest client (or of a disconnected client that may come back).
+  The requesting client's position is held from the start, so a fast
+  model cannot overrun the buffer before that client begins reading.
+- Resume: each frame carries an SSE id "<run_id>:<seq>". A client that
+  reconnects with Last-Event-ID continues from the next frame, replayed
+  from the buffer, without re-invoking the agent.
+- Cancellation: when the last client leaves before the run finishes, the
+  run waits `grace_seconds` for a reconnect, then is cancelled, which
+  stops the LangGraph run. A cancelled run ends with `closing_frame`.
+
+Finished and cancelled runs stay in the registry for `ttl_seconds`, so a
+late reconnect still replays the buffered answer instead of losing it.
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import AsyncGenerator, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+
+class StreamPositionLost(Exception):
+    """The frames after the requested position are no longer buffered."""
+
+
+_ORIGINATOR = 0  # follower ID held for the client that requested the run
+
+
+def parse_last_event_id(value: str) -> Optional[Tuple[str, int]]:
+    """Split a "<run_id>:<seq>" event ID. Returns None if malformed."""
+    run_id, _, seq = value.strip().rpartition(":")
+    if not run_id or not seq.isdigit():
+        return None
+    return run_id, int(seq)
+
+
+class StreamRun:
+    """One agent turn's SSE frames, shared by the connections following it."""
+
+    def __init__(
+        self,
+        run_id: str,
+        session_id: str,
+        window: int = 256,
+        history: int = 2048,
+        grace_seconds: float = 0.0,
+        on_cancel: Optional[Callable[[str, int], None]] = None,
+        connect_seconds: float = 30.0,
+        closing_frame: Optional[bytes] = None,
+    ):
+        """
+        Args:
+            run_id: Unique ID of the turn (the message ID), used in event IDs
+            session_id: Session the turn belongs to
+            window: Max frames the producer may run ahead of the slowest client
+            history: Frames kept for replay (at least `window`)
+            grace_seconds: How long a run with no clients waits for a reconnect
+                (0: cancel as soon as the last client leaves)
+            on_cancel: Called with (reason, frames_delivered) if the run is cancelled
+            connect_seconds: How long the requesting client's position is held
+                before it starts following the run
+            closing_frame: Frame appended if the run is cancelled, so clients
+                replaying it afterwards see the stream end
+        """
+        self.run_id = run_id
+        self.session_id = session_id
+        self.window = window
+        self.grace_seconds = grace_seconds
+        self.on_cancel = on_cancel
+        self.connect_seconds = connect_seconds
+        self.closing_frame = closing_frame
+
+        self.frames: Deque[bytes] = deque(maxlen=max(history, window))
+        self.next_seq = 0  # Sequence number of the next frame to publish
+        self.done = False
+        self.cancelled = False
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+
+        self._id_prefix = f"id: {run_id}:".encode()
+        # follower -> next sequence number it needs. Follower 0 is the
+        # requesting client, held at the first frame until it connects
+        self._cursors: Dict[int, int] = {_ORIGINATOR: 0}
+        self._detached_cursor: Optional[int] = None  # where a departed client stopped
+        self._next_follower = _ORIGINATOR + 1
+        self._originator_waiting = True
+        self._frame_waiters: List[asyncio.Future] = []
+        self._room_waiters: List[asyncio.Future] = []
+        self._grace_handle: Optional[asyncio.TimerHandle] = None
+        self._connect_handle: Optional[asyncio.TimerHandle] = None
+
+    # ------------------------------------------------------------------
+    # Producer side
+    # ------------------------------------------------------------------
+
+    def start(self, frames: AsyncGenerator[bytes, None]) -> None:
+        """Run the frame producer as a task on the current event loop."""
+        loop = asyncio.get_running_loop()
+        self.task = loop.create_task(self._produce(frames))
+        # A done callback also runs for a task cancelled before it started
+        self.task.add_done_callback(self._finished)
+        self._connect_handle = loop.call_later(self.connect_seconds, self._connect_expired)
+
+    def _connect_expired(self) -> None:
+        """The requesting client never started reading: release its position."""
+        self._connect_handle = None
+        if not self._originator_waiting:
+            return
+        self._originator_waiting = False
+        del self._cursors[_ORIGINATOR]
+        if not self.done and not self._cursors:
+            self._detach(0, "client_never_connected")
+
+    async def _produce(self, frames: AsyncGenerator[bytes, None]) -> None:
+        try:
+            async for frame in frames:
+                await self.publish(frame)
+        finally:
+            # Runs the producer's cleanup now rather than at garbage collection
+            await frames.aclose()
+
+    def _finished(self, task: asyncio.Task) -> None:
+        self.done = True
+        self.finished_at = time.monotonic()
+        if self._connect_handle is not None:
+            self._connect_handle.cancel()
+            self._connect_handle = None
+        if self.cancelled and self.closing_frame is not None:
+            self._append(self.closing_frame)
+        self._wake(self._frame_waiters)
+
+    def _slowest_cursor(self) -> Optional[int]:
+        cursors = list(self._cursors.values())
+        if self._detached_cursor is not None:
+            cursors.append(self._detached_cursor)
+        return min(cursors) if cursors else None
+
+    async def publish(self, frame: bytes) -> None:
+        """Append a frame, waiting while the slowest client is a window behind."""
+        while True:
+            slowest = self._slowest_cursor()
+            if slowest is None or self.next_seq - slowest < self.window:
+                break
+            waiter = asyncio.get_running_loop().create_future()
+            self._room_waiters.append(waiter)
+            await waiter
+        self._append(frame)
+        if self._frame_waiters:
+            self._wake(self._frame_waiters)
+
+    def _append(self, frame: bytes) -> None:
+        self.frames.append(frame)
+        self.next_seq += 1
+
+    @staticmethod
+    def _wake(waiters: List[asyncio.Future]) -> None:
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        waiters.clear()
+
+    # ------------------------------------------------------------------
+    # Consumer side
+    # ------------------------------------------------------------------
+
+    @property
+    def first_buffered_seq(self) -> int:
+        return self.next_seq - len(self.frames)
+
+    def can_resume(self, last_seq: int) -> bool:
+        """Whether every frame after `last_seq` can still be delivered."""
+        return self.first_buffered_seq <= last_seq + 1 <= self.next_seq
+
+    async def follow(
+        self,
+        last_seq: int = -1,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+        poll_seconds: float = 0.5,
+        originator: bool = False,
+    ) -> AsyncGenerator[bytes, None]:
+        """
+        Yield id-tagged frames after `last_seq` until the run finishes.
+
+        While waiting for the agent, `is_disconnected` is polled every
+        `poll_seconds` so an idle stream notices a departed client.
+        `originator` marks the client that requested the run, which takes
+        over the position held for it since the run was created.
+        """
+        if originator and self._originator_waiting:
+            self._originator_waiting = False
+            if self._connect_handle is not None:
+                self._connect_handle.cancel()
+                self._connect_handle = None
+            follower = _ORIGINATOR
+            last_seq = self._cursors[follower] - 1
+        else:
+            if not self.can_resume(last_seq):
+                raise StreamPositionLost(f"Frames after {self.run_id}:{last_seq} are no longer available")
+            follower = self._next_follower
+            self._next_follower += 1
+        cursor = last_seq + 1
+        self._cursors[follower] = cursor
+        self._detached_cursor = None
+        if self._grace_handle is not None:
+            self._grace_handle.cancel()
+            self._grace_handle = None
+
+        reason = "stream_closed"
+        next_poll = time.monotonic() + poll_seconds
+        try:
+            while True:
+                if cursor < self.next_seq:
+                    frame = self.frames[cursor - self.first_buffered_seq]
+                    seq = cursor
+                    cursor += 1
+                    self._cursors[follower] = cursor
+                    if self._room_waiters:
+                        self._wake(self._room_waiters)
+                    if is_disconnected is not None and time.monotonic() >= next_poll:
+                        next_poll = time.monotonic() + poll_seconds
+                        if await is_disconnected():
+                            reason = "client_disconnected"
+                            return
+                    yield self._id_prefix + str(seq).encode() + b"\n" + frame
+                    continue
+
+                if self.done:
+                    return
+
+                waiter = asyncio.get_running_loop().create_future()
+                self._frame_waiters.append(waiter)
+                try:
+                    await asyncio.wait_for(waiter, poll_seconds)
+                except asyncio.TimeoutError:
+                    next_poll = time.monotonic() + poll_seconds
+                    if is_disconnected is not None and await is_disconnected():
+                        reason = "client_disconnected"
+                        return
+        finally:
+            del self._cursors[follower]
+            if not self.done and not self._cursors:
+                self._detach(cursor, reason)
+
+    def _detach(self, cursor: int, reason: str) -> None:
+        """The last client left mid-run: wait for a reconnect, then cancel."""
+        self._detached_cursor = cursor
+        if self._room_waiters:
+            self._wake(self._room_waiters)
+        if self.grace_seconds <= 0:
+            self.cancel(reason)
+        else:
+            self._grace_handle = asyncio.get_running_loop().call_later(
+                self.grace_seconds, self._grace_expired, reason
+            )
+
+    def _grace_expired(self, reason: str) -> None:
+        self._grace_handle = None
+        if not self._cursors and not self.done:
+            self.cancel(reason)
+
+    def cancel(self, reason: str) -> None:
+        """Cancel the producer (and the agent run inside it)."""
+        if self.cancelled or self.done:
+            return
+        self.cancelled = True
+        if self.task is not None:
+            self.task.cancel()
+        if self.on_cancel is not None:
+            self.on_cancel(reason, self._detached_cursor or 0)
+
+
+class StreamRunRegistry:
+    """In-flight and recently finished runs, by run ID."""
+
+    def __init__(self, ttl_seconds: float = 120.0):
+        self.ttl_seconds = ttl_seconds
+        self.runs: Dict[str, StreamRun] = {}
+        self._inflight: Dict[Hashable, StreamRun] = {}  # request key -> unfinished run
+
+    def _prune(self) -> None:
+        cutoff = time.monotonic() - self.ttl_seconds
+        expired = [
+            run_id for run_id, run in self.runs.items()
+            if run.finished_at is not None and run.finished_at < cutoff
+        ]
+        for run_id in expired:
+            del self.runs[run_id]
+        for key in [key for key, run in self._inflight.items() if run.done or run.cancelled]:
+            del self._inflight[key]
+
+    def add(self, run: StreamRun, key: Optional[Hashable] = None) -> None:
+        """Register a run, optionally under a key identifying its request."""
+        self._prune()
+        self.runs[run.run_id] = run
+        if key is not None:
+            self._inflight[key] = run
+
+    def inflight(self, key: Optional[Hashable]) -> Optional[StreamRun]:
+        """The unfinished run started for an identical request, if any."""
+        run = self._inflight.get(key) if key is not None else None
+        if run is not None and (run.done or run.cancelled):
+            del self._inflight[key]
+            return None
+        return run
+
+    def get(self, run_id: str) -> Optional[StreamRun]:
+        self._prune()
+        return self.runs.get(run_id)
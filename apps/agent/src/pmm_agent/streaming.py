@@ -0,0 +1,109 @@
+"""
+Message Normalization for Chat Responses.
+
+Turns LangChain AIMessages into typed events (tool calls, then text) in a
+single pass over the message. Handles both `tool_calls` and Anthropic
+`tool_use` content blocks, which describe the same call, plain string and
+list-of-blocks content, and messages seen more than once.
+
+One normalizer is used per turn so tool calls are deduplicated across the
+turn. Dedup uses the tool call ID; args are only serialized for the rare
+calls without one.
+
+    normalizer = MessageNormalizer()
+    for event in normalizer.normalize(message):
+        if isinstance(event, ToolCallEvent):
+            ...
+        else:
+            ...
+"""
+
+import json
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Union
+
+from langchain_core.messages import AIMessage
+
+
+class ToolCallEvent(NamedTuple):
+    """A tool call requested by the model."""
+
+    name: str
+    args: Dict[str, Any]
+    id: Optional[str] = None
+
+
+class TextEvent(NamedTuple):
+    """Text produced by the model."""
+
+    text: str
+
+
+StreamEvent = Union[ToolCallEvent, TextEvent]
+
+
+class MessageNormalizer:
+    """Converts AIMessages into deduplicated tool-call and text events for one turn."""
+
+    def __init__(self):
+        self._seen_ids: Set[str] = set()
+        self._seen_keys: Set[str] = set()
+        # Characters already emitted per message ID, so a repeated message
+        # only contributes text that is new
+        self._emitted_text: Dict[str, int] = {}
+        self.duplicates = 0
+
+    def _is_new_call(self, name: str, args: Dict[str, Any], call_id: Optional[str]) -> bool:
+        if call_id:
+            if call_id in self._seen_ids:
+                self.duplicates += 1
+                return False
+            self._seen_ids.add(call_id)
+            return True
+
+        try:
+            key = f"{name}:{json.dumps(args, sort_keys=True)}"
+        except (TypeError, ValueError):
+            key = f"{name}:{args}"
+        if key in self._seen_keys:
+            self.duplicates += 1
+            return False
+        self._seen_keys.add(key)
+        return True
+
+    def normalize(self, message: AIMessage) -> List[StreamEvent]:
+        """Return the message's new tool calls followed by its new text."""
+        events: List[StreamEvent] = []
+
+        for call in message.tool_calls:
+            name = call.get("name")
+            args = call.get("args") or {}
+            if name and self._is_new_call(name, args, call.get("id")):
+                events.append(ToolCallEvent(name, args, call.get("id")))
+
+        content = message.content
+        if isinstance(content, str):
+            text = content
+        else:
+            parts = []
+            for item in content:
+                if isinstance(item, str):
+                    parts.append(item)
+                elif isinstance(item, dict):
+                    item_type = item.get("type")
+                    if item_type == "text":
+                        parts.append(item.get("text", ""))
+                    elif item_type == "tool_use":
+                        name = item.get("name")
+                        args = item.get("input") or {}
+                        if name and self._is_new_call(name, args, item.get("id")):
+                            events.append(ToolCallEvent(name, args, item.get("id")))
+            text = "".join(parts)
+
+        if text and message.id:
+            emitted = self._emitted_text.get(message.id, 0)
+            self._emitted_text[message.id] = max(emitted, len(text))
+            text = text[emitted:]
+        if text:
+            events.append(TextEvent(text))
+        return events
+
@@ -0,0 +1,291 @@
+"""
+Lightweight Tracing for PMM Agent.
+
+Per-stage spans for chat turns (message conversion, model calls, tool
+execution, SSE serialization, logging). The API mirrors the OpenTelemetry
+tracer surface - `start_span`, `start_as_current_span`, `set_attribute`,
+`end` - and spans export with OTel-shaped fields (hex trace/span IDs,
+nanosecond timestamps), so switching to the real SDK later is mechanical.
+
+The default tracer is a no-op: every call returns a shared non-recording
+span, so instrumentation costs a method call when tracing is off.
+
+Configure with the TRACING_EXPORTER environment variable:
+    none   - no-op tracer (default)
+    memory - keep recent spans in memory (tests, debugging)
+    file   - append spans as JSON lines to logs/traces_YYYYMMDD.jsonl
+"""
+
+import json
+import os
+import secrets
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional
+
+from .observability import running_on_vercel
+
+
+class NonRecordingSpan:
+    """Span that records nothing. Shared by the no-op tracer."""
+
+    name = ""
+    timings: Dict[str, float] = {}
+
+    def __enter__(self) -> "NonRecordingSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        return None
+
+    def is_recording(self) -> bool:
+        return False
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_attributes(self, attributes: Dict[str, Any]) -> None:
+        pass
+
+    def record_exception(self, exception: BaseException) -> None:
+        pass
+
+    def end(self, end_time: Optional[int] = None) -> None:
+        pass
+
+
+INVALID_SPAN = NonRecordingSpan()
+
+
+class Span:
+    """A timed operation within a trace."""
+
+    __slots__ = (
+        "name", "trace_id", "span_id", "parent_id", "start_time", "end_time",
+        "attributes", "status", "timings", "_tracer",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        tracer: "Tracer",
+        parent: Optional["Span"] = None,
+        attributes: Optional[Dict[str, Any]] = None,
+        start_time: Optional[int] = None,
+    ):
+        self.name = name
+        self._tracer = tracer
+        self.span_id = secrets.token_hex(8)
+        if parent is not None and parent.is_recording():
+            self.trace_id = parent.trace_id
+            self.parent_id = parent.span_id
+            # Children share the root's timings dict so the whole trace
+            # can be summarized without walking exported spans
+            self.timings = parent.timings
+        else:
+            self.trace_id = secrets.token_hex(16)
+            self.parent_id = None
+            self.timings = {}
+        self.start_time = start_time if start_time is not None else time.time_ns()
+        self.end_time: Optional[int] = None
+        self.attributes: Dict[str, Any] = dict(attributes) if attributes else {}
+        self.status = "UNSET"
+
+    def __enter__(self) -> "Span":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc is not None:
+            self.record_exception(exc)
+        self.end()
+
+    def is_recording(self) -> bool:
+        return self.end_time is None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]) -> None:
+        self.attributes.update(attributes)
+
+    def record_exception(self, exception: BaseException) -> None:
+        self.status = "ERROR"
+        self.attributes["exception.type"] = type(exception).__name__
+        self.attributes["exception.message"] = str(exception)
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        if self.end_time is None:
+            return None
+        return (self.end_time - self.start_time) / 1_000_000
+
+    def end(self, end_time: Optional[int] = None) -> None:
+        """End the span and hand it to the exporter. Idempotent."""
+        if self.end_time is not None:
+            return
+        self.end_time = end_time if end_time is not None else time.time_ns()
+        self.timings[self.name] = self.timings.get(self.name, 0.0) + self.duration_ms
+        self._tracer._on_end(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class SpanExporter:
+    """Receives finished spans."""
+
+    def export(self, spans: List[Span]) -> None:
+        raise NotImplementedError
+
+    def shutdown(self) -> None:
+        pass
+
+
+class InMemorySpanExporter(SpanExporter):
+    """Keep the most recent finished spans in memory."""
+
+    def __init__(self, max_spans: int = 10000):
+        self._spans: Deque[Span] = deque(maxlen=max_spans)
+
+    def export(self, spans: List[Span]) -> None:
+        self._spans.extend(spans)
+
+    def get_finished_spans(self) -> List[Span]:
+        return list(self._spans)
+
+    def clear(self) -> None:
+        self._spans.clear()
+
+
+class FileSpanExporter(SpanExporter):
+    """Append finished spans to a daily JSON lines file."""
+
+    def __init__(self, log_dir: Optional[Path] = None):
+        if running_on_vercel():
+            self.log_dir = Path("/tmp/logs")
+        else:
+            self.log_dir = log_dir or Path(__file__).parent.parent.parent / "logs"
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+
+    def export(self, spans: List[Span]) -> None:
+        trace_file = self.log_dir / f"traces_{datetime.now().strftime('%Y%m%d')}.jsonl"
+        try:
+            with open(trace_file, "a") as f:
+                for span in spans:
+                    f.write(json.dumps(span.to_dict(), default=str) + "\n")
+        except (OSError, PermissionError):
+            # Tracing must never break a request
+            pass
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("pmm_agent_current_span", default=None)
+
+
+class _CurrentSpanScope:
+    """Context manager that makes a span current for its duration."""
+
+    __slots__ = ("_span", "_token")
+
+    def __init__(self, span: Span):
+        self._span = span
+        self._token = None
+
+    def __enter__(self) -> Span:
+        self._token = _current_span.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Exited from a different context (e.g. across generator resumes)
+            pass
+        self._span.__exit__(exc_type, exc, tb)
+
+
+class Tracer:
+    """Creates spans and hands finished ones to an exporter."""
+
+    def __init__(self, exporter: SpanExporter):
+        self.exporter = exporter
+
+    def start_span(
+        self,
+        name: str,
+        parent: Optional[Span] = None,
+        attributes: Optional[Dict[str, Any]] = None,
+        start_time: Optional[int] = None,
+    ) -> Span:
+        """
+        Start a span without making it current.
+
+        The parent defaults to the current span. Pass `parent` explicitly
+        inside async generators, where the current-span context does not
+        reliably survive across yields.
+        """
+        if parent is None:
+            parent = _current_span.get()
+        return Span(name, self, parent=parent, attributes=attributes, start_time=start_time)
+
+    def start_as_current_span(
+        self,
+        name: str,
+        attributes: Optional[Dict[str, Any]] = None,
+    ) -> _CurrentSpanScope:
+        """Start a span and make it the current span within a `with` block."""
+        return _CurrentSpanScope(self.start_span(name, attributes=attributes))
+
+    def _on_end(self, span: Span) -> None:
+        self.exporter.export([span])
+
+
+class NoOpTracer:
+    """Tracer that never records. The default."""
+
+    exporter = None
+
+    def start_span(self, name, parent=None, attributes=None, start_time=None) -> NonRecordingSpan:
+        return INVALID_SPAN
+
+    def start_as_current_span(self, name, attributes=None) -> NonRecordingSpan:
+        return INVALID_SPAN
+
+
+# Global tracer instance
+_tracer_instance = None
+
+
+def get_tracer():
+    """Get or create the global tracer based on TRACING_EXPORTER."""
+    global _tracer_instance
+    if _tracer_instance is None:
+        exporter_name = os.getenv("TRACING_EXPORTER", "none").lower()
+        if exporter_name == "memory":
+            _tracer_instance = Tracer(InMemorySpanExporter())
+        elif exporter_name == "file":
+            try:
+                _tracer_instance = Tracer(FileSpanExporter())
+            except (OSError, PermissionError):
+                _tracer_instance = NoOpTracer()
+        else:
+            _tracer_instance = NoOpTracer()
+    return _tracer_instance
+
+
+def set_tracer(tracer) -> None:
+    """Replace the global tracer (tests and embedding applications)."""
+    global _tracer_instance
+    _tracer_instance = tracer
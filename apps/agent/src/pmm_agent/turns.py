@@ -0,0 +1,136 @@
+"""
+Chat Turn Coordination.
+
+Two guards for concurrent requests against the same session:
+
+- SingleFlight: identical requests (same session and message) that arrive
+  while the first is still running share its result instead of starting a
+  second agent run. This absorbs double-submits and client retries.
+- SessionTurnLocks: a session's turns run one at a time, so history reads
+  and writes from overlapping turns cannot interleave. At most
+  `max_queue_depth` turns wait behind the running one; more are refused.
+
+Requests without a session ID always start a new session and are never
+coalesced: there is nothing that ties two of them to the same user.
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+def turn_key(session_id: Optional[str], message: str) -> Optional[Tuple[str, str]]:
+    """Key identifying duplicate requests, or None if they cannot be matched."""
+    if not session_id:
+        return None
+    return session_id, message
+
+
+class SingleFlight:
+    """Runs one coroutine per key at a time; concurrent callers share its result."""
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    async def run(self, key: Optional[Hashable], factory: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """
+        Await `factory()`, or the run already in flight for `key`.
+
+        Returns (result, coalesced). The run is shielded: a caller that goes
+        away does not cancel it for the callers still waiting.
+        """
+        if key is None:
+            return await factory(), False
+
+        task = self._inflight.get(key)
+        coalesced = task is not None
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task), coalesced
+
+
+class SessionBusy(Exception):
+    """The session already has the maximum number of turns queued."""
+
+
+class SessionTurn:
+    """A place in a session's turn queue, reserved by SessionTurnLocks.admit."""
+
+    def __init__(self, locks: "SessionTurnLocks", session_id: str, lock: asyncio.Lock):
+        self.session_id = session_id
+        self._locks = locks
+        self._lock = lock
+        self._held = False
+        self._left = False
+
+    async def __aenter__(self) -> "SessionTurn":
+        try:
+            await self._lock.acquire()
+        except BaseException:
+            self._leave()
+            raise
+        self._held = True
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self._held = False
+        self._lock.release()
+        self._leave()
+
+    def discard(self) -> None:
+        """Give up a place that will never be entered (e.g. its run was cancelled first)."""
+        if not self._held:
+            self._leave()
+
+    def _leave(self) -> None:
+        if not self._left:
+            self._left = True
+            self._locks._leave(self.session_id)
+
+
+class SessionTurnLocks:
+    """
+    One asyncio lock per session, with a bounded queue of waiting turns.
+
+    Admission is synchronous, so a request can be refused (HTTP 429) before
+    any work starts; the lock itself is awaited when the turn runs.
+    """
+
+    def __init__(self, max_queue_depth: int = 4):
+        """
+        Args:
+            max_queue_depth: Turns allowed to wait behind the running one
+        """
+        self.max_queue_depth = max_queue_depth
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._users: Dict[str, int] = {}  # turns holding or waiting for each lock
+
+    def pending(self, session_id: str) -> int:
+        """Turns running or queued for a session."""
+        return self._users.get(session_id, 0)
+
+    def admit(self, session_id: str) -> SessionTurn:
+        """Reserve a place in the session's queue, or raise SessionBusy."""
+        pending = self._users.get(session_id, 0)
+        if pending > self.max_queue_depth:
+            raise SessionBusy(f"Session {session_id} already has {pending} turns in progress")
+        lock = self._locks.get(session_id)
+        if lock is None:
+            lock = self._locks[session_id] = asyncio.Lock()
+        self._users[session_id] = pending + 1
+        return SessionTurn(self, session_id, lock)
+
+    def _leave(self, session_id: str) -> None:
+        remaining = self._users[session_id] - 1
+        if remaining:
+            self._users[session_id] = remaining
+        else:
+            # Nothing holds or waits on the lock: drop it with the session's turns
+            del self._users[session_id]
+            del self._locks[session_id]
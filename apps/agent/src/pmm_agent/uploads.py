@@ -0,0 +1,300 @@
+"""
+Dataset Uploads.
+
+Receives data files for the analytics tools over `POST /datasets`:
+
+- The multipart body is parsed as it arrives (python-multipart's streaming
+  parser) and the file part is written straight to disk, so memory use is
+  one network chunk no matter how large the file is.
+- The file is saved in ANALYTICS_DATA_DIR as `<dataset_id>.<ext>`. The ID
+  (e.g. "ds_3f2a9c01d4e8") can be passed as `dataset` or `data_file` to
+  the analytics tools.
+- A background worker converts it into the dataset registry's Arrow copy,
+  infers its schema and, for event data, builds the bitmap user index, so
+  the first tool call does not pay for parsing. `GET /datasets/{id}`
+  reports upload and conversion progress. A file that fails to convert is
+  deleted and its job marked failed.
+- Uploaded files count against a per-client and a total disk budget. When
+  an upload would pass one, the oldest finished uploads (of that client,
+  for the per-client budget) are deleted; if that is not enough the upload
+  is refused with 413. Uploads dropped from tracking are deleted too.
+
+Needs the analytics extra (the engine and python-multipart).
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import AsyncIterator, List, Optional
+
+MAX_TRACKED_UPLOADS = 256
+FINISHED = ("ready", "failed")
+
+logger = logging.getLogger("pmm_agent")
+
+
+class UploadRejected(Exception):
+    """The upload is not acceptable; carries the HTTP status to answer with."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+@dataclass
+class UploadJob:
+    """State of one upload, as reported by GET /datasets/{dataset_id}."""
+    dataset_id: str
+    filename: Optional[str] = None
+    status: str = "receiving"  # receiving -> converting -> ready | failed
+    bytes_received: int = 0
+    progress: float = 0.0  # fraction of the file converted
+    rows: Optional[int] = None
+    columns: Optional[List[str]] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    client: Optional[str] = None  # budget owner (client IP); not reported
+    path: Optional[Path] = None  # the saved file; not reported
+
+    def to_dict(self) -> dict:
+        report = asdict(self)
+        del report["client"], report["path"]
+        return report
+
+    @property
+    def stored_bytes(self) -> int:
+        """Disk space the upload counts against its budgets (failed files are deleted)."""
+        return 0 if self.status == "failed" else self.bytes_received
+
+
+class _FileWriter:
+    """python-multipart callbacks that write the part named `file` to `path`."""
+
+    def __init__(self, path: Path, suffixes: tuple):
+        self.path = path
+        self.suffixes = suffixes
+        self.filename: Optional[str] = None
+        self.suffix: Optional[str] = None
+        self._headers: dict = {}
+        self._field = b""
+        self._value = b""
+        self._out = None
+        self.complete = False
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self._part_begin,
+            "on_header_field": lambda data, start, end: self._append("_field", data[start:end]),
+            "on_header_value": lambda data, start, end: self._append("_value", data[start:end]),
+            "on_header_end": self._header_end,
+            "on_headers_finished": self._headers_finished,
+            "on_part_data": self._part_data,
+            "on_part_end": self._part_end,
+            "on_end": self._end,
+        }
+
+    def _append(self, name: str, data: bytes) -> None:
+        setattr(self, name, getattr(self, name) + data)
+
+    def _part_begin(self) -> None:
+        self._headers = {}
+
+    def _header_end(self) -> None:
+        self._headers[self._field.lower()] = self._value
+        self._field = self._value = b""
+
+    def _headers_finished(self) -> None:
+        from python_multipart.multipart import parse_options_header
+
+        _, options = parse_options_header(self._headers.get(b"content-disposition"))
+        if options.get(b"name") != b"file" or self.filename is not None:
+            return
+        self.filename = Path(options.get(b"filename", b"").decode("utf-8", "replace")).name
+        self.suffix = Path(self.filename).suffix.lower()
+        if self.suffix not in self.suffixes:
+            raise UploadRejected(415, f"Upload a {', '.join(self.suffixes)} file (got '{self.filename}')")
+        self._out = open(self.path, "wb")
+
+    def _part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._out is not None:
+            self._out.write(data[start:end])
+
+    def _part_end(self) -> None:
+        self.close()
+
+    def _end(self) -> None:
+        self.complete = True
+
+    def close(self) -> None:
+        if self._out is not None:
+            self._out.close()
+            self._out = None
+
+
+class DatasetUploads:
+    """Streams uploads to disk and converts them on a background thread."""
+
+    def __init__(self, max_bytes: int, workers: int = 1, max_client_bytes: int = 0, max_total_bytes: int = 0):
+        """
+        Args:
+            max_bytes: Largest accepted request body
+            workers: Conversion threads
+            max_client_bytes: Disk space for one client's uploads (0: unlimited)
+            max_total_bytes: Disk space for all uploads (0: unlimited)
+        """
+        self.max_bytes = max_bytes
+        self.max_client_bytes = max_client_bytes
+        self.max_total_bytes = max_total_bytes
+        self.jobs: "OrderedDict[str, UploadJob]" = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dataset-convert")
+
+    @staticmethod
+    def data_dir() -> Path:
+        from .domains.data_analytics.engine import events
+
+        return events.ANALYTICS_DATA_DIR
+
+    def get(self, dataset_id: str) -> Optional[UploadJob]:
+        return self.jobs.get(dataset_id)
+
+    def _track(self, job: UploadJob) -> None:
+        self.jobs[job.dataset_id] = job
+        while len(self.jobs) > MAX_TRACKED_UPLOADS:
+            oldest = next((old for old in self.jobs.values() if old.status in FINISHED), None)
+            if oldest is None:
+                break  # every tracked upload is still in progress
+            self._remove(oldest)
+
+    def _remove(self, job: UploadJob) -> None:
+        """Stop tracking a finished upload and delete its file."""
+        self.jobs.pop(job.dataset_id, None)
+        if job.path is not None:
+            job.path.unlink(missing_ok=True)
+
+    def _make_room(self, job: UploadJob) -> None:
+        """
+        Delete the oldest finished uploads until `job` fits the disk budgets.
+
+        Raises:
+            UploadRejected: The budget is taken by uploads still in progress
+        """
+        budgets = [(None, self.max_total_bytes, "all uploads")]
+        if job.client is not None:
+            budgets.insert(0, (job.client, self.max_client_bytes, "your uploads"))
+        for client, limit, whose in budgets:
+            if not limit:
+                continue
+            owned = [old for old in self.jobs.values() if client is None or old.client == client]
+            used = sum(old.stored_bytes for old in owned)
+            for old in owned:
+                if used <= limit:
+                    break
+                if old.status in FINISHED:
+                    used -= old.stored_bytes
+                    self._remove(old)
+            if used > limit:
+                raise UploadRejected(413, f"Upload exceeds the {limit // (1024 * 1024)} MB disk budget for {whose}")
+
+    async def receive(
+        self, content_type: str, body: AsyncIterator[bytes], client: Optional[str] = None
+    ) -> UploadJob:
+        """
+        Write the `file` part of a multipart body to the data directory and queue its conversion.
+
+        `client` (the client IP) owns the upload for the per-client disk budget.
+
+        Raises:
+            ImportError: The analytics extra is not installed
+            UploadRejected: Not multipart, no `file` part, wrong file type or too large
+        """
+        from python_multipart.exceptions import MultipartParseError
+        from python_multipart.multipart import MultipartParser, parse_options_header
+
+        from .domains.data_analytics.engine.events import DATASET_SUFFIXES
+
+        media_type, options = parse_options_header(content_type)
+        if media_type != b"multipart/form-data" or not options.get(b"boundary"):
+            raise UploadRejected(400, "Expected a multipart/form-data body with a `file` field")
+
+        job = UploadJob(dataset_id=f"ds_{uuid.uuid4().hex[:12]}", client=client)
+        data_dir = self.data_dir()
+        data_dir.mkdir(parents=True, exist_ok=True)
+        writer = _FileWriter(data_dir / f".{job.dataset_id}.part", DATASET_SUFFIXES)
+        parser = MultipartParser(options[b"boundary"], writer.callbacks())
+        self._track(job)
+        try:
+            async for chunk in body:
+                job.bytes_received += len(chunk)
+                if job.bytes_received > self.max_bytes:
+                    raise UploadRejected(413, f"Upload exceeds {self.max_bytes // (1024 * 1024)} MB")
+                self._make_room(job)
+                # Parsing and the disk write happen off the event loop
+                await asyncio.to_thread(parser.write, chunk)
+                job.filename = writer.filename
+            parser.finalize()
+            writer.close()
+            if writer.filename is None:
+                raise UploadRejected(400, "Expected a multipart/form-data body with a `file` field")
+            if not writer.complete:
+                raise UploadRejected(400, "The upload ended before the closing multipart boundary")
+            path = data_dir / f"{job.dataset_id}{writer.suffix}"
+            os.replace(writer.path, path)
+            job.path = path
+        except MultipartParseError as e:
+            self._discard(job, writer)
+            raise UploadRejected(400, f"Malformed multipart body: {e}")
+        except BaseException:
+            # Rejected or disconnected: nothing is kept
+            self._discard(job, writer)
+            raise
+
+        job.status = "converting"
+        self._executor.submit(self._convert, job, path)
+        return job
+
+    def _discard(self, job: UploadJob, writer: _FileWriter) -> None:
+        writer.close()
+        writer.path.unlink(missing_ok=True)
+        self.jobs.pop(job.dataset_id, None)
+
+    def _convert(self, job: UploadJob, path: Path) -> None:
+        from .domains.data_analytics.engine import (
+            DatasetNotFound,
+            get_registry,
+            infer_schema,
+            load_events,
+            user_index,
+        )
+        from .domains.data_analytics.engine.events import file_hash
+
+        def report(fraction: float) -> None:
+            job.progress = round(fraction, 4)
+
+        try:
+            table = get_registry().table(path, file_hash(path), progress=report)
+            infer_schema(job.dataset_id)  # ready for draft_sql_query_pack
+        except Exception as e:
+            # Anything escaping here would vanish into the executor and leave the job converting
+            path.unlink(missing_ok=True)
+            job.status, job.error = "failed", str(e)
+            logger.warning(
+                f"⚠️  Converting upload {job.dataset_id} failed: {e}",
+                exc_info=not isinstance(e, (ValueError, OSError)),
+            )
+            return
+        job.rows, job.columns = table.num_rows, table.schema.names
+        job.progress, job.status = 1.0, "ready"
+        try:
+            # Event data with the default columns gets its cohort index up front
+            user_index(load_events(job.dataset_id))
+        except (DatasetNotFound, ValueError):
+            pass
+        except Exception as e:
+            logger.warning(f"⚠️  Could not index upload {job.dataset_id}: {e}", exc_info=True)
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Offline load test for the agent server.
+
+Runs the real FastAPI app (ReAct loop, tools, streaming, observability) under
+uvicorn on a local port, with ChatAnthropic swapped for the deterministic
+FakeChatModel. Many concurrent async clients drive /chat or /chat/stream and
+the script reports throughput, time to first byte and latency percentiles.
+No API key or network access is needed and no tokens are spent.
+
+Rate limiting is disabled for the run so the numbers measure the server,
+not the limiter.
+
+Usage:
+    python3 tests/bench_load.py
+    python3 tests/bench_load.py --endpoint chat --concurrency 100 --requests 1000
+    python3 tests/bench_load.py --script tool --latency 0.5 --tokens-per-second 80
+    python3 tests/bench_load.py --json results.json
+    python3 tests/bench_load.py --fixture fixtures/recorded/<message_id>.json --pace
+
+With --fixture, the server replays a recorded production turn (see
+pmm_agent/replay.py and RECORD_TURNS_DIR) instead of a synthetic script.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Add src to path for imports
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+
+# Keep the console quiet so terminal I/O doesn't dominate the measurement
+os.environ.setdefault("ANTHROPIC_API_KEY", "sk-ant-offline-benchmark")
+os.environ.setdefault("DEBUG_STREAM", "0")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+
+# Tool-call scripts per domain: one tool step, then a final answer
+TOOL_STEPS = {
+    "pmm": {
+        "name": "analyze_product",
+        "args": {"product_description": "A CLI that turns spreadsheets into dashboards."},
+    },
+    "data_analytics": {
+        "name": "draft_sql_query_pack",
+        "args": {"schema_hints": "events(user_id, event_name, occurred_at)", "questions": "activation rate"},
+    },
+}
+
+ANSWER_TEXT = (
+    "Here is a concise answer with enough text to exercise the streaming path. " * 8
+).strip()
+
+
+def build_script(name: str, domain: str) -> List[Dict]:
+    """Build a FakeChatModel script by name."""
+    if name == "answer":
+        return [{"text": ANSWER_TEXT}]
+    if name == "tool":
+        return [{"tool_calls": [TOOL_STEPS[domain]]}, {"text": ANSWER_TEXT}]
+    if name == "multi-tool":
+        return [
+            {"tool_calls": [TOOL_STEPS[domain]]},
+            {"tool_calls": [TOOL_STEPS[domain]]},
+            {"text": ANSWER_TEXT},
+        ]
+    raise ValueError(f"Unknown script: {name}")
+
+
+def install_fake_agent(server, script: List[Dict], latency_s: float, tokens_per_second: float):
+    """Replace the server's agent with one backed by FakeChatModel."""
+    from pmm_agent.agent import create_analytics_agent, create_pmm_agent
+    from pmm_agent.fake_model import FakeChatModel
+
+    model = FakeChatModel(script=script, latency_s=latency_s, tokens_per_second=tokens_per_second)
+    if server.domain == "data_analytics":
+        server.agent = create_analytics_agent(mode="full", model=model)
+    else:
+        server.agent = create_pmm_agent(mode="full", model=model)
+    server.limiter.enabled = False
+    server.token_limiter.enabled = False
+
+
+class ServerThread:
+    """Run a uvicorn server in a background thread on a free port."""
+
+    def __init__(self, app):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+        config = uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning", access_log=False)
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self) -> "ServerThread":
+        self.thread.start()
+        deadline = time.time() + 10
+        while not self.server.started:
+            if time.time() > deadline:
+                raise RuntimeError("Server did not start within 10 seconds")
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+def install_replay_agent(server, fixture: Dict, pace: bool):
+    """Replace the server's agent with one replaying a recorded turn."""
+    from pmm_agent.replay import create_replay_agent
+
+    server.agent = create_replay_agent(fixture, pace=pace)
+    server.limiter.enabled = False
+    server.token_limiter.enabled = False
+
+
+async def one_request(client: httpx.AsyncClient, endpoint: str, index: int, message: Optional[str] = None) -> Dict:
+    """Send one chat request and time it."""
+    payload = {"message": message or f"Load test request {index}: what should I measure?"}
+    start = time.perf_counter()
+    ttfb = None
+    size = 0
+    try:
+        if endpoint == "stream":
+            async with client.stream("POST", "/chat/stream", json=payload) as response:
+                async for chunk in response.aiter_raw():
+                    if ttfb is None:
+                        ttfb = time.perf_counter() - start
+                    size += len(chunk)
+                ok = response.status_code == 200
+        else:
+            response = await client.post("/chat", json=payload)
+            ttfb = time.perf_counter() - start
+            size = len(response.content)
+            ok = response.status_code == 200
+    except httpx.HTTPError:
+        ok = False
+    latency = time.perf_counter() - start
+    return {"ok": ok, "ttfb": ttfb if ttfb is not None else latency, "latency": latency, "bytes": size}
+
+
+async def drive(base_url: str, endpoint: str, total: int, concurrency: int, message: Optional[str] = None) -> Dict:
+    """Issue `total` requests from `concurrency` concurrent clients."""
+    counter = iter(range(total))
+    results: List[Dict] = []
+
+    async def worker(client: httpx.AsyncClient):
+        for index in counter:
+            results.append(await one_request(client, endpoint, index, message))
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return summarize(results, elapsed)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def summarize(results: List[Dict], elapsed: float) -> Dict:
+    ok = [r for r in results if r["ok"]]
+    latencies = [r["latency"] for r in ok]
+    ttfbs = [r["ttfb"] for r in ok]
+    return {
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "elapsed_s": elapsed,
+        "requests_per_s": len(ok) / elapsed if elapsed else 0.0,
+        "bytes_per_s": sum(r["bytes"] for r in ok) / elapsed if elapsed else 0.0,
+        "ttfb_ms": {
+            "p50": percentile(ttfbs, 50) * 1000,
+            "p99": percentile(ttfbs, 99) * 1000,
+        },
+        "latency_ms": {
+            "mean": statistics.fmean(latencies) * 1000 if latencies else 0.0,
+            "p50": percentile(latencies, 50) * 1000,
+            "p95": percentile(latencies, 95) * 1000,
+            "p99": percentile(latencies, 99) * 1000,
+            "max": max(latencies) * 1000 if latencies else 0.0,
+        },
+    }
+
+
+def print_report(config: Dict, summary: Dict) -> None:
+    print("=" * 60)
+    print(f"Load Test: /{'chat/stream' if config['endpoint'] == 'stream' else 'chat'}")
+    print("=" * 60)
+    print(f"Domain: {config['domain']} | Script: {config['script']} | "
+          f"Model latency: {config['latency']}s | Token rate: {config['tokens_per_second'] or 'instant'}")
+    print(f"Requests: {summary['requests']} | Concurrency: {config['concurrency']} | Errors: {summary['errors']}")
+    print(f"Throughput: {summary['requests_per_s']:.1f} req/s ({summary['bytes_per_s'] / 1024:.1f} KiB/s)")
+    print(f"TTFB:    p50 {summary['ttfb_ms']['p50']:.1f}ms | p99 {summary['ttfb_ms']['p99']:.1f}ms")
+    latency = summary["latency_ms"]
+    print(f"Latency: p50 {latency['p50']:.1f}ms | p95 {latency['p95']:.1f}ms | "
+          f"p99 {latency['p99']:.1f}ms | max {latency['max']:.1f}ms")
+
+
+def run_benchmark(
+    endpoint: str = "stream",
+    requests: int = 200,
+    concurrency: int = 20,
+    script: str = "tool",
+    latency: float = 0.0,
+    tokens_per_second: float = 0.0,
+    fixture_path: Optional[Path] = None,
+    pace: bool = False,
+) -> Dict:
+    """Run one load test configuration and return its summary."""
+    from pmm_agent import server
+
+    message = None
+    if fixture_path:
+        from pmm_agent.replay import fixture_user_message, load_fixture
+
+        fixture = load_fixture(fixture_path)
+        install_replay_agent(server, fixture, pace)
+        message = fixture_user_message(fixture)
+        script = f"replay:{fixture_path.name}{' (paced)' if pace else ''}"
+    else:
+        install_fake_agent(server, build_script(script, server.domain), latency, tokens_per_second)
+    with ServerThread(server.app) as running:
+        summary = asyncio.run(drive(running.base_url, endpoint, requests, concurrency, message))
+    summary["config"] = {
+        "endpoint": endpoint,
+        "domain": server.domain,
+        "script": script,
+        "latency": latency,
+        "tokens_per_second": tokens_per_second,
+        "concurrency": concurrency,
+    }
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline load test with a fake chat model")
+    parser.add_argument("--endpoint", choices=["stream", "chat"], default="stream")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--script", choices=["answer", "tool", "multi-tool"], default="tool")
+    parser.add_argument("--latency", type=float, default=0.0, help="Fake model delay per call (seconds)")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="Fake output token rate (0 = instant)")
+    parser.add_argument("--fixture", type=Path, help="Replay a recorded turn instead of a script")
+    parser.add_argument("--pace", action="store_true", help="With --fixture, wait for recorded latencies")
+    parser.add_argument("--json", type=Path, help="Write the summary to this JSON file")
+    args = parser.parse_args(argv)
+
+    summary = run_benchmark(
+        endpoint=args.endpoint,
+        requests=args.requests,
+        concurrency=args.concurrency,
+        script=args.script,
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        fixture_path=args.fixture,
+        pace=args.pace,
+    )
+    print_report(summary["config"], summary)
+
+    if args.json:
+        args.json.write_text(json.dumps(summary, indent=2))
+        print(f"\n📄 Summary written to {args.json}")
+
+    return 0 if summary["errors"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
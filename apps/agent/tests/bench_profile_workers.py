@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark for parallel dataset profiling.
+
+Writes a wide synthetic Parquet file (integer, float, string and
+timestamp columns) and profiles it with 1, 2, 4 and 8 worker processes.
+Each worker count is warmed up once first, so process start-up is not
+counted (the pool is kept between calls, as in the server).
+
+For each worker count it reports rows/s, speedup over one worker and
+parallel efficiency (speedup / workers). Speedup is bounded by the
+number of CPU cores, which is printed with the results.
+
+Usage:
+    python3 tests/bench_profile_workers.py
+    python3 tests/bench_profile_workers.py --rows 2000000 --columns 32
+    python3 tests/bench_profile_workers.py --workers 4 --workers 16 --repeat 5
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Add src to path for imports
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+os.environ.setdefault("ANTHROPIC_API_KEY", "sk-ant-offline-benchmark")
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+
+def write_dataset(path: Path, rows: int, columns: int, row_group_rows: int) -> None:
+    """A Parquet file with `columns` columns cycling through four column types."""
+    rng = np.random.default_rng(0)
+    data = {}
+    for i in range(columns):
+        kind = i % 4
+        if kind == 0:
+            data[f"id_{i}"] = rng.integers(0, rows, rows)
+        elif kind == 1:
+            data[f"amount_{i}"] = np.where(rng.random(rows) < 0.05, np.nan, rng.lognormal(3, 1, rows))
+        elif kind == 2:
+            data[f"category_{i}"] = rng.choice([f"value_{k}" for k in range(50)], rows)
+        else:
+            data[f"created_at_{i}"] = pd.Timestamp("2024-01-01", tz="UTC") + pd.to_timedelta(
+                rng.integers(0, 90 * 86400, rows), unit="s"
+            )
+    pd.DataFrame(data).to_parquet(path, index=False, row_group_size=row_group_rows)
+
+
+def measure(path: Path, workers: int, repeat: int) -> float:
+    """Best-of-`repeat` seconds to profile the file with `workers` processes."""
+    from pmm_agent.domains.data_analytics.engine import profile_file
+
+    profile_file(path, workers=workers)  # warm-up: start the pool
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        profile_file(path, workers=workers)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Parallel profiling benchmark")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--columns", type=int, default=16)
+    parser.add_argument("--row-group-rows", type=int, default=100_000)
+    parser.add_argument("--workers", type=int, action="append", help="Worker counts besides 1 (default 2, 4, 8)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    print("=" * 60)
+    print("Parallel Profiling (profile_file)")
+    print("=" * 60)
+
+    results: Dict[int, float] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "wide.parquet"
+        write_dataset(path, args.rows, args.columns, args.row_group_rows)
+        print(f"{args.rows:,} rows x {args.columns} columns, "
+              f"{path.stat().st_size / 1024 / 1024:.0f} MiB, {os.cpu_count()} CPU cores\n")
+        # One worker always runs first: it is the baseline for speedup
+        for workers in sorted({1, *(args.workers or [2, 4, 8])}):
+            results[workers] = measure(path, workers, args.repeat)
+            speedup = results[1] / results[workers]
+            print(f"{workers} worker{'s' if workers > 1 else ' '} | {args.rows / results[workers]:>12,.0f} rows/s | "
+                  f"{results[workers]:6.2f}s | speedup {speedup:4.2f}x | efficiency {speedup / workers:4.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
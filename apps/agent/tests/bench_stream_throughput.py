@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the /chat/stream generate() hot path.
+
+Feeds synthetic LangGraph event sequences straight into the streaming
+endpoint (no HTTP, no model, no tools) and drains the SSE body, so the
+numbers cover only event handling, serialization, logging and metrics.
+
+Scenarios:
+1. long_text        - one agent message with a long text answer
+2. many_tool_calls  - a long ReAct loop of tool calls and tool results
+3. list_content     - Anthropic-style list content (text + tool_use blocks)
+4. mixed            - a realistic turn: tool calls, results, then an answer
+
+For each scenario it reports frames/s, bytes/s, CPU time per response and
+allocations per response (tracemalloc, measured in a separate pass).
+
+Regression gate: save a baseline, then compare later runs against it. The
+run fails if frames/s drops by more than the tolerance in any scenario.
+
+Usage:
+    python3 tests/bench_stream_throughput.py
+    python3 tests/bench_stream_throughput.py --save baseline.json
+    python3 tests/bench_stream_throughput.py --baseline baseline.json --tolerance 0.2
+    python3 tests/bench_stream_throughput.py --scenario long_text --iterations 50
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+# Add src to path for imports
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+
+# Keep console output and debug events out of the measurement
+os.environ.setdefault("ANTHROPIC_API_KEY", "sk-ant-offline-benchmark")
+os.environ.setdefault("DEBUG_STREAM", "0")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from langchain_core.messages import AIMessage, ToolMessage  # noqa: E402
+
+LONG_TEXT = "Activation is the share of new users who reach the aha moment within seven days. " * 60
+
+
+def _tool_call(i: int) -> Dict:
+    return {
+        "name": "draft_sql_query_pack",
+        "args": {"schema_hints": f"events_{i}(user_id, event_name, occurred_at)", "questions": "activation"},
+        "id": f"call_{i}",
+    }
+
+
+def scenario_long_text() -> List[Dict]:
+    return [{"agent": {"messages": [AIMessage(content=LONG_TEXT)]}}]
+
+
+def scenario_many_tool_calls() -> List[Dict]:
+    events = []
+    for i in range(40):
+        calls = [_tool_call(i * 3 + j) for j in range(3)]
+        events.append({"agent": {"messages": [AIMessage(content="", tool_calls=calls)]}})
+        events.append({"tools": {"messages": [
+            ToolMessage(content="SELECT 1;" * 50, tool_call_id=call["id"]) for call in calls
+        ]}})
+    events.append({"agent": {"messages": [AIMessage(content="Done.")]}})
+    return events
+
+
+def scenario_list_content() -> List[Dict]:
+    events = []
+    for i in range(10):
+        call = _tool_call(i)
+        content = [
+            {"type": "text", "text": f"Step {i}: checking the schema. "},
+            {"type": "tool_use", "name": call["name"], "input": call["args"], "id": call["id"]},
+        ]
+        events.append({"agent": {"messages": [AIMessage(content=content, tool_calls=[call])]}})
+        events.append({"tools": {"messages": [ToolMessage(content="ok", tool_call_id=call["id"])]}})
+    events.append({"agent": {"messages": [AIMessage(content=[{"type": "text", "text": LONG_TEXT[:2000]}])]}})
+    return events
+
+
+def scenario_mixed() -> List[Dict]:
+    calls = [_tool_call(0), _tool_call(1)]
+    return [
+        {"agent": {"messages": [AIMessage(content="", tool_calls=calls)]}},
+        {"tools": {"messages": [ToolMessage(content="SELECT 1;", tool_call_id=c["id"]) for c in calls]}},
+        {"agent": {"messages": [AIMessage(content=LONG_TEXT[:3000])]}},
+    ]
+
+
+SCENARIOS: Dict[str, Callable[[], List[Dict]]] = {
+    "long_text": scenario_long_text,
+    "many_tool_calls": scenario_many_tool_calls,
+    "list_content": scenario_list_content,
+    "mixed": scenario_mixed,
+}
+
+
+class ReplayEventsAgent:
+    """Stand-in for the LangGraph agent that yields pre-built events."""
+
+    def __init__(self, events: List[Dict]):
+        self.events = events
+
+    async def astream(self, inputs, config):
+        for event in self.events:
+            yield event
+
+
+async def _connected_receive():
+    # The client stays connected for the whole benchmark
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+def _make_request():
+    from starlette.requests import Request
+
+    return Request({
+        "type": "http",
+        "method": "POST",
+        "path": "/chat/stream",
+        "headers": [],
+        "client": ("127.0.0.1", 0),
+        "query_string": b"",
+    }, receive=_connected_receive)
+
+
+async def run_turn(server) -> Dict:
+    """Drive one streaming turn and drain its body."""
+    response = await server.chat_stream(server.ChatRequest(message="Benchmark turn"), _make_request())
+    frames = 0
+    size = 0
+    async for frame in response.body_iterator:
+        frames += 1
+        size += len(frame)
+    return {"frames": frames, "bytes": size}
+
+
+async def measure(server, iterations: int) -> Dict:
+    """Time `iterations` turns and return throughput numbers."""
+    frames = size = 0
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    for _ in range(iterations):
+        result = await run_turn(server)
+        frames += result["frames"]
+        size += result["bytes"]
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+    return {
+        "frames_per_response": frames // iterations,
+        "bytes_per_response": size // iterations,
+        "frames_per_s": frames / wall,
+        "bytes_per_s": size / wall,
+        "cpu_ms_per_response": cpu / iterations * 1000,
+    }
+
+
+async def measure_allocations(server, iterations: int) -> Dict:
+    """Count allocations per response with tracemalloc (separate, slower pass)."""
+    await run_turn(server)  # warm caches outside the trace
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for _ in range(iterations):
+        await run_turn(server)
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename") if stat.size_diff > 0)
+    return {
+        "peak_kib": peak / 1024,
+        "retained_kib_per_response": allocated / iterations / 1024,
+    }
+
+
+def run_scenario(name: str, iterations: int, alloc_iterations: int) -> Dict:
+    """Benchmark one scenario against the real streaming endpoint."""
+    from pmm_agent import server
+
+    original_agent = server.agent
+    server.agent = ReplayEventsAgent(SCENARIOS[name]())
+    server.limiter.enabled = False
+    server.token_limiter.enabled = False
+    # Every benchmark turn is a session's first message, which logs a
+    # protocol-violation warning when it calls tools; keep those off the console
+    previous_level = server.logger.logger.level
+    server.logger.logger.setLevel(logging.ERROR)
+    try:
+        asyncio.run(measure(server, 2))  # warm-up
+        result = asyncio.run(measure(server, iterations))
+        result.update(asyncio.run(measure_allocations(server, alloc_iterations)))
+    finally:
+        server.agent = original_agent
+        server.logger.logger.setLevel(previous_level)
+        # Benchmark turns each create a session; drop them
+        server.sessions.clear()
+    return result
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Return scenarios whose frames/s regressed beyond the tolerance."""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]["frames_per_s"]
+        after = result["frames_per_s"]
+        if after < before * (1 - tolerance):
+            regressions.append(f"{name}: {before:,.0f} → {after:,.0f} frames/s ({after / before - 1:+.0%})")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="SSE streaming throughput micro-benchmark")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), action="append")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--alloc-iterations", type=int, default=3)
+    parser.add_argument("--save", type=Path, help="Write results to this JSON file")
+    parser.add_argument("--baseline", type=Path, help="Compare against a saved JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed frames/s drop (default 15%%)")
+    args = parser.parse_args(argv)
+
+    print("=" * 60)
+    print("SSE Streaming Throughput (generate() hot path)")
+    print("=" * 60)
+
+    results = {}
+    for name in args.scenario or list(SCENARIOS):
+        result = run_scenario(name, args.iterations, args.alloc_iterations)
+        results[name] = result
+        print(f"\n{name}")
+        print(f"   {result['frames_per_response']} frames, {result['bytes_per_response'] / 1024:.1f} KiB per response")
+        print(f"   {result['frames_per_s']:,.0f} frames/s | {result['bytes_per_s'] / 1024 / 1024:.2f} MiB/s")
+        print(f"   CPU {result['cpu_ms_per_response']:.2f}ms/response | "
+              f"peak {result['peak_kib']:.0f} KiB | retained {result['retained_kib_per_response']:.1f} KiB/response")
+
+    if args.save:
+        args.save.write_text(json.dumps(results, indent=2))
+        print(f"\n📄 Results written to {args.save}")
+
+    if args.baseline:
+        regressions = compare(results, json.loads(args.baseline.read_text()), args.tolerance)
+        print("\n" + "=" * 60)
+        if regressions:
+            print("❌ Throughput regressions:")
+            for line in regressions:
+                print(f"   {line}")
+            return 1
+        print(f"✅ No scenario regressed by more than {args.tolerance:.0%}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
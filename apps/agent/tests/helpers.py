@@ -0,0 +1,82 @@
+"""
+Shared fixtures for the analytics engine tests.
+
+- random_events: a reproducible random event log (user_id, event_name, occurred_at)
+- DataDir: a temporary ANALYTICS_DATA_DIR with its own dataset registry
+- SandboxWorkspace: a DataDir holding events.csv from the last 60 days,
+  for SQL templates that filter on CURRENT_DATE
+
+Test scripts import it after putting this directory on sys.path:
+    sys.path.insert(0, str(Path(__file__).parent))
+    from helpers import DataDir, random_events
+"""
+
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+EVENTS = ["signup_completed", "onboarding_completed", "first_value_action", "page_view"]
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def random_events(n_events, n_users, days=60, seed=7):
+    """Random event log: user_id, event_name, occurred_at (UTC datetimes)."""
+    rng = np.random.default_rng(seed)
+    seconds = rng.integers(0, days * 86400, n_events)
+    return pd.DataFrame({
+        "user_id": rng.integers(0, n_users, n_events).astype(str),
+        "event_name": rng.choice(EVENTS, n_events, p=[0.15, 0.15, 0.1, 0.6]),
+        "occurred_at": pd.to_datetime(START) + pd.to_timedelta(seconds, unit="s"),
+    })
+
+
+class DataDir:
+    """Temporary ANALYTICS_DATA_DIR (`path`, created empty) and dataset registry."""
+
+    def __enter__(self):
+        from pmm_agent.domains.data_analytics.engine import DatasetRegistry, events
+        from pmm_agent.domains.data_analytics.engine import registry as registry_module
+
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self._tmp.name) / "data"
+        self.path.mkdir()
+        self.registry = DatasetRegistry(Path(self._tmp.name) / "datasets")
+        self._originals = events.ANALYTICS_DATA_DIR, registry_module._registry
+        events.ANALYTICS_DATA_DIR = self.path
+        registry_module._registry = self.registry
+        return self
+
+    def files(self):
+        return sorted(p.name for p in self.path.iterdir())
+
+    def __exit__(self, *exc):
+        from pmm_agent.domains.data_analytics.engine import events
+        from pmm_agent.domains.data_analytics.engine import registry as registry_module
+
+        events.ANALYTICS_DATA_DIR, registry_module._registry = self._originals
+        self._tmp.cleanup()
+
+
+class SandboxWorkspace(DataDir):
+    """DataDir with events.csv (`frame`) shifted to end today, and sandboxes over it."""
+
+    def __enter__(self):
+        super().__enter__()
+        frame = random_events(5000, 300)
+        # Templates filter on CURRENT_DATE, so shift the events to end now
+        frame["occurred_at"] += pd.Timestamp.now(tz=timezone.utc).normalize() - pd.Timestamp(datetime(2024, 3, 1, tzinfo=timezone.utc))
+        frame.to_csv(self.path / "events.csv", index=False)
+        self.frame = frame
+        return self
+
+    @property
+    def cache(self):
+        """Directory of the sandboxes' DuckDB files."""
+        return self.path.parent / "cache"
+
+    def sandbox(self, **kwargs):
+        from pmm_agent.domains.data_analytics.engine import SqlSandbox
+        return SqlSandbox(cache_dir=self.cache, **kwargs)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Test script for approximate metrics from a user sample.
+
+Tests:
+1. Exact funnel, retention and cohort rates (and scaled user counts) fall
+   inside the sample's 95% intervals about as often as they should; the
+   sample is deterministic, and a sample of every user gives exact results
+2. On a large file, the first approximate answer parses only the sampled
+   users' rows, where the exact one parses every event
+3. compute_event_metrics samples large files in auto mode, reports ≈
+   estimates and ± margins, and computes exactly when asked
+
+Usage:
+    python3 tests/test_approximate_metrics.py
+"""
+
+import os
+import sys
+from pathlib import Path
+
+# Add src to path for imports
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+sys.path.insert(0, str(Path(__file__).parent))
+os.environ.setdefault("ANTHROPIC_API_KEY", "sk-ant-test-key")
+
+from helpers import DataDir, random_events  # noqa: E402
+
+STEPS = ["signup_completed", "onboarding_completed", "first_value_action"]
+
+
+def _pairs(sample_table, exact_table):
+    """(successes, trials) for every rate from the sample and from all events."""
+    from pmm_agent.domains.data_analytics.engine import cohort_matrix, funnel, retention
+
+    pairs = []
+    for table in (sample_table, exact_table):
+        rates = []
+        result = funnel(table, STEPS, 14)
+        rates += [(users, result.users[0]) for users in result.users[1:]]
+        for start, back in [(None, None), ("signup_completed", "first_value_action")]:
+            result = retention(table, start, [1, 7, 30], back)
+            rates += list(zip(result.retained, result.eligible))
+        result = cohort_matrix(table, None, "week", 6)
+        rates += [
+            (int(result.active[r, k]), int(result.sizes[r]))
+            for r in range(6) for k in range(1, 6) if result.observable[r, k] and result.sizes[r]
+        ]
+        pairs.append(rates)
+    return zip(*pairs)
+
+
+def test_interval_coverage():
+    """Test that exact results fall inside the sample's intervals."""
+    print("=" * 60)
+    print("Testing Approximate Results Against Exact Ones")
+    print("=" * 60)
+
+    from pmm_agent.domains.data_analytics.engine import (
+        approximate,
+        load_events,
+        load_user_sample,
+        retention,
+    )
+
+    with DataDir() as data:
+        random_events(400_000, 60_000, days=70).to_parquet(data.path / "events.parquet", index=False)
+        exact = load_events("events.parquet")
+        sample = load_user_sample("events.parquet", users=6_000)
+
+        inside = total = 0
+        for (successes, trials), (exact_successes, exact_trials) in _pairs(sample.table, exact):
+            low, high = sample.interval(successes, trials)
+            inside += low <= exact_successes / exact_trials <= high
+            # The user count behind the rate, scaled, against the same share of all users
+            low, high = sample.interval(trials, sample.sampled_users)
+            inside += low * sample.total_users <= exact_trials <= high * sample.total_users
+            total += 2
+
+        approximate._samples.clear()
+        again = load_user_sample("events.parquet", users=6_000)
+        everyone = load_user_sample("events.parquet", users=100_000)
+
+    assert sample.total_users == exact.n_users and sample.sampled_users == 6_000
+    assert sample.total_events == len(exact) + exact.dropped_rows
+    assert inside >= 0.9 * total, f"Only {inside} of {total} exact values inside the 95% intervals"
+    assert again.table.n_users == sample.table.n_users and (again.table.ts == sample.table.ts).all()
+    assert everyone.exact and everyone.interval(3, 10) == (0.3, 0.3)
+    assert retention(everyone.table, None, [1, 7]) == retention(exact, None, [1, 7])
+    print(f"✅ {inside} of {total} exact rates and counts inside the 95% intervals "
+          f"from {sample.sampled_users:,} of {sample.total_users:,} users")
+
+
+def test_rows_parsed():
+    """Test that a sample parses only the sampled users' rows."""
+    print("\n" + "=" * 60)
+    print("Testing Rows Parsed for a First Answer on a Large File")
+    print("=" * 60)
+
+    from pmm_agent.domains.data_analytics.engine import (
+        approximate,
+        events,
+        load_events,
+        load_user_sample,
+        retention,
+    )
+
+    parsed = []
+    originals = approximate.events_from_frame, events.events_from_frame
+
+    def counting_build(frame, *args, **kwargs):
+        parsed.append(len(frame))
+        return originals[1](frame, *args, **kwargs)
+
+    with DataDir() as data:
+        random_events(1_000_000, 200_000, days=90).to_parquet(data.path / "big.parquet", index=False)
+        approximate.events_from_frame = events.events_from_frame = counting_build
+        try:
+            sample = load_user_sample("big.parquet", users=10_000)
+            approximate_result = retention(sample.table, None, [1, 7, 30])
+            exact = retention(load_events("big.parquet"), None, [1, 7, 30])
+        finally:
+            approximate.events_from_frame, events.events_from_frame = originals
+
+    for retained, eligible, rate in zip(approximate_result.retained, approximate_result.eligible, exact.rates):
+        low, high = sample.interval(retained, eligible)
+        assert low - 0.01 <= rate <= high + 0.01, (rate, low, high)
+    sample_rows, all_rows = parsed
+    assert sample_rows == len(sample.table) and all_rows == sample.total_events, (parsed, sample.total_events)
+    assert sample_rows < all_rows / 10, f"Parsed {sample_rows:,} rows for a 5% user sample of {all_rows:,}"
+    print(f"✅ Retention from {sample_rows:,} parsed rows for {sample.sampled_users:,} sampled users "
+          f"vs {all_rows:,} for the exact answer")
+
+
+def test_tool():
+    """Test auto, approximate and exact modes in compute_event_metrics."""
+    print("\n" + "=" * 60)
+    print("Testing compute_event_metrics Modes")
+    print("=" * 60)
+
+    from pmm_agent.domains.data_analytics.engine import approximate
+    from pmm_agent.domains.data_analytics.tools import compute_event_metrics
+
+    def run(**arguments):
+        return compute_event_metrics.invoke({"dataset": "events.parquet", **arguments})
+
+    with DataDir() as data:
+        random_events(30_000, 2_000).to_parquet(data.path / "events.parquet", index=False)
+        small_file = run(analysis="retention")
+
+        original = approximate.APPROX_MIN_EVENTS, approximate.APPROX_SAMPLE_USERS
+        approximate.APPROX_MIN_EVENTS, approximate.APPROX_SAMPLE_USERS = 10_000, 500
+        try:
+            outputs = {
+                analysis: run(analysis=analysis, steps=",".join(STEPS), periods=4)
+                for analysis in ("funnel", "retention", "cohorts", "stickiness")
+            }
+            exact = run(analysis="retention", mode="exact")
+            approximate.APPROX_SAMPLE_USERS = 5_000
+            everyone = run(analysis="retention", mode="approximate")
+            bad_mode = run(analysis="retention", mode="fast")
+        finally:
+            approximate.APPROX_MIN_EVENTS, approximate.APPROX_SAMPLE_USERS = original
+
+    for analysis, output in outputs.items():
+        assert "**Approximate:** from 500 sampled users (25.0%)" in output, output
+        assert "≈" in output and " ± " in output, output
+    assert "| 2. onboarding_completed | ≈" in outputs["funnel"]
+    assert "**Average DAU/MAU:**" in outputs["stickiness"] and " ± " in outputs["stickiness"].split("Average")[1]
+    for output in (small_file, exact, everyone):
+        assert "Approximate" not in output and "≈" not in output and "| Day 7 |" in output, output
+    assert exact == small_file and everyone == small_file
+    assert "❌ Unknown mode 'fast'" in bad_mode
+    print("✅ Auto mode sampled the file with ≈ and ± in every analysis; exact and full samples match all events")
+
+
+def main():
+    """Run approximate metrics tests."""
+    results = {}
+    for test in (test_interval_coverage, test_rows_parsed, test_tool):
+        try:
+            test()
+            results[test.__name__] = True
+        except AssertionError as e:
+            print(f"❌ {test.__name__} failed: {e}")
+            results[test.__name__] = False
+
+    print("\n" + "=" * 60)
+    print("Test Summary")
+    print("=" * 60)
+    for name, passed in results.items():
+        print(f"{name}: {'✅ PASS' if passed else '❌ FAIL'}")
+
+    return 0 if all(results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
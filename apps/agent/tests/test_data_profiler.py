@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Test script for the streaming data profiler.
+
+Tests:
+1. HyperLogLog distinct counts are within 2% and sketches merge as a union
+2. Null rates, distinct counts, timestamp ranges, duplicate keys and value
+   distributions are correct, and identical for any chunk size or format
+3. Peak memory follows the chunk size, not the file size (250k vs 1M rows),
+   and duplicate keys fall back to an estimate past the exact-key limit
+4. t-digest quantiles are within 1% in rank, and worker processes give the
+   same profile as one process
+5. create_data_quality_checklist runs the checks when given a data file
+
+Usage:
+    python3 tests/test_data_profiler.py
+"""
+
+import os
+import sys
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+# Add src to path for imports
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+sys.path.insert(0, str(Path(__file__).parent))
+os.environ.setdefault("ANTHROPIC_API_KEY", "sk-ant-test-key")
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+from helpers import DataDir  # noqa: E402
+
+
+def _dirty_events(n, seed=3):
+    """Events with known defects: nulls, duplicate event IDs and a bad timestamp."""
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame({
+        "event_id": np.arange(n),
+        "user_id": rng.integers(0, n // 10, n),
+        "event_name": rng.choice(["signup", "login", "purchase"], n, p=[0.2, 0.7, 0.1]),
+        "revenue": np.where(rng.random(n) < 0.1, rng.random(n) * 100, np.nan),
+        "occurred_at": np.datetime_as_string(
+            np.datetime64("2024-01-01T00:00:00") + rng.integers(0, 30 * 86400, n).astype("timedelta64[s]"),
+            timezone="UTC",
+        ),
+    })
+    frame.loc[::50, "user_id"] = None
+    frame.loc[5:9, "event_id"] = 4  # 5 duplicate rows
+    frame.loc[17, "occurred_at"] = "not a time"
+    return frame
+
+
+def test_hyperloglog():
+    """Test HyperLogLog accuracy and merging."""
+    print("=" * 60)
+    print("Testing HyperLogLog")
+    print("=" * 60)
+
+    from pmm_agent.domains.data_analytics.engine import HyperLogLog
+
+    rng = np.random.default_rng(0)
+    for true_count in (100, 10_000, 1_000_000):
+        sketch = HyperLogLog()
+        sketch.add(pd.Series(rng.permutation(true_count * 2)[:true_count]).repeat(2))
+        error = abs(sketch.estimate() - true_count) / true_count
+        assert error < 0.02, (true_count, sketch.estimate())
+
+    left, right = HyperLogLog(), HyperLogLog()
+    left.add(pd.Series(np.arange(0, 60_000)))
+    right.add(pd.Series(np.arange(30_000, 90_000, dtype=float)))  # ints and floats hash alike
+    union = left.merge(right).estimate()
+    assert abs(union - 90_000) / 90_000 < 0.02, union
+    try:
+        left.merge(HyperLogLog(p=10))
+        raise AssertionError("Different precisions should not merge")
+    except ValueError:
+        pass
+    print(f"✅ Estimates within 2%; union of overlapping halves ≈ {union:,}")
+
+
+def test_profile_values():
+    """Test profile statistics across chunk sizes and formats."""
+    print("\n" + "=" * 60)
+    print("Testing Profile Statistics")
+    print("=" * 60)
+
+    from pmm_agent.domains.data_analytics.engine import profile_file
+
+    frame = _dirty_events(20_000)
+    with tempfile.TemporaryDirectory() as tmp:
+        frame.to_csv(Path(tmp) / "events.csv", index=False)
+        frame.to_parquet(Path(tmp) / "events.parquet", index=False)
+        profiles = [
+            profile_file(Path(tmp) / name, key_columns=["event_id"], chunk_rows=chunk)
+            for name in ("events.csv", "events.parquet")
+            for chunk in (1_000, 7_777, 100_000)
+        ]
+
+    for profile in profiles:
+        columns = profile.columns
+        assert profile.rows == 20_000
+        assert profile.duplicate_keys == 5 and profile.duplicates_exact
+        assert columns["user_id"].nulls == 400
+        assert abs(columns["revenue"].null_rate - frame["revenue"].isna().mean()) < 1e-9
+        assert abs(columns["user_id"].distinct_count - frame["user_id"].nunique()) / frame["user_id"].nunique() < 0.02
+        assert columns["occurred_at"].is_time and columns["occurred_at"].unparsed == 1
+        valid = pd.to_datetime(frame["occurred_at"], utc=True, errors="coerce")
+        assert columns["occurred_at"].minimum == int(valid.min().timestamp())
+        assert columns["occurred_at"].maximum == int(valid.max().timestamp())
+        assert abs(columns["revenue"].maximum - frame["revenue"].max()) < 1e-9  # CSV round-trips floats to ~15 digits
+        assert dict(columns["event_name"].top_values()) == frame["event_name"].value_counts().to_dict()
+    assert profiles[0].chunks == 20 and profiles[2].chunks == 1
+    print("✅ Same results for CSV/Parquet at chunk sizes 1,000 / 7,777 / 100,000")
+
+
+def test_bounded_memory():
+    """Test peak memory against chunk size, and the duplicate-key fallback."""
+    print("\n" + "=" * 60)
+    print("Testing Bounded Memory on 1M Rows")
+    print("=" * 60)
+
+    from pmm_agent.domains.data_analytics.engine import profile as profile_module
+    from pmm_agent.domains.data_analytics.engine import profile_file
+
+    frame = _dirty_events(1_000_000)
+    full_size = frame.memory_usage(deep=True).sum()
+    peaks = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in (250_000, 1_000_000):
+            frame.iloc[:rows].to_parquet(Path(tmp) / f"{rows}.parquet", index=False, row_group_size=50_000)
+        del frame
+
+        for rows in (250_000, 1_000_000):
+            tracemalloc.start()
+            profile = profile_file(Path(tmp) / f"{rows}.parquet", chunk_rows=50_000)
+            peaks[rows] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            assert profile.rows == rows
+
+        original_limit = profile_module.MAX_EXACT_KEYS
+        profile_module.MAX_EXACT_KEYS = 100_000
+        try:
+            estimated = profile_file(Path(tmp) / "1000000.parquet", key_columns=["event_id"], chunk_rows=50_000)
+        finally:
+            profile_module.MAX_EXACT_KEYS = original_limit
+
+    # Four times the rows, about the same peak: memory follows the chunk, not the file
+    assert peaks[1_000_000] < 1.3 * peaks[250_000], peaks
+    assert peaks[1_000_000] < full_size / 3, f"Peak {peaks[1_000_000] / 1e6:.0f} MB for a {full_size / 1e6:.0f} MB table"
+    assert not estimated.duplicates_exact
+    assert estimated.duplicate_keys < 20_000, estimated.duplicate_keys  # true value 5; HLL error ~0.8%
+    print(f"✅ Peak {peaks[250_000] / 1e6:.0f} MB at 250k rows, {peaks[1_000_000] / 1e6:.0f} MB at 1M rows "
+          f"({full_size / 1e6:.0f} MB in memory); "
+          f"estimated duplicates past the exact limit: {estimated.duplicate_keys:,}")
+
+
+def test_parallel_profile():
+    """Test t-digest accuracy and that parallel profiles match sequential ones."""
+    print("\n" + "=" * 60)
+    print("Testing Quantiles and Parallel Profiling")
+    print("=" * 60)
+
+    from pmm_agent.domains.data_analytics.engine import TDigest, profile_file
+
+    rng = np.random.default_rng(1)
+    values = rng.lognormal(3, 1.5, 500_000)
+    parts = [TDigest() for _ in range(4)]
+    for i, chunk in enumerate(np.array_split(values, 40)):
+        parts[i % 4].add(chunk)
+    merged = parts[0].merge(parts[1]).merge(parts[2]).merge(parts[3])
+    ordered = np.sort(values)
+    for q in (0.01, 0.25, 0.5, 0.9, 0.99, 0.999):
+        rank = np.searchsorted(ordered, merged.quantile(q)) / len(values)
+        assert abs(rank - q) < 0.01, (q, rank)
+    assert merged.count == len(values) and len(merged.means) < 200
+
+    frame = _dirty_events(60_000)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "events.parquet"
+        frame.to_parquet(path, index=False, row_group_size=10_000)
+        single = profile_file(path, key_columns=["event_id"], chunk_rows=5_000)
+        parallel = profile_file(path, key_columns=["event_id"], chunk_rows=5_000, workers=4)
+        csv_path = Path(tmp) / "events.csv"
+        frame.to_csv(csv_path, index=False)
+        single_csv = profile_file(csv_path, key_columns=["event_id"])
+        by_column = profile_file(csv_path, key_columns=["event_id"], workers=3)
+
+    assert parallel.workers == 4 and by_column.workers == 3
+    for single, profile in ((single, parallel), (single_csv, by_column)):
+        assert list(profile.columns) == list(single.columns)
+        assert profile.rows == single.rows and profile.duplicate_keys == single.duplicate_keys == 5
+        for name, column in single.columns.items():
+            other = profile.columns[name]
+            assert (other.nulls, other.unparsed, other.minimum) == (column.nulls, column.unparsed, column.minimum), name
+            assert other.distinct_count == column.distinct_count, name
+            assert other.top_values() == column.top_values(), name
+    revenue = frame["revenue"].dropna()
+    p95 = parallel.columns["revenue"].quantile(0.95)
+    assert abs((revenue < p95).mean() - 0.95) < 0.01, p95
+    print(f"✅ Merged t-digest within 1% rank from the 1st to 99.9th percentile ({len(merged.means)} centroids); "
+          f"4 Parquet parts and 3 CSV column groups match one process")
+
+
+def test_checklist_tool():
+    """Test create_data_quality_checklist with a data file."""
+    print("\n" + "=" * 60)
+    print("Testing create_data_quality_checklist Profiling")
+    print("=" * 60)
+
+    from pmm_agent.domains.data_analytics.tools import create_data_quality_checklist
+
+    with DataDir() as data:
+        _dirty_events(5_000).to_csv(data.path / "events.csv", index=False)
+        output = create_data_quality_checklist.invoke({
+            "dataset": "events",
+            "data_file": "events.csv",
+            "key_columns": "event_id",
+        })
+        missing = create_data_quality_checklist.invoke({"dataset": "events", "data_file": "nope.csv"})
+        prose_only = create_data_quality_checklist.invoke({"dataset": "events"})
+
+    assert "### Profile Results: events.csv" in output
+    assert "| unique: `event_id` | ❌ 5 duplicate rows |" in output
+    assert "| not_null: `user_id` | ⚠️ 100 nulls (2.0%) |" in output
+    assert "| valid timestamp: `occurred_at` | ❌ 1 values could not be parsed |" in output
+    assert "| Column | Null rate | Distinct | Min | p50 | p95 | Max |" in output
+    assert "freshness: `occurred_at`" in output and "`event_name`: login" in output
+    assert "### Data Quality Tests" in output
+    assert "❌ No dataset named 'nope.csv'" in missing
+    assert "Profile Results" not in prose_only
+    print(output.split("### Data Quality Tests")[0])
+    print("✅ Checks, column table and distributions rendered")
+
+
+def main():
+    """Run data profiler tests."""
+    results = {}
+    for test in (test_hyperloglog, test_profile_values, test_bounded_memory, test_parallel_profile,
+                 test_checklist_tool):
+        try:
+            test()
+            results[test.__name__] = True
+        except AssertionError as e:
+            print(f"❌ {test.__name__} failed: {e}")
+            results[test.__name__] = False
+
+    print("\n" + "=" * 60)
+    print("Test Summary")
+    print("=" * 60)
+    for name, passed in results.items():
+        print(f"{name}: {'✅ PASS' if passed else '❌ FAIL'}")
+
+    return 0 if all(results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
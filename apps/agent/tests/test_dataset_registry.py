@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Test script for the memory-mapped dataset registry.
+
+Tests:
+1. A file is converted once per content hash, and opening the artifact
+   maps it instead of allocating its columns
+2. CSV columns that stop fitting the inferred type further down the file
+   are widened (int to float, bad timestamps to string)
+3. Artifacts are evicted least recently used first once they pass the size limit
+4. Event loading, profiling and the SQL sandbox share one conversion per file
+5. Sandbox databases count toward the size limit, pinned artifacts are not
+   evicted, an artifact evicted before it is opened is converted again, and
+   different files convert at the same time
+
+Usage:
+    python3 tests/test_dataset_registry.py
+"""
+
+import os
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+# Add src to path for imports
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+sys.path.insert(0, str(Path(__file__).parent))
+os.environ.setdefault("ANTHROPIC_API_KEY", "sk-ant-test-key")
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+from helpers import DataDir, random_events  # noqa: E402
+
+
+def test_convert_once():
+    """Test one conversion per content hash and zero-copy opening."""
+    print("=" * 60)
+    print("Testing Conversion and Memory Mapping")
+    print("=" * 60)
+
+    import pyarrow as pa
+
+    from pmm_agent.domains.data_analytics.engine import DatasetRegistry
+    from pmm_agent.domains.data_analytics.engine.events import file_hash
+
+    frame = random_events(200_000, 5_000)
+    with tempfile.TemporaryDirectory() as tmp:
+        registry = DatasetRegistry(Path(tmp) / "datasets")
+        source = Path(tmp) / "events.csv"
+        frame.to_csv(source, index=False)
+        digest = file_hash(source)
+
+        artifact = registry.artifact(source, digest)
+        converted_at = artifact.stat().st_mtime_ns
+        inode = artifact.stat().st_ino
+        again = registry.artifact(source, digest)
+        assert again == artifact and again.stat().st_ino == inode
+        assert again.stat().st_mtime_ns >= converted_at
+
+        before = pa.total_allocated_bytes()
+        table = registry.table(source, digest)
+        users = table.column("user_id")
+        allocated = pa.total_allocated_bytes() - before
+
+        assert table.num_rows == len(frame)
+        assert [str(u) for u in users.to_pylist()[:5]] == frame["user_id"].astype(str).tolist()[:5]
+        assert allocated < 1024, f"Opening allocated {allocated} bytes"
+        assert str(table.schema.field("occurred_at").type).startswith("timestamp")
+    print(f"✅ {len(frame):,} rows converted once to {artifact.name[:12]}…; opened with {allocated} bytes allocated")
+
+
+def test_csv_widening():
+    """Test that late type changes in a CSV widen the column."""
+    print("\n" + "=" * 60)
+    print("Testing CSV Type Widening")
+    print("=" * 60)
+
+    from pmm_agent.domains.data_analytics.engine import DatasetRegistry
+    from pmm_agent.domains.data_analytics.engine import registry as registry_module
+
+    rows = 300_000
+    frame = pd.DataFrame({
+        "amount": np.arange(rows).astype(object),
+        "occurred_at": np.datetime_as_string(
+            np.datetime64("2024-01-01T00:00:00") + np.arange(rows).astype("timedelta64[s]"), timezone="UTC"
+        ).astype(object),
+        "label": np.where(np.arange(rows) % 2, "a", ""),
+    })
+    frame.loc[rows - 1, "amount"] = 1.5
+    frame.loc[rows - 2, "occurred_at"] = "not a time"
+
+    original_block = registry_module.CSV_BLOCK_BYTES
+    registry_module.CSV_BLOCK_BYTES = 1 << 16  # the bad values are many blocks in
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            source = Path(tmp) / "late.csv"
+            frame.to_csv(source, index=False)
+            table = DatasetRegistry(Path(tmp) / "datasets").table(source, "late")
+            converted = table.to_pandas()
+    finally:
+        registry_module.CSV_BLOCK_BYTES = original_block
+
+    assert str(table.schema.field("amount").type) == "double", table.schema
+    assert str(table.schema.field("occurred_at").type) == "string", table.schema
+    assert converted["amount"].iloc[-1] == 1.5 and converted["amount"].iloc[10] == 10
+    assert converted["occurred_at"].iloc[-2] == "not a time"
+    assert converted["label"].isna().sum() == rows // 2, "Empty strings should read as nulls, as in pandas"
+    print(f"✅ Widened amount to {table.schema.field('amount').type} and occurred_at to string")
+
+
+def test_eviction():
+    """Test least-recently-used eviction by total size."""
+    print("\n" + "=" * 60)
+    print("Testing LRU Eviction")
+    print("=" * 60)
+
+    from pmm_agent.domains.data_analytics.engine import DatasetRegistry
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sources = []
+        for i in range(3):
+            source = Path(tmp) / f"part{i}.parquet"
+            random_events(20_000, 1_000, seed=i).to_parquet(source, index=False)
+            sources.append(source)
+
+        registry = DatasetRegistry(Path(tmp) / "datasets", max_bytes=1 << 40)
+        first = registry.artifact(sources[0], "a")
+        size = first.stat().st_size
+        registry.max_bytes = int(2.5 * size)
+        second = registry.artifact(sources[1], "b")
+        os.utime(first, ns=(second.stat().st_mtime_ns + 1_000_000,) * 2)  # "a" used most recently
+        opened = registry.table(sources[1], "b")
+        os.utime(second, ns=(first.stat().st_mtime_ns - 1_000_000,) * 2)
+        third = registry.artifact(sources[2], "c")
+        remaining = sorted(p.name for p in registry.artifacts())
+
+        # A table opened before its artifact was evicted still reads
+        rows = opened.column("user_id").to_numpy()
+
+    assert remaining == ["a.arrow", "c.arrow"], remaining
+    assert len(rows) == 20_000 and not second.exists() and third.name == "c.arrow"
+    print(f"✅ Limit {2.5 * size / 1e6:.1f} MB: evicted the least recently used artifact; open tables unaffected")
+
+
+def test_shared_by_tools():
+    """Test that loading, profiling and the sandbox parse each file once."""
+    print("\n" + "=" * 60)
+    print("Testing One Conversion for All Tools")
+    print("=" * 60)
+
+    from pmm_agent.domains.data_analytics.engine import SqlSandbox, load_events, profile_dataset
+    from pmm_agent.domains.data_analytics.engine import registry as registry_module
+
+    conversions = []
+    original_write = registry_module._write_csv
+
+    def counting_write(path, target, progress):
+        conversions.append(path.name)
+        original_write(path, target, progress)
+
+    frame = random_events(50_000, 2_000)
+    with DataDir() as data:
+        registry_module._write_csv = counting_write
+        try:
+            frame.to_csv(data.path / "events.csv", index=False)
+            table = load_events("events.csv")
+            profile = profile_dataset("events.csv")
+            count = SqlSandbox().run("events.csv", "SELECT COUNT(*) FROM events").rows[0][0]
+        finally:
+            registry_module._write_csv = original_write
+        cached = sorted(p.suffix for p in data.registry.artifacts())
+
+    assert conversions == ["events.csv"], conversions
+    assert cached == [".arrow", ".duckdb"], cached  # the sandbox's database sits in the registry
+    assert len(table) == len(frame)
+    assert profile.rows == count == len(frame)
+    assert profile.columns["occurred_at"].is_time and profile.columns["occurred_at"].unparsed == 0
+    print(f"✅ load_events, profile_dataset and the SQL sandbox used one conversion ({len(frame):,} rows)")
+
+
+def test_budget_and_pins():
+    """Test the shared size budget, pinning, reconversion and per-file conversion locks."""
+    print("\n" + "=" * 60)
+    print("Testing Shared Budget, Pins and Conversion Locks")
+    print("=" * 60)
+
+    from pmm_agent.domains.data_analytics.engine import DatasetRegistry
+    from pmm_agent.domains.data_analytics.engine import registry as registry_module
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sources = []
+        for i in range(2):
+            source = Path(tmp) / f"part{i}.csv"
+            random_events(20_000, 1_000, seed=i).to_csv(source, index=False)
+            sources.append(source)
+
+        registry = DatasetRegistry(Path(tmp) / "datasets", max_bytes=1 << 40)
+        with registry.pinned(sources[0], "a") as first:
+            size = first.stat().st_size
+            database = registry.root / "a.duckdb"  # as the SQL sandbox names its files
+            database.write_bytes(b"\0" * size)
+            os.utime(database, ns=(first.stat().st_mtime_ns - 1_000_000,) * 2)
+            registry.max_bytes = int(1.5 * size)
+            removed = registry.evict()
+            assert first.exists(), "A pinned artifact was evicted"
+        assert removed == [database], removed
+
+        # Evicted between the conversion and the caller's open: converted again
+        conversions = []
+        original_convert = registry._convert
+
+        def evicted_convert(source, digest, progress):
+            original_convert(source, digest, progress)
+            conversions.append(source.name)
+            if len(conversions) == 1:
+                registry.path(digest).unlink()
+
+        registry._convert = evicted_convert
+        table = registry.table(sources[1], "b")
+        del registry._convert
+        original_write = registry_module._write_csv
+
+        # Two files convert at once: the first waits for the second to start
+        started, overlapped = threading.Event(), []
+
+        def waiting_write(path, target, progress):
+            if path == sources[0]:
+                overlapped.append(started.wait(timeout=5))
+            else:
+                started.set()
+            original_write(path, target, progress)
+
+        for artifact in registry.artifacts():
+            artifact.unlink()
+        registry_module._write_csv = waiting_write
+        try:
+            threads = [
+                threading.Thread(target=registry.artifact, args=(source, digest))
+                for source, digest in zip(sources, "ab")
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            registry_module._write_csv = original_write
+
+    assert conversions == ["part1.csv", "part1.csv"], conversions
+    assert table.num_rows == 20_000
+    assert overlapped == [True], "The second file waited for the first one's conversion"
+    print("✅ A sandbox database was evicted before a pinned artifact; an evicted artifact reconverted; "
+          "two files converted at once")
+
+
+def main():
+    """Run dataset registry tests."""
+    results = {}
+    for test in (
+        test_convert_once,
+        test_csv_widening,
+        test_eviction,
+        test_shared_by_tools,
+        test_budget_and_pins,
+    ):
+        try:
+            test()
+            results[test.__name__] = True
+        except AssertionError as e:
+            print(f"❌ {test.__name__} failed: {e}")
+            results[test.__name__] = False
+
+    print("\n" + "=" * 60)
+    print("Test Summary")
+    print("=" * 60)
+    for name, passed in results.items():
+        print(f"{name}: {'✅ PASS' if passed else '❌ FAIL'}")
+
+    return 0 if all(results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
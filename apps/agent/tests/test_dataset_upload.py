@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Test script for dataset uploads (/datasets).
+
+Tests:
+1. A CSV uploaded to /datasets converts in the background, reports progress,
+   and its dataset ID works as the `dataset` argument of the analytics tools
+2. A 64 MB body streams to disk with peak memory of a few chunks
+3. Non-multipart bodies, missing file fields, unsupported file types,
+   oversized and truncated uploads are refused and leave no files behind
+4. A file that cannot be parsed, or whose conversion raises anything else,
+   fails its conversion and is removed
+5. Uploads past the per-client or total disk budget delete the oldest
+   finished uploads, or are refused when that is not enough; uploads
+   dropped from tracking are deleted
+
+Usage:
+    python3 tests/test_dataset_upload.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+# Add src to path for imports
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+sys.path.insert(0, str(Path(__file__).parent))
+os.environ.setdefault("ANTHROPIC_API_KEY", "sk-ant-test-key")
+
+from helpers import DataDir, random_events  # noqa: E402
+
+BOUNDARY = "----test-boundary-7d1f"
+
+
+def _wait(client, dataset_id, timeout=30):
+    deadline = time.monotonic() + timeout
+    while True:
+        status = client.get(f"/datasets/{dataset_id}").json()
+        if status["status"] in ("ready", "failed") or time.monotonic() > deadline:
+            return status
+        time.sleep(0.05)
+
+
+def test_upload_and_use():
+    """Test upload, progress polling and dataset IDs in tool arguments."""
+    print("=" * 60)
+    print("Testing Upload, Conversion and Tool Use")
+    print("=" * 60)
+
+    from fastapi.testclient import TestClient
+
+    from pmm_agent import server
+    from pmm_agent.domains.data_analytics.tools import compute_event_metrics, run_sql_query
+
+    frame = random_events(20_000, 800)
+    with DataDir() as data:
+        csv = frame.to_csv(index=False).encode()
+        client = TestClient(server.app)
+        response = client.post("/datasets", files={"file": ("My Events.csv", csv, "text/csv")})
+        assert response.status_code == 202, response.text
+        job = response.json()
+        status = _wait(client, job["dataset_id"])
+
+        metrics = compute_event_metrics.invoke({
+            "dataset": job["dataset_id"],
+            "analysis": "funnel",
+            "steps": "signup_completed,onboarding_completed",
+        })
+        count = run_sql_query.invoke({"dataset": job["dataset_id"], "sql": "SELECT COUNT(*) AS n FROM events"})
+        missing = client.get("/datasets/ds_doesnotexist")
+        files = data.files()
+
+    assert job["dataset_id"].startswith("ds_") and job["filename"] == "My Events.csv"
+    assert job["bytes_received"] > len(csv) and job["status"] == "converting"
+    assert status["status"] == "ready" and status["progress"] == 1.0, status
+    assert status["rows"] == len(frame) and status["columns"] == list(frame.columns)
+    assert files == [f"{job['dataset_id']}.csv"], files
+    assert "20,000 events" in metrics, metrics
+    assert "| 20000 |" in count, count
+    assert missing.status_code == 404
+    print(f"✅ {job['dataset_id']}: {status['rows']:,} rows ready; funnel and SQL ran against the ID")
+
+
+def test_streaming_memory():
+    """Test that a large upload is written through without buffering."""
+    print("\n" + "=" * 60)
+    print("Testing Streaming Upload Memory")
+    print("=" * 60)
+
+    from pmm_agent.uploads import DatasetUploads
+
+    line = b"u123456,page_view,2024-01-01T00:00:00Z\n"
+    chunk = line * (65_536 // len(line))
+    chunks = (64 << 20) // len(chunk)
+
+    async def body():
+        yield (f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"note\"\r\n\r\nignored\r\n"
+               f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"big.csv\"\r\n"
+               f"Content-Type: text/csv\r\n\r\nuser_id,event_name,occurred_at\n").encode()
+        for _ in range(chunks):
+            yield chunk
+        yield f"\r\n--{BOUNDARY}--\r\n".encode()
+
+    with DataDir() as data:
+        uploads = DatasetUploads(max_bytes=1 << 30)
+        uploads._convert = lambda job, path: None  # measure receiving only
+        tracemalloc.start()
+        job = asyncio.run(uploads.receive(f"multipart/form-data; boundary={BOUNDARY}", body()))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        size = (data.path / f"{job.dataset_id}.csv").stat().st_size
+
+    expected = len(b"user_id,event_name,occurred_at\n") + chunks * len(chunk)
+    assert size == expected, (size, expected)
+    assert peak < 4 << 20, f"Peak {peak / 1e6:.1f} MB for a {size / 1e6:.0f} MB upload"
+    print(f"✅ {size / 1e6:.0f} MB written to disk with a {peak / 1e6:.2f} MB peak")
+
+
+def test_rejections():
+    """Test that bad uploads are refused without leaving files."""
+    print("\n" + "=" * 60)
+    print("Testing Upload Refusals")
+    print("=" * 60)
+
+    from fastapi.testclient import TestClient
+
+    from pmm_agent import server
+
+    multipart = {"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"}
+    truncated = (f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"a.csv\"\r\n\r\n"
+                 "user_id,event_name\nu1,x\n").encode()
+
+    with DataDir() as data:
+        client = TestClient(server.app)
+        original_limit = server.dataset_uploads.max_bytes
+        server.dataset_uploads.max_bytes = 1000
+        try:
+            codes = {
+                "json": client.post("/datasets", json={"file": "a,b"}).status_code,
+                "no file field": client.post("/datasets", data={"other": "x"}, files={"other_file": ("a.csv", b"a")}).status_code,
+                "excel": client.post("/datasets", files={"file": ("report.xlsx", b"PK\x03\x04")}).status_code,
+                "too large": client.post("/datasets", files={"file": ("big.csv", b"a,b\n" * 1000)}).status_code,
+                "truncated": client.post("/datasets", content=truncated, headers=multipart).status_code,
+            }
+        finally:
+            server.dataset_uploads.max_bytes = original_limit
+        files = data.files()
+
+    assert codes == {"json": 400, "no file field": 400, "excel": 415, "too large": 413, "truncated": 400}, codes
+    assert files == [], files
+    print(f"✅ Refused: {codes}; data directory empty")
+
+
+def test_failed_conversion():
+    """Test that an unparseable file, or any conversion error, is reported and removed."""
+    print("\n" + "=" * 60)
+    print("Testing Failed Conversion")
+    print("=" * 60)
+
+    from fastapi.testclient import TestClient
+
+    from pmm_agent import server
+    from pmm_agent.domains.data_analytics import engine
+
+    def crash(dataset):
+        raise RuntimeError("schema inference crashed")
+
+    with DataDir() as data:
+        client = TestClient(server.app)
+        job = client.post("/datasets", files={"file": ("broken.parquet", b"not parquet at all")}).json()
+        status = _wait(client, job["dataset_id"])
+        original_infer = engine.infer_schema
+        engine.infer_schema = crash
+        try:
+            job = client.post("/datasets", files={"file": ("events.csv", b"user_id,event_name\nu1,x\n")}).json()
+            crashed = _wait(client, job["dataset_id"])
+        finally:
+            engine.infer_schema = original_infer
+        files = data.files()
+
+    assert status["status"] == "failed" and status["error"], status
+    assert crashed["status"] == "failed" and crashed["error"] == "schema inference crashed", crashed
+    assert files == [], files
+    print(f"✅ Reported: {status['error'][:80]}; unexpected errors fail the job too")
+
+
+def _body(filename, payload):
+    async def body():
+        yield (f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n\r\n"
+               ).encode() + payload
+        yield f"\r\n--{BOUNDARY}--\r\n".encode()
+    return body()
+
+
+def test_disk_budgets():
+    """Test per-client and total disk budgets and deleting untracked uploads."""
+    print("\n" + "=" * 60)
+    print("Testing Upload Disk Budgets")
+    print("=" * 60)
+
+    from pmm_agent import uploads as uploads_module
+    from pmm_agent.uploads import DatasetUploads, UploadRejected
+
+    # Each upload is about 1.1 KB: three fit a client's budget, four fit in total
+    uploads = DatasetUploads(max_bytes=1 << 20, max_client_bytes=3_500, max_total_bytes=5_000)
+    uploads._convert = lambda job, path: setattr(job, "status", "ready")
+    names = {}
+
+    def upload(name, client, size=1_000):
+        job = asyncio.run(uploads.receive(
+            f"multipart/form-data; boundary={BOUNDARY}", _body(f"{name}.csv", b"x" * size), client=client
+        ))
+        uploads._executor.submit(lambda: None).result()  # the conversion has run
+        names[job.dataset_id] = name
+
+    def remaining(data):
+        return sorted(names[Path(file).stem] for file in data.files())
+
+    with DataDir() as data:
+        for name in ("a1", "a2", "a3", "b1"):
+            upload(name, name[0])
+        full = remaining(data)
+        upload("b2", "b")  # past the total budget: the oldest upload goes
+        upload("a4", "a")  # a's own budget fits, the total does not
+        over_total = remaining(data)
+        try:
+            upload("c1", "c", size=4_000)
+            refused = None
+        except UploadRejected as e:
+            refused = e
+        after_refusal = remaining(data)
+
+        original_tracked = uploads_module.MAX_TRACKED_UPLOADS
+        uploads_module.MAX_TRACKED_UPLOADS = 2
+        try:
+            upload("c2", "c")
+        finally:
+            uploads_module.MAX_TRACKED_UPLOADS = original_tracked
+        untracked = remaining(data)
+        tracked = sorted(names[dataset_id] for dataset_id in uploads.jobs)
+
+    assert full == ["a1", "a2", "a3", "b1"], full
+    assert over_total == ["a3", "a4", "b1", "b2"], over_total
+    assert refused is not None and refused.status_code == 413 and "your uploads" in refused.detail, refused
+    assert after_refusal == over_total, after_refusal
+    assert untracked == tracked == ["a4", "c2"], (untracked, tracked)
+    print("✅ Oldest finished uploads deleted past each budget; a 4 KB upload over the client budget got a 413; "
+          "untracked uploads deleted")
+
+
+def main():
+    """Run dataset upload tests."""
+    results = {}
+    for test in (
+        test_upload_and_use,
+        test_streaming_memory,
+        test_rejections,
+        test_failed_conversion,
+        test_disk_budgets,
+    ):
+        try:
+            test()
+            results[test.__name__] = True
+        except AssertionError as e:
+            print(f"❌ {test.__name__} failed: {e}")
+            results[test.__name__] = False
+
+    print("\n" + "=" * 60)
+    print("Test Summary")
+    print("=" * 60)
+    for name, passed in results.items():
+        print(f"{name}: {'✅ PASS' if passed else '❌ FAIL'}")
+
+    return 0 if all(results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Test script for the stream debug-event channel.
+
+Tests:
+1. A disabled channel starts no thread and records nothing
+2. An enabled channel formats events on its sink thread, off the caller
+3. A full queue drops and counts events instead of growing while the
+   writer is behind, and reports the count once it catches up
+4. The channel defaults to off wherever the server counts as production
+5. A streamed turn with the channel disabled emits and formats no events;
+   enabled, every emitted event is formatted
+
+Usage:
+    python3 tests/test_debug_channel.py
+"""
+
+import io
+import os
+import sys
+import threading
+from pathlib import Path
+
+# Add src to path for imports
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+os.environ.setdefault("ANTHROPIC_API_KEY", "sk-ant-test-key")
+
+
+def test_disabled_channel():
+    """Test that a disabled channel is inert."""
+    print("=" * 60)
+    print("Testing Disabled Debug Channel")
+    print("=" * 60)
+
+    from pmm_agent.debug import DebugChannel
+
+    sink = io.StringIO()
+    channel = DebugChannel(enabled=False, stream=sink)
+    channel.emit("tool_call", name="fetch_url", args={"url": "x"})
+    channel.close()
+
+    assert channel._thread is None
+    assert sink.getvalue() == ""
+    print("✅ No sink thread and no output when disabled")
+
+
+def test_enabled_channel():
+    """Test that events reach the sink, formatted off the caller's thread."""
+    print("\n" + "=" * 60)
+    print("Testing Enabled Debug Channel")
+    print("=" * 60)
+
+    from pmm_agent.debug import DebugChannel
+
+    sink = io.StringIO()
+    channel = DebugChannel(enabled=True, stream=sink)
+    channel.emit("stream_start", messages=3)
+    channel.emit("tool_call", name="draft_sql_query_pack", args={"questions": "q" * 500})
+    channel.close()
+
+    lines = sink.getvalue().splitlines()
+    print("\n".join(f"   {line}" for line in lines))
+    assert len(lines) == 2
+    assert "stream_start messages=3" in lines[0]
+    assert "name=draft_sql_query_pack" in lines[1]
+    assert lines[1].endswith("..."), "Long args should be capped"
+    print("✅ Events written by the sink thread")
+
+
+class _BlockedSink(io.StringIO):
+    """Sink whose writes wait until `release` is set, like a stalled pipe."""
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def write(self, text):
+        self.release.wait()
+        return super().write(text)
+
+
+def test_bounded_queue():
+    """Test that a stalled writer drops events instead of queueing them all."""
+    print("\n" + "=" * 60)
+    print("Testing Bounded Debug Queue")
+    print("=" * 60)
+
+    from pmm_agent.debug import DebugChannel
+
+    sink = _BlockedSink()
+    channel = DebugChannel(enabled=True, stream=sink, max_pending=10)
+    for i in range(100):
+        channel.emit("event", i=i)
+    pending = channel._queue.qsize()
+    dropped = channel.dropped
+    sink.release.set()
+    channel.close()
+
+    lines = sink.getvalue().splitlines()
+    # The writer holds at most one event while blocked, the queue ten
+    assert pending == 10 and dropped in (89, 90), (pending, dropped)
+    assert len(lines) == 100 - dropped + 1, len(lines)
+    warnings = [line for line in lines if " warning " in line]
+    assert len(warnings) == 1 and warnings[0].endswith(f"dropped={dropped}"), warnings
+    print(f"✅ {dropped} of 100 events dropped behind a stalled writer, queue held at {pending}")
+
+
+def test_production_default():
+    """Test that the channel is off by default in every production setting."""
+    print("\n" + "=" * 60)
+    print("Testing Debug Channel Production Default")
+    print("=" * 60)
+
+    from pmm_agent import debug
+
+    settings = [{"VERCEL": "1"}, {"PRODUCTION": "true"}, {"ENVIRONMENT": "production"}, {}]
+    names = ("VERCEL", "VERCEL_ENV", "PRODUCTION", "ENVIRONMENT", "DEBUG_STREAM")
+    original = {name: os.environ.pop(name, None) for name in names}
+    enabled = []
+    try:
+        for setting in settings:
+            os.environ.update(setting)
+            enabled.append(debug._enabled_from_env())
+            for name in setting:
+                del os.environ[name]
+    finally:
+        os.environ.update({name: value for name, value in original.items() if value is not None})
+
+    assert enabled == [False, False, False, True], enabled
+    print("✅ Off with VERCEL, PRODUCTION=true or ENVIRONMENT=production; on locally")
+
+
+class _CountingChannel:
+    """Wraps a DebugChannel, counting the emit calls the stream loop makes."""
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.emits = 0
+
+    @property
+    def enabled(self):
+        return self.channel.enabled
+
+    def emit(self, event, **fields):
+        self.emits += 1
+        self.channel.emit(event, **fields)
+
+
+class _ToolAgent:
+    """Stand-in for the LangGraph agent: one tool call, then an answer."""
+
+    async def astream(self, inputs, config):
+        from langchain_core.messages import AIMessage, ToolMessage
+
+        call = {"name": "draft_sql_query_pack", "args": {"schema_hints": "events"}, "id": "call_1"}
+        yield {"agent": {"messages": [AIMessage(content="", tool_calls=[call])]}}
+        yield {"tools": {"messages": [ToolMessage(content="SELECT 1", tool_call_id="call_1")]}}
+        yield {"agent": {"messages": [AIMessage(content="Here is your SQL. " * 50)]}}
+
+
+def test_disabled_path_work():
+    """Test that a stream with the channel disabled emits and formats nothing."""
+    print("\n" + "=" * 60)
+    print("Testing Disabled Debug Path (per SSE frame)")
+    print("=" * 60)
+
+    from fastapi.testclient import TestClient
+
+    from pmm_agent import debug as debug_module
+    from pmm_agent import server
+    from pmm_agent.debug import DebugChannel
+
+    formatted = []
+    original_format = debug_module.format_event
+
+    def counting_format(event, fields):
+        formatted.append(event)
+        return original_format(event, fields)
+
+    def stream(enabled):
+        channel = _CountingChannel(DebugChannel(enabled=enabled, stream=io.StringIO()))
+        server.debug = channel
+        response = client.post("/chat/stream", json={"message": "Write SQL"})
+        channel.channel.close()
+        return channel.emits, response.text.count("data: ")
+
+    original_agent, original_debug = server.agent, server.debug
+    server.agent = _ToolAgent()
+    debug_module.format_event = counting_format
+    try:
+        client = TestClient(server.app)
+        disabled_emits, frames = stream(enabled=False)
+        disabled_formatted = len(formatted)
+        enabled_emits, _ = stream(enabled=True)
+    finally:
+        server.agent, server.debug = original_agent, original_debug
+        debug_module.format_event = original_format
+
+    print(f"   Disabled: {disabled_emits} emits, {disabled_formatted} formatted over {frames} frames")
+    print(f"   Enabled:  {enabled_emits} emits, {len(formatted)} formatted")
+    assert frames > 3, frames
+    assert disabled_emits == 0 and disabled_formatted == 0, (disabled_emits, disabled_formatted)
+    assert enabled_emits > 3 and len(formatted) == enabled_emits, (enabled_emits, formatted)
+    print("✅ Disabled path is a flag check")
+
+
+def main():
+    """Run debug channel tests."""
+    results = {}
+    for test in (
+        test_disabled_channel,
+        test_enabled_channel,
+        test_bounded_queue,
+        test_production_default,
+        test_disabled_path_work,
+    ):
+        try:
+            test()
+            results[test.__name__] = True
+        except AssertionError as e:
+            print(f"❌ {test.__name__} failed: {e}")
+            results[test.__name__] = False
+
+    print("\n" + "=" * 60)
+    print("Test Summary")
+    print("=" * 60)
+    for name, passed in results.items():
+        print(f"{name}: {'✅ PASS' if passed else '❌ FAIL'}")
+
+    return 0 if all(results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Test script for the local analytics engine (funnels, retention, cohorts).
+
+Tests:
+1. Funnel, retention and cohort results match a naive per-user implementation
+2. CSV and Parquet files load with ISO or epoch timestamps; bad columns and
+   paths outside the data directory are reported
+3. Tables and results are cached by content hash: repeated questions
+   neither reload the file nor recompute, and edited files are reloaded
+4. compute_event_metrics returns markdown tables and friendly errors
+
+Usage:
+    python3 tests/test_event_metrics.py
+"""
+
+import os
+import sys
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add src to path for imports
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+sys.path.insert(0, str(Path(__file__).parent))
+os.environ.setdefault("ANTHROPIC_API_KEY", "sk-ant-test-key")
+
+import numpy as np  # noqa: E402
+from helpers import DataDir, random_events  # noqa: E402
+
+
+def _by_user(frame):
+    events = defaultdict(list)
+    for user, name, at in frame.sort_values("occurred_at").itertuples(index=False):
+        events[user].append((at.to_pydatetime(), name))
+    return events
+
+
+def _naive_funnel(frame, steps, window_days):
+    counts = [0] * len(steps)
+    for events in _by_user(frame).values():
+        first = next((at for at, name in events if name == steps[0]), None)
+        if first is None:
+            continue
+        counts[0] += 1
+        reached = first
+        for i, step in enumerate(steps[1:], 1):
+            reached = next(
+                (at for at, name in events
+                 if name == step and at >= reached and at <= first + timedelta(days=window_days)),
+                None,
+            )
+            if reached is None:
+                break
+            counts[i] += 1
+    return counts
+
+
+def _naive_retention(frame, start_event, day):
+    last_day = frame["occurred_at"].max().date()
+    eligible = retained = 0
+    for events in _by_user(frame).values():
+        start = next((at.date() for at, name in events if start_event in (None, name)), None)
+        if start is None or start + timedelta(days=day) > last_day:
+            continue
+        eligible += 1
+        retained += any(at.date() == start + timedelta(days=day) for at, _ in events)
+    return eligible, retained
+
+
+def _naive_weekly_cohorts(frame, periods):
+    def week(at):
+        return (at.date() - timedelta(days=at.weekday())).isoformat()
+
+    last_week = datetime.fromisoformat(week(frame["occurred_at"].max()))
+    labels = [(last_week - timedelta(weeks=periods - 1 - r)).date().isoformat() for r in range(periods)]
+    sizes = defaultdict(int)
+    active = defaultdict(set)
+    for user, events in _by_user(frame).items():
+        cohort = week(events[0][0])
+        sizes[cohort] += 1
+        for at, _ in events:
+            offset = (datetime.fromisoformat(week(at)) - datetime.fromisoformat(cohort)).days // 7
+            active[(cohort, offset)].add(user)
+    return labels, [sizes[label] for label in labels], {
+        (label, k): len(active[(label, k)]) for label in labels for k in range(periods)
+    }
+
+
+def _table(frame):
+    from pmm_agent.domains.data_analytics.engine.events import events_from_frame
+    return events_from_frame(frame, dataset_hash=f"test-{id(frame)}")
+
+
+def test_matches_naive():
+    """Test vectorized results against per-user Python loops."""
+    print("=" * 60)
+    print("Testing Results Against Naive Implementation")
+    print("=" * 60)
+
+    from pmm_agent.domains.data_analytics.engine import cohort_matrix, funnel, retention
+
+    frame = random_events(6000, 400)
+    table = _table(frame)
+    steps = ["signup_completed", "onboarding_completed", "first_value_action"]
+
+    for window in (3, 30):
+        result = funnel(table, steps, window_days=window)
+        assert result.users == _naive_funnel(frame, steps, window), (window, result.users)
+    assert funnel(table, ["signup_completed", "never_happens"]).users[1] == 0
+
+    for start_event in (None, "signup_completed"):
+        result = retention(table, start_event, days=[1, 7, 30])
+        for day, eligible, retained in zip(result.days, result.eligible, result.retained):
+            assert (eligible, retained) == _naive_retention(frame, start_event, day), (start_event, day)
+
+    cohorts = cohort_matrix(table, period="week", periods=6)
+    labels, sizes, active = _naive_weekly_cohorts(frame, 6)
+    assert cohorts.labels == labels, cohorts.labels
+    assert list(cohorts.sizes) == sizes, (list(cohorts.sizes), sizes)
+    for r, label in enumerate(labels):
+        for k in range(6):
+            if cohorts.observable[r, k]:
+                assert cohorts.active[r, k] == active[(label, k)], (label, k)
+            else:
+                assert np.isnan(cohorts.rates[r, k])
+
+    print(f"✅ Funnel {funnel(table, steps).users}, retention and 6×6 weekly cohorts match")
+
+
+def test_loading():
+    """Test file formats, timestamp forms and input errors."""
+    print("\n" + "=" * 60)
+    print("Testing Event File Loading")
+    print("=" * 60)
+
+    from pmm_agent.domains.data_analytics.engine import DatasetNotFound, load_events
+
+    frame = random_events(500, 50)
+    epoch_ms = frame.assign(occurred_at=frame["occurred_at"].astype("int64") // 10**6)
+    custom = frame.rename(columns={"user_id": "uid", "event_name": "action", "occurred_at": "ts"})
+
+    with DataDir() as data:
+        frame.to_csv(data.path / "iso.csv", index=False)
+        frame.to_parquet(data.path / "iso.parquet", index=False)
+        epoch_ms.to_csv(data.path / "epoch.csv", index=False)
+        custom.to_csv(data.path / "custom.csv", index=False)
+        with open(data.path / "gaps.csv", "w") as f:
+            f.write("user_id,event_name,occurred_at\nu1,signup,2024-01-01T10:00:00Z\n,signup,2024-01-01\nu2,signup,not a date\n")
+
+        tables = [load_events(name) for name in ("iso.csv", "iso.parquet", "epoch.csv")]
+        tables.append(load_events("custom.csv", "uid", "action", "ts"))
+        for table in tables[1:]:
+            assert np.array_equal(np.sort(table.ts), np.sort(tables[0].ts))
+            assert table.n_users == tables[0].n_users
+        gaps = load_events("gaps.csv")
+        assert len(gaps) == 1 and gaps.dropped_rows == 2
+
+        try:
+            load_events("custom.csv")
+            raise AssertionError("Missing columns should be reported")
+        except ValueError as e:
+            assert "uid" in str(e)
+        for bad in ("missing.csv", "../etc/passwd", "/etc/passwd"):
+            try:
+                load_events(bad)
+                raise AssertionError(f"{bad} should not resolve")
+            except DatasetNotFound:
+                pass
+
+    print("✅ CSV/Parquet, ISO/epoch-ms and renamed columns load identically; bad inputs rejected")
+
+
+def test_caching():
+    """Test content-hash caching of tables and results."""
+    print("\n" + "=" * 60)
+    print("Testing Table and Result Caching")
+    print("=" * 60)
+
+    from pmm_agent.domains.data_analytics.engine import (
+        cohort_matrix,
+        events,
+        funnel,
+        load_events,
+        metrics,
+        retention,
+    )
+
+    frame = random_events(200_000, 20_000, days=90, seed=11)
+    steps = ["signup_completed", "onboarding_completed", "first_value_action"]
+
+    loads, computes = [], []
+    original_build, original_memo = events.events_from_frame, metrics._memo
+
+    def counting_build(frame, *args, **kwargs):
+        loads.append(len(frame))
+        return original_build(frame, *args, **kwargs)
+
+    def counting_memo(table, key, compute):
+        def counted():
+            computes.append(key[0])
+            return compute()
+        return original_memo(table, key, counted)
+
+    with DataDir() as data:
+        events.events_from_frame, metrics._memo = counting_build, counting_memo
+        path = data.path / "events.parquet"
+        try:
+            frame.to_parquet(path, index=False)
+            table = load_events("events.parquet")
+            first = (funnel(table, steps), retention(table), cohort_matrix(table))
+            cold = (len(loads), len(computes))
+
+            for _ in range(10):
+                table_again = load_events("events.parquet")
+                again = (funnel(table_again, steps), retention(table_again), cohort_matrix(table_again))
+            warm = (len(loads), len(computes))
+
+            # New content means a new hash: the edited file is reloaded
+            frame.iloc[:100_000].to_parquet(path, index=False)
+            edited = load_events("events.parquet")
+            edited_funnel = funnel(edited, steps)
+        finally:
+            events.events_from_frame, metrics._memo = original_build, original_memo
+
+    assert table_again is table
+    assert all(a is b for a, b in zip(first, again)), "Results should come from the cache"
+    assert cold == (1, 3) and warm == cold, f"10 repeats loaded or computed again: {cold} -> {warm}"
+    assert loads == [len(frame), 100_000] and computes == ["funnel", "retention", "cohorts", "funnel"], (loads, computes)
+    assert edited is not table and len(edited) == 100_000
+    assert edited_funnel.users != first[0].users
+    print(f"✅ One load and {cold[1]} computations answered 10 repeats; the edited file was reloaded")
+
+
+def test_compute_tool():
+    """Test the compute_event_metrics tool output."""
+    print("\n" + "=" * 60)
+    print("Testing compute_event_metrics Tool")
+    print("=" * 60)
+
+    from pmm_agent.domains.data_analytics.tools import compute_event_metrics
+
+    with DataDir() as data:
+        random_events(3000, 200).to_csv(data.path / "events.csv", index=False)
+        funnel_md = compute_event_metrics.invoke({
+            "dataset": "events.csv",
+            "steps": "signup_completed, first_value_action, typo_event",
+        })
+        retention_md = compute_event_metrics.invoke({"dataset": "events.csv", "analysis": "retention"})
+        cohorts_md = compute_event_metrics.invoke({"dataset": "events.csv", "analysis": "cohorts", "periods": 4})
+        missing = compute_event_metrics.invoke({"dataset": "nope.csv"})
+        no_steps = compute_event_metrics.invoke({"dataset": "events.csv"})
+
+    assert "| 1. signup_completed |" in funnel_md and "typo_event" in funnel_md.split("Not found")[1]
+    assert "| Day 7 |" in retention_md
+    assert "| Cohort | Users | Week 0 | Week 1 | Week 2 | Week 3 |" in cohorts_md
+    assert missing.startswith("❌") and no_steps.startswith("❌")
+    print(funnel_md)
+    print("✅ Funnel, retention and cohort tables rendered; errors reported")
+
+
+def main():
+    """Run event metrics tests."""
+    results = {}
+    for test in (test_matches_naive, test_loading, test_caching, test_compute_tool):
+        try:
+            test()
+            results[test.__name__] = True
+        except AssertionError as e:
+            print(f"❌ {test.__name__} failed: {e}")
+            results[test.__name__] = False
+
+    print("\n" + "=" * 60)
+    print("Test Summary")
+    print("=" * 60)
+    for name, passed in results.items():
+        print(f"{name}: {'✅ PASS' if passed else '❌ FAIL'}")
+
+    return 0 if all(results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Test script for the deterministic fake chat model.
+
+Tests:
+1. Scripted steps are replayed per turn (tool call, then answer)
+2. Latency and token-rate pacing are applied
+3. The real ReAct agent runs end-to-end with the fake model injected
+
+Usage:
+    python3 tests/test_fake_model.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+# Add src to path for imports
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "sk-ant-offline-test")
+
+SCRIPT = [
+    {"tool_calls": [{"name": "draft_sql_query_pack",
+                     "args": {"schema_hints": "events(user_id, event_name)", "questions": "activation"}}]},
+    {"text": "Here is your SQL pack."},
+]
+
+
+def test_script_replay():
+    """Test that steps follow the number of AI messages in the turn."""
+    print("=" * 60)
+    print("Testing Script Replay")
+    print("=" * 60)
+
+    from langchain_core.messages import HumanMessage, ToolMessage
+
+    from pmm_agent.fake_model import FakeChatModel
+
+    model = FakeChatModel(script=SCRIPT)
+    first = model.invoke([HumanMessage(content="hi")])
+    assert first.tool_calls[0]["name"] == "draft_sql_query_pack"
+    assert first.tool_calls[0]["id"] == "call_0_0"
+
+    history = [HumanMessage(content="hi"), first, ToolMessage(content="ok", tool_call_id="call_0_0")]
+    second = model.invoke(history)
+    assert second.content == "Here is your SQL pack."
+    assert not second.tool_calls
+
+    # A new human message restarts the script
+    third = model.invoke(history + [second, HumanMessage(content="again")])
+    assert third.tool_calls, "Script should restart on a new turn"
+    assert first.usage_metadata["output_tokens"] > 0
+    print("✅ Steps replayed deterministically per turn")
+
+
+def test_pacing():
+    """Test latency and token-rate pacing."""
+    print("\n" + "=" * 60)
+    print("Testing Latency Pacing")
+    print("=" * 60)
+
+    from langchain_core.messages import HumanMessage
+
+    from pmm_agent.fake_model import FakeChatModel
+
+    model = FakeChatModel(script=[{"text": "x" * 400}], latency_s=0.05, tokens_per_second=1000)
+    start = time.perf_counter()
+    asyncio.run(model.ainvoke([HumanMessage(content="hi")]))
+    elapsed = time.perf_counter() - start
+    # 0.05s latency + 100 tokens at 1000 tok/s
+    assert elapsed >= 0.14, f"Expected >= 0.15s, got {elapsed:.3f}s"
+    print(f"✅ Paced response in {elapsed * 1000:.0f}ms")
+
+
+def test_agent_integration():
+    """Test the ReAct agent end-to-end with real tools."""
+    print("\n" + "=" * 60)
+    print("Testing Agent Integration")
+    print("=" * 60)
+
+    from langchain_core.messages import HumanMessage
+
+    from pmm_agent.agent import create_analytics_agent
+    from pmm_agent.fake_model import FakeChatModel
+
+    agent = create_analytics_agent(mode="full", model=FakeChatModel(script=SCRIPT))
+    result = asyncio.run(agent.ainvoke({"messages": [HumanMessage(content="Draft activation SQL")]}))
+    kinds = [type(m).__name__ for m in result["messages"]]
+    assert kinds == ["HumanMessage", "AIMessage", "ToolMessage", "AIMessage"], kinds
+    assert result["messages"][-1].content == "Here is your SQL pack."
+    print(f"✅ Agent ran offline: {' → '.join(kinds)}")
+
+
+def main():
+    """Run fake model tests."""
+    results = {}
+    for test in (test_script_replay, test_pacing, test_agent_integration):
+        try:
+            test()
+            results[test.__name__] = True
+        except AssertionError as e:
+            print(f"❌ {test.__name__} failed: {e}")
+            results[test.__name__] = False
+
+    print("\n" + "=" * 60)
+    print("Test Summary")
+    print("=" * 60)
+    for name, passed in results.items():
+        print(f"{name}: {'✅ PASS' if passed else '❌ FAIL'}")
+
+    return 0 if all(results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Test script for incremental metrics over appended event partitions.
+
+Tests:
+1. After each append of half-day partitions, funnel, retention and cohort
+   results equal the metrics functions run on all partitions concatenated
+2. Appending a small partition to a large history only reads and
+   aggregates the new partition
+3. Late data (a partition with earlier events) and rewritten partitions
+   rebuild the aggregates and still give exact results; compute_event_metrics
+   accepts a partition directory
+
+Usage:
+    python3 tests/test_incremental_metrics.py
+"""
+
+import os
+import sys
+from pathlib import Path
+
+# Add src to path for imports
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+sys.path.insert(0, str(Path(__file__).parent))
+os.environ.setdefault("ANTHROPIC_API_KEY", "sk-ant-test-key")
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+from helpers import DataDir, random_events  # noqa: E402
+
+STEPS = ["signup_completed", "onboarding_completed", "first_value_action"]
+DAYS = [0, 1, 7, 30]
+
+
+def _half_days(frame):
+    """Partitions of 12 hours each, in time order."""
+    half_day = frame["occurred_at"].dt.floor("12h")
+    return [part.reset_index(drop=True) for _, part in frame.groupby(half_day, sort=True)]
+
+
+def _write(directory, index, part):
+    # Mix formats: partitions are whatever the export job wrote
+    if index % 3:
+        part.to_parquet(directory / f"part-{index:04d}.parquet", index=False)
+    else:
+        part.to_csv(directory / f"part-{index:04d}.csv", index=False)
+
+
+def _results(source):
+    """Metrics from an EventLog (methods) or an EventTable (metrics functions)."""
+    from pmm_agent.domains.data_analytics.engine import EventLog, cohort_matrix, funnel, retention
+
+    if isinstance(source, EventLog):
+        return [
+            source.funnel(STEPS, 7),
+            source.retention(None, DAYS),
+            source.retention("signup_completed", DAYS, "first_value_action"),
+            *(source.cohort_matrix(None, period, 6) for period in ("day", "week", "month")),
+            source.cohort_matrix("signup_completed", "week", 4),
+        ]
+    return [
+        funnel(source, STEPS, 7),
+        retention(source, None, DAYS),
+        retention(source, "signup_completed", DAYS, "first_value_action"),
+        *(cohort_matrix(source, None, period, 6) for period in ("day", "week", "month")),
+        cohort_matrix(source, "signup_completed", "week", 4),
+    ]
+
+
+def _same(incremental, full):
+    for a, b in zip(incremental, full):
+        if hasattr(a, "active"):
+            assert a.labels == b.labels, (a.labels, b.labels)
+            assert np.array_equal(a.sizes, b.sizes), (a.sizes, b.sizes)
+            assert np.array_equal(a.active, b.active), (a.period, a.active, b.active)
+        else:
+            assert a == b, (a, b)
+
+
+def _full_table(frames, tag):
+    from pmm_agent.domains.data_analytics.engine.events import events_from_frame
+
+    return events_from_frame(pd.concat(frames, ignore_index=True), tag)
+
+
+def test_matches_full_recompute():
+    """Test exact agreement with a full recompute after every append."""
+    print("=" * 60)
+    print("Testing Incremental Results After Each Append")
+    print("=" * 60)
+
+    from pmm_agent.domains.data_analytics.engine import load_event_log
+
+    parts = _half_days(random_events(40_000, 3_000, days=45))
+    with DataDir() as data:
+        directory = data.path / "events"
+        directory.mkdir(parents=True)
+        checked = 0
+        written = 0
+        # Appends of 1 to 7 partitions at a time
+        for size in [1, 1, 2, 7, 1, 3] * 20:
+            if written == len(parts):
+                break
+            for index in range(written, min(written + size, len(parts))):
+                _write(directory, index, parts[index])
+            appended = min(size, len(parts) - written)
+            written += appended
+            log = load_event_log("events")
+            assert log.last_append[0] == appended and log.rebuilds == 0
+            _same(_results(log), _results(_full_table(parts[:written], f"prefix-{written}")))
+            checked += 1
+
+    assert written == len(parts) and len(log.partitions) == len(parts)
+    print(f"✅ {checked} appends of {len(parts)} half-day partitions: funnel, retention and cohorts match a full recompute")
+
+
+def test_only_new_data():
+    """Test that an append reads and aggregates only the new partition."""
+    print("\n" + "=" * 60)
+    print("Testing Append Cost")
+    print("=" * 60)
+
+    from pmm_agent.domains.data_analytics.engine import incremental, load_event_log
+
+    history = random_events(300_000, 40_000, days=90)
+    latest = history["occurred_at"].max()
+    append = random_events(2_000, 20_000, days=1, seed=11)
+    append["occurred_at"] = latest + pd.Timedelta(hours=1) + (append["occurred_at"] - append["occurred_at"].min())
+
+    read, funnel_rows, cohort_rows = [], [], []
+    originals = incremental.EventLog._read, incremental._FunnelAggregate.update, incremental._CohortAggregate.update
+
+    def counting_read(self, path, digest):
+        batch = originals[0](self, path, digest)
+        read.append(len(batch[2]))
+        return batch
+
+    def counting_funnel(self, log, batch):
+        funnel_rows.append(len(batch[2]))
+        originals[1](self, log, batch)
+
+    def counting_cohorts(self, log, batch):
+        cohort_rows.append(len(batch[2]))
+        originals[2](self, log, batch)
+
+    with DataDir() as data:
+        directory = data.path / "events"
+        directory.mkdir(parents=True)
+        history.to_parquet(directory / "part-0000.parquet", index=False)
+        incremental.EventLog._read = counting_read
+        incremental._FunnelAggregate.update = counting_funnel
+        incremental._CohortAggregate.update = counting_cohorts
+        try:
+            log = load_event_log("events")
+            log.funnel(STEPS, 7)
+            log.retention(None, DAYS)
+            append.to_parquet(directory / "part-0001.parquet", index=False)
+
+            log = load_event_log("events")
+            results = [log.funnel(STEPS, 7), log.retention(None, DAYS)]
+        finally:
+            incremental.EventLog._read, incremental._FunnelAggregate.update, incremental._CohortAggregate.update = originals
+
+        expected = _results(_full_table([history, append], "full"))[:2]
+
+    assert read == [len(history), len(append)], read
+    assert funnel_rows == [len(history), len(append)], funnel_rows
+    assert cohort_rows == [len(history), len(append)], cohort_rows
+    assert log.last_append == (1, len(append)) and log.rebuilds == 0
+    _same(results, expected)
+    print(f"✅ Appending {len(append):,} events to {len(history):,}: read and aggregated "
+          f"{read[-1]:,} new rows only")
+
+
+def test_late_and_changed_partitions():
+    """Test rebuilds for late data and rewritten partitions, and the tool."""
+    print("\n" + "=" * 60)
+    print("Testing Late Data, Rewrites and the Compute Tool")
+    print("=" * 60)
+
+    from pmm_agent.domains.data_analytics.engine import load_event_log
+    from pmm_agent.domains.data_analytics.tools import compute_event_metrics
+
+    parts = _half_days(random_events(20_000, 1_500, days=30))
+    late = parts[10].copy()
+    late["user_id"] = late["user_id"].astype(str) + "_late"
+
+    with DataDir() as data:
+        directory = data.path / "events"
+        directory.mkdir(parents=True)
+        for index, part in enumerate(parts[:40]):
+            _write(directory, index, part)
+        load_event_log("events").funnel(STEPS, 7)
+
+        late.to_parquet(directory / "part-0040.parquet", index=False)
+        log = load_event_log("events")
+        _same(_results(log), _results(_full_table(parts[:40] + [late], "late")))
+        rebuilds = log.rebuilds
+
+        # Rewriting an earlier partition (a corrected export) reloads everything
+        parts[5].iloc[: len(parts[5]) // 2].to_parquet(directory / "part-0005.parquet", index=False)
+        log = load_event_log("events")
+        rewritten = parts[:5] + [parts[5].iloc[: len(parts[5]) // 2]] + parts[6:40] + [late]
+        _same(_results(log), _results(_full_table(rewritten, "rewritten")))
+        reloaded = log.last_append[0]
+
+        for index in range(41, 45):
+            _write(directory, index, parts[index])
+        output = compute_event_metrics.invoke({"dataset": "events", "analysis": "retention", "days": "1,7"})
+        missing = compute_event_metrics.invoke({"dataset": "no_such_dir/", "analysis": "retention"})
+
+    assert rebuilds == 1 and reloaded == 41, (rebuilds, reloaded)
+    assert "**Partitions:** 45 (4 new since the last call" in output, output
+    assert "### Retention" in output and "| Day 7 |" in output
+    assert "❌" in missing
+    print("✅ Late partition merged and rebuilt; rewritten partition reloaded; tool read 4 new partitions")
+
+
+def main():
+    """Run incremental metrics tests."""
+    results = {}
+    for test in (test_matches_full_recompute, test_only_new_data, test_late_and_changed_partitions):
+        try:
+            test()
+            results[test.__name__] = True
+        except AssertionError as e:
+            print(f"❌ {test.__name__} failed: {e}")
+            results[test.__name__] = False
+
+    print("\n" + "=" * 60)
+    print("Test Summary")
+    print("=" * 60)
+    for name, passed in results.items():
+        print(f"{name}: {'✅ PASS' if passed else '❌ FAIL'}")
+
+    return 0 if all(results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Test script for sampled, level-gated observability.
+
+Tests:
+1. Sampling keeps errors and protocol violations, drops the rest at rate 0
+2. Tool args are not serialized when INFO is disabled or the turn is sampled out
+3. Stored text and event count are bounded
+4. Per-call overhead is measured (and printed for comparison)
+5. At rate 0, /chat and /chat/stream turns that fail or whose tool fails
+   are still kept, with the error recorded
+
+Usage:
+    python3 tests/test_observability_sampling.py
+"""
+
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add src to path for imports
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+
+
+class CountingArg:
+    """Tool arg that counts how often it is serialized (via json default=str)."""
+
+    serializations = 0
+
+    def __str__(self):
+        CountingArg.serializations += 1
+        return "counting-arg"
+
+
+def _make_logger(**kwargs):
+    from pmm_agent.observability import AgentLogger
+
+    return AgentLogger(log_dir=Path(tempfile.mkdtemp()), enable_file_logging=False, **kwargs)
+
+
+def test_sampling_policy():
+    """Test that errors and violations are always kept."""
+    print("=" * 60)
+    print("Testing Sampling Policy")
+    print("=" * 60)
+
+    from pmm_agent.observability import SamplingPolicy
+
+    agent_logger = _make_logger(sampling=SamplingPolicy(rate=0.0))
+
+    ok_call = agent_logger.log_tool_call("fetch_url", {"url": "x"}, session_id="s1", message_id="m1")
+    # Follow-up message, no protocol check: sampled out
+    agent_logger.log_response("s1", "m1", "hi", "hello", [ok_call], 10.0, is_first_message=False)
+    assert len(agent_logger.events) == 0
+    assert agent_logger.events_sampled_out == 1
+
+    # First message with tool calls: protocol violation, always kept
+    agent_logger.log_response("s2", "m2", "hi", "hello", [ok_call], 10.0, is_first_message=True)
+    assert len(agent_logger.events) == 1
+
+    # Tool error: always kept
+    failed_call = agent_logger.log_tool_call("fetch_url", {}, session_id="s3", message_id="m3", error="timeout")
+    agent_logger.log_response("s3", "m3", "hi", "hello", [failed_call], 10.0)
+    assert len(agent_logger.events) == 2
+
+    # Aggregates are updated for every turn regardless of sampling
+    assert agent_logger.sessions["s1"].message_count == 1
+
+    # Rate-based decisions are deterministic per message ID
+    half = SamplingPolicy(rate=0.5)
+    decisions = [half.sampled(f"message-{i}") for i in range(2000)]
+    assert decisions == [half.sampled(f"message-{i}") for i in range(2000)]
+    assert 800 < sum(decisions) < 1200, f"Expected ~1000 sampled, got {sum(decisions)}"
+    print("✅ Errors and violations kept; others sampled deterministically")
+
+
+def test_lazy_formatting():
+    """Test that args are not serialized when the line is not emitted."""
+    print("\n" + "=" * 60)
+    print("Testing Lazy Tool Arg Formatting")
+    print("=" * 60)
+
+    from pmm_agent.observability import SamplingPolicy
+
+    agent_logger = _make_logger(sampling=SamplingPolicy(rate=1.0))
+    previous_level = agent_logger.logger.level
+    try:
+        agent_logger.logger.setLevel(logging.WARNING)
+        CountingArg.serializations = 0
+        agent_logger.log_tool_call("fetch_url", {"arg": CountingArg()}, session_id="s1", message_id="m1")
+        assert CountingArg.serializations == 0, "Args serialized with INFO disabled"
+
+        agent_logger.logger.setLevel(logging.INFO)
+        agent_logger.sampling = SamplingPolicy(rate=0.0)
+        agent_logger.log_tool_call("fetch_url", {"arg": CountingArg()}, session_id="s1", message_id="m1")
+        assert CountingArg.serializations == 0, "Args serialized for a sampled-out turn"
+    finally:
+        agent_logger.logger.setLevel(previous_level)
+
+    print("✅ No serialization when the log line is skipped")
+
+
+def test_storage_bounds():
+    """Test text truncation and the event cap."""
+    print("\n" + "=" * 60)
+    print("Testing Storage Bounds")
+    print("=" * 60)
+
+    agent_logger = _make_logger(max_events=5, max_text_chars=100)
+    agent_logger.logger.disabled = True
+    for i in range(20):
+        agent_logger.log_response(f"s{i}", f"m{i}", "q" * 1000, "a" * 5000, [], 1.0)
+    agent_logger.logger.disabled = False
+
+    assert len(agent_logger.events) == 5
+    assert agent_logger.events[-1].message_id == "m19"
+    assert len(agent_logger.events[-1].agent_response) < 200
+    assert len(agent_logger.sessions) == 20
+    print("✅ Events capped at 5, text capped at 100 chars")
+
+
+def test_overhead_measurement():
+    """Measure per-call overhead with full and zero sampling."""
+    print("\n" + "=" * 60)
+    print("Measuring Observability Overhead")
+    print("=" * 60)
+
+    from pmm_agent.observability import SamplingPolicy
+
+    args = {"schema_hints": "events(user_id, event_name, occurred_at) " * 20, "questions": "activation"}
+    results = {}
+    for rate in (1.0, 0.0):
+        agent_logger = _make_logger(sampling=SamplingPolicy(rate=rate))
+        # Swap in a null handler so we measure formatting, not terminal I/O
+        handlers = agent_logger.logger.handlers
+        agent_logger.logger.handlers = [logging.NullHandler()]
+        try:
+            start = time.perf_counter()
+            for i in range(2000):
+                call = agent_logger.log_tool_call("draft_sql_query_pack", args, "s", message_id=f"m{i}")
+                agent_logger.log_response("s", f"m{i}", "question", "answer", [call], 1.0)
+            elapsed = time.perf_counter() - start
+        finally:
+            agent_logger.logger.handlers = handlers
+        stats = agent_logger.get_overhead_stats()
+        results[rate] = stats["avg_us_per_call"]
+        print(f"   rate={rate}: {elapsed * 1000:.1f}ms for 2000 turns, {stats['avg_us_per_call']:.1f}µs/call")
+        assert stats["calls"] == 4000
+
+    print(f"   Sampled-out turns cost {results[0.0] / results[1.0]:.0%} of fully recorded turns")
+    print("✅ Overhead measured via get_overhead_stats()")
+
+
+def test_failed_turns_kept():
+    """Test that the server records errors so failed turns survive sampling."""
+    print("\n" + "=" * 60)
+    print("Testing Failed Turns at Sample Rate 0")
+    print("=" * 60)
+
+    import os
+
+    os.environ.setdefault("ANTHROPIC_API_KEY", "sk-ant-test-key")
+    from fastapi.testclient import TestClient
+    from langchain_core.messages import AIMessage, ToolMessage
+
+    from pmm_agent import server
+    from pmm_agent.observability import SamplingPolicy
+
+    class FailingAgent:
+        async def astream(self, inputs, config):
+            raise RuntimeError("model unavailable")
+            yield
+
+    class FailingToolAgent:
+        async def astream(self, inputs, config):
+            call = {"name": "fetch_url", "args": {"url": "x"}, "id": "call_1"}
+            yield {"agent": {"messages": [AIMessage(content="", tool_calls=[call])]}}
+            yield {"tools": {"messages": [ToolMessage(content="Error: timeout", tool_call_id="call_1", status="error")]}}
+            yield {"agent": {"messages": [AIMessage(content="The page timed out.")]}}
+
+    original_agent, original_sampling = server.agent, server.logger.sampling
+    # Violations are not kept either, so only the errors can keep these turns
+    server.logger.sampling = SamplingPolicy(rate=0.0, keep_protocol_violations=False)
+    server.limiter.enabled = False
+    events_before = len(server.logger.events)
+    try:
+        client = TestClient(server.app, raise_server_exceptions=False)
+        server.agent = FailingAgent()
+        failed = client.post("/chat", json={"message": "hi", "session_id": "failed-chat"})
+        failed_stream = client.post("/chat/stream", json={"message": "hi", "session_id": "failed-stream"})
+        server.agent = FailingToolAgent()
+        tool_failed = client.post("/chat", json={"message": "hi", "session_id": "failed-tool"})
+    finally:
+        server.agent, server.logger.sampling = original_agent, original_sampling
+        server.limiter.enabled = True
+
+    events = {event.session_id: event for event in list(server.logger.events)[events_before:]}
+    assert failed.status_code == 500 and failed_stream.status_code == 200 and tool_failed.status_code == 200
+    assert set(events) == {"failed-chat", "failed-stream", "failed-tool"}, list(events)
+    assert events["failed-chat"].error == "RuntimeError: model unavailable"
+    assert events["failed-stream"].error == "RuntimeError: model unavailable"
+    assert events["failed-tool"].error is None
+    [tool_call] = events["failed-tool"].tool_calls
+    assert tool_call.error == "Error: timeout" and tool_call.duration_ms is not None
+    assert server.logger.sessions["failed-chat"].errors == ["RuntimeError: model unavailable"]
+    print("✅ Failed /chat and /chat/stream turns and a failed tool call kept at rate 0")
+
+
+def main():
+    """Run observability sampling tests."""
+    results = {}
+    for test in (
+        test_sampling_policy,
+        test_lazy_formatting,
+        test_storage_bounds,
+        test_overhead_measurement,
+        test_failed_turns_kept,
+    ):
+        try:
+            test()
+            results[test.__name__] = True
+        except AssertionError as e:
+            print(f"❌ {test.__name__} failed: {e}")
+            results[test.__name__] = False
+
+    print("\n" + "=" * 60)
+    print("Test Summary")
+    print("=" * 60)
+    for name, passed in results.items():
+        print(f"{name}: {'✅ PASS' if passed else '❌ FAIL'}")
+
+    return 0 if all(results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
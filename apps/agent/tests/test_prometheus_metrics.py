@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Test script for the Prometheus metrics endpoint.
+
+Tests:
+1. Counters and histograms render in the text exposition format
+2. /metrics/prometheus is served without rate limiting or caching
+3. Scrape output does not grow with the number of sessions
+
+Usage:
+    python3 tests/test_prometheus_metrics.py
+"""
+
+import os
+import sys
+from pathlib import Path
+
+# Add src to path for imports
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+os.environ.setdefault("ANTHROPIC_API_KEY", "sk-ant-test-key")
+
+
+def test_metric_rendering():
+    """Test counter and histogram exposition output."""
+    print("=" * 60)
+    print("Testing Metric Rendering")
+    print("=" * 60)
+
+    from pmm_agent.metrics import MetricsRegistry
+
+    registry = MetricsRegistry()
+    counter = registry.counter("demo_total", "Demo counter.", ("tool",))
+    histogram = registry.histogram("demo_seconds", "Demo histogram.", buckets=(0.1, 1.0))
+
+    counter.inc(1.0, "fetch_url")
+    counter.labels("fetch_url").inc(2)
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5.0)
+
+    output = registry.render()
+    print(output)
+
+    assert "# TYPE demo_total counter" in output
+    assert 'demo_total{tool="fetch_url"} 3' in output
+    assert 'demo_seconds_bucket{le="0.1"} 1' in output
+    assert 'demo_seconds_bucket{le="1.0"} 2' in output
+    assert 'demo_seconds_bucket{le="+Inf"} 3' in output
+    assert "demo_seconds_count 3" in output
+    assert "demo_seconds_sum 5.55" in output
+    print("✅ Counters and histograms render correctly")
+
+
+def test_prometheus_endpoint():
+    """Test that the endpoint records requests and is not rate limited."""
+    print("\n" + "=" * 60)
+    print("Testing /metrics/prometheus Endpoint")
+    print("=" * 60)
+
+    from fastapi.testclient import TestClient
+
+    from pmm_agent.server import app, metrics
+
+    client = TestClient(app)
+    health_before = metrics.requests_total.get("GET", "/health", "200")
+    client.get("/health")
+    client.get("/health")
+
+    # Well past the 30/minute limit on the JSON /metrics endpoint
+    for _ in range(40):
+        response = client.get("/metrics/prometheus")
+        assert response.status_code == 200, f"Expected 200, got {response.status_code}"
+
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    health_after = health_before + 2
+    assert f'pmm_agent_http_requests_total{{method="GET",route="/health",status="200"}} {health_after:g}' in body
+    assert 'pmm_agent_cache_hits_total{cache="health"}' in body
+    assert "pmm_agent_sessions " in body
+
+    # The JSON summary records its cache misses in the same registry
+    assert client.get("/metrics").status_code == 200
+    assert metrics.cache_misses_total.get("metrics") >= 1
+    print("✅ Endpoint serves scrape output without rate limiting")
+
+
+def test_scrape_size_is_constant():
+    """Test that session count does not change the size of the scrape."""
+    print("\n" + "=" * 60)
+    print("Testing Scrape Size vs Session Count")
+    print("=" * 60)
+
+    from pmm_agent import server
+
+    before = server.metrics.render()
+    for i in range(5000):
+        server.sessions[f"load-test-{i}"] = {"messages": []}
+    try:
+        after = server.metrics.render()
+    finally:
+        for i in range(5000):
+            server.sessions.pop(f"load-test-{i}", None)
+
+    assert len(before.splitlines()) == len(after.splitlines()), "Scrape grew with session count"
+    print(f"✅ {len(after.splitlines())} lines before and after adding 5000 sessions")
+
+
+def main():
+    """Run Prometheus metrics tests."""
+    results = {}
+    for test in (test_metric_rendering, test_prometheus_endpoint, test_scrape_size_is_constant):
+        try:
+            test()
+            results[test.__name__] = True
+        except AssertionError as e:
+            print(f"❌ {test.__name__} failed: {e}")
+            results[test.__name__] = False
+
+    print("\n" + "=" * 60)
+    print("Test Summary")
+    print("=" * 60)
+    for name, passed in results.items():
+        print(f"{name}: {'✅ PASS' if passed else '❌ FAIL'}")
+
+    return 0 if all(results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
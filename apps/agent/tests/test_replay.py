@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Test script for record/replay of agent turns.
+
+Tests:
+1. A /chat/stream turn is recorded to a fixture when RECORD_TURNS_DIR is set
+2. Replay reproduces the recorded messages without calling the model or tools
+3. Paced replay honours recorded latencies
+
+Usage:
+    python3 tests/test_replay.py
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add src to path for imports
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+os.environ.setdefault("ANTHROPIC_API_KEY", "sk-ant-test-key")
+
+RECORD_DIR = Path(tempfile.mkdtemp())
+
+SCRIPT = [
+    {"tool_calls": [{"name": "analyze_product",
+                     "args": {"product_description": "A CLI that turns spreadsheets into dashboards."}}]},
+    {"text": "Your product turns spreadsheets into dashboards."},
+]
+
+
+def _recorded_fixture_path() -> Path:
+    """Record one turn through the server and return its fixture path."""
+    from fastapi.testclient import TestClient
+
+    from pmm_agent import server
+    from pmm_agent.agent import create_pmm_agent
+    from pmm_agent.fake_model import FakeChatModel
+
+    original_agent, original_dir = server.agent, server.RECORD_TURNS_DIR
+    server.agent = create_pmm_agent(mode="full", model=FakeChatModel(script=SCRIPT, latency_s=0.02))
+    server.RECORD_TURNS_DIR = str(RECORD_DIR)
+    try:
+        client = TestClient(server.app)
+        response = client.post("/chat/stream", json={"message": "What does my product do?"})
+        assert response.status_code == 200
+    finally:
+        server.agent, server.RECORD_TURNS_DIR = original_agent, original_dir
+
+    fixtures = sorted(RECORD_DIR.glob("*.json"), key=lambda p: p.stat().st_mtime)
+    assert fixtures, "No fixture written"
+    return fixtures[-1]
+
+
+def test_record_turn():
+    """Test that a streaming turn is written as a fixture."""
+    print("=" * 60)
+    print("Testing Turn Recording")
+    print("=" * 60)
+
+    from pmm_agent.replay import fixture_user_message, load_fixture
+
+    fixture = load_fixture(_recorded_fixture_path())
+    assert fixture["domain"] == "pmm"
+    assert fixture_user_message(fixture) == "What does my product do?"
+    assert len(fixture["model_responses"]) == 2
+    assert fixture["model_responses"][0]["latency_s"] >= 0.02
+
+    (output,) = fixture["tool_outputs"]
+    assert output["name"] == "analyze_product"
+    assert output["args"] == SCRIPT[0]["tool_calls"][0]["args"]
+    assert output["content"], "Tool output should be recorded"
+    print(f"✅ Recorded {len(fixture['model_responses'])} model responses and 1 tool output")
+
+
+def test_replay_turn():
+    """Test that replay serves recorded responses and tool outputs."""
+    print("\n" + "=" * 60)
+    print("Testing Turn Replay")
+    print("=" * 60)
+
+    from pmm_agent.replay import create_replay_agent, fixture_input_messages, load_fixture
+
+    fixture = load_fixture(_recorded_fixture_path())
+    # Prove the tool output comes from the fixture, not the real tool
+    fixture["tool_outputs"][0]["content"] = "RECORDED ANALYSIS"
+
+    agent = create_replay_agent(fixture)
+    result = asyncio.run(agent.ainvoke({"messages": fixture_input_messages(fixture)}))
+    messages = result["messages"]
+
+    assert [m.type for m in messages] == ["human", "ai", "tool", "ai"], [m.type for m in messages]
+    assert messages[1].tool_calls[0]["name"] == "analyze_product"
+    assert messages[2].content == "RECORDED ANALYSIS"
+    assert messages[3].content == SCRIPT[1]["text"]
+    assert messages[3].usage_metadata["output_tokens"] > 0
+    print("✅ Replayed human → ai → tool → ai with recorded outputs")
+
+
+def test_paced_replay():
+    """Test that pace=True waits for recorded latencies."""
+    print("\n" + "=" * 60)
+    print("Testing Paced Replay")
+    print("=" * 60)
+
+    from pmm_agent.replay import create_replay_agent, fixture_input_messages, load_fixture
+
+    fixture = load_fixture(_recorded_fixture_path())
+    for response in fixture["model_responses"]:
+        response["latency_s"] = 0.05
+
+    timings = {}
+    for pace in (False, True):
+        agent = create_replay_agent(fixture, pace=pace)
+        start = time.perf_counter()
+        asyncio.run(agent.ainvoke({"messages": fixture_input_messages(fixture)}))
+        timings[pace] = time.perf_counter() - start
+
+    assert timings[True] >= 0.1, f"Paced replay took {timings[True]:.3f}s"
+    print(f"✅ Unpaced {timings[False] * 1000:.0f}ms, paced {timings[True] * 1000:.0f}ms")
+
+
+def main():
+    """Run record/replay tests."""
+    results = {}
+    for test in (test_record_turn, test_replay_turn, test_paced_replay):
+        try:
+            test()
+            results[test.__name__] = True
+        except AssertionError as e:
+            print(f"❌ {test.__name__} failed: {e}")
+            results[test.__name__] = False
+
+    print("\n" + "=" * 60)
+    print("Test Summary")
+    print("=" * 60)
+    for name, passed in results.items():
+        print(f"{name}: {'✅ PASS' if passed else '❌ FAIL'}")
+
+    return 0 if all(results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
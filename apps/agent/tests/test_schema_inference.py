@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Test script for schema inference.
+
+Tests:
+1. Column kinds, grain candidates and join keys are inferred from a
+   sample, and the result is cached by content hash
+2. draft_sql_query_pack summarizes datasets passed as `dataset`, including
+   the join keys they share, in far fewer characters than the data
+3. create_data_quality_checklist checks the inferred grain for duplicates
+   when no key columns are given
+
+Usage:
+    python3 tests/test_schema_inference.py
+"""
+
+import os
+import sys
+from pathlib import Path
+
+# Add src to path for imports
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+sys.path.insert(0, str(Path(__file__).parent))
+os.environ.setdefault("ANTHROPIC_API_KEY", "sk-ant-test-key")
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+from helpers import DataDir, random_events  # noqa: E402
+
+
+def _events_with_ids(rows=30_000, users=1_500):
+    frame = random_events(rows, users)
+    frame.insert(0, "event_id", [f"evt_{i:07d}" for i in range(len(frame))])
+    frame["revenue"] = np.round(np.random.default_rng(3).gamma(2.0, 20.0, len(frame)), 2)
+    frame.loc[::10, "revenue"] = np.nan
+    return frame
+
+
+def _accounts(users=1_500):
+    return pd.DataFrame({
+        "user_id": [f"u{i}" for i in range(users)],
+        "plan": np.where(np.arange(users) % 3, "free", "pro"),
+        "signup_date": pd.date_range("2024-01-01", periods=users, freq="h").strftime("%Y-%m-%d"),
+        "is_active": np.arange(users) % 2 == 0,
+    })
+
+
+def test_infer_schema():
+    """Test inferred kinds, grain, join keys and caching."""
+    print("=" * 60)
+    print("Testing Schema Inference")
+    print("=" * 60)
+
+    from pmm_agent.domains.data_analytics.engine import infer_schema
+    from pmm_agent.domains.data_analytics.engine import schema as schema_module
+
+    frame = _events_with_ids()
+    with DataDir() as data:
+        frame.to_csv(data.path / "events.csv", index=False)
+        frame.to_csv(data.path / "events_copy.csv", index=False)
+        _accounts().to_parquet(data.path / "accounts.parquet", index=False)
+
+        original_sample = schema_module.SAMPLE_ROWS
+        schema_module.SAMPLE_ROWS = 5_000
+        schema_module._schemas.clear()
+        try:
+            schema = infer_schema("events.csv")
+            again = infer_schema("events.csv")
+            copy = infer_schema("events_copy.csv")
+            accounts = infer_schema("accounts.parquet")
+            cached = len(schema_module._schemas)
+        finally:
+            schema_module.SAMPLE_ROWS = original_sample
+
+    kinds = {name: column.kind for name, column in schema.columns.items()}
+    assert kinds == {
+        "event_id": "id", "user_id": "id", "event_name": "category",
+        "occurred_at": "timestamp", "revenue": "numeric",
+    }, kinds
+    assert schema.rows == len(frame) and schema.sampled == 5_000
+    assert schema.grain[0] == ("event_id",), schema.grain
+    assert schema.join_keys == ["event_id", "user_id"]
+    assert 0.08 < schema.columns["revenue"].null_rate < 0.12
+    assert again is schema, "A second call should be served from the cache"
+    assert copy.dataset == "events_copy.csv" and copy.columns is schema.columns and cached == 2
+
+    account_kinds = {name: column.kind for name, column in accounts.columns.items()}
+    assert account_kinds == {"user_id": "id", "plan": "category", "signup_date": "timestamp", "is_active": "boolean"}, account_kinds
+    assert accounts.grain[0] == ("user_id",) and accounts.sampled == accounts.rows
+    print(f"✅ {kinds}; grain {schema.grain}; identical content inferred once")
+
+
+def test_sql_pack_hints():
+    """Test that draft_sql_query_pack receives inferred schema summaries."""
+    print("\n" + "=" * 60)
+    print("Testing draft_sql_query_pack Schema Hints")
+    print("=" * 60)
+
+    from pmm_agent.domains.data_analytics.tools import draft_sql_query_pack
+
+    frame = _events_with_ids()
+    with DataDir() as data:
+        frame.to_csv(data.path / "events.csv", index=False)
+        _accounts().to_csv(data.path / "accounts.csv", index=False)
+        pack = draft_sql_query_pack.invoke({"dataset": "events.csv, accounts.csv", "questions": "activation by plan"})
+        missing = draft_sql_query_pack.invoke({"dataset": "nope.csv", "questions": "activation"})
+        pasted = draft_sql_query_pack.invoke({"schema_hints": "events(user_id, event_name)", "questions": "activation"})
+        csv_chars = len(frame.to_csv(index=False))
+
+    context = pack.split("### Schema Context")[1].split("### Questions to Answer")[0]
+    assert "Table `events.csv`: 30,000 rows; grain: one row per event_id" in context, context
+    assert "- event_name: category (" in context and "- occurred_at: timestamp (" in context
+    assert "Table `accounts.csv`: 1,500 rows; grain: one row per user_id" in context, context
+    assert "Shared join keys: user_id (`events.csv`, `accounts.csv`)" in context, context
+    assert len(context) < 1_500 and len(context) * 500 < csv_chars, len(context)
+    assert "❌" in missing and "nope.csv" in missing
+    assert "events(user_id, event_name)" in pasted
+    print(f"✅ Schema context of {len(context):,} characters for {csv_chars / 1e6:.1f} MB of CSV")
+    print(context.strip())
+
+
+def test_checklist_grain():
+    """Test that the data quality checklist checks the inferred grain."""
+    print("\n" + "=" * 60)
+    print("Testing Inferred Grain in Data Quality Checks")
+    print("=" * 60)
+
+    from pmm_agent.domains.data_analytics.engine import schema as schema_module
+    from pmm_agent.domains.data_analytics.tools import create_data_quality_checklist
+
+    frame = _events_with_ids(5_000, 400)
+    duplicated = pd.concat([frame, frame.iloc[1:51:2]], ignore_index=True)
+    with DataDir() as data:
+        duplicated.to_csv(data.path / "events.csv", index=False)
+        original_sample = schema_module.SAMPLE_ROWS
+        schema_module.SAMPLE_ROWS = 1_000
+        try:
+            inferred = create_data_quality_checklist.invoke({"dataset": "events", "data_file": "events.csv"})
+            explicit = create_data_quality_checklist.invoke({
+                "dataset": "events", "data_file": "events.csv", "key_columns": "user_id,event_name",
+            })
+        finally:
+            schema_module.SAMPLE_ROWS = original_sample
+
+    # Duplicates too rare for the sample still make event_id the inferred grain
+    assert "| unique: `event_id` (inferred grain) | ❌ 25 duplicate rows |" in inferred, inferred
+    assert "Table `events.csv`: 5,025 rows" in inferred
+    assert "| unique: `user_id, event_name` |" in explicit and "(inferred grain)" not in explicit
+    print("✅ Inferred grain event_id checked: 25 duplicate rows found")
+
+
+def main():
+    """Run schema inference tests."""
+    results = {}
+    for test in (test_infer_schema, test_sql_pack_hints, test_checklist_grain):
+        try:
+            test()
+            results[test.__name__] = True
+        except AssertionError as e:
+            print(f"❌ {test.__name__} failed: {e}")
+            results[test.__name__] = False
+
+    print("\n" + "=" * 60)
+    print("Test Summary")
+    print("=" * 60)
+    for name, passed in results.items():
+        print(f"{name}: {'✅ PASS' if passed else '❌ FAIL'}")
+
+    return 0 if all(results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Test script for the DuckDB SQL sandbox.
+
+Tests:
+1. draft_sql_query_pack templates run unchanged against an event file
+2. Writes, multiple statements, file access and configuration changes are refused
+3. Long queries are interrupted at the timeout and results are capped at the row limit
+4. Connections are pooled per dataset, statements prepared once, results
+   cached, and an edited file is reloaded (its old database deleted)
+5. Loading a dataset does not block queries on loaded ones, and the least
+   recently used dataset is closed and deleted past max_datasets
+6. run_sql_query returns a result preview with the query plan
+
+Usage:
+    python3 tests/test_sql_sandbox.py
+"""
+
+import os
+import re
+import sys
+import time
+from pathlib import Path
+
+# Add src to path for imports
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+sys.path.insert(0, str(Path(__file__).parent))
+os.environ.setdefault("ANTHROPIC_API_KEY", "sk-ant-test-key")
+
+from helpers import SandboxWorkspace  # noqa: E402
+
+
+def test_templates_run():
+    """Test that the SQL pack's single-statement templates execute."""
+    print("=" * 60)
+    print("Testing draft_sql_query_pack Templates")
+    print("=" * 60)
+
+    from pmm_agent.domains.data_analytics.tools import draft_sql_query_pack
+
+    pack = draft_sql_query_pack.invoke({"schema_hints": "events(user_id, event_name, occurred_at)", "questions": "activation"})
+    activation = re.findall(r"```sql\n(.*?)```", pack, re.S)[0]
+
+    with SandboxWorkspace() as workspace:
+        result = workspace.sandbox().run("events.csv", activation)
+
+    assert result.columns[0] == "total_users", result.columns
+    assert result.rows[0][0] > 0, "The activation funnel should see recent users"
+    assert "HASH_GROUP_BY" in result.plan or "AGGREGATE" in result.plan, result.plan
+    print(f"✅ Activation funnel template: {dict(zip(result.columns, result.rows[0]))}")
+
+
+def test_refusals():
+    """Test that only a single read-only SELECT runs."""
+    print("\n" + "=" * 60)
+    print("Testing Sandbox Refusals")
+    print("=" * 60)
+
+    from pmm_agent.domains.data_analytics.engine import QueryRejected, SandboxError
+
+    attempts = {
+        "DELETE FROM events": QueryRejected,
+        "CREATE TABLE copy AS SELECT * FROM events": QueryRejected,
+        "SELECT 1; DROP TABLE events": QueryRejected,
+        "COPY events TO 'out.csv'": QueryRejected,
+        "SET enable_external_access = true": QueryRejected,
+        "SELECT * FROM read_csv('/etc/passwd')": SandboxError,
+        "SELECT * FROM events.csv": SandboxError,
+        "SELEC nonsense": QueryRejected,
+    }
+    with SandboxWorkspace() as workspace:
+        sandbox = workspace.sandbox()
+        for sql, expected in attempts.items():
+            try:
+                sandbox.run("events.csv", sql)
+                raise AssertionError(f"Should refuse: {sql}")
+            except expected:
+                pass
+        # The connection still works and the data is unchanged
+        count = sandbox.run("events.csv", "SELECT COUNT(*) FROM events;").rows[0][0]
+
+    assert count == 5000, count
+    print(f"✅ {len(attempts)} unsafe statements refused; table intact")
+
+
+def test_limits():
+    """Test the query timeout and the row cap."""
+    print("\n" + "=" * 60)
+    print("Testing Timeout and Row Cap")
+    print("=" * 60)
+
+    from pmm_agent.domains.data_analytics.engine import QueryTimeout
+
+    with SandboxWorkspace() as workspace:
+        sandbox = workspace.sandbox(timeout_seconds=0.3, max_rows=100, pool_size=1)
+        started = time.perf_counter()
+        try:
+            sandbox.run("events.csv", "SELECT COUNT(*) FROM events a, events b, events c")
+            raise AssertionError("Cross join should time out")
+        except QueryTimeout:
+            stopped_after = time.perf_counter() - started
+        # The single pooled connection is usable again
+        preview = sandbox.run("events.csv", "SELECT * FROM events ORDER BY occurred_at", max_rows=10)
+        capped = sandbox.run("events.csv", "SELECT * FROM events", max_rows=10_000)
+
+    assert stopped_after < 2, stopped_after
+    assert len(preview.rows) == 10 and preview.truncated
+    assert preview.rows[0][2] <= preview.rows[-1][2]
+    assert len(capped.rows) == 100 and capped.truncated
+    print(f"✅ Stopped after {stopped_after:.2f}s; previews capped at 10 and 100 rows")
+
+
+def test_reuse():
+    """Test pooling, prepared statements, result caching and reloads."""
+    print("\n" + "=" * 60)
+    print("Testing Connection and Statement Reuse")
+    print("=" * 60)
+
+    with SandboxWorkspace() as workspace:
+        sandbox = workspace.sandbox(pool_size=2)
+        digest, pool = sandbox.pool("events.csv")
+        assert sandbox.pool("events.csv") == (digest, pool)
+
+        sql = "SELECT event_name, COUNT(DISTINCT user_id) AS users FROM events GROUP BY 1 ORDER BY 1"
+        first = sandbox.run("events.csv", sql, explain=False)
+        again = sandbox.run("events.csv", sql, explain=False)
+        assert not first.cached and again.cached and again.rows == first.rows
+
+        # Same statement with a different row cap: result not cached, statement already prepared
+        connection = pool.acquire(1)
+        prepared_before = connection.prepared_count()
+        pool.release(connection)
+        sandbox.run("events.csv", sql, max_rows=2, explain=False)
+        connection = pool.acquire(1)
+        assert connection.prepared_count() == prepared_before == 1
+        pool.release(connection)
+
+        workspace.frame.iloc[:1000].to_csv(workspace.path / "events.csv", index=False)
+        new_digest, new_pool = sandbox.pool("events.csv")
+        reloaded = sandbox.run("events.csv", "SELECT COUNT(*) FROM events")
+        cached_files = sorted(p.name for p in workspace.cache.iterdir())
+
+    assert new_digest != digest and new_pool is not pool
+    assert pool.closed and not new_pool.closed
+    assert reloaded.rows[0][0] == 1000
+    assert cached_files == [f"{new_digest}.duckdb"], cached_files
+    print("✅ One pool per dataset, statements prepared once, results cached, edits reloaded")
+
+
+def test_loading_and_eviction():
+    """Test that loads run outside the sandbox lock and pools are evicted."""
+    print("\n" + "=" * 60)
+    print("Testing Concurrent Loads and Pool Eviction")
+    print("=" * 60)
+
+    import threading
+
+    with SandboxWorkspace() as workspace:
+        for name, rows in (("a.csv", 300), ("b.csv", 100), ("c.csv", 200)):
+            workspace.frame.iloc[:rows].to_csv(workspace.path / name, index=False)
+        sandbox = workspace.sandbox(max_datasets=2)
+        sql = "SELECT COUNT(*) FROM events"
+        assert sandbox.run("events.csv", sql).rows[0][0] == 5000
+
+        # Hold a.csv's load open; a query on the loaded dataset still runs
+        original_build = sandbox._build_database
+        loading, release = threading.Event(), threading.Event()
+
+        def slow_build(path, digest):
+            loading.set()
+            release.wait(10)
+            return original_build(path, digest)
+
+        sandbox._build_database = slow_build
+        results = {}
+        cold = threading.Thread(target=lambda: results.update(a=sandbox.run("a.csv", sql).rows[0][0]))
+        cold.start()
+        loading.wait(10)
+        warm = sandbox.run("events.csv", "SELECT COUNT(DISTINCT user_id) FROM events").rows[0][0]
+        finished_during_load = cold.is_alive()
+        release.set()
+        cold.join(10)
+        sandbox._build_database = original_build
+
+        # Two pools fit: loading b.csv evicts events.csv, the least recently used
+        _, events_pool = sandbox.pool("events.csv")
+        sandbox.run("a.csv", sql)
+        sandbox.run("b.csv", sql)
+        cached_after_b = sorted(p.name for p in workspace.cache.glob("*.duckdb"))
+        # Evicted while a query holds a connection: closed when it is released
+        _, a_pool = sandbox.pool("a.csv")
+        held = a_pool.acquire(1)
+        sandbox.run("c.csv", sql)
+        closed_while_held = a_pool.closed
+        a_pool.release(held)
+        reloaded = sandbox.run("events.csv", sql).rows[0][0]
+
+    assert warm > 0 and finished_during_load, "Query on a loaded dataset waited for another dataset's load"
+    assert results == {"a": 300}, results
+    assert events_pool.closed and len(cached_after_b) == 2, cached_after_b
+    assert not closed_while_held and a_pool.closed
+    assert reloaded == 5000
+    print("✅ Loaded datasets answered during a load; LRU pools closed and their files deleted")
+
+
+def test_run_sql_query_tool():
+    """Test the run_sql_query tool output."""
+    print("\n" + "=" * 60)
+    print("Testing run_sql_query Tool")
+    print("=" * 60)
+
+    from pmm_agent.domains.data_analytics.engine import sandbox as sandbox_module
+    from pmm_agent.domains.data_analytics.tools import run_sql_query
+
+    with SandboxWorkspace() as workspace:
+        original = sandbox_module._sandbox
+        sandbox_module._sandbox = workspace.sandbox()
+        try:
+            output = run_sql_query.invoke({
+                "dataset": "events.csv",
+                "sql": "SELECT event_name, COUNT(*) AS n FROM events GROUP BY 1 ORDER BY n DESC",
+            })
+            repeated = run_sql_query.invoke({
+                "dataset": "events.csv",
+                "sql": "SELECT event_name, COUNT(*) AS n FROM events GROUP BY 1 ORDER BY n DESC",
+            })
+            refused = run_sql_query.invoke({"dataset": "events.csv", "sql": "DROP TABLE events"})
+        finally:
+            sandbox_module._sandbox = original
+
+    assert "| event_name | n |" in output and "| page_view |" in output
+    assert "### Query Plan" in output
+    assert "cached result" in repeated
+    assert refused.startswith("❌ Query failed")
+    print(output)
+    print("✅ Preview, plan and refusal rendered")
+
+
+def main():
+    """Run SQL sandbox tests."""
+    results = {}
+    for test in (
+        test_templates_run,
+        test_refusals,
+        test_limits,
+        test_reuse,
+        test_loading_and_eviction,
+        test_run_sql_query_tool,
+    ):
+        try:
+            test()
+            results[test.__name__] = True
+        except AssertionError as e:
+            print(f"❌ {test.__name__} failed: {e}")
+            results[test.__name__] = False
+
+    print("\n" + "=" * 60)
+    print("Test Summary")
+    print("=" * 60)
+    for name, passed in results.items():
+        print(f"{name}: {'✅ PASS' if passed else '❌ FAIL'}")
+
+    return 0 if all(results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
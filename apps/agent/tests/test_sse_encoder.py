@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Test script for the pre-serialized SSE frame encoder.
+
+Tests:
+1. Encoded frames are byte-identical to the json.dumps frames they replace
+2. /chat/stream writes bytes frames the frontend parser accepts
+3. A streamed text encodes each distinct character once and serves the
+   rest of its frames from the cache
+
+Usage:
+    python3 tests/test_sse_encoder.py
+"""
+
+import json
+import os
+import sys
+from pathlib import Path
+
+# Add src to path for imports
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+os.environ.setdefault("ANTHROPIC_API_KEY", "sk-ant-test-key")
+
+SAMPLES = ["a", " ", '"', "\\", "\n", "\t", "\x00", "é", "ü", "中", "😀", " ", "plain text", 'say "hi"\n']
+
+
+def test_frames_match_json_dumps():
+    """Test byte-for-byte compatibility with the previous frames."""
+    print("=" * 60)
+    print("Testing Frame Compatibility")
+    print("=" * 60)
+
+    from pmm_agent.server import sse_done, sse_text, sse_tool_call
+
+    for sample in SAMPLES:
+        expected = f"data: {json.dumps({'type': 'text', 'content': sample})}\n\n".encode()
+        assert sse_text(sample) == expected, (sample, sse_text(sample))
+
+    args = {"url": "https://example.com/ü", "nested": {"n": [1, 2.5, None, True]}}
+    expected = f"data: {json.dumps({'type': 'tool_call', 'name': 'fetch_url', 'args': args})}\n\n".encode()
+    assert sse_tool_call("fetch_url", args) == expected
+
+    expected = f"data: {json.dumps({'type': 'done', 'session_id': 'abc-123'})}\n\n".encode()
+    assert sse_done("abc-123") == expected
+    print(f"✅ {len(SAMPLES) + 2} frames identical to json.dumps output")
+
+
+def test_stream_writes_bytes():
+    """Test that the streaming endpoint yields bytes the frontend can parse."""
+    print("\n" + "=" * 60)
+    print("Testing /chat/stream Bytes Frames")
+    print("=" * 60)
+
+    from fastapi.testclient import TestClient
+    from langchain_core.messages import AIMessage
+
+    from pmm_agent import server
+
+    class EchoAgent:
+        async def astream(self, inputs, config):
+            yield {"agent": {"messages": [AIMessage(content="Hé \"😀\"", id="msg_1")]}}
+
+    original_agent = server.agent
+    server.agent = EchoAgent()
+    server.limiter.enabled = False
+    try:
+        client = TestClient(server.app)
+        body = client.post("/chat/stream", json={"message": "Echo"}).text
+    finally:
+        server.agent = original_agent
+        server.limiter.enabled = True
+
+    # Same parsing as the web frontend: split on blank lines, read the "data: " line
+    frames = [
+        json.loads(line[6:])
+        for block in body.split("\n\n")
+        for line in block.split("\n")
+        if line.startswith("data: ")
+    ]
+    assert body.startswith("id: "), "Frames should carry event IDs"
+    assert "".join(f["content"] for f in frames if f["type"] == "text") == "Hé \"😀\""
+    assert frames[-1]["type"] == "done"
+    print(f"✅ {len(frames)} frames parsed")
+
+
+def test_encoder_cache():
+    """Test that repeated characters are served from the frame cache."""
+    print("\n" + "=" * 60)
+    print("Testing SSE Frame Cache")
+    print("=" * 60)
+
+    from pmm_agent import server
+
+    text = "Activation is the share of new users who reach the aha moment. " * 50
+    escapes = []
+    original_escape = server.encode_basestring_ascii
+
+    def counting_escape(content):
+        escapes.append(content)
+        return original_escape(content)
+
+    server.sse_text.cache_clear()
+    server.encode_basestring_ascii = counting_escape
+    try:
+        for _ in range(5):
+            frames = [server.sse_text(char) for char in text]
+    finally:
+        server.encode_basestring_ascii = original_escape
+    info = server.sse_text.cache_info()
+
+    encoded = len(text) * 5
+    print(f"   {encoded} frames: {len(escapes)} escaped, {info.hits} from the cache")
+    assert sorted(escapes) == sorted(set(text)), "Each distinct character should be escaped once"
+    assert info.misses == len(set(text)) and info.hits == encoded - info.misses, info
+    assert frames == [f"data: {json.dumps({'type': 'text', 'content': char})}\n\n".encode() for char in text]
+    print("✅ Only distinct characters are encoded")
+
+
+def main():
+    """Run SSE encoder tests."""
+    results = {}
+    for test in (test_frames_match_json_dumps, test_stream_writes_bytes, test_encoder_cache):
+        try:
+            test()
+            results[test.__name__] = True
+        except AssertionError as e:
+            print(f"❌ {test.__name__} failed: {e}")
+            results[test.__name__] = False
+
+    print("\n" + "=" * 60)
+    print("Test Summary")
+    print("=" * 60)
+    for name, passed in results.items():
+        print(f"{name}: {'✅ PASS' if passed else '❌ FAIL'}")
+
+    return 0 if all(results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+Test script for backpressure, disconnect handling and resume in /chat/stream.
+
+Tests:
+1. A slow client holds the agent back to the buffer size
+2. A fast producer waits for the requesting client instead of overrunning
+   the buffer before it connects; a client that never connects releases it
+3. An idle stream notices a disconnected client and cancels the producer
+4. A cancelled run stays in the registry, and a late reconnect replays its
+   buffered frames and a closing frame instead of getting a 409
+5. End-to-end: with no grace period, closing the connection mid-answer
+   stops the agent run and is recorded (with the tokens used so far) in
+   AgentLogger and Prometheus
+6. End-to-end: with the default settings, reconnecting with Last-Event-ID
+   after a dropped connection replays the missed frames without running
+   the agent again
+
+Usage:
+    python3 tests/test_stream_disconnect.py
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+# Add src to path for imports
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+sys.path.insert(0, str(Path(__file__).parent))
+os.environ.setdefault("ANTHROPIC_API_KEY", "sk-ant-test-key")
+os.environ.setdefault("DEBUG_STREAM", "0")
+
+
+class FakeRequest:
+    """Request stand-in whose client disconnects after `connected_polls` checks."""
+
+    def __init__(self, connected_polls=None):
+        self.connected_polls = connected_polls
+        self.polls = 0
+
+    async def is_disconnected(self):
+        self.polls += 1
+        return self.connected_polls is not None and self.polls > self.connected_polls
+
+
+def test_backpressure():
+    """Test that the producer never runs more than a buffer ahead."""
+    print("=" * 60)
+    print("Testing Backpressure")
+    print("=" * 60)
+
+    from pmm_agent import server
+    from pmm_agent.stream_runs import StreamRun
+
+    produced = 0
+
+    async def frames():
+        nonlocal produced
+        for i in range(10_000):
+            produced += 1
+            yield b"data: x\n\n"
+
+    async def run():
+        run = StreamRun("bp", "s", window=server.STREAM_BUFFER_FRAMES, grace_seconds=0)
+        run.start(frames())
+        stream = run.follow(-1, FakeRequest().is_disconnected, originator=True)
+        consumed = 0
+        async for _ in stream:
+            consumed += 1
+            if consumed == 10:
+                await asyncio.sleep(0.05)  # slow client: let the producer run
+                ahead = produced - consumed
+                await stream.aclose()
+                return ahead
+
+    ahead = asyncio.run(run())
+    assert ahead <= server.STREAM_BUFFER_FRAMES + 1, f"Producer ran {ahead} frames ahead"
+    print(f"✅ Producer held to {ahead} frames ahead (buffer {server.STREAM_BUFFER_FRAMES})")
+
+
+def test_requester_position_held():
+    """Test that frames published before the requester connects are kept."""
+    print("\n" + "=" * 60)
+    print("Testing Requester Position Before It Connects")
+    print("=" * 60)
+
+    from pmm_agent.stream_runs import StreamRun
+
+    reasons = []
+
+    async def frames(count):
+        for i in range(count):
+            yield f"data: {i}\n\n".encode()
+
+    async def late_requester():
+        run = StreamRun("late", "s", window=16, history=64)
+        run.start(frames(1000))
+        for _ in range(20):
+            await asyncio.sleep(0)  # the producer runs before the response starts
+        published_before = run.next_seq
+        received = [frame async for frame in run.follow(-1, originator=True)]
+        return published_before, received
+
+    async def absent_requester():
+        run = StreamRun("absent", "s", window=16, connect_seconds=0.01,
+                        on_cancel=lambda reason, sent: reasons.append(reason))
+        run.start(frames(1000))
+        for _ in range(500):
+            if run.cancelled:
+                break
+            await asyncio.sleep(0.01)
+        return run.next_seq
+
+    published_before, received = asyncio.run(late_requester())
+    assert published_before == 16, f"Producer ran {published_before} frames ahead of the requester"
+    assert len(received) == 1000 and received[-1] == b"id: late:999\ndata: 999\n\n"
+    assert asyncio.run(absent_requester()) == 16
+    assert reasons == ["client_never_connected"], reasons
+    print(f"✅ Producer held at {published_before} frames until the requester read all 1000; "
+          "an absent requester released the run")
+
+
+def test_idle_disconnect():
+    """Test that a disconnect is noticed while the agent is thinking."""
+    print("\n" + "=" * 60)
+    print("Testing Disconnect While Idle")
+    print("=" * 60)
+
+    from pmm_agent.stream_runs import StreamRun
+
+    cancelled = []
+    reasons = []
+
+    async def frames():
+        try:
+            yield b"data: first\n\n"
+            await asyncio.sleep(60)  # a long model call
+            yield b"data: never\n\n"
+        except (asyncio.CancelledError, GeneratorExit):
+            cancelled.append(True)
+            raise
+
+    request = FakeRequest(connected_polls=1)
+
+    async def run():
+        run = StreamRun("idle", "s", grace_seconds=0, on_cancel=lambda reason, sent: reasons.append((reason, sent)))
+        run.start(frames())
+        follower = run.follow(-1, request.is_disconnected, originator=True)
+        received = [frame async for frame in follower]
+        await asyncio.sleep(0)  # let the cancelled producer unwind
+        return received
+
+    received = asyncio.run(run())
+    assert received == [b"id: idle:0\ndata: first\n\n"], received
+    assert cancelled, "Producer was not cancelled"
+    assert reasons == [("client_disconnected", 1)], reasons
+    # Cancelled at the first poll that saw the client gone, not after more idle waits
+    assert request.polls == 2, f"Took {request.polls} polls to notice"
+    print(f"✅ Producer cancelled at poll {request.polls}, the first after the client left")
+
+
+def test_replay_after_cancel():
+    """Test that a cancelled run's frames can still be replayed."""
+    print("\n" + "=" * 60)
+    print("Testing Replay of a Cancelled Run")
+    print("=" * 60)
+
+    from pmm_agent.stream_runs import StreamRun, StreamRunRegistry
+
+    async def frames():
+        for i in range(3):
+            yield f"data: {i}\n\n".encode()
+        await asyncio.sleep(60)  # a long model call
+        yield b"data: never\n\n"
+
+    async def run():
+        registry = StreamRunRegistry(ttl_seconds=60)
+        run = StreamRun("gone", "s", grace_seconds=0, closing_frame=b"data: closed\n\n")
+        registry.add(run)
+        run.start(frames())
+        follower = run.follow(-1, originator=True)
+        first = [await follower.__anext__(), await follower.__anext__()]
+        await follower.aclose()  # the connection drops mid-answer
+        for _ in range(10):
+            await asyncio.sleep(0)  # let the cancelled producer unwind
+        resumed = registry.get("gone")
+        assert resumed is run and run.cancelled and resumed.can_resume(1)
+        return first, [frame async for frame in resumed.follow(1)]
+
+    first, rest = asyncio.run(run())
+    assert first == [b"id: gone:0\ndata: 0\n\n", b"id: gone:1\ndata: 1\n\n"], first
+    assert rest == [b"id: gone:2\ndata: 2\n\n", b"id: gone:3\ndata: closed\n\n"], rest
+    print(f"✅ Cancelled run replayed {len(rest)} frames, ending with the closing frame")
+
+
+def test_disconnect_end_to_end():
+    """Test closing a real connection mid-answer."""
+    print("\n" + "=" * 60)
+    print("Testing Disconnect Over HTTP")
+    print("=" * 60)
+
+    import httpx
+    from bench_load import ServerThread
+    from langchain_core.messages import AIMessage
+
+    from pmm_agent import server
+
+    state = {"steps": 0, "cancelled": False}
+
+    class EndlessAgent:
+        async def astream(self, inputs, config):
+            try:
+                while True:
+                    await asyncio.sleep(0.05)
+                    state["steps"] += 1
+                    message = AIMessage(
+                        content=f"step {state['steps']}. ",
+                        id=f"m{state['steps']}",
+                        usage_metadata={"input_tokens": 100, "output_tokens": 10, "total_tokens": 110},
+                    )
+                    yield {"agent": {"messages": [message]}}
+            except (asyncio.CancelledError, GeneratorExit):
+                state["cancelled"] = True
+                raise
+
+    original_agent, original_grace = server.agent, server.STREAM_RESUME_GRACE_SECONDS
+    server.agent = EndlessAgent()
+    server.STREAM_RESUME_GRACE_SECONDS = 0  # cancel as soon as the client leaves
+    server.limiter.enabled = False
+    cancellations_before = len(server.logger.cancellations)
+    try:
+        with ServerThread(server.app) as running:
+            with httpx.Client(base_url=running.base_url, timeout=10) as client:
+                with client.stream("POST", "/chat/stream", json={"message": "Go", "session_id": "disconnect-test"}) as response:
+                    for chunk in response.iter_raw():
+                        if state["steps"] >= 3:
+                            break
+            # Connection closed; the server should stop within a poll interval or two
+            deadline = time.time() + 5
+            while not state["cancelled"] and time.time() < deadline:
+                time.sleep(0.05)
+            steps_at_cancel = state["steps"]
+            time.sleep(0.3)
+    finally:
+        server.agent, server.STREAM_RESUME_GRACE_SECONDS = original_agent, original_grace
+        server.limiter.enabled = True
+
+    assert state["cancelled"], "Agent run kept going after the client left"
+    assert state["steps"] == steps_at_cancel, "Agent produced steps after cancellation"
+    assert len(server.logger.cancellations) == cancellations_before + 1
+    event = server.logger.cancellations[-1]
+    assert event.session_id == "disconnect-test"
+    assert server.logger.sessions["disconnect-test"].cancelled_streams == 1
+    # Tokens spent before the cancel still count
+    assert server.logger.sessions["disconnect-test"].token_usage.total_tokens >= 110
+    assert server.metrics.streams_cancelled_total.get(event.reason) >= 1
+    # The partial answer keeps the session history user/assistant
+    assert server.sessions["disconnect-test"]["messages"][-1]["role"] == "assistant"
+    print(f"✅ Run cancelled after {steps_at_cancel} steps ({event.reason}, {event.frames_sent} frames sent)")
+
+
+def test_resume_end_to_end():
+    """Test reconnecting with Last-Event-ID after a dropped connection."""
+    print("\n" + "=" * 60)
+    print("Testing Last-Event-ID Resume")
+    print("=" * 60)
+
+    import httpx
+    from bench_load import ServerThread
+    from langchain_core.messages import AIMessage
+
+    from pmm_agent import server
+
+    state = {"runs": 0}
+
+    class CountingAgent:
+        async def astream(self, inputs, config):
+            state["runs"] += 1
+            for i in range(20):
+                await asyncio.sleep(0.02)
+                yield {"agent": {"messages": [AIMessage(content=f"part {i}. ", id=f"m{i}")]}}
+
+    def parse(body):
+        events = []
+        for block in body.split("\n\n"):
+            lines = dict(line.split(": ", 1) for line in block.split("\n") if ": " in line)
+            if "data" in lines:
+                events.append((lines.get("id"), json.loads(lines["data"])))
+        return events
+
+    original_agent = server.agent
+    server.agent = CountingAgent()
+    server.limiter.enabled = False
+    payload = {"message": "Go", "session_id": "resume-test"}
+    try:
+        with ServerThread(server.app) as running:
+            with httpx.Client(base_url=running.base_url, timeout=10) as client:
+                # Drop the connection after a few frames
+                received = ""
+                with client.stream("POST", "/chat/stream", json=payload) as response:
+                    for chunk in response.iter_text():
+                        received += chunk
+                        if received.count("\n\n") >= 3:
+                            break
+                first = parse(received[:received.rindex("\n\n") + 2])
+                last_id = first[-1][0]
+
+                resumed = client.post("/chat/stream", json=payload, headers={"Last-Event-ID": last_id})
+                assert resumed.status_code == 200, resumed.text
+                rest = parse(resumed.text)
+
+                run_id = last_id.rpartition(":")[0]
+                unknown = client.post("/chat/stream", json=payload, headers={"Last-Event-ID": "nope:3"})
+                wrong_session = client.post(
+                    "/chat/stream", json={"message": "Go", "session_id": "other"},
+                    headers={"Last-Event-ID": f"{run_id}:0"},
+                )
+    finally:
+        server.agent = original_agent
+        server.limiter.enabled = True
+
+    events = first + rest
+    seqs = [int(event_id.rpartition(":")[2]) for event_id, _ in events]
+    assert seqs == list(range(len(events))), seqs
+    text = "".join(data["content"] for _, data in events if data["type"] == "text")
+    assert text == "".join(f"part {i}. " for i in range(20)), text
+    assert events[-1][1]["type"] == "done"
+    assert state["runs"] == 1, "Agent ran again on resume"
+    assert unknown.status_code == 404 and wrong_session.status_code == 404
+    assert server.sessions["resume-test"]["messages"][-1]["content"] == text
+    print(f"✅ Resumed after {len(first)} frames, {len(rest)} replayed, agent ran once")
+
+
+def main():
+    """Run stream disconnect tests."""
+    results = {}
+    for test in (
+        test_backpressure,
+        test_requester_position_held,
+        test_idle_disconnect,
+        test_replay_after_cancel,
+        test_disconnect_end_to_end,
+        test_resume_end_to_end,
+    ):
+        try:
+            test()
+            results[test.__name__] = True
+        except AssertionError as e:
+            print(f"❌ {test.__name__} failed: {e}")
+            results[test.__name__] = False
+
+    print("\n" + "=" * 60)
+    print("Test Summary")
+    print("=" * 60)
+    for name, passed in results.items():
+        print(f"{name}: {'✅ PASS' if passed else '❌ FAIL'}")
+
+    return 0 if all(results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Test script for the AIMessage normalizer shared by /chat and /chat/stream.
+
+Tests:
+1. tool_calls and tool_use blocks for the same call produce one event
+2. Calls without IDs are deduplicated by name and args
+3. Repeated messages only contribute new text
+4. /chat and /chat/stream return the final answer and every tool call
+5. Calls with IDs are deduplicated without serializing their args, where
+   the previous extraction serialized every call three times
+
+Usage:
+    python3 tests/test_stream_normalizer.py
+"""
+
+import json
+import os
+import sys
+from pathlib import Path
+
+# Add src to path for imports
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+os.environ.setdefault("ANTHROPIC_API_KEY", "sk-ant-test-key")
+
+from langchain_core.messages import AIMessage  # noqa: E402
+
+
+def _anthropic_message(calls, text="Checking.", message_id="msg_1"):
+    """AIMessage as ChatAnthropic returns it: text and tool_use blocks plus tool_calls."""
+    content = [{"type": "text", "text": text}] + [
+        {"type": "tool_use", "name": c["name"], "input": c["args"], "id": c["id"]} for c in calls
+    ]
+    return AIMessage(content=content, tool_calls=calls, id=message_id)
+
+
+def _calls(count, step=0):
+    return [
+        {"name": "draft_sql_query_pack", "args": {"schema_hints": f"table_{i}", "questions": f"q{step}"},
+         "id": f"toolu_{step}_{i}"}
+        for i in range(count)
+    ]
+
+
+def test_tool_use_dedup():
+    """Test that both representations of a call yield one event."""
+    print("=" * 60)
+    print("Testing tool_calls / tool_use Dedup")
+    print("=" * 60)
+
+    from pmm_agent.streaming import MessageNormalizer, TextEvent, ToolCallEvent
+
+    normalizer = MessageNormalizer()
+    events = normalizer.normalize(_anthropic_message(_calls(2)))
+    assert [type(e) for e in events] == [ToolCallEvent, ToolCallEvent, TextEvent], events
+    assert events[0].id == "toolu_0_0" and events[1].id == "toolu_0_1"
+    assert events[2].text == "Checking."
+    assert normalizer.duplicates == 2
+    print("✅ Two calls, two events, text last")
+
+
+def test_id_less_dedup():
+    """Test that calls without IDs fall back to name + args."""
+    print("\n" + "=" * 60)
+    print("Testing Dedup Without IDs")
+    print("=" * 60)
+
+    from pmm_agent.streaming import MessageNormalizer
+
+    normalizer = MessageNormalizer()
+    content = [
+        {"type": "tool_use", "name": "fetch_url", "input": {"url": "a", "timeout": 5}},
+        {"type": "tool_use", "name": "fetch_url", "input": {"timeout": 5, "url": "a"}},
+        {"type": "tool_use", "name": "fetch_url", "input": {"url": "b"}},
+    ]
+    events = normalizer.normalize(AIMessage(content=content))
+    assert [e.args["url"] for e in events] == ["a", "b"]
+    print("✅ Arg order does not defeat dedup")
+
+
+def test_repeated_message_text():
+    """Test that a repeated message only streams text that is new."""
+    print("\n" + "=" * 60)
+    print("Testing Repeated Message Text")
+    print("=" * 60)
+
+    from pmm_agent.streaming import MessageNormalizer
+
+    normalizer = MessageNormalizer()
+    first = normalizer.normalize(AIMessage(content="Let me check.", id="msg_1"))
+    again = normalizer.normalize(AIMessage(content="Let me check. Done.", id="msg_1"))
+    # A different message keeps all of its text
+    final = normalizer.normalize(AIMessage(content="The answer is 42.", id="msg_2"))
+    assert first[0].text == "Let me check."
+    assert again[0].text == " Done."
+    assert final[0].text == "The answer is 42."
+    print("✅ Only new text is emitted")
+
+
+def test_endpoints_share_normalizer():
+    """Test /chat and /chat/stream on an Anthropic-style turn."""
+    print("\n" + "=" * 60)
+    print("Testing /chat and /chat/stream")
+    print("=" * 60)
+
+    from fastapi.testclient import TestClient
+    from langchain_core.messages import ToolMessage
+
+    from pmm_agent import server
+
+    calls = _calls(2)
+    steps = [
+        _anthropic_message(calls, text="Let me draft that.", message_id="msg_1"),
+        [ToolMessage(content="SELECT 1;", tool_call_id=c["id"]) for c in calls],
+        AIMessage(content=[{"type": "text", "text": "Here is your SQL pack."}], id="msg_2"),
+    ]
+
+    class TurnAgent:
+        async def astream(self, inputs, config):
+            yield {"agent": {"messages": [steps[0]]}}
+            yield {"tools": {"messages": steps[1]}}
+            yield {"agent": {"messages": [steps[2]]}}
+
+    original_agent = server.agent
+    server.agent = TurnAgent()
+    server.limiter.enabled = False
+    try:
+        client = TestClient(server.app)
+        chat = client.post("/chat", json={"message": "Draft SQL"}).json()
+        stream = client.post("/chat/stream", json={"message": "Draft SQL"}).text
+    finally:
+        server.agent = original_agent
+        server.limiter.enabled = True
+
+    assert chat["response"] == "Here is your SQL pack.", chat["response"]
+    assert [c["args"]["schema_hints"] for c in chat["tool_calls"]] == ["table_0", "table_1"]
+
+    frames = [json.loads(line[6:]) for line in stream.split("\n") if line.startswith("data: ")]
+    tool_frames = [f for f in frames if f["type"] == "tool_call"]
+    text = "".join(f["content"] for f in frames if f["type"] == "text")
+    assert len(tool_frames) == 2
+    assert text == "Let me draft that.Here is your SQL pack.", text
+    print("✅ Same tool calls and final text on both endpoints")
+
+
+def legacy_extract(message, seen):
+    """The pre-normalizer extraction, kept as the baseline."""
+    out = []
+
+    def key(name, args):
+        try:
+            return f"{name}:{json.dumps(args, sort_keys=True)}"
+        except (TypeError, ValueError):
+            return f"{name}:{args}"
+
+    for tc in message.tool_calls:
+        name = tc.get("name")
+        args = tc.get("input") or tc.get("args", {})
+        if name and key(name, args) not in seen:
+            seen.add(key(name, args))
+            out.append(("tool_call", name, args))
+    text = ""
+    for item in message.content:
+        if isinstance(item, dict):
+            if item.get("type") == "text":
+                text += item.get("text", "")
+            elif item.get("type") == "tool_use":
+                name, args = item.get("name"), item.get("input", {})
+                if name and key(name, args) not in seen:
+                    seen.add(key(name, args))
+                    out.append(("tool_call", name, args))
+    if text:
+        out.append(("text", text))
+    return out
+
+
+def test_normalizer_work():
+    """Test that calls with IDs are deduplicated without serializing their args."""
+    print("\n" + "=" * 60)
+    print("Testing Normalizer Work vs. Legacy Extraction")
+    print("=" * 60)
+
+    from pmm_agent.streaming import MessageNormalizer, TextEvent, ToolCallEvent
+
+    messages = [_anthropic_message(_calls(20, step=i), message_id=f"msg_{i}") for i in range(50)]
+    calls = 50 * 20
+
+    dumps = []
+    original_dumps = json.dumps
+
+    def counting_dumps(*args, **kwargs):
+        dumps.append(args[0])
+        return original_dumps(*args, **kwargs)
+
+    json.dumps = counting_dumps
+    try:
+        seen = set()
+        legacy = [event for m in messages for event in legacy_extract(m, seen)]
+        legacy_dumps = len(dumps)
+        normalizer = MessageNormalizer()
+        events = [event for m in messages for event in normalizer.normalize(m)]
+        normalizer_dumps = len(dumps) - legacy_dumps
+    finally:
+        json.dumps = original_dumps
+
+    print(f"   legacy     {legacy_dumps} json.dumps calls for {calls} tool calls")
+    print(f"   normalizer {normalizer_dumps} json.dumps calls")
+    assert [e[1] for e in legacy if e[0] == "tool_call"] == [e.name for e in events if isinstance(e, ToolCallEvent)]
+    assert sum(isinstance(e, TextEvent) for e in events) == 50
+    assert legacy_dumps == 3 * calls, legacy_dumps  # twice for a new call, once for its tool_use block
+    assert normalizer_dumps == 0, normalizer_dumps
+    print("✅ Same events with no args serialized")
+
+
+def main():
+    """Run normalizer tests."""
+    results = {}
+    for test in (
+        test_tool_use_dedup,
+        test_id_less_dedup,
+        test_repeated_message_text,
+        test_endpoints_share_normalizer,
+        test_normalizer_work,
+    ):
+        try:
+            test()
+            results[test.__name__] = True
+        except AssertionError as e:
+            print(f"❌ {test.__name__} failed: {e}")
+            results[test.__name__] = False
+
+    print("\n" + "=" * 60)
+    print("Test Summary")
+    print("=" * 60)
+    for name, passed in results.items():
+        print(f"{name}: {'✅ PASS' if passed else '❌ FAIL'}")
+
+    return 0 if all(results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
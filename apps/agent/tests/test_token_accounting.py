@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Test script for per-turn and per-session token accounting.
+
+Tests:
+1. Usage metadata is summed across ReAct steps and attributed to tools
+2. /chat/stream populates AgentResponseEvent.token_count and SessionMetrics
+3. /chat logs its responses: token_count, message count and SessionMetrics usage
+4. /metrics/tokens ranks the heaviest sessions and tools
+
+Usage:
+    python3 tests/test_token_accounting.py
+"""
+
+import os
+import sys
+from pathlib import Path
+
+# Add src to path for imports
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+os.environ.setdefault("ANTHROPIC_API_KEY", "sk-ant-test-key")
+
+
+def _usage(input_tokens, output_tokens, cache_read=0):
+    return {
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "total_tokens": input_tokens + output_tokens,
+        "input_token_details": {"cache_read": cache_read},
+    }
+
+
+def _scripted_turn():
+    """Messages for one ReAct turn: tool call step, then final answer step."""
+    from langchain_core.messages import AIMessage, ToolMessage
+
+    return [
+        AIMessage(
+            content="",
+            tool_calls=[{"name": "draft_sql_query_pack", "args": {"schema_hints": "events"}, "id": "call_1"}],
+            usage_metadata=_usage(1000, 50, cache_read=800),
+        ),
+        ToolMessage(content="SELECT 1", tool_call_id="call_1"),
+        AIMessage(content="Here is your SQL.", usage_metadata=_usage(1400, 200)),
+    ]
+
+
+class ScriptedAgent:
+    """Stand-in for the LangGraph agent with usage metadata on each step."""
+
+    async def astream(self, inputs, config):
+        step1, tool_result, step2 = _scripted_turn()
+        yield {"agent": {"messages": [step1]}}
+        yield {"tools": {"messages": [tool_result]}}
+        yield {"agent": {"messages": [step2]}}
+
+
+def test_turn_accounting():
+    """Test summing and tool attribution for a single turn."""
+    print("=" * 60)
+    print("Testing Turn Token Accounting")
+    print("=" * 60)
+
+    from pmm_agent.observability import TurnTokenAccounting
+
+    accounting = TurnTokenAccounting()
+    for message in _scripted_turn():
+        if message.type == "ai":
+            accounting.record_step(message)
+
+    assert accounting.steps == 2
+    assert accounting.total.input_tokens == 2400
+    assert accounting.total.output_tokens == 250
+    assert accounting.total.cache_read_tokens == 800
+    # The second step consumed the SQL tool's output
+    assert accounting.by_tool["draft_sql_query_pack"].total_tokens == 1600
+    print(f"✅ Total: {accounting.total.to_dict()}")
+
+
+def test_stream_and_chat_accounting():
+    """Test that both endpoints aggregate tokens and /metrics/tokens reports them."""
+    print("\n" + "=" * 60)
+    print("Testing Endpoint Token Accounting")
+    print("=" * 60)
+
+    from fastapi.testclient import TestClient
+
+    from pmm_agent import server
+
+    original_agent = server.agent
+    server.agent = ScriptedAgent()
+    try:
+        client = TestClient(server.app)
+        response = client.post(
+            "/chat/stream", json={"message": "Write SQL", "session_id": "token-stream"}
+        )
+        assert response.status_code == 200
+
+        event = server.logger.events[-1]
+        assert event.token_count == 2650, f"Expected 2650 tokens, got {event.token_count}"
+        assert event.token_usage.cache_read_tokens == 800
+
+        response = client.post("/chat", json={"message": "Write SQL", "session_id": "token-chat"})
+        assert response.status_code == 200
+        response = client.post("/chat", json={"message": "Again", "session_id": "token-chat"})
+        assert response.status_code == 200
+        chat_event = server.logger.events[-1]
+    finally:
+        server.agent = original_agent
+
+    assert server.logger.sessions["token-stream"].token_usage.total_tokens == 2650
+    assert server.logger.sessions["token-chat"].token_usage.total_tokens == 5300
+    assert server.logger.sessions["token-chat"].message_count == 2
+    assert chat_event.session_id == "token-chat" and chat_event.token_count == 2650
+    assert [call.tool_name for call in chat_event.tool_calls] == ["draft_sql_query_pack"]
+
+    report = client.get("/metrics/tokens?limit=2").json()
+    print(f"   Report: {report}")
+    assert report["sessions"][0]["session_id"] == "token-chat"
+    assert report["tools"][0]["tool_name"] == "draft_sql_query_pack"
+    assert report["totals"]["total_tokens"] >= 7950
+
+    scrape = client.get("/metrics/prometheus").text
+    assert 'pmm_agent_tokens_total{kind="input"}' in scrape
+    print("✅ Sessions and tools ranked by token usage")
+
+
+def main():
+    """Run token accounting tests."""
+    results = {}
+    for test in (test_turn_accounting, test_stream_and_chat_accounting):
+        try:
+            test()
+            results[test.__name__] = True
+        except AssertionError as e:
+            print(f"❌ {test.__name__} failed: {e}")
+            results[test.__name__] = False
+
+    print("\n" + "=" * 60)
+    print("Test Summary")
+    print("=" * 60)
+    for name, passed in results.items():
+        print(f"{name}: {'✅ PASS' if passed else '❌ FAIL'}")
+
+    return 0 if all(results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Test script for token-bucket rate limiting of chat turns.
+
+Tests:
+1. A bucket refuses turns it cannot cover and reports when to retry
+2. Settling refunds over-estimates and charges expensive turns as debt
+3. The SQLite backend shares one bucket between workers (separate connections)
+4. /chat charges reported tokens: a heavy turn is throttled, light ones are not
+5. A /chat turn whose agent fails refunds its reservation and ends its span
+6. Rotating an unknown API key or session does not reach a fresh bucket:
+   such turns are charged to the client IP
+7. Known API keys behind one IP are charged to, and request-limited by,
+   their own keys only; anonymous traffic from that IP keeps its own limits
+
+Usage:
+    python3 tests/test_token_rate_limit.py
+"""
+
+import os
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+# Add src to path for imports
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+os.environ.setdefault("ANTHROPIC_API_KEY", "sk-ant-test-key")
+
+
+class MeteredAgent:
+    """Agent stand-in that reports 60k input tokens for "heavy" messages, 50 otherwise."""
+
+    async def astream(self, inputs, config):
+        from langchain_core.messages import AIMessage
+
+        heavy = "heavy" in inputs["messages"][-1].content
+        usage = {"input_tokens": 60000 if heavy else 50, "output_tokens": 10, "total_tokens": 0}
+        yield {"agent": {"messages": [AIMessage(content="ok", usage_metadata=usage)]}}
+
+
+def test_bucket_refusal():
+    """Test reservation and refusal against a small bucket."""
+    print("=" * 60)
+    print("Testing Token Bucket Refusal")
+    print("=" * 60)
+
+    from pmm_agent.ratelimit import MemoryBackend, RateLimited, TokenBucketLimiter
+
+    limiter = TokenBucketLimiter(MemoryBackend(), capacity=1000, refill_per_second=100)
+    limiter.reserve("ip:1", 600)
+    limiter.reserve("ip:1", 400)
+    try:
+        limiter.reserve("ip:1", 300)
+        raise AssertionError("Empty bucket should refuse")
+    except RateLimited as e:
+        assert 2.5 < e.retry_after <= 3.0, e.retry_after
+        retry_after = e.retry_after
+    # Other keys have their own buckets; oversized turns run from a full one
+    limiter.reserve("ip:2", 5000)
+    print(f"✅ Refused with retry in {retry_after:.2f}s; keys independent")
+
+
+def test_settle():
+    """Test refunds and debt when actual usage differs from the estimate."""
+    print("\n" + "=" * 60)
+    print("Testing Settlement")
+    print("=" * 60)
+
+    from pmm_agent.ratelimit import MemoryBackend, RateLimited, TokenBucketLimiter
+
+    limiter = TokenBucketLimiter(MemoryBackend(), capacity=1000, refill_per_second=100)
+    over = limiter.reserve("light", 900)
+    limiter.settle(over, 100)  # refund 800
+    limiter.settle(over, 100)  # settling twice is a no-op
+    limiter.reserve("light", 800)
+
+    heavy = limiter.reserve("heavy", 500)
+    limiter.settle(heavy, 3000)  # 2500 of debt: bucket at -2000
+    try:
+        limiter.reserve("heavy", 100)
+        raise AssertionError("Indebted bucket should refuse")
+    except RateLimited as e:
+        assert e.retry_after > 20, e.retry_after
+        heavy_wait = e.retry_after
+
+    unreported = limiter.reserve("unreported", 700)
+    limiter.settle(unreported, None)  # no usage reported: the estimate stands
+    try:
+        limiter.reserve("unreported", 700)
+        raise AssertionError("Estimate should still be charged")
+    except RateLimited:
+        pass
+    print(f"✅ Refund applied; 3000-token turn waits {heavy_wait:.0f}s before the next")
+
+
+def test_sqlite_shared():
+    """Test that workers with their own connections share a bucket."""
+    print("\n" + "=" * 60)
+    print("Testing SQLite Backend Across Workers")
+    print("=" * 60)
+
+    from pmm_agent.ratelimit import RateLimited, SQLiteBackend, TokenBucketLimiter
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "buckets.db")
+        workers = [TokenBucketLimiter(SQLiteBackend(path), capacity=1000, refill_per_second=0.001) for _ in range(4)]
+        granted = []
+
+        def worker(limiter):
+            for _ in range(10):
+                try:
+                    limiter.reserve("session:shared", 50)
+                    granted.append(1)
+                except RateLimited:
+                    pass
+
+        threads = [threading.Thread(target=worker, args=(limiter,)) for limiter in workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for limiter in workers:
+            limiter.backend.close()
+
+    assert len(granted) == 20, f"{len(granted)} turns granted from a 1000-token bucket at 50 each"
+    print("✅ 4 workers × 10 turns: exactly 20 granted from one shared bucket")
+
+
+def test_chat_charges_reported_tokens():
+    """Test that /chat throttles by reported usage, not request count."""
+    print("\n" + "=" * 60)
+    print("Testing /chat Token Charging")
+    print("=" * 60)
+
+    from fastapi.testclient import TestClient
+
+    from pmm_agent import server
+    from pmm_agent.ratelimit import MemoryBackend, TokenBucketLimiter
+
+    original_agent, original_limiter = server.agent, server.token_limiter
+    server.agent = MeteredAgent()
+    server.token_limiter = TokenBucketLimiter(MemoryBackend(), capacity=40000, refill_per_second=40000 / 60)
+    server.limiter.enabled = False  # more turns than the per-IP request limit
+    rejected_before = server.metrics.token_rate_limited_total.get("chat")
+    try:
+        client = TestClient(server.app)
+        # Light turns are refunded down to their real cost: many fit in one bucket
+        light = [client.post("/chat", json={"message": f"light {i}", "session_id": "light"}).status_code for i in range(20)]
+        heavy = client.post("/chat", json={"message": "heavy", "session_id": "heavy"})
+        throttled = client.post("/chat", json={"message": "again", "session_id": "heavy"})
+    finally:
+        server.agent, server.token_limiter = original_agent, original_limiter
+        server.limiter.enabled = True
+
+    assert light == [200] * 20, light
+    assert heavy.status_code == 200
+    assert throttled.status_code == 429, throttled.status_code
+    assert int(throttled.headers["Retry-After"]) > 30
+    assert server.metrics.token_rate_limited_total.get("chat") == rejected_before + 1
+    print(f"✅ 20 light turns allowed; after a 60k-token turn: 429, retry in {throttled.headers['Retry-After']}s")
+
+
+def test_failed_turn_refunded():
+    """Test that a /chat turn that raises is not left charged."""
+    print("\n" + "=" * 60)
+    print("Testing Failed /chat Turn Settlement")
+    print("=" * 60)
+
+    from fastapi.testclient import TestClient
+
+    from pmm_agent import server
+    from pmm_agent.ratelimit import MemoryBackend, TokenBucketLimiter
+    from pmm_agent.tracing import InMemorySpanExporter, Tracer, set_tracer
+
+    class FailingAgent:
+        async def astream(self, inputs, config):
+            raise RuntimeError("model unavailable")
+            yield
+
+    original_agent, original_limiter = server.agent, server.token_limiter
+    server.agent = FailingAgent()
+    # No refill: only a refund can bring the bucket back to full
+    server.token_limiter = TokenBucketLimiter(MemoryBackend(), capacity=40000, refill_per_second=0.001)
+    exporter = InMemorySpanExporter()
+    set_tracer(Tracer(exporter))
+    try:
+        client = TestClient(server.app, raise_server_exceptions=False)
+        failed = client.post("/chat", json={"message": "hello"})
+        full = server.token_limiter.backend.take("ip:testclient", 0, 40000, 40000, 0.001, 0)[0]
+    finally:
+        server.agent, server.token_limiter = original_agent, original_limiter
+        set_tracer(None)
+
+    turns = [span for span in exporter.get_finished_spans() if span.name == "chat.turn"]
+    assert failed.status_code == 500, failed.status_code
+    assert full, "Failed turn left its estimate charged"
+    assert len(turns) == 1 and turns[0].status == "ERROR", [(span.name, span.status) for span in turns]
+    print("✅ Failed turn: 500, bucket refunded to full, chat.turn span ended with ERROR")
+
+
+def test_rotation_does_not_bypass():
+    """Test that per-request unknown API keys and sessions share the client's IP bucket."""
+    print("\n" + "=" * 60)
+    print("Testing Key and Session Rotation")
+    print("=" * 60)
+
+    from fastapi.testclient import TestClient
+
+    from pmm_agent import server
+    from pmm_agent.ratelimit import (
+        MemoryBackend,
+        RateLimited,
+        TokenBucketLimiter,
+        hash_api_key,
+        rate_limit_key,
+    )
+
+    known = frozenset({hash_api_key("team-key")})
+    assert rate_limit_key("team-key", "10.0.0.1", known) == hash_api_key("team-key")
+    assert rate_limit_key("made-up", "10.0.0.1", known) == "ip:10.0.0.1"
+    assert rate_limit_key(None, None, known) == "ip:unknown"
+
+    # A refusal on any of several keys leaves the others uncharged
+    limiter = TokenBucketLimiter(MemoryBackend(), capacity=1000, refill_per_second=0.001)
+    limiter.reserve("key:spent", 1000)
+    try:
+        limiter.reserve(["ip:a", "key:spent"], 500)
+        raise AssertionError("Exhausted key bucket should refuse")
+    except RateLimited as e:
+        assert e.key == "key:spent"
+    limiter.reserve("ip:a", 1000)
+
+    original_agent, original_limiter = server.agent, server.token_limiter
+    server.agent = MeteredAgent()
+    server.token_limiter = TokenBucketLimiter(MemoryBackend(), capacity=40000, refill_per_second=40000 / 60)
+    server.limiter.enabled = False
+    try:
+        client = TestClient(server.app)
+        heavy = client.post("/chat", json={"message": "heavy", "session_id": "r0"}, headers={"X-API-Key": "k0"})
+        rotated = [
+            client.post("/chat", json={"message": "light", "session_id": f"r{i}"}, headers={"X-API-Key": f"k{i}"})
+            for i in range(1, 6)
+        ]
+    finally:
+        server.agent, server.token_limiter = original_agent, original_limiter
+        server.limiter.enabled = True
+
+    assert heavy.status_code == 200
+    assert [response.status_code for response in rotated] == [429] * 5, [r.status_code for r in rotated]
+    print("✅ 5 rotated unknown keys/sessions after a 60k-token turn: all 429 from the IP's bucket")
+
+
+def test_api_keys_behind_one_ip():
+    """Test that known API keys behind the same IP have their own budgets."""
+    print("\n" + "=" * 60)
+    print("Testing API Keys Behind a Shared IP")
+    print("=" * 60)
+
+    from fastapi.testclient import TestClient
+
+    from pmm_agent import server
+    from pmm_agent.ratelimit import MemoryBackend, TokenBucketLimiter, hash_api_key
+
+    def post(message, api_key=None):
+        headers = {"X-API-Key": api_key} if api_key else {}
+        return client.post("/chat", json={"message": message}, headers=headers).status_code
+
+    original_agent, original_limiter = server.agent, server.token_limiter
+    original_keys = server.RATE_LIMIT_API_KEYS
+    server.agent = MeteredAgent()
+    server.RATE_LIMIT_API_KEYS = frozenset({hash_api_key("alice-key"), hash_api_key("bob-key")})
+    try:
+        # Every TestClient request comes from the same client address
+        client = TestClient(server.app)
+        server.limiter.enabled = False
+        server.token_limiter = TokenBucketLimiter(MemoryBackend(), capacity=40000, refill_per_second=0.001)
+        alice_heavy = post("heavy", "alice-key")
+        tokens = [post("light", "alice-key"), post("light", "bob-key"), post("light")]
+        ip_bucket = server.token_limiter.backend.take("ip:testclient", 0, 0, 40000, 0, 0)[1]
+
+        # The 10/minute request limit is per key too
+        server.limiter.enabled = True
+        server.limiter.reset()
+        server.token_limiter = TokenBucketLimiter(MemoryBackend(), capacity=40000, refill_per_second=40000 / 60)
+        alice = [post(f"light {i}", "alice-key") for i in range(11)]
+        bob = [post(f"light {i}", "bob-key") for i in range(10)]
+        anonymous = [post(f"light {i}") for i in range(11)]
+    finally:
+        server.agent, server.token_limiter = original_agent, original_limiter
+        server.RATE_LIMIT_API_KEYS = original_keys
+        server.limiter.enabled = True
+        server.limiter.reset()
+
+    assert alice_heavy == 200
+    # Alice's spent bucket throttles only Alice; Bob and anonymous traffic still run
+    assert tokens == [429, 200, 200], tokens
+    assert ip_bucket < 40000, "Anonymous turn should be charged to the IP bucket"
+    assert alice == [200] * 10 + [429], alice
+    assert bob == [200] * 10, bob
+    assert anonymous == [200] * 10 + [429], anonymous
+    print("✅ Two API keys on one IP: separate token buckets and request limits; anonymous traffic limited per IP")
+
+
+def main():
+    """Run token rate limit tests."""
+    results = {}
+    for test in (
+        test_bucket_refusal,
+        test_settle,
+        test_sqlite_shared,
+        test_chat_charges_reported_tokens,
+        test_failed_turn_refunded,
+        test_rotation_does_not_bypass,
+        test_api_keys_behind_one_ip,
+    ):
+        try:
+            test()
+            results[test.__name__] = True
+        except AssertionError as e:
+            print(f"❌ {test.__name__} failed: {e}")
+            results[test.__name__] = False
+
+    print("\n" + "=" * 60)
+    print("Test Summary")
+    print("=" * 60)
+    for name, passed in results.items():
+        print(f"{name}: {'✅ PASS' if passed else '❌ FAIL'}")
+
+    return 0 if all(results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
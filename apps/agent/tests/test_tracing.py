@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Test script for per-stage tracing spans.
+
+Tests:
+1. The default tracer is a no-op
+2. Spans nest, time themselves and export to the in-memory exporter
+3. A /chat/stream turn records conversion, ReAct node, SSE and logging spans
+   and attaches their timings to the AgentResponseEvent
+4. A /chat turn records the same ReAct node spans and timings
+5. A stream closed mid-message still ends its SSE serialization span
+
+Usage:
+    python3 tests/test_tracing.py
+"""
+
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+# Add src to path for imports
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+os.environ.setdefault("ANTHROPIC_API_KEY", "sk-ant-test-key")
+
+
+class ScriptedAgent:
+    """Stand-in for the LangGraph agent that streams a fixed ReAct turn."""
+
+    async def astream(self, inputs, config):
+        from langchain_core.messages import AIMessage, ToolMessage
+
+        await asyncio.sleep(0.01)
+        yield {"agent": {"messages": [AIMessage(
+            content="",
+            tool_calls=[{"name": "analyze_product", "args": {"product_description": "x"}, "id": "call_1"}],
+        )]}}
+        await asyncio.sleep(0.01)
+        yield {"tools": {"messages": [ToolMessage(content="analysis", tool_call_id="call_1")]}}
+        await asyncio.sleep(0.01)
+        yield {"agent": {"messages": [AIMessage(content="Done.")]}}
+
+
+def test_noop_default():
+    """Test that tracing is off unless configured."""
+    print("=" * 60)
+    print("Testing No-op Default Tracer")
+    print("=" * 60)
+
+    from pmm_agent.tracing import INVALID_SPAN, NoOpTracer
+
+    tracer = NoOpTracer()
+    with tracer.start_as_current_span("turn") as span:
+        span.set_attribute("key", "value")
+        child = tracer.start_span("child", parent=span)
+        child.end()
+
+    assert span is INVALID_SPAN and child is INVALID_SPAN
+    assert not span.is_recording()
+    print("✅ No-op tracer returns the shared non-recording span")
+
+
+def test_span_nesting_and_export():
+    """Test parent/child relationships, timings and export."""
+    print("\n" + "=" * 60)
+    print("Testing Span Nesting and Export")
+    print("=" * 60)
+
+    from pmm_agent.tracing import InMemorySpanExporter, Tracer
+
+    exporter = InMemorySpanExporter()
+    tracer = Tracer(exporter)
+
+    with tracer.start_as_current_span("turn") as root:
+        with tracer.start_as_current_span("stage") as child:
+            child.set_attribute("items", 3)
+        explicit = tracer.start_span("react.agent", parent=root, start_time=root.start_time)
+        explicit.end(root.start_time + 5_000_000)
+
+    spans = {span.name: span for span in exporter.get_finished_spans()}
+    assert set(spans) == {"turn", "stage", "react.agent"}
+    assert spans["stage"].parent_id == root.span_id
+    assert spans["stage"].trace_id == root.trace_id
+    assert spans["react.agent"].duration_ms == 5.0
+    assert root.timings["react.agent"] == 5.0
+    assert set(root.timings) == {"turn", "stage", "react.agent"}
+    print(f"✅ Timings: {root.timings}")
+
+
+def test_stream_turn_spans():
+    """Test that a streaming turn attaches stage timings to its event."""
+    print("\n" + "=" * 60)
+    print("Testing /chat/stream Span Instrumentation")
+    print("=" * 60)
+
+    from fastapi.testclient import TestClient
+
+    from pmm_agent import server
+    from pmm_agent.tracing import InMemorySpanExporter, Tracer, set_tracer
+
+    exporter = InMemorySpanExporter()
+    set_tracer(Tracer(exporter))
+    original_agent = server.agent
+    server.agent = ScriptedAgent()
+    try:
+        client = TestClient(server.app)
+        response = client.post("/chat/stream", json={"message": "Trace this turn"})
+        assert response.status_code == 200
+        assert '"type": "done"' in response.text
+    finally:
+        server.agent = original_agent
+        set_tracer(None)
+
+    names = [span.name for span in exporter.get_finished_spans()]
+    for expected in (
+        "chat_stream.turn",
+        "chat_stream.convert_messages",
+        "react.agent",
+        "react.tools",
+        "chat_stream.sse_serialize",
+        "chat_stream.log_response",
+    ):
+        assert expected in names, f"Missing span {expected}: {names}"
+    assert names.count("react.agent") == 2
+
+    event = server.logger.events[-1]
+    assert event.span_timings is not None
+    assert event.span_timings["react.tools"] >= 5.0
+    assert "chat_stream.turn" in event.span_timings
+    print(f"✅ Event span timings: { {k: round(v, 2) for k, v in event.span_timings.items()} }")
+
+
+def test_chat_turn_spans():
+    """Test that a /chat turn records per-node spans and timings."""
+    print("\n" + "=" * 60)
+    print("Testing /chat Span Instrumentation")
+    print("=" * 60)
+
+    from fastapi.testclient import TestClient
+
+    from pmm_agent import server
+    from pmm_agent.tracing import InMemorySpanExporter, Tracer, set_tracer
+
+    exporter = InMemorySpanExporter()
+    set_tracer(Tracer(exporter))
+    original_agent = server.agent
+    server.agent = ScriptedAgent()
+    try:
+        client = TestClient(server.app)
+        response = client.post("/chat", json={"message": "Trace this turn"})
+        assert response.status_code == 200
+        assert response.json()["response"] == "Done."
+    finally:
+        server.agent = original_agent
+        set_tracer(None)
+
+    names = [span.name for span in exporter.get_finished_spans()]
+    for expected in ("chat.turn", "chat.convert_messages", "react.agent", "react.tools", "chat.log_response"):
+        assert expected in names, f"Missing span {expected}: {names}"
+    assert names.count("react.agent") == 2
+
+    event = server.logger.events[-1]
+    assert event.span_timings is not None
+    assert {"react.agent", "react.tools", "chat.turn"} <= set(event.span_timings)
+    print(f"✅ Event span timings: { {k: round(v, 2) for k, v in event.span_timings.items()} }")
+
+
+def test_closed_stream_spans():
+    """Test that closing a stream mid-message ends the SSE span."""
+    print("\n" + "=" * 60)
+    print("Testing Spans of a Closed Stream")
+    print("=" * 60)
+
+    from langchain_core.messages import AIMessage
+    from starlette.requests import Request
+
+    from pmm_agent import server
+    from pmm_agent.tracing import InMemorySpanExporter, Tracer, set_tracer
+
+    class LongAnswerAgent:
+        async def astream(self, inputs, config):
+            # More characters than the frame buffer: the producer pauses mid-message
+            yield {"agent": {"messages": [AIMessage(content="x" * 1000)]}}
+
+    async def close_mid_message():
+        async def receive():
+            await asyncio.sleep(3600)  # the client never sends a disconnect itself
+
+        scope = {
+            "type": "http", "method": "POST", "path": "/chat/stream", "headers": [],
+            "query_string": b"", "client": ("127.0.0.1", 5000), "app": server.app,
+        }
+        response = await server.chat_stream(server.ChatRequest(message="Go"), Request(scope, receive))
+        frames = response.body_iterator
+        for _ in range(10):
+            await frames.__anext__()
+        await frames.aclose()  # the client goes away
+        for _ in range(100):
+            if "chat_stream.turn" in [span.name for span in exporter.get_finished_spans()]:
+                break
+            await asyncio.sleep(0.01)
+
+    exporter = InMemorySpanExporter()
+    set_tracer(Tracer(exporter))
+    original_agent, original_grace = server.agent, server.STREAM_RESUME_GRACE_SECONDS
+    server.agent = LongAnswerAgent()
+    server.STREAM_RESUME_GRACE_SECONDS = 0
+    server.limiter.enabled = False
+    try:
+        asyncio.run(close_mid_message())
+    finally:
+        server.agent, server.STREAM_RESUME_GRACE_SECONDS = original_agent, original_grace
+        server.limiter.enabled = True
+        set_tracer(None)
+
+    spans = {span.name: span for span in exporter.get_finished_spans()}
+    assert "chat_stream.turn" in spans and spans["chat_stream.turn"].attributes.get("cancelled"), list(spans)
+    assert "chat_stream.sse_serialize" in spans, f"SSE span left open: {list(spans)}"
+    print("✅ Cancelled turn ended its SSE serialization span")
+
+
+def main():
+    """Run tracing tests."""
+    results = {}
+    for test in (
+        test_noop_default,
+        test_span_nesting_and_export,
+        test_stream_turn_spans,
+        test_chat_turn_spans,
+        test_closed_stream_spans,
+    ):
+        try:
+            test()
+            results[test.__name__] = True
+        except AssertionError as e:
+            print(f"❌ {test.__name__} failed: {e}")
+            results[test.__name__] = False
+
+    print("\n" + "=" * 60)
+    print("Test Summary")
+    print("=" * 60)
+    for name, passed in results.items():
+        print(f"{name}: {'✅ PASS' if passed else '❌ FAIL'}")
+
+    return 0 if all(results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
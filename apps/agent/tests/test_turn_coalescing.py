@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Test script for request coalescing and the per-session turn queue.
+
+Tests:
+1. SingleFlight runs a key once and shares the result with concurrent callers
+2. A double-submitted /chat/stream request follows the first run: one agent
+   run, identical frames, one user/assistant pair in the history
+3. A double-submitted /chat request returns the shared response
+4. Different concurrent messages in one session run one after the other and
+   each sees the previous answer
+5. Turns beyond the session's queue depth are refused with 429, and queue
+   places are released on completion, cancellation and discard
+
+Usage:
+    python3 tests/test_turn_coalescing.py
+"""
+
+import asyncio
+import os
+import sys
+import threading
+from pathlib import Path
+
+# Add src to path for imports
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+sys.path.insert(0, str(Path(__file__).parent))
+os.environ.setdefault("ANTHROPIC_API_KEY", "sk-ant-test-key")
+os.environ.setdefault("DEBUG_STREAM", "0")
+
+from langchain_core.messages import AIMessage, HumanMessage  # noqa: E402
+
+
+class SlowEchoAgent:
+    """Answers "echo: <last user message> after <n> messages", slowly, counting runs."""
+
+    def __init__(self):
+        self.runs = 0
+        self.active = 0
+        self.max_active = 0
+
+    def _answer(self, messages):
+        last = [m for m in messages if isinstance(m, HumanMessage)][-1]
+        return f"echo: {last.content} after {len(messages)} messages"
+
+    async def _work(self):
+        self.runs += 1
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(0.3)
+        finally:
+            self.active -= 1
+
+    async def astream(self, inputs, config):
+        await self._work()
+        messages = inputs["messages"]
+        yield {"agent": {"messages": [AIMessage(content=self._answer(messages), id=f"run{self.runs}")]}}
+
+
+def _concurrently(*calls):
+    """Run blocking calls in threads and return their results in order."""
+    results = [None] * len(calls)
+
+    def worker(i, call):
+        results[i] = call()
+
+    threads = [threading.Thread(target=worker, args=(i, call)) for i, call in enumerate(calls)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def _serve(agent):
+    """Patch the server's agent and start it in a thread."""
+    from bench_load import ServerThread
+
+    from pmm_agent import server
+
+    original_agent = server.agent
+    server.agent = agent
+    server.limiter.enabled = False
+
+    def restore():
+        server.agent = original_agent
+        server.limiter.enabled = True
+
+    return ServerThread(server.app), restore
+
+
+def test_single_flight():
+    """Test that concurrent callers of one key share a single run."""
+    print("=" * 60)
+    print("Testing SingleFlight")
+    print("=" * 60)
+
+    from pmm_agent.turns import SingleFlight, turn_key
+
+    calls = []
+
+    async def work(value):
+        calls.append(value)
+        await asyncio.sleep(0.05)
+        return value * 2
+
+    async def run():
+        flights = SingleFlight()
+        key = turn_key("s1", "hello")
+        shared = await asyncio.gather(
+            flights.run(key, lambda: work(1)),
+            flights.run(key, lambda: work(2)),
+        )
+        other = await flights.run(turn_key("s1", "other"), lambda: work(3))
+        anonymous = await asyncio.gather(
+            flights.run(turn_key(None, "hello"), lambda: work(4)),
+            flights.run(turn_key(None, "hello"), lambda: work(5)),
+        )
+        return shared, other, anonymous, key in flights
+
+    shared, other, anonymous, still_inflight = asyncio.run(run())
+    assert shared == [(2, False), (2, True)], shared
+    assert other == (6, False)
+    assert anonymous == [(8, False), (10, False)], "Requests without a session must not be coalesced"
+    assert calls == [1, 3, 4, 5], calls
+    assert not still_inflight
+    print("✅ One run per key, result shared, anonymous requests kept apart")
+
+
+def test_stream_double_submit():
+    """Test that a duplicate /chat/stream request joins the first run."""
+    print("\n" + "=" * 60)
+    print("Testing /chat/stream Double-Submit")
+    print("=" * 60)
+
+    import httpx
+
+    from pmm_agent import server
+
+    agent = SlowEchoAgent()
+    running_server, restore = _serve(agent)
+    payload = {"message": "Hello", "session_id": "coalesce-stream"}
+    coalesced_before = server.metrics.requests_coalesced_total.get("chat_stream")
+    try:
+        with running_server as running:
+            with httpx.Client(base_url=running.base_url, timeout=10) as client:
+                first, second = _concurrently(
+                    lambda: client.post("/chat/stream", json=payload).text,
+                    lambda: client.post("/chat/stream", json=payload).text,
+                )
+    finally:
+        restore()
+
+    assert agent.runs == 1, f"Agent ran {agent.runs} times"
+    assert first == second, "Both clients should receive the same frames"
+    assert '"type": "done"' in first
+    history = server.sessions["coalesce-stream"]["messages"]
+    assert [m["role"] for m in history] == ["system", "user", "assistant"], history
+    assert server.metrics.requests_coalesced_total.get("chat_stream") == coalesced_before + 1
+    print("✅ One agent run, identical streams, one history entry")
+
+
+def test_chat_double_submit():
+    """Test that a duplicate /chat request shares the first response."""
+    print("\n" + "=" * 60)
+    print("Testing /chat Double-Submit")
+    print("=" * 60)
+
+    import httpx
+
+    from pmm_agent import server
+
+    agent = SlowEchoAgent()
+    running_server, restore = _serve(agent)
+    payload = {"message": "Hello", "session_id": "coalesce-chat"}
+    try:
+        with running_server as running:
+            with httpx.Client(base_url=running.base_url, timeout=10) as client:
+                first, second = _concurrently(
+                    lambda: client.post("/chat", json=payload).json(),
+                    lambda: client.post("/chat", json=payload).json(),
+                )
+    finally:
+        restore()
+
+    assert agent.runs == 1, f"Agent ran {agent.runs} times"
+    assert first == second
+    assert [m["role"] for m in server.sessions["coalesce-chat"]["messages"]] == ["system", "user", "assistant"]
+    print(f"✅ Shared response: {first['response']!r}")
+
+
+def test_session_turns_serialized():
+    """Test that different messages in one session do not overlap."""
+    print("\n" + "=" * 60)
+    print("Testing Per-Session Turn Ordering")
+    print("=" * 60)
+
+    import httpx
+
+    from pmm_agent import server
+
+    agent = SlowEchoAgent()
+    running_server, restore = _serve(agent)
+    try:
+        with running_server as running:
+            with httpx.Client(base_url=running.base_url, timeout=10) as client:
+                _concurrently(
+                    lambda: client.post("/chat", json={"message": "one", "session_id": "ordered"}),
+                    lambda: client.post("/chat/stream", json={"message": "two", "session_id": "ordered"}).text,
+                    lambda: client.post("/chat", json={"message": "three", "session_id": "ordered"}),
+                )
+    finally:
+        restore()
+
+    history = server.sessions["ordered"]["messages"][1:]
+    assert agent.runs == 3 and agent.max_active == 1, (agent.runs, agent.max_active)
+    assert [m["role"] for m in history] == ["user", "assistant"] * 3, history
+    # Each turn saw the complete history before it: 1, 3 and 5 messages
+    counts = sorted(int(m["content"].rsplit(" after ", 1)[1].split()[0]) for m in history if m["role"] == "assistant")
+    assert counts == [1, 3, 5], counts
+    print("✅ Three turns ran one at a time with consistent history")
+
+
+def test_queue_depth_limit():
+    """Test the per-session queue bound and slot bookkeeping."""
+    print("\n" + "=" * 60)
+    print("Testing Session Queue Depth")
+    print("=" * 60)
+
+    import httpx
+
+    from pmm_agent import server
+    from pmm_agent.turns import SessionBusy, SessionTurnLocks
+
+    async def bookkeeping():
+        locks = SessionTurnLocks(max_queue_depth=1)
+        running, waiting = locks.admit("s"), locks.admit("s")
+        try:
+            locks.admit("s")
+            raise AssertionError("Third turn should be refused")
+        except SessionBusy:
+            pass
+        async with running:
+            waiter = asyncio.ensure_future(waiting.__aenter__())
+            await asyncio.sleep(0)
+            waiter.cancel()  # cancelled while queued
+            await asyncio.gather(waiter, return_exceptions=True)
+            assert locks.pending("s") == 1
+        never_started = locks.admit("s")
+        never_started.discard()
+        never_started.discard()
+        return locks.pending("s"), locks._locks
+
+    pending, lock_table = asyncio.run(bookkeeping())
+    assert pending == 0 and not lock_table, (pending, lock_table)
+
+    agent = SlowEchoAgent()
+    running_server, restore = _serve(agent)
+    original_depth = server.session_turns.max_queue_depth
+    server.session_turns.max_queue_depth = 1
+    rejected_before = server.metrics.session_turns_rejected_total.get("chat")
+    try:
+        with running_server as running:
+            with httpx.Client(base_url=running.base_url, timeout=10) as client:
+                statuses = _concurrently(*[
+                    lambda i=i: client.post("/chat", json={"message": f"m{i}", "session_id": "busy"}).status_code
+                    for i in range(4)
+                ])
+                after = client.post("/chat", json={"message": "later", "session_id": "busy"}).status_code
+    finally:
+        server.session_turns.max_queue_depth = original_depth
+        restore()
+
+    assert sorted(statuses) == [200, 200, 429, 429], statuses
+    assert after == 200, "Queue places should be released after the turns finish"
+    assert server.metrics.session_turns_rejected_total.get("chat") == rejected_before + 2
+    assert server.session_turns.pending("busy") == 0
+    print(f"✅ Statuses {sorted(statuses)} with queue depth 1; queue drained afterwards")
+
+
+def main():
+    """Run coalescing tests."""
+    results = {}
+    for test in (
+        test_single_flight,
+        test_stream_double_submit,
+        test_chat_double_submit,
+        test_session_turns_serialized,
+        test_queue_depth_limit,
+    ):
+        try:
+            test()
+            results[test.__name__] = True
+        except AssertionError as e:
+            print(f"❌ {test.__name__} failed: {e}")
+            results[test.__name__] = False
+
+    print("\n" + "=" * 60)
+    print("Test Summary")
+    print("=" * 60)
+    for name, passed in results.items():
+        print(f"{name}: {'✅ PASS' if passed else '❌ FAIL'}")
+
+    return 0 if all(results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
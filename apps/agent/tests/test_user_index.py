@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Test script for the bitmap user index.
+
+Tests:
+1. Retention and cohort matrices from day bitsets equal the metrics
+   functions; stickiness and funnel reach match a pandas implementation
+2. On a large user base, new cohort questions are answered from the index,
+   scanning the events only once per event name asked about
+3. compute_event_metrics reports stickiness and unordered funnels, and
+   falls back to the metrics functions when the index would be too large
+4. Cached indexes and their per-event bitsets stay within USER_INDEX_MAX_MB
+   together, dropping the least recently used, and ordered funnels do not
+   build an index
+
+Usage:
+    python3 tests/test_user_index.py
+"""
+
+import os
+import sys
+from pathlib import Path
+
+# Add src to path for imports
+src_path = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_path))
+sys.path.insert(0, str(Path(__file__).parent))
+os.environ.setdefault("ANTHROPIC_API_KEY", "sk-ant-test-key")
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+from helpers import EVENTS, DataDir, random_events  # noqa: E402
+
+
+def _same_cohorts(a, b):
+    assert a.labels == b.labels, (a.labels, b.labels)
+    assert np.array_equal(a.sizes, b.sizes), (a.sizes, b.sizes)
+    assert np.array_equal(a.active, b.active), (a.period, a.active, b.active)
+
+
+def test_matches_metrics():
+    """Test bitmap results against the metrics functions and pandas."""
+    print("=" * 60)
+    print("Testing Bitmap Index Results")
+    print("=" * 60)
+
+    from pmm_agent.domains.data_analytics.engine import UserIndex, cohort_matrix, retention
+    from pmm_agent.domains.data_analytics.engine.bitmaps import popcount
+    from pmm_agent.domains.data_analytics.engine.events import events_from_frame
+
+    frame = random_events(60_000, 4_000, days=100)
+    table = events_from_frame(frame, "bitmap-test")
+    index = UserIndex(table)
+
+    for start, back in [(None, None), ("signup_completed", None), ("signup_completed", "first_value_action")]:
+        days = [0, 1, 3, 7, 30, 99, 150]
+        assert index.retention(start, days, back) == retention(table, start, days, back), (start, back)
+    for period, periods in [("day", 10), ("week", 6), ("month", 4), ("week", 30)]:
+        _same_cohorts(index.cohort_matrix(None, period, periods), cohort_matrix(table, None, period, periods))
+    _same_cohorts(index.cohort_matrix("onboarding_completed", "week", 8), cohort_matrix(table, "onboarding_completed", "week", 8))
+
+    day = frame["occurred_at"].dt.floor("D")
+    daily = frame.groupby(day)["user_id"].agg(set)
+    sticky = index.stickiness(window_days=30, days=10)
+    for label, dau, mau in zip(sticky.labels, sticky.dau, sticky.mau):
+        at = pd.Timestamp(label, tz=day.dt.tz)
+        window = daily[(daily.index > at - pd.Timedelta(days=30)) & (daily.index <= at)]
+        assert dau == len(daily.get(at, set())), label
+        assert mau == len(set().union(*window)), label
+
+    steps = ["first_value_action", "onboarding_completed", "signup_completed"]
+    did = frame.groupby("event_name")["user_id"].agg(set)
+    reach = index.funnel_reach(steps)
+    assert reach.users == [len(did[steps[0]]), len(did[steps[0]] & did[steps[1]]), len(did[steps[0]] & did[steps[1]] & did[steps[2]])]
+    assert not reach.ordered and index.funnel_reach(["nope"]).users == [0]
+
+    # The popcount fallback for NumPy 1.x agrees with bitwise_count
+    words = np.random.default_rng(1).integers(0, 2**63, (5, 40), dtype=np.int64).astype(np.uint64)
+    bitwise_count = getattr(np, "bitwise_count", None)
+    try:
+        if bitwise_count is not None:
+            del np.bitwise_count
+        fallback = popcount(words)
+    finally:
+        if bitwise_count is not None:
+            np.bitwise_count = bitwise_count
+    assert fallback.tolist() == [sum(bin(int(w)).count("1") for w in row) for row in words]
+    print(f"✅ Retention, cohorts, stickiness and reach match; index of {index.nbytes / 1e3:.0f} KB for "
+          f"{table.n_users:,} users x {index.n_days} days")
+
+
+def test_interactive_queries():
+    """Test that cohort questions are answered from bitsets, scanning events once per event name."""
+    print("\n" + "=" * 60)
+    print("Testing Event Scans on a Large User Base")
+    print("=" * 60)
+
+    from pmm_agent.domains.data_analytics.engine import (
+        bitmaps,
+        cohort_matrix,
+        retention,
+        user_index,
+    )
+    from pmm_agent.domains.data_analytics.engine.events import events_from_frame
+    from pmm_agent.domains.data_analytics.engine.metrics import clear_cache
+
+    table = events_from_frame(random_events(300_000, 50_000, days=90), "bitmap-scans")
+    scans = []
+    original_bitmaps = bitmaps._bitmaps
+
+    def counting_bitmaps(users, rows, n_rows, words):
+        scans.append(len(users))
+        return original_bitmaps(users, rows, n_rows, words)
+
+    questions = [(start, back, period) for start in (None, *EVENTS[:3]) for back in (None, "page_view") for period in ("week", "month")]
+    bitmaps._bitmaps = counting_bitmaps
+    try:
+        index = user_index(table)
+        build_scans = len(scans)
+        clear_cache()
+        from_index = [(index.retention(s, (1, 7, 30), b), index.cohort_matrix(s, p, 8)) for s, b, p in questions]
+    finally:
+        bitmaps._bitmaps = original_bitmaps
+    query_scans = len(scans) - build_scans
+
+    clear_cache()
+    from_events = [(retention(table, s, (1, 7, 30), b), cohort_matrix(table, s, p, 8)) for s, b, p in questions]
+
+    for (a_ret, a_coh), (b_ret, b_coh) in zip(from_index, from_events):
+        assert a_ret == b_ret
+        _same_cohorts(a_coh, b_coh)
+    # The build scans all events for the day and event bitsets; after that, only the
+    # first question about each named event scans that event's rows, so every row
+    # is read at most once more however many questions are asked
+    named = {name for s, b, _ in questions for name in (s, b) if name}
+    assert build_scans == 2 and scans[:2] == [len(table)] * 2, scans
+    assert query_scans == len(named), (query_scans, named)
+    assert sum(scans[2:]) <= len(table), scans
+    print(f"✅ {len(questions) * 2} questions from the index ({index.nbytes / 1e6:.1f} MB) with "
+          f"{query_scans} scans of one event's rows; same results as the metrics functions")
+
+
+def test_tool():
+    """Test stickiness and unordered funnels in compute_event_metrics, and the size fallback."""
+    print("\n" + "=" * 60)
+    print("Testing compute_event_metrics with the Index")
+    print("=" * 60)
+
+    from pmm_agent.domains.data_analytics.engine import bitmaps
+    from pmm_agent.domains.data_analytics.tools import compute_event_metrics
+
+    with DataDir() as data:
+        random_events(30_000, 2_000).to_parquet(data.path / "events.parquet", index=False)
+        sticky = compute_event_metrics.invoke({"dataset": "events.parquet", "analysis": "stickiness", "periods": 7})
+        reach = compute_event_metrics.invoke({
+            "dataset": "events.parquet", "analysis": "funnel", "ordered": False,
+            "steps": "signup_completed,first_value_action",
+        })
+        ordered = compute_event_metrics.invoke({
+            "dataset": "events.parquet", "analysis": "funnel", "steps": "signup_completed,first_value_action",
+        })
+
+        original_limit, original_indexes = bitmaps.USER_INDEX_MAX_BYTES, bitmaps._indexes.copy()
+        bitmaps.USER_INDEX_MAX_BYTES = 0
+        bitmaps._indexes.clear()
+        try:
+            random_events(30_000, 2_000, seed=3).to_parquet(data.path / "other.parquet", index=False)
+            fallback = compute_event_metrics.invoke({"dataset": "other.parquet", "analysis": "retention"})
+            refused = compute_event_metrics.invoke({"dataset": "other.parquet", "analysis": "stickiness"})
+        finally:
+            bitmaps.USER_INDEX_MAX_BYTES = original_limit
+            bitmaps._indexes.clear()
+            bitmaps._indexes.update(original_indexes)
+
+    assert "### Stickiness (DAU / 30-day active users)" in sticky and "**Average DAU/MAU:**" in sticky, sticky
+    assert sticky.count("| 2024-") == 7, sticky
+    assert "### Funnel Reach (users who did every step so far, in any order)" in reach, reach
+    assert "### Funnel (30-day window from the first step)" in ordered
+    reach_users = int(reach.split("| 2. first_value_action | ")[1].split(" |")[0].replace(",", ""))
+    ordered_users = int(ordered.split("| 2. first_value_action | ")[1].split(" |")[0].replace(",", ""))
+    assert reach_users >= ordered_users, (reach_users, ordered_users)
+    assert "| Day 7 |" in fallback and "❌ Stickiness needs the bitmap user index" in refused, refused
+    print(f"✅ Stickiness and reach reported; reach {reach_users:,} ≥ ordered {ordered_users:,}; oversize index falls back")
+
+
+def test_memory_budget():
+    """Test the shared index budget and that ordered funnels skip the index."""
+    print("\n" + "=" * 60)
+    print("Testing the Index Memory Budget")
+    print("=" * 60)
+
+    from pmm_agent.domains.data_analytics.engine import bitmaps, user_index
+    from pmm_agent.domains.data_analytics.engine.events import events_from_frame
+    from pmm_agent.domains.data_analytics.tools import compute_event_metrics
+
+    tables = [events_from_frame(random_events(20_000, 2_000, days=60, seed=i), f"budget-{i}") for i in range(3)]
+    original_limit, original_indexes = bitmaps.USER_INDEX_MAX_BYTES, bitmaps._indexes.copy()
+    bitmaps._indexes.clear()
+    try:
+        size = bitmaps.UserIndex.estimate_bytes(tables[0])
+        # Fits two indexes, or one with two per-event bitsets (each a little smaller than an index)
+        bitmaps.USER_INDEX_MAX_BYTES = int(2.9 * size)
+        first, second = user_index(tables[0]), user_index(tables[1])
+        user_index(tables[0])  # the second is now least recently used
+        third = user_index(tables[2])
+        kept = [index for index in bitmaps._indexes.values()]
+        # Per-event bitsets count too: building them drops the other index
+        third.event_days("signup_completed")
+        third.event_days("onboarding_completed")
+        after_events = list(bitmaps._indexes.values())
+        cached_bytes = sum(index.nbytes for index in after_events)
+
+        bitmaps._indexes.clear()
+        with DataDir() as data:
+            random_events(5_000, 500).to_parquet(data.path / "events.parquet", index=False)
+            ordered = compute_event_metrics.invoke({
+                "dataset": "events.parquet", "analysis": "funnel", "steps": "signup_completed,first_value_action",
+            })
+            built_for_ordered = len(bitmaps._indexes)
+    finally:
+        bitmaps.USER_INDEX_MAX_BYTES = original_limit
+        bitmaps._indexes.clear()
+        bitmaps._indexes.update(original_indexes)
+
+    assert kept == [first, third] and second not in kept, "The least recently used index should have been dropped"
+    assert after_events == [third] and len(third._event_days) == 2, (after_events, third._event_days.keys())
+    assert cached_bytes <= int(2.9 * size), (cached_bytes, size)
+    assert "### Funnel (30-day window" in ordered and built_for_ordered == 0, built_for_ordered
+    print(f"✅ {cached_bytes / 1e3:.0f} KB cached within a {2.9 * size / 1e3:.0f} KB budget; "
+          "ordered funnel built no index")
+
+
+def main():
+    """Run bitmap user index tests."""
+    results = {}
+    for test in (test_matches_metrics, test_interactive_queries, test_tool, test_memory_budget):
+        try:
+            test()
+            results[test.__name__] = True
+        except AssertionError as e:
+            print(f"❌ {test.__name__} failed: {e}")
+            results[test.__name__] = False
+
+    print("\n" + "=" * 60)
+    print("Test Summary")
+    print("=" * 60)
+    for name, passed in results.items():
+        print(f"{name}: {'✅ PASS' if passed else '❌ FAIL'}")
+
+    return 0 if all(results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -35,6 +35,10 @@ import remarkGfm from "remark-gfm";
 const API_URL = import.meta.env.VITE_API_URL || 
   (import.meta.env.DEV ? "http://localhost:8123" : "/api");
 
+// Reconnect attempts for an interrupted /chat/stream response
+const MAX_STREAM_RETRIES = 3;
+const STREAM_RETRY_DELAY_MS = 500;
+
 // Domain configuration interface
 interface DomainConfig {
   domain: string;
@@ -144,6 +148,15 @@ interface ToolCall {
   status: "pending" | "running" | "completed";
 }
 
+// One SSE frame from /chat/stream
+interface StreamEvent {
+  type: "text" | "tool_call" | "done";
+  content?: string;
+  name?: string;
+  args?: Record<string, unknown>;
+  session_id?: string;
+}
+
 // =============================================================================
 // COMPONENTS
 // =============================================================================
@@ -501,88 +514,131 @@ export default function App() {
       };
       setMessages((prev) => [...prev, assistantMessage]);
 
+      const handleEvent = (data: StreamEvent) => {
+        if (data.type === "text") {
+          assistantMessage = {
+            ...assistantMessage,
+            content: assistantMessage.content + (data.content ?? ""),
+          };
+          setMessages((prev) => [
+            ...prev.slice(0, -1),
+            assistantMessage,
+          ]);
+        } else if (data.type === "tool_call") {
+          const toolCall: ToolCall = {
+            id: crypto.randomUUID(),
+            name: data.name ?? "",
+            args: data.args ?? {},
+            status: "running",
+          };
+          assistantMessage = {
+            ...assistantMessage,
+            toolCalls: [...(assistantMessage.toolCalls || []), toolCall],
+          };
+          setMessages((prev) => [
+            ...prev.slice(0, -1),
+            assistantMessage,
+          ]);
+        } else if (data.type === "done") {
+          if (data.session_id) {
+            setSessionId(data.session_id);
+          }
+          // Mark all tool calls as completed
+          if (assistantMessage.toolCalls?.length) {
+            assistantMessage = {
+              ...assistantMessage,
+              toolCalls: assistantMessage.toolCalls.map((tc) => ({
+                ...tc,
+                status: "completed" as const,
+              })),
+            };
+            setMessages((prev) => [
+              ...prev.slice(0, -1),
+              assistantMessage,
+            ]);
+          }
+        }
+      };
+
       try {
-        const response = await fetch(`${API_URL}/chat/stream`, {
-          method: "POST",
-          headers: {
+        // If the connection drops mid-answer, reconnect with the last event ID;
+        // the server replays the missed frames without re-running the agent
+        let lastEventId: string | null = null;
+        let finished = false;
+
+        for (let attempt = 0; !finished; attempt++) {
+          const headers: Record<string, string> = {
             "Content-Type": "application/json",
-          },
-          body: JSON.stringify({
-            message: content.trim(),
-            session_id: sessionId,
-          }),
-        });
+          };
+          if (lastEventId) {
+            headers["Last-Event-ID"] = lastEventId;
+          }
 
-        if (!response.ok) {
-          throw new Error(`HTTP error! status: ${response.status}`);
-        }
+          try {
+            const response = await fetch(`${API_URL}/chat/stream`, {
+              method: "POST",
+              headers,
+              body: JSON.stringify({
+                message: content.trim(),
+                session_id: sessionId,
+              }),
+            });
+
+            if (!response.ok) {
+              throw new Error(`HTTP error! status: ${response.status}`);
+            }
 
-        const reader = response.body?.getReader();
-        const decoder = new TextDecoder();
+            const reader = response.body?.getReader();
+            const decoder = new TextDecoder();
 
-        if (!reader) {
-          throw new Error("No response body");
-        }
+            if (!reader) {
+              throw new Error("No response body");
+            }
 
-        while (true) {
-          const { done, value } = await reader.read();
-          if (done) break;
-
-          const chunk = decoder.decode(value);
-          const lines = chunk.split("\n\n");
-
-          for (const line of lines) {
-            if (line.startsWith("data: ")) {
-              try {
-                const data = JSON.parse(line.slice(6));
-
-                if (data.type === "text") {
-                  assistantMessage = {
-                    ...assistantMessage,
-                    content: assistantMessage.content + data.content,
-                  };
-                  setMessages((prev) => [
-                    ...prev.slice(0, -1),
-                    assistantMessage,
-                  ]);
-                } else if (data.type === "tool_call") {
-                  const toolCall: ToolCall = {
-                    id: crypto.randomUUID(),
-                    name: data.name,
-                    args: data.args,
-                    status: "running",
-                  };
-                  assistantMessage = {
-                    ...assistantMessage,
-                    toolCalls: [...(assistantMessage.toolCalls || []), toolCall],
-                  };
-                  setMessages((prev) => [
-                    ...prev.slice(0, -1),
-                    assistantMessage,
-                  ]);
-                } else if (data.type === "done") {
-                  if (data.session_id) {
-                    setSessionId(data.session_id);
-                  }
-                  // Mark all tool calls as completed
-                  if (assistantMessage.toolCalls?.length) {
-                    assistantMessage = {
-                      ...assistantMessage,
-                      toolCalls: assistantMessage.toolCalls.map((tc) => ({
-                        ...tc,
-                        status: "completed" as const,
-                      })),
-                    };
-                    setMessages((prev) => [
-                      ...prev.slice(0, -1),
-                      assistantMessage,
-                    ]);
+            // Frames can span reads: keep the incomplete tail for the next one
+            let buffer = "";
+            while (true) {
+              const { done, value } = await reader.read();
+              if (done) break;
+
+              buffer += decoder.decode(value, { stream: true });
+              const frames = buffer.split("\n\n");
+              buffer = frames.pop() ?? "";
+
+              for (const frame of frames) {
+                for (const line of frame.split("\n")) {
+                  if (line.startsWith("id: ")) {
+                    lastEventId = line.slice(4);
+                  } else if (line.startsWith("data: ")) {
+                    try {
+                      const data: StreamEvent = JSON.parse(line.slice(6));
+                      handleEvent(data);
+                      if (data.type === "done") {
+                        finished = true;
+                      }
+                    } catch (e) {
+                      // Skip invalid JSON
+                    }
                   }
                 }
-              } catch (e) {
-                // Skip invalid JSON
               }
             }
+
+            if (!finished) {
+              throw new Error("Stream ended before the response was complete");
+            }
+          } catch (err) {
+            const retryable =
+              lastEventId !== null &&
+              attempt < MAX_STREAM_RETRIES &&
+              !(err instanceof Error && err.message.startsWith("HTTP error!"));
+            if (finished || !retryable) {
+              throw err;
+            }
+            console.warn("Stream interrupted, resuming:", err);
+            await new Promise((resolve) =>
+              setTimeout(resolve, STREAM_RETRY_DELAY_MS * (attempt + 1))
+            );
           }
         }
       } catch (err) {